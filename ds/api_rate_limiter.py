@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.26】API请求频率控制器（滑动窗口 + 接口权重表）
+
+核心功能:
+1. 滑动日志：记录最近60秒每个请求的(时间, 权重)，额度随旧请求滑出窗口逐步释放，
+   不再是"整分钟清零"的固定窗口（窗口边界前后不会出现两倍突发）
+2. 等待在锁外进行：锁内只做计数和计算等待时间，超限的调用方各自sleep，
+   其他线程不会被排在一个60秒的sleep后面
+3. 接口权重表：acquire(endpoint="fetch_positions") / acquire(endpoint="fetch_ohlcv", limit=100)
+4. acquire_async：asyncio版本（await asyncio.sleep）
+5. 从币安响应头X-MBX-USED-WEIGHT-1M学习实际已用权重：同IP的其他进程（如另一个模型的机器人）
+   消耗的权重作为补记额度计入，避免本地计数偏低而触发418/429；
+   服务端计数按自然分钟清零，补记额度在该分钟结束时失效（不会在滑动窗口里多留60秒）
+
+币安限制（统一账户papi / 合约）：
+- 请求频率：1200次/分钟
+- 权重限制：6000权重/分钟
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Mapping, Optional
+
+from market_data_fetcher import kline_request_weight
+
+WINDOW_SECONDS = 60.0
+
+# 各接口的请求权重（单个symbol查询）
+ENDPOINT_WEIGHTS: Dict[str, int] = {
+    # ccxt统一方法
+    "fetch_ticker": 1,
+    "fetch_balance": 20,  # GET /papi/v1/balance
+    "fetch_positions": 5,  # GET /papi/v1/um/positionRisk
+    "fetch_open_orders": 1,
+    "fetch_order": 1,
+    "fetch_my_trades": 5,
+    "fetch_time": 1,
+    "create_order": 1,
+    "cancel_order": 1,
+    "set_leverage": 1,
+    # papi原生接口（requests直接调用）
+    "papi_conditional_open_orders": 1,  # GET /papi/v1/um/conditional/openOrders
+    "papi_conditional_order": 1,  # POST /papi/v1/um/conditional/order
+    "papi_cancel_conditional_order": 1,  # DELETE /papi/v1/um/conditional/order
+}
+
+# 不带symbol（全部币种）查询时的权重
+ALL_SYMBOLS_WEIGHTS: Dict[str, int] = {
+    "fetch_open_orders": 40,
+    "papi_conditional_open_orders": 40,
+}
+
+USED_WEIGHT_HEADERS = ("x-mbx-used-weight-1m", "x-mbx-used-weight")
+
+
+def order_book_request_weight(limit: int) -> int:
+    """合约 /depth 接口的请求权重（随limit分档）"""
+    if limit <= 50:
+        return 2
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 10
+    return 20
+
+
+def endpoint_weight(endpoint: str, limit: Optional[int] = None, all_symbols: bool = False) -> int:
+    """
+    查表得到接口权重
+
+    Args:
+        endpoint: 接口名（ENDPOINT_WEIGHTS的键，或fetch_ohlcv / fetch_order_book）
+        limit: K线/盘口数量（fetch_ohlcv、fetch_order_book按limit分档）
+        all_symbols: 是否为不带symbol的全币种查询
+    """
+    if endpoint == "fetch_ohlcv":
+        return kline_request_weight(limit or 500)
+    if endpoint == "fetch_order_book":
+        return order_book_request_weight(limit or 500)
+    if all_symbols and endpoint in ALL_SYMBOLS_WEIGHTS:
+        return ALL_SYMBOLS_WEIGHTS[endpoint]
+    if endpoint not in ENDPOINT_WEIGHTS:
+        raise ValueError(f"未知接口: {endpoint}")
+    return ENDPOINT_WEIGHTS[endpoint]
+
+
+class APIRateLimiter:
+    """🆕 V8.7.4: 全局API请求频率控制器（V8.9.26起为滑动窗口）
+
+    核心功能：
+    1. 请求计数：追踪最近60秒的请求次数和权重
+    2. 自动限流：超限时在锁外等待到足够额度滑出窗口
+    3. 权重感知：按接口权重表申请，或直接传入权重
+    4. 服务端校准：record_headers/observe读取X-MBX-USED-WEIGHT-1M
+
+    交易员建议：避免触发Rate Limit导致封号
+    """
+
+    def __init__(
+        self, max_requests_per_minute: int = 1200, weight_limit_per_minute: int = 6000
+    ):
+        self.max_requests = max_requests_per_minute
+        self.weight_limit = weight_limit_per_minute
+        self.window_seconds = WINDOW_SECONDS
+
+        # (时间, 权重, 请求数)：本进程的实际请求
+        self._log = deque()
+        # 服务端校准补记：当前自然分钟内其他进程的已用权重，到分钟结束时失效
+        self._correction = 0
+        self._correction_expires = 0.0
+        self.request_count = 0
+        self.weight_count = 0
+        self.lock = threading.Lock()
+
+        self.server_used_weight: Optional[int] = None
+        self.server_updated_at: Optional[float] = None
+        self.total_wait_seconds = 0.0
+        self.wait_events = 0
+
+        print(
+            f"🚦 [API限频器] 已启动: {max_requests_per_minute}次/分, "
+            f"{weight_limit_per_minute}权重/分（滑动窗口）"
+        )
+
+    # ------------------------------------------------------------------
+    # 内部：锁内计数
+    # ------------------------------------------------------------------
+
+    def _evict(self, now: float):
+        """移除滑出窗口的记录（调用方持锁）"""
+        cutoff = now - self.window_seconds
+        log = self._log
+        while log and log[0][0] <= cutoff:
+            _, weight, requests = log.popleft()
+            self.weight_count -= weight
+            self.request_count -= requests
+        if self._correction and now >= self._correction_expires:
+            self._correction = 0
+
+    def _try_acquire(self, weight: int) -> float:
+        """
+        尝试占用额度
+
+        Returns:
+            0表示已占用；否则为需要等待的秒数（未占用）
+        """
+        weight = min(weight, self.weight_limit)
+        with self.lock:
+            now = time.time()
+            self._evict(now)
+
+            over_requests = self.request_count + 1 - self.max_requests
+            over_weight = self.weight_count + self._correction + weight - self.weight_limit
+            if over_requests <= 0 and over_weight <= 0:
+                self._log.append((now, weight, 1))
+                self.request_count += 1
+                self.weight_count += weight
+                return 0.0
+
+            # 找到最早的时刻：滑出窗口的记录（及分钟结束时失效的补记额度）足以腾出所需的请求数和权重
+            freed_requests = 0
+            freed_weight = 0
+            correction_pending = self._correction > 0
+            for ts, entry_weight, requests in self._log:
+                release = ts + self.window_seconds
+                if correction_pending and self._correction_expires <= release:
+                    correction_pending = False
+                    freed_weight += self._correction
+                    if freed_requests >= over_requests and freed_weight >= over_weight:
+                        return max(self._correction_expires - now, 0.001)
+                freed_requests += requests
+                freed_weight += entry_weight
+                if freed_requests >= over_requests and freed_weight >= over_weight:
+                    return max(release - now, 0.001)
+            if correction_pending and freed_requests >= over_requests:
+                if freed_weight + self._correction >= over_weight:
+                    return max(self._correction_expires - now, 0.001)
+            return self.window_seconds
+
+    def _note_wait(self, wait_time: float):
+        with self.lock:
+            self.total_wait_seconds += wait_time
+            self.wait_events += 1
+            req_msg = f"请求{self.request_count}/{self.max_requests}"
+            weight_msg = f"权重{self.weight_count + self._correction}/{self.weight_limit}"
+        if wait_time >= 1:
+            print(f"⏳ [API限频] {req_msg}, {weight_msg}, 等待{wait_time:.1f}s")
+
+    @staticmethod
+    def _resolve_weight(weight, endpoint, limit, all_symbols) -> int:
+        if endpoint is not None:
+            return endpoint_weight(endpoint, limit=limit, all_symbols=all_symbols)
+        return 1 if weight is None else int(weight)
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def acquire(
+        self,
+        weight: Optional[int] = None,
+        endpoint: Optional[str] = None,
+        limit: Optional[int] = None,
+        all_symbols: bool = False,
+    ):
+        """请求许可（阻塞直到获得；等待发生在锁外）
+
+        Args:
+            weight: 直接指定权重（与endpoint二选一，默认1）
+            endpoint: 接口名，按ENDPOINT_WEIGHTS查表
+            limit: fetch_ohlcv / fetch_order_book的数量
+            all_symbols: 不带symbol的全币种查询
+        """
+        weight = self._resolve_weight(weight, endpoint, limit, all_symbols)
+        while True:
+            wait_time = self._try_acquire(weight)
+            if wait_time <= 0:
+                return
+            self._note_wait(wait_time)
+            time.sleep(wait_time)
+
+    async def acquire_async(
+        self,
+        weight: Optional[int] = None,
+        endpoint: Optional[str] = None,
+        limit: Optional[int] = None,
+        all_symbols: bool = False,
+    ):
+        """acquire的asyncio版本（等待期间不阻塞事件循环）"""
+        import asyncio
+
+        weight = self._resolve_weight(weight, endpoint, limit, all_symbols)
+        while True:
+            wait_time = self._try_acquire(weight)
+            if wait_time <= 0:
+                return
+            self._note_wait(wait_time)
+            await asyncio.sleep(wait_time)
+
+    def record_headers(self, headers: Optional[Mapping]):
+        """
+        用响应头X-MBX-USED-WEIGHT-1M校准本地计数
+
+        服务端数值是当前自然分钟内整个IP的已用权重；本地同一分钟内记录的权重少于它时，
+        差额作为补记额度计入，到这一分钟结束（服务端清零）时失效。
+        同一分钟内只会调高补记额度（只会让限流更保守，不会放宽）
+        """
+        if not headers:
+            return
+        used = None
+        for key, value in headers.items():
+            if str(key).lower() in USED_WEIGHT_HEADERS:
+                try:
+                    used = int(value)
+                except (TypeError, ValueError):
+                    continue
+                if str(key).lower() == USED_WEIGHT_HEADERS[0]:
+                    break
+        if used is None:
+            return
+
+        with self.lock:
+            now = time.time()
+            self._evict(now)
+            minute_start = now - now % 60
+            local = sum(weight for ts, weight, _ in self._log if ts >= minute_start)
+            self.server_used_weight = used
+            self.server_updated_at = now
+            if used > local + self._correction:
+                self._correction = used - local
+                self._correction_expires = minute_start + 60
+
+    def observe(self, exchange):
+        """读取ccxt交易所实例最近一次响应的头部（exchange.last_response_headers）"""
+        self.record_headers(getattr(exchange, "last_response_headers", None))
+
+    def get_status(self) -> dict:
+        """获取当前状态"""
+        with self.lock:
+            now = time.time()
+            self._evict(now)
+            elapsed = now - self._log[0][0] if self._log else 0.0
+            return {
+                "request_count": self.request_count,
+                "weight_count": self.weight_count + self._correction,
+                "max_requests": self.max_requests,
+                "weight_limit": self.weight_limit,
+                "elapsed_seconds": elapsed,
+                "requests_remaining": self.max_requests - self.request_count,
+                "weight_remaining": self.weight_limit - self.weight_count - self._correction,
+                "server_used_weight": self.server_used_weight,
+                "total_wait_seconds": self.total_wait_seconds,
+                "wait_events": self.wait_events,
+            }
+
+
+if __name__ == "__main__":
+    """
+    自检：权重表、滑动窗口释放、锁外等待、服务端校准、asyncio版本
+    """
+    import asyncio
+
+    assert endpoint_weight("fetch_ohlcv", limit=100) == 2
+    assert endpoint_weight("fetch_order_book", limit=5) == 2
+    assert endpoint_weight("fetch_open_orders", all_symbols=True) == 40
+    assert endpoint_weight("fetch_positions") == 5
+
+    limiter = APIRateLimiter(max_requests_per_minute=1000, weight_limit_per_minute=10)
+    limiter.window_seconds = 0.5
+    for _ in range(5):
+        limiter.acquire(endpoint="fetch_ohlcv", limit=100)
+    assert limiter.get_status()["weight_count"] == 10
+
+    # 满额时：一个线程等待期间，其他线程仍可立即拿到锁读取状态
+    start = time.time()
+    waiter = threading.Thread(target=limiter.acquire, kwargs={"weight": 2})
+    waiter.start()
+    time.sleep(0.05)
+    lock_start = time.time()
+    limiter.get_status()
+    assert time.time() - lock_start < 0.05, "等待期间不应持有锁"
+    waiter.join()
+    waited = time.time() - start
+    assert 0.3 < waited < 1.0, waited
+
+    # 服务端校准：本地计数少于响应头数值时补记差额
+    limiter = APIRateLimiter(max_requests_per_minute=1000, weight_limit_per_minute=6000)
+    limiter.acquire(weight=5)
+    limiter.record_headers({"X-MBX-USED-WEIGHT-1M": "120"})
+    assert limiter.get_status()["weight_count"] >= 120
+    assert limiter.get_status()["request_count"] == 1
+    before = limiter.get_status()["weight_count"]
+    limiter.record_headers({"x-mbx-used-weight-1m": "3"})
+    assert limiter.get_status()["weight_count"] == before  # 不会放宽
+
+    # 补记额度在服务端分钟结束时失效（本地请求仍按滑动窗口保留），等待时间按分钟边界计算
+    real_time = time.time
+    clock = [60 * 28_333_333.0 + 50]  # 某一分钟的第50秒
+    time.time = lambda: clock[0]
+    try:
+        limiter = APIRateLimiter(max_requests_per_minute=1000, weight_limit_per_minute=100)
+        limiter.acquire(weight=5)
+        limiter.record_headers({"X-MBX-USED-WEIGHT-1M": "90"})
+        assert limiter.get_status()["weight_count"] == 90
+        assert abs(limiter._try_acquire(20) - 10) < 1e-6  # 10秒后分钟结束，补记的85失效
+        clock[0] += 10
+        assert limiter.get_status()["weight_count"] == 5
+        assert limiter._try_acquire(20) == 0
+    finally:
+        time.time = real_time
+
+    # asyncio版本：并发协程在额度内不等待，超额后按窗口释放
+    limiter = APIRateLimiter(max_requests_per_minute=4, weight_limit_per_minute=6000)
+    limiter.window_seconds = 0.3
+
+    async def _run():
+        start = time.time()
+        await asyncio.gather(*(limiter.acquire_async(weight=1) for _ in range(8)))
+        return time.time() - start
+
+    elapsed = asyncio.run(_run())
+    assert 0.25 < elapsed < 1.0, elapsed
+
+    print("✅ API限频器自检通过")
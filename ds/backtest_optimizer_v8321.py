@@ -7,6 +7,10 @@
 3. 本地统计分析（参数敏感度、异常检测）
 4. 成本优化的AI决策（压缩数据、精简Prompt）
 5. 资源控制（限制内存、CPU nice值、进程隔离）
+6. 【V8.9.22】过滤位图索引：每个阈值的通过集合由有序数组二分得到并缓存为位图，
+   每组参数的捕获集合只需几次按位与；随机采样按需解码组合下标，不展开全部组合
+7. 【V8.9.20】机会可以是OpportunityTable：过滤索引直接按列构建，
+   captured_details为捕获行的子表，上下文分析只还原用到的几个字段
 
 适用环境：2核2G服务器
 """
@@ -17,6 +21,8 @@ import random
 
 import numpy as np
 
+from opportunity_table import OpportunityTable, take_opportunities
+
 # 尝试导入psutil（可选）
 try:
     import psutil
@@ -115,29 +121,21 @@ def optimize_params_v8321_lightweight(
         else:
             print("      ℹ️  AI建议的参数都不在搜索空间中，跳过")
 
-    all_results = []
-
-    for i, params in enumerate(sampled_params):
-        # 内存检查（每10组检查一次）
-        if i % 10 == 0 and HAS_PSUTIL:
-            mem_usage = psutil.Process().memory_info().rss / (1024**2)
-            if mem_usage > 300:  # 超过300MB则GC
-                gc.collect()
-                print(f"      [{i}/{max_combinations}] 内存: {mem_usage:.0f}MB → GC")
-
-        # 模拟这个参数配置
-        result = simulate_params_with_v8321_filter(opportunities, params)
-        score = calculate_v8321_optimization_score(result)
-
-        all_results.append({
-            "params": params,
-            "score": score,
-            "metrics": extract_key_metrics(result),
-        })
+    # 【V8.9.8】参数组合多进程并行评估（worker数/内存上限见parallel_grid_search，
+    # 内存不足或任务太少时自动串行；结果顺序与串行一致）
+    # 【V8.9.22】共享数据为过滤位图索引（只构建一次，各组参数复用阈值位图；
+    # 并行时数值列写入共享内存，各worker只读映射同一份）
+    from parallel_grid_search import evaluate_param_grid
 
-        # 进度显示
-        if (i + 1) % 20 == 0:
-            print(f"      进度: {i + 1}/{max_combinations}...")
+    filter_index = V8321FilterIndex(opportunities)
+    evaluations = evaluate_param_grid(
+        filter_index, sampled_params, evaluate_params_v8321
+    )
+    all_results = [
+        {"params": params, "score": score, "metrics": metrics}
+        for params, (score, metrics) in zip(sampled_params, evaluations)
+    ]
+    print(f"      进度: {len(all_results)}/{len(sampled_params)}")
 
     # 排序并取Top 10
     top_10 = sorted(all_results, key=lambda x: x["score"], reverse=True)[:10]
@@ -157,7 +155,7 @@ def optimize_params_v8321_lightweight(
 
     # 本地计算：上下文特征相关性
     context_analysis = analyze_context_features_local(
-        opportunities, top_10[0]["params"]
+        filter_index, top_10[0]["params"]
     )
 
     # 本地检测：异常情况
@@ -211,7 +209,7 @@ def optimize_params_v8321_lightweight(
 
                 # 验证AI调整后的参数
                 ai_result = simulate_params_with_v8321_filter(
-                    opportunities, ai_adjusted_params
+                    filter_index, ai_adjusted_params
                 )
                 ai_score = calculate_v8321_optimization_score(ai_result)
 
@@ -474,27 +472,41 @@ def random_sample_param_grid(grid: dict, sample_size: int) -> list[dict]:
     # ===== 3. 随机填充（剩余） =====
     remaining = sample_size - len(samples)
     if remaining > 0:
-        # 生成所有组合的索引
-        from itertools import product
+        sizes = [len(vals) for vals in param_values]
+        total = calculate_total_combinations(grid)
 
-        all_indices = list(product(*[range(len(vals)) for vals in param_values]))
-
-        # 过滤掉已采样的配置
-        available_indices = []
-        for indices in all_indices:
+        def is_new(indices):
             config = {
                 param_names[i]: param_values[i][indices[i]]
                 for i in range(len(param_names))
             }
-            config_tuple = tuple(sorted(config.items()))
-            if config_tuple not in seen:
-                available_indices.append(indices)
-
-        # 随机采样
-        if len(available_indices) > remaining:
-            sampled_indices = random.sample(available_indices, remaining)
+            return tuple(sorted(config.items())) not in seen
+
+        if total <= 4 * (remaining + len(seen)):
+            # 组合数与采样数相当：逐个枚举（生成器，不建列表）再采样
+            from itertools import product
+
+            available_indices = [
+                indices
+                for indices in product(*[range(size) for size in sizes])
+                if is_new(indices)
+            ]
+            if len(available_indices) > remaining:
+                sampled_indices = random.sample(available_indices, remaining)
+            else:
+                sampled_indices = available_indices
         else:
-            sampled_indices = available_indices
+            # 【V8.9.22】组合数远大于采样数：随机抽取组合序号并解码，不展开全部组合
+            sampled_indices = []
+            drawn = set()
+            while len(sampled_indices) < remaining and len(drawn) < total:
+                flat = random.randrange(total)
+                if flat in drawn:
+                    continue
+                drawn.add(flat)
+                indices = _decode_grid_index(flat, sizes)
+                if is_new(indices):
+                    sampled_indices.append(indices)
 
         # 构建参数字典
         for indices in sampled_indices:
@@ -513,6 +525,15 @@ def random_sample_param_grid(grid: dict, sample_size: int) -> list[dict]:
     return samples
 
 
+def _decode_grid_index(flat: int, sizes: list[int]) -> tuple:
+    """组合序号 → 各参数取值下标（与itertools.product顺序一致，最后一个参数变化最快）"""
+    indices = []
+    for size in reversed(sizes):
+        flat, idx = divmod(flat, size)
+        indices.append(idx)
+    return tuple(reversed(indices))
+
+
 def calculate_total_combinations(grid: dict) -> int:
     """计算总组合数"""
     total = 1
@@ -526,6 +547,267 @@ def calculate_total_combinations(grid: dict) -> int:
 # ============================================================
 
 
+class _ThresholdColumn:
+    """【V8.9.22】单个数值字段的有序索引：阈值筛选 = 二分查找 + 缓存的位图
+
+    NaN排在有序数组之后，比较语义与逐个if判断一致（NaN的比较结果总为False）
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.size = len(values)
+        valid_rows = np.flatnonzero(~np.isnan(values))
+        self.order = np.concatenate([
+            valid_rows[np.argsort(values[valid_rows], kind="stable")],
+            np.flatnonzero(np.isnan(values)),
+        ])
+        self.valid_count = len(valid_rows)
+        self.sorted = values[self.order[: self.valid_count]]
+        self._bitsets: dict = {}
+
+    @classmethod
+    def from_sorted(cls, order: np.ndarray, sorted_values: np.ndarray) -> "_ThresholdColumn":
+        """由已排好序的order/sorted还原（多进程worker映射共享数组用）"""
+        column = cls.__new__(cls)
+        column.size = len(order)
+        column.order = order
+        column.valid_count = len(sorted_values)
+        column.sorted = sorted_values
+        column._bitsets = {}
+        return column
+
+    def _bitset(self, key, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows] = True
+        bits = self._bitsets[key] = np.packbits(mask)
+        return bits
+
+    def at_least(self, threshold) -> np.ndarray:
+        """value >= threshold 的行（NaN不通过）"""
+        key = (">=", threshold)
+        if key in self._bitsets:
+            return self._bitsets[key]
+        start = np.searchsorted(self.sorted, threshold, side="left")
+        return self._bitset(key, self.order[start : self.valid_count])
+
+    def not_below(self, threshold) -> np.ndarray:
+        """not (value < threshold) 的行（NaN通过）"""
+        key = ("!<", threshold)
+        if key in self._bitsets:
+            return self._bitsets[key]
+        start = np.searchsorted(self.sorted, threshold, side="left")
+        return self._bitset(key, self.order[start:])
+
+    def not_above(self, threshold) -> np.ndarray:
+        """not (value > threshold) 的行（NaN通过）"""
+        key = ("!>", threshold)
+        if key in self._bitsets:
+            return self._bitsets[key]
+        end = np.searchsorted(self.sorted, threshold, side="right")
+        return self._bitset(
+            key, np.concatenate([self.order[:end], self.order[self.valid_count :]])
+        )
+
+
+class V8321FilterIndex:
+    """【V8.9.22】V8.3.21四层过滤的位图索引（对一组机会只构建一次）
+
+    每个阈值字段一个_ThresholdColumn，参数组合的捕获集合 = 各层位图按位与，
+    与逐个调用passes_*_filter的结果逐项一致；高级过滤字段在首次启用时才构建
+    """
+
+    def __init__(self, opportunities: list[dict] | OpportunityTable):
+        self.opportunities = opportunities
+        self.size = len(opportunities)
+        # 【V8.9.20】列式表直接取列，不还原dict
+        self._table = opportunities if isinstance(opportunities, OpportunityTable) else None
+
+        # 第1层：基础过滤
+        self.signal_score = _ThresholdColumn(self._field("signal_score", default=np.nan))
+        self.consensus_score = _ThresholdColumn(self._field("consensus_score", default=np.nan))
+        self.has_consensus_score = np.packbits(self._present("consensus_score"))
+        self.consensus = _ThresholdColumn(self._field("consensus", "indicator_consensus"))
+        self.risk_reward = _ThresholdColumn(self._field("actual_risk_reward", "risk_reward"))
+        # 与get_profit_pct一致：actual_profit_pct > objective_profit > 0
+        self.profits = self._field("actual_profit_pct", "objective_profit")
+        self._advanced = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    # 【V8.9.8】多进程网格搜索：数值列写入共享内存，worker映射后还原索引（不含机会dict）
+    _THRESHOLD_COLUMNS = ("signal_score", "consensus_score", "consensus", "risk_reward")
+
+    def to_shared_arrays(self) -> tuple:
+        """(数组dict, meta)：第2-4层字段一并构建，worker中没有机会dict可供懒构建"""
+        advanced = self._advanced_columns()
+        columns = {name: getattr(self, name) for name in self._THRESHOLD_COLUMNS}
+        columns.update(
+            (f"advanced_{name}", col)
+            for name, col in advanced.items()
+            if isinstance(col, _ThresholdColumn)
+        )
+        arrays = {"profits": self.profits, "has_consensus_score": self.has_consensus_score,
+                  "advanced_is_trend": advanced["is_trend"]}
+        for name, col in columns.items():
+            arrays[f"{name}.order"] = col.order
+            arrays[f"{name}.sorted"] = col.sorted
+        return arrays, {"size": self.size, "columns": list(columns)}
+
+    @classmethod
+    def from_shared_arrays(cls, arrays: dict, meta: dict) -> "V8321FilterIndex":
+        index = cls.__new__(cls)
+        index.opportunities = None  # worker中只有数值列，captured_details为None
+        index.size = meta["size"]
+        index.profits = arrays["profits"]
+        index.has_consensus_score = arrays["has_consensus_score"]
+        index._advanced = {"is_trend": arrays["advanced_is_trend"]}
+        for name in meta["columns"]:
+            col = _ThresholdColumn.from_sorted(arrays[f"{name}.order"], arrays[f"{name}.sorted"])
+            if name.startswith("advanced_"):
+                index._advanced[name[len("advanced_"):]] = col
+            else:
+                setattr(index, name, col)
+        return index
+
+    def _present(self, name: str) -> np.ndarray:
+        """该字段存在的行（与name in o一致）"""
+        if self._table is not None:
+            return self._table.has(name)
+        return np.fromiter(
+            (name in o for o in self.opportunities), dtype=bool, count=self.size
+        )
+
+    def _field(self, *names: str, default: float = 0.0) -> np.ndarray:
+        """依次取第一个存在的字段（与o.get(a, o.get(b, default))一致）"""
+        if self._table is None:
+            def first(o):
+                for name in names:
+                    if name in o:
+                        return o[name]
+                return default
+
+            return np.array(
+                [float(first(o)) for o in self.opportunities], dtype=np.float64
+            ).reshape(self.size)
+        values = np.full(self.size, default, dtype=np.float64)
+        for name in reversed(names):
+            present = self._table.has(name)
+            if present.any():
+                values = np.where(present, self._table.column(name).astype(np.float64), values)
+        return values
+
+    def _matches(self, name: str, choices: tuple) -> np.ndarray:
+        """字段值在choices中的行（缺失视为不匹配）"""
+        if self._table is not None:
+            mask = np.zeros(self.size, dtype=bool)
+            for choice in choices:
+                mask |= self._table.equals(name, choice)
+            return mask
+        return np.fromiter(
+            (o.get(name) in choices for o in self.opportunities), dtype=bool, count=self.size
+        )
+
+    def _advanced_columns(self) -> dict:
+        """第2-4层过滤字段（按方向取对应的一侧）"""
+        if self._advanced is None:
+            is_long = self._matches("direction", ("long",))
+            ratio = self._field("kline_ctx_bullish_ratio")
+            self._advanced = {
+                "kline_side_ratio": _ThresholdColumn(np.where(is_long, ratio, 1 - ratio)),
+                "price_chg": _ThresholdColumn(np.abs(self._field("kline_ctx_price_chg_pct"))),
+                "is_trend": np.packbits(self._matches("mkt_struct_swing", ("HH-HL", "LL-LH"))),
+                "trend_age": _ThresholdColumn(self._field("mkt_struct_age_hours")),
+                "sr_test_cnt": _ThresholdColumn(
+                    np.where(
+                        is_long,
+                        self._field("support_hist_test_cnt"),
+                        self._field("resist_hist_test_cnt"),
+                    )
+                ),
+                "sr_false_break": _ThresholdColumn(
+                    np.where(
+                        is_long,
+                        self._field("support_hist_false_bd"),
+                        self._field("resist_hist_false_bo"),
+                    )
+                ),
+            }
+        return self._advanced
+
+    def _rows(self, bits: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+    def basic_bits(self, params: dict) -> np.ndarray:
+        """第1层（与passes_basic_filter一致）"""
+        legacy = self.consensus.at_least(params.get("min_consensus", 2))
+        if "min_consensus_score" in params:
+            # 有consensus_score的机会用新版阈值，其余回退到consensus
+            new = self.consensus_score.at_least(params.get("min_consensus_score", 30))
+            consensus = (self.has_consensus_score & new) | (
+                ~self.has_consensus_score & legacy
+            )
+        else:
+            consensus = legacy
+        return (
+            self.signal_score.at_least(params.get("min_signal_score", 50))
+            & consensus
+            & self.risk_reward.at_least(params.get("min_risk_reward", 1.5))
+        )
+
+    def advanced_layers(self, params: dict) -> list[tuple]:
+        """第2-4层 [(missed_reason, bits)]（与passes_*_filter一致）"""
+        cols = self._advanced_columns()
+        kline = cols["kline_side_ratio"].not_below(
+            params.get("min_kline_bullish_ratio", 0.6)
+        ) & cols["price_chg"].not_below(params.get("min_price_chg_pct", 0.5))
+
+        market = cols["trend_age"].not_below(params.get("min_trend_age_hours", 0.5))
+        if params.get("allowed_mkt_struct") == "trend_only":
+            market = market & cols["is_trend"]
+
+        sr = cols["sr_test_cnt"].not_above(
+            params.get("max_sr_test_count", 999)
+        ) & cols["sr_false_break"].not_above(2)
+
+        return [("kline_context", kline), ("market_structure", market), ("sr_history", sr)]
+
+    def captured_rows(self, params: dict) -> tuple:
+        """按过滤顺序计算捕获行号和各层淘汰数
+
+        Returns:
+            (captured_rows, missed_reasons)：missed_reasons的键顺序与逐个过滤时首次出现的顺序一致
+        """
+        passed = self.basic_bits(params)
+        layers = [("basic_params", ~passed)]
+
+        # 【V8.3.21.1修复】高级过滤器默认不启用
+        if params.get("enable_advanced_filters", False):
+            for reason, bits in self.advanced_layers(params):
+                layers.append((reason, passed & ~bits))
+                passed = passed & bits
+
+        missed = []
+        for reason, bits in layers:
+            rows = self._rows(bits)
+            if len(rows):
+                missed.append((int(rows[0]), reason, len(rows)))
+        missed_reasons = {reason: count for _, reason, count in sorted(missed)}
+        return self._rows(passed), missed_reasons
+
+
+def evaluate_params_v8321(opportunities: list[dict], params: dict) -> tuple:
+    """【V8.9.8】Grid Search单组参数评估（模块级函数，供多进程worker调用）
+
+    内存检查（每10组RSS>300MB时GC）由parallel_grid_search在串行循环和worker中统一执行
+
+    Returns:
+        (score, key_metrics)：不返回captured_details，避免大对象回传主进程
+
+    """
+    result = simulate_params_with_v8321_filter(opportunities, params)
+    return calculate_v8321_optimization_score(result), extract_key_metrics(result)
+
+
 def test_params_on_opportunities(opportunities: list[dict], params: dict) -> dict:
     """【V8.4.5】测试参数在机会集上的表现（别名函数）
 
@@ -553,45 +835,24 @@ def simulate_params_with_v8321_filter(opportunities: list[dict], params: dict) -
     4. S/R历史过滤（测试次数、假突破）- 可选
 
     【V8.3.21.1修复】：Layer 2-4默认不启用，避免过度过滤历史数据
-    """
-    captured = []
-    missed_reasons: dict[str, int] = {}
-
-    # 【V8.3.21.1修复】高级过滤器默认不启用
-    enable_advanced_filters = params.get("enable_advanced_filters", False)
-
-    for opp in opportunities:
-        # 第1层：基础过滤（必须）
-        if not passes_basic_filter(opp, params):
-            reason = "basic_params"
-            missed_reasons[reason] = missed_reasons.get(reason, 0) + 1
-            continue
 
-        # 【V8.3.21.1修复】第2-4层：高级过滤（可选，默认不启用）
-        if enable_advanced_filters:
-            # 第2层：K线上下文过滤
-            if not passes_kline_context_filter(opp, params):
-                reason = "kline_context"
-                missed_reasons[reason] = missed_reasons.get(reason, 0) + 1
-                continue
-
-            # 第3层：市场结构过滤
-            if not passes_market_structure_filter(opp, params):
-                reason = "market_structure"
-                missed_reasons[reason] = missed_reasons.get(reason, 0) + 1
-                continue
-
-            # 第4层：S/R历史过滤
-            if not passes_sr_history_filter(opp, params):
-                reason = "sr_history"
-                missed_reasons[reason] = missed_reasons.get(reason, 0) + 1
-                continue
-
-        # 通过所有过滤，记录
-        captured.append(opp)
+    【V8.9.22】opportunities可以是V8321FilterIndex（Grid Search时复用同一个索引），
+    传入列表时临时构建索引；捕获集合与逐个调用passes_*_filter一致
+    【V8.9.20】也可以是OpportunityTable，此时captured_details为捕获行的子表
+    """
+    if not isinstance(opportunities, V8321FilterIndex):
+        opportunities = V8321FilterIndex(opportunities)
+
+    rows, missed_reasons = opportunities.captured_rows(params)
+    # 多进程worker中的索引只有数值列（见V8321FilterIndex.from_shared_arrays）
+    captured = (
+        take_opportunities(opportunities.opportunities, rows)
+        if opportunities.opportunities is not None
+        else None
+    )
 
     # 计算统计指标
-    if len(captured) == 0:
+    if len(rows) == 0:
         return {
             "total_opportunities": len(opportunities),
             "captured_count": 0,
@@ -602,22 +863,14 @@ def simulate_params_with_v8321_filter(opportunities: list[dict], params: dict) -
             "missed_reasons": missed_reasons,
         }
 
-    # 【V8.3.21.1修复】计算利润（兼容不同字段名）
-    # 优先使用actual_profit_pct，如果没有则使用objective_profit
-    profits = []
-    for c in captured:
-        if "actual_profit_pct" in c:
-            profits.append(c["actual_profit_pct"])
-        elif "objective_profit" in c:
-            profits.append(c["objective_profit"])
-        else:
-            profits.append(0)  # 默认值
+    # 【V8.3.21.1修复】计算利润（兼容不同字段名，见get_profit_pct）
+    profits = opportunities.profits[rows]
 
     avg_profit = np.mean(profits) if len(profits) > 0 else 0
 
     # 【V8.3.21风控】分离盈利和亏损
-    wins = [p for p in profits if p > 0]
-    losses = [p for p in profits if p <= 0]
+    wins = profits[profits > 0]
+    losses = profits[profits <= 0]
 
     win_rate = len(wins) / len(profits) if len(profits) > 0 else 0
     avg_win = np.mean(wins) if len(wins) > 0 else 0
@@ -629,20 +882,15 @@ def simulate_params_with_v8321_filter(opportunities: list[dict], params: dict) -
     # 期望收益（考虑胜率和盈亏比）
     expectancy = (win_rate * avg_win) + ((1 - win_rate) * avg_loss)
 
-    # 最大回撤（连续亏损的最大值）
-    max_drawdown = 0
-    cumulative = 0
-    peak = 0
-    for p in profits:
-        cumulative += p
-        peak = max(peak, cumulative)
-        drawdown = peak - cumulative
-        max_drawdown = max(max_drawdown, drawdown)
+    # 最大回撤（连续亏损的最大值，峰值从0起算）
+    cumulative = np.cumsum(profits)
+    peak = np.maximum.accumulate(np.maximum(cumulative, 0))
+    max_drawdown = float((peak - cumulative).max())
 
     return {
         "total_opportunities": len(opportunities),
-        "captured_count": len(captured),
-        "capture_rate": len(captured) / len(opportunities),
+        "captured_count": len(rows),
+        "capture_rate": len(rows) / len(opportunities),
         "avg_profit": avg_profit,
         "win_rate": win_rate,
         "time_exit_rate": 0.5,  # 简化：假设50% time_exit
@@ -812,6 +1060,18 @@ def calculate_param_sensitivity_local(all_results: list[dict]) -> dict:
     return sensitivity
 
 
+# 上下文分析读取的字段（捕获集为列式表时只还原这些列）
+_CONTEXT_FIELDS = (
+    "direction",
+    "kline_ctx_bullish_ratio",
+    "mkt_struct_swing",
+    "support_hist_test_cnt",
+    "resist_hist_test_cnt",
+    "actual_profit_pct",
+    "objective_profit",
+)
+
+
 def analyze_context_features_local(
     opportunities: list[dict], best_params: dict
 ) -> dict:
@@ -825,6 +1085,8 @@ def analyze_context_features_local(
 
     if len(captured) == 0:
         return {"error": "无捕获机会"}
+    if isinstance(captured, OpportunityTable):
+        captured = captured.to_dicts(_CONTEXT_FIELDS)
 
     analysis = {}
 
@@ -1540,3 +1802,84 @@ def translate_insights_to_chinese(insights_en: list[str]) -> list[str]:
 if __name__ == "__main__":
     print("V8.3.21回测优化模块（含AI迭代）")
     print("使用方法：从主程序导入 optimize_params_v8321_lightweight")
+
+    # 【V8.9.22】对照测试：位图索引 vs 逐个调用passes_*_filter
+    rng = np.random.default_rng(3)
+    opps = []
+    for i in range(2000):
+        opp = {
+            "signal_score": float(rng.integers(30, 100)),
+            "consensus": int(rng.integers(0, 5)),
+            "risk_reward": float(rng.uniform(0, 4)),
+            "direction": "long" if i % 2 else "short",
+            "kline_ctx_bullish_ratio": float(rng.uniform(0, 1)),
+            "kline_ctx_price_chg_pct": float(rng.normal(0, 1.5)),
+            "mkt_struct_swing": ["HH-HL", "LL-LH", "range"][i % 3],
+            "mkt_struct_age_hours": float(rng.uniform(0, 3)) if i % 11 else float("nan"),
+            "support_hist_test_cnt": int(rng.integers(0, 8)),
+            "resist_hist_test_cnt": int(rng.integers(0, 8)),
+            "support_hist_false_bd": int(rng.integers(0, 4)),
+            "resist_hist_false_bo": int(rng.integers(0, 4)),
+            "objective_profit": float(rng.normal(0.5, 3)),
+        }
+        if i % 3:
+            opp["consensus_score"] = float(rng.integers(0, 100))
+        if i % 5 == 0:
+            opp["actual_profit_pct"] = float(rng.normal(0, 2))
+        opps.append(opp)
+
+    def legacy_captured(opportunities, params):
+        advanced = params.get("enable_advanced_filters", False)
+        return [
+            o
+            for o in opportunities
+            if passes_basic_filter(o, params)
+            and (
+                not advanced
+                or (
+                    passes_kline_context_filter(o, params)
+                    and passes_market_structure_filter(o, params)
+                    and passes_sr_history_filter(o, params)
+                )
+            )
+        ]
+
+    grid = define_param_grid_v8321("scalping")
+    filter_index = V8321FilterIndex(opps)
+    for params in random_sample_param_grid(grid, 200):
+        for advanced in (False, True):
+            params["enable_advanced_filters"] = advanced
+            expected = legacy_captured(opps, params)
+            result = simulate_params_with_v8321_filter(filter_index, params)
+            assert result["captured_count"] == len(expected)
+            assert all(a is b for a, b in zip(result.get("captured_details", []), expected))
+    print("✅ 位图索引过滤结果与逐个过滤一致")
+
+    # 【V8.9.8】worker从共享数组还原的索引与原索引评估一致（以模块名导入，worker才能按名称找到）
+    import backtest_optimizer_v8321 as module
+    from parallel_grid_search import evaluate_param_grid
+
+    sampled = random_sample_param_grid(grid, 40)
+    for i, params in enumerate(sampled):
+        params["enable_advanced_filters"] = bool(i % 2)
+    serial = [evaluate_params_v8321(filter_index, params) for params in sampled]
+    parallel = evaluate_param_grid(
+        module.V8321FilterIndex(opps), sampled, module.evaluate_params_v8321,
+        max_workers=2, memory_cap_mb=4096,
+    )
+    assert parallel == serial, "共享数组并行评估与串行不一致"
+    print("✅ 共享数组并行评估与串行一致")
+
+    # 【V8.9.20】列式表输入：捕获行、统计和上下文分析与dict列表一致
+    table = OpportunityTable.from_dicts(opps)
+    table_index = V8321FilterIndex(table)
+    check_fields = ("signal_score", "consensus", "direction", "objective_profit")
+    for params in sampled:
+        from_table = simulate_params_with_v8321_filter(table_index, params)
+        from_dicts = simulate_params_with_v8321_filter(filter_index, params)
+        assert from_table.pop("captured_details").to_dicts(check_fields) == [
+            {k: o[k] for k in check_fields} for o in from_dicts.pop("captured_details")
+        ]
+        assert from_table == from_dicts, "列式表过滤结果与dict列表不一致"
+    assert analyze_context_features_local(table, sampled[0]) == analyze_context_features_local(opps, sampled[0])
+    print("✅ 列式表过滤结果与dict列表一致")
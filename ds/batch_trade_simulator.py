@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.7】批量交易模拟器（向量化）
+
+核心功能:
+1. 价格矩阵（机会数 × 未来K线数）+ 每个机会的SL/TP向量 → 一次性得到
+   平仓类型、平仓K线索引、利润（支持多空、max_holding_hours超时平仓）
+2. SL/TP计算向量化：ATR、支撑阻力（波段）、形态（超短线Pin Bar/吞没）三种来源，
+   优先级与_simulate_trade_with_params_enhanced一致
+3. 摘要数据模拟（max_high/min_low/final_close）向量化，与_simulate_with_summary一致；
+   【V8.9.18】机会带future_data["path"]时改用路径矩阵精确模拟
+4. simulate_opportunities_batch: 网格搜索用，调用方用opportunity_arrays构建一次机会数组并
+   显式传入（arrays=），每组参数只做数组运算；不传时每次按当前列表内容重新构建，
+   原地修改过的机会列表不会拿到旧数组
+
+主程序的_simulate_trade_with_params_enhanced直接调用enhanced_levels + simulate_path_batch
+（单个机会即1行矩阵）。逐K线的标量实现_simulate_trade_with_params保留在主程序中作为参照实现，
+原增强版的标量SL/TP优先级逻辑移到_reference_enhanced_levels；check_against_scalar_oracles
+从主程序源码加载参照函数逐项比对（tests/test_batch_trade_simulator.py 与本文件末尾的自检都调用它）。
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 平仓类型编码
+EXIT_NO_ENTRY = 0
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_TIME_EXIT = 3
+EXIT_HOLDING = 4
+EXIT_NO_DATA = 5
+
+EXIT_TYPE_NAMES = {
+    EXIT_NO_ENTRY: "no_entry",
+    EXIT_STOP_LOSS: "stop_loss",
+    EXIT_TAKE_PROFIT: "take_profit",
+    EXIT_TIME_EXIT: "time_exit",
+    EXIT_HOLDING: "holding",
+    EXIT_NO_DATA: "no_data",
+}
+
+# 形态类型编码（与get_pattern_based_tp_sl对应）
+PATTERN_CODES = {
+    "bullish_pin": 1,
+    "bearish_pin": 2,
+    "bullish_engulfing": 3,
+    "bearish_engulfing": 4,
+}
+
+
+def _profit_pct(exit_price, entry, is_long):
+    return np.where(
+        is_long,
+        (exit_price - entry) / entry * 100,
+        (entry - exit_price) / entry * 100,
+    )
+
+
+def effective_atr(entry: np.ndarray, atr: np.ndarray) -> np.ndarray:
+    """atr<=0时按入场价2%估算（与标量实现一致）"""
+    return np.where(atr <= 0, entry * 0.02, atr)
+
+
+def atr_levels(
+    entry: np.ndarray,
+    is_long: np.ndarray,
+    atr: np.ndarray,
+    atr_stop_multiplier: float,
+    atr_tp_multiplier: Optional[float],
+    min_risk_reward: float,
+):
+    """ATR止损止盈（_simulate_trade_with_params的Fallback分支）"""
+    atr = effective_atr(entry, atr)
+    sl_distance = atr * atr_stop_multiplier
+    if atr_tp_multiplier is not None:
+        tp_distance = atr * atr_tp_multiplier
+    else:
+        tp_distance = sl_distance * min_risk_reward
+    stop_loss = np.where(is_long, entry - sl_distance, entry + sl_distance)
+    take_profit = np.where(is_long, entry + tp_distance, entry - tp_distance)
+    return stop_loss, take_profit
+
+
+def pattern_levels(
+    entry: np.ndarray,
+    is_long: np.ndarray,
+    pattern_codes: np.ndarray,
+    pattern_high: np.ndarray,
+    pattern_low: np.ndarray,
+    atr: np.ndarray,
+):
+    """
+    形态止损止盈（向量化get_pattern_based_tp_sl），无效时为NaN
+
+    Args:
+        pattern_codes: PATTERN_CODES编码，0表示无形态
+        pattern_high / pattern_low: 形态K线高低点（缺失时传入场价，与标量默认值一致）
+        atr: 已经过effective_atr处理的ATR
+    """
+    valid = (pattern_high > 0) & (pattern_low > 0) & (pattern_high > pattern_low)
+    stop_loss = np.full(len(entry), np.nan)
+    take_profit = np.full(len(entry), np.nan)
+
+    rules = [
+        # (编码, 方向为多, SL基准为低点, SL倍数, TP倍数)
+        (PATTERN_CODES["bullish_pin"], True, 0.2, 0.5),
+        (PATTERN_CODES["bearish_pin"], False, 0.2, 0.5),
+        (PATTERN_CODES["bullish_engulfing"], True, 0.3, 1.0),
+        (PATTERN_CODES["bearish_engulfing"], False, 0.3, 1.0),
+    ]
+    for code, long_rule, sl_mult, tp_mult in rules:
+        mask = valid & (pattern_codes == code) & (is_long == long_rule)
+        if long_rule:
+            stop_loss = np.where(mask, pattern_low - atr * sl_mult, stop_loss)
+            take_profit = np.where(mask, pattern_high + atr * tp_mult, take_profit)
+        else:
+            stop_loss = np.where(mask, pattern_high + atr * sl_mult, stop_loss)
+            take_profit = np.where(mask, pattern_low - atr * tp_mult, take_profit)
+    return stop_loss, take_profit
+
+
+def enhanced_levels(
+    entry: np.ndarray,
+    is_long: np.ndarray,
+    atr: np.ndarray,
+    atr_stop_multiplier: float,
+    atr_tp_multiplier: Optional[float],
+    min_risk_reward: float,
+    is_swing: np.ndarray,
+    support: Optional[np.ndarray] = None,
+    resistance: Optional[np.ndarray] = None,
+    pattern_codes: Optional[np.ndarray] = None,
+    pattern_high: Optional[np.ndarray] = None,
+    pattern_low: Optional[np.ndarray] = None,
+):
+    """
+    SL/TP计算，优先级与_simulate_trade_with_params_enhanced一致：
+    1. 形态（仅scalping，形态无效时回退ATR）
+    2. 支撑阻力（仅swing，且support/resistance均非0）
+    3. ATR
+
+    support/resistance缺失用0表示（标量实现中的None）。
+    """
+    n = len(entry)
+    atr = effective_atr(entry, atr)
+    zeros = np.zeros(n)
+    support = zeros if support is None else support
+    resistance = zeros if resistance is None else resistance
+
+    # 3. ATR（默认）
+    sl_distance = atr * atr_stop_multiplier
+    tp_distance = atr * (atr_tp_multiplier or atr_stop_multiplier * min_risk_reward)
+    stop_loss = np.where(is_long, entry - sl_distance, entry + sl_distance)
+    take_profit = np.where(is_long, entry + tp_distance, entry - tp_distance)
+
+    # 2. SR Levels（swing）
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tp_mult_sr = atr_tp_multiplier or 6.0
+        sr_margin = atr * 0.3
+        atr_sl_long, atr_tp_long = entry - atr * atr_stop_multiplier, entry + atr * tp_mult_sr
+        atr_sl_short, atr_tp_short = entry + atr * atr_stop_multiplier, entry - atr * tp_mult_sr
+
+        sl_long = np.where(support > 0, support - sr_margin, atr_sl_long)
+        tp_long = np.where(resistance > 0, resistance + sr_margin, atr_tp_long)
+        bad_long = (
+            ((entry - sl_long) <= 0)
+            | ((tp_long - entry) <= 0)
+            | (((tp_long - entry) / (entry - sl_long)) < 1.5)
+        )
+        sl_long = np.where(bad_long, atr_sl_long, sl_long)
+        tp_long = np.where(bad_long, atr_tp_long, tp_long)
+
+        sl_short = np.where(resistance > 0, resistance + sr_margin, atr_sl_short)
+        tp_short = np.where(support > 0, support - sr_margin, atr_tp_short)
+        bad_short = (
+            ((sl_short - entry) <= 0)
+            | ((entry - tp_short) <= 0)
+            | (((entry - tp_short) / (sl_short - entry)) < 1.5)
+        )
+        sl_short = np.where(bad_short, atr_sl_short, sl_short)
+        tp_short = np.where(bad_short, atr_tp_short, tp_short)
+
+    use_sr = is_swing & (support != 0) & (resistance != 0)
+    stop_loss = np.where(use_sr, np.where(is_long, sl_long, sl_short), stop_loss)
+    take_profit = np.where(use_sr, np.where(is_long, tp_long, tp_short), take_profit)
+
+    # 1. 形态（scalping）
+    if pattern_codes is not None:
+        pat_sl, pat_tp = pattern_levels(
+            entry, is_long, pattern_codes, pattern_high, pattern_low, atr
+        )
+        use_pattern = (~is_swing) & (pattern_codes > 0) & ~np.isnan(pat_sl)
+        stop_loss = np.where(use_pattern, pat_sl, stop_loss)
+        take_profit = np.where(use_pattern, pat_tp, take_profit)
+
+    return stop_loss, take_profit
+
+
+def build_price_matrix(future_frames: List, horizon: Optional[int] = None):
+    """
+    把每个机会的future_data（DataFrame）拼成NaN填充的价格矩阵
+
+    high/low列缺失时用close代替（与标量实现的row.get默认值一致）。
+
+    Returns:
+        (highs, lows, closes, lengths)
+    """
+    lengths = np.array([len(f) for f in future_frames], dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    if horizon is not None:
+        width = min(width, horizon)
+        lengths = np.minimum(lengths, horizon)
+
+    highs = np.full((len(future_frames), width), np.nan)
+    lows = np.full((len(future_frames), width), np.nan)
+    closes = np.full((len(future_frames), width), np.nan)
+    for i, frame in enumerate(future_frames):
+        k = lengths[i]
+        if k == 0:
+            continue
+        close = frame["close"].to_numpy(dtype=np.float64)[:k] if "close" in frame else np.zeros(k)
+        closes[i, :k] = close
+        highs[i, :k] = frame["high"].to_numpy(dtype=np.float64)[:k] if "high" in frame else close
+        lows[i, :k] = frame["low"].to_numpy(dtype=np.float64)[:k] if "low" in frame else close
+    return highs, lows, closes, lengths
+
+
+def simulate_path_batch(
+    entry: np.ndarray,
+    is_long: np.ndarray,
+    stop_loss: np.ndarray,
+    take_profit: np.ndarray,
+    highs: np.ndarray,
+    lows: np.ndarray,
+    closes: np.ndarray,
+    lengths: np.ndarray,
+    max_holding_hours: Optional[float] = None,
+    can_entry: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    逐K线路径模拟的向量化版本（与标量实现的iterrows循环一致）
+
+    - 同一根K线先检查止损再检查止盈
+    - high<=0或low<=0的K线跳过
+    - 第max_holding_hours*4根（0起）K线按收盘价超时平仓
+    - 全部K线未触达时按最后一根收盘价计算（holding）
+
+    Returns:
+        {"exit_type": 编码数组, "exit_index": 平仓K线索引(-1无), "profit": 利润%数组}
+    """
+    m, width = highs.shape
+    can_entry = np.ones(m, dtype=bool) if can_entry is None else can_entry
+    max_candles = int(max_holding_hours * 4) if max_holding_hours else None
+
+    cols = np.arange(width)[None, :]
+    in_range = cols < lengths[:, None]
+    if max_candles is not None:
+        in_range &= cols < max_candles
+
+    with np.errstate(invalid="ignore"):
+        valid = in_range & (highs > 0) & (lows > 0)
+        long_col = is_long[:, None]
+        sl_hit = valid & np.where(long_col, lows <= stop_loss[:, None], highs >= stop_loss[:, None])
+        tp_hit = valid & np.where(long_col, highs >= take_profit[:, None], lows <= take_profit[:, None])
+
+    any_hit = sl_hit | tp_hit
+    has_hit = any_hit.any(axis=1)
+    first_hit = np.where(has_hit, any_hit.argmax(axis=1), -1)
+    rows = np.arange(m)
+    hit_is_sl = has_hit & sl_hit[rows, np.maximum(first_hit, 0)]
+
+    # 未触达：超时或持有到最后
+    timed_out = ~has_hit & (max_candles is not None) & (lengths > (max_candles or 0))
+    time_idx = np.full(m, max_candles if max_candles is not None else 0)
+    last_idx = np.maximum(lengths - 1, 0)
+    fallback_idx = np.where(timed_out, time_idx, last_idx)
+    fallback_close = closes[rows, np.minimum(fallback_idx, max(width - 1, 0))] if width else np.zeros(m)
+    fallback_close = np.where(np.isnan(fallback_close), entry, fallback_close)
+
+    exit_price = np.where(
+        has_hit, np.where(hit_is_sl, stop_loss, take_profit), fallback_close
+    )
+    profit = _profit_pct(exit_price, entry, is_long)
+    exit_type = np.where(
+        has_hit,
+        np.where(hit_is_sl, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT),
+        np.where(timed_out, EXIT_TIME_EXIT, EXIT_HOLDING),
+    )
+    exit_index = np.where(has_hit, first_hit, fallback_idx)
+
+    no_data = lengths == 0
+    exit_type = np.where(no_data, EXIT_NO_DATA, exit_type)
+    profit = np.where(no_data, 0.0, profit)
+    exit_type = np.where(can_entry, exit_type, EXIT_NO_ENTRY)
+    profit = np.where(can_entry, profit, 0.0)
+    exit_index = np.where(can_entry & ~no_data, exit_index, -1)
+
+    return {"exit_type": exit_type, "exit_index": exit_index, "profit": profit}
+
+
+def simulate_summary_batch(
+    entry: np.ndarray,
+    is_long: np.ndarray,
+    stop_loss: np.ndarray,
+    take_profit: np.ndarray,
+    max_high: np.ndarray,
+    min_low: np.ndarray,
+    final_close: np.ndarray,
+    max_holding_hours: Optional[float] = None,
+    can_entry: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """摘要数据模拟的向量化版本（与_simulate_with_summary一致：先止损后止盈）"""
+    m = len(entry)
+    can_entry = np.ones(m, dtype=bool) if can_entry is None else can_entry
+
+    with np.errstate(invalid="ignore"):
+        sl_hit = np.where(is_long, min_low <= stop_loss, max_high >= stop_loss)
+        tp_hit = np.where(is_long, max_high >= take_profit, min_low <= take_profit)
+        no_data = (max_high <= 0) | (min_low <= 0)
+
+    exit_price = np.where(sl_hit, stop_loss, np.where(tp_hit, take_profit, final_close))
+    profit = _profit_pct(exit_price, entry, is_long)
+    untouched = EXIT_TIME_EXIT if max_holding_hours else EXIT_HOLDING
+    exit_type = np.where(sl_hit, EXIT_STOP_LOSS, np.where(tp_hit, EXIT_TAKE_PROFIT, untouched))
+
+    exit_type = np.where(no_data, EXIT_NO_DATA, exit_type)
+    profit = np.where(no_data, 0.0, profit)
+    exit_type = np.where(can_entry, exit_type, EXIT_NO_ENTRY)
+    profit = np.where(can_entry, profit, 0.0)
+    return {"exit_type": exit_type, "exit_index": np.full(m, -1), "profit": profit}
+
+
+def opportunity_arrays(opportunities: List[Dict]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    机会列表 → 列数组；future_data不是摘要dict（如DataFrame）时返回None，调用方回退逐个模拟
+
+    全部机会都带future_data["path"]时额外生成highs/lows/closes/lengths路径矩阵。
+    结果是当时列表内容的快照：网格搜索在循环外构建一次，传给simulate_opportunities_batch(arrays=)
+    """
+    summaries = [opp.get("future_data") for opp in opportunities]
+    if not all(isinstance(s, dict) for s in summaries):
+        return None
+
+    entry = np.array([opp["entry_price"] for opp in opportunities], dtype=np.float64)
+    arrays = {
+        "entry": entry,
+        "is_long": np.array([opp["direction"] == "long" for opp in opportunities], dtype=bool),
+        "atr": np.array([opp["atr"] for opp in opportunities], dtype=np.float64),
+        "consensus": np.array([opp["consensus"] for opp in opportunities], dtype=np.float64),
+        "risk_reward": np.array([opp["risk_reward"] for opp in opportunities], dtype=np.float64),
+        "max_high": np.array([s.get("max_high", 0) for s in summaries], dtype=np.float64),
+        "min_low": np.array([s.get("min_low", 0) for s in summaries], dtype=np.float64),
+        "final_close": np.array(
+            [s.get("final_close", e) for s, e in zip(summaries, entry.tolist())],
+            dtype=np.float64,
+        ),
+    }
+    if summaries and all(s.get("path") is not None for s in summaries):
+        from future_path_arena import path_price_matrix
+
+        highs, lows, closes, lengths = path_price_matrix([s["path"] for s in summaries])
+        arrays.update(highs=highs, lows=lows, closes=closes, lengths=lengths)
+    return arrays
+
+
+def simulate_opportunities_batch(
+    opportunities: List[Dict],
+    params: Dict,
+    signal_score: float = 70,
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+) -> Optional[Dict[str, np.ndarray]]:
+    """
+    一组参数下批量模拟所有机会（simulate_params_on_opportunities的向量化内核）
+
+    与逐个调用_simulate_trade_with_params(signal_type=None, market_data=None)结果一致。
+
+    Args:
+        arrays: opportunity_arrays(opportunities)的结果；None时按当前列表内容现场构建
+
+    Returns:
+        {"can_entry", "exit_type", "exit_index", "profit"}；无法向量化时返回None
+    """
+    if arrays is None:
+        arrays = opportunity_arrays(opportunities)
+    if arrays is None:
+        return None
+
+    can_entry = (
+        (signal_score >= params.get("min_signal_score", 60))
+        & (arrays["consensus"] >= params.get("min_indicator_consensus", 2))
+        & (arrays["risk_reward"] >= params.get("min_risk_reward", 1.5))
+    )
+    stop_loss, take_profit = atr_levels(
+        arrays["entry"],
+        arrays["is_long"],
+        arrays["atr"],
+        params.get("atr_stop_multiplier", 1.5),
+        params.get("atr_tp_multiplier", 3.0),
+        params.get("min_risk_reward", 1.5),
+    )
+    if "highs" in arrays:
+        result = simulate_path_batch(
+            arrays["entry"],
+            arrays["is_long"],
+            stop_loss,
+            take_profit,
+            arrays["highs"],
+            arrays["lows"],
+            arrays["closes"],
+            arrays["lengths"],
+            max_holding_hours=params.get("max_holding_hours", 24),
+            can_entry=can_entry,
+        )
+    else:
+        result = simulate_summary_batch(
+            arrays["entry"],
+            arrays["is_long"],
+            stop_loss,
+            take_profit,
+            arrays["max_high"],
+            arrays["min_low"],
+            arrays["final_close"],
+            max_holding_hours=params.get("max_holding_hours", 24),
+            can_entry=can_entry,
+        )
+    result["can_entry"] = can_entry
+    return result
+
+
+def summarize_batch_result(result: Dict[str, np.ndarray], total: int) -> Dict:
+    """按simulate_params_on_opportunities的返回结构汇总（利润按原顺序逐个累加）"""
+    can_entry = result["can_entry"]
+    exit_type = result["exit_type"]
+    captured_count = int(can_entry.sum())
+    total_profit = sum(result["profit"][can_entry].tolist())
+    return {
+        "total_opportunities": total,
+        "captured_count": captured_count,
+        "total_profit": total_profit,
+        "avg_profit": total_profit / captured_count if captured_count > 0 else 0,
+        "time_exit_count": int((can_entry & (exit_type == EXIT_TIME_EXIT)).sum()),
+        "take_profit_count": int((can_entry & (exit_type == EXIT_TAKE_PROFIT)).sum()),
+        "stop_loss_count": int((can_entry & (exit_type == EXIT_STOP_LOSS)).sum()),
+        "capture_rate": captured_count / total if total > 0 else 0,
+    }
+
+
+def _load_scalar_oracles():
+    """从主程序源码中取出标量模拟函数（主程序导入时会连接交易所，不能直接import）"""
+    import ast
+    from pathlib import Path
+
+    names = {
+        "_simulate_trade_with_params_enhanced",
+        "_simulate_trade_with_params",
+        "_simulate_with_summary",
+        "get_pattern_based_tp_sl",
+    }
+    source = (Path(__file__).parent / "deepseek_多币种智能版.py").read_text(encoding="utf-8")
+    tree = ast.parse(source)
+    module = ast.Module(
+        body=[n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in names],
+        type_ignores=[],
+    )
+    namespace: Dict = {"np": np}
+    exec(compile(module, "oracle", "exec"), namespace)
+    return namespace
+
+
+def _reference_enhanced_levels(
+    get_pattern_based_tp_sl,
+    entry_price,
+    direction,
+    atr,
+    atr_stop_multiplier,
+    atr_tp_multiplier,
+    min_risk_reward,
+    signal_type,
+    support=None,
+    resistance=None,
+    pattern_type=None,
+    pattern_data=None,
+):
+    """原_simulate_trade_with_params_enhanced的标量SL/TP计算（对照测试的参照实现）"""
+    if atr <= 0:
+        atr = entry_price * 0.02
+
+    def atr_based(tp_multiplier):
+        sl_distance = atr * atr_stop_multiplier
+        tp_distance = atr * tp_multiplier
+        if direction == "long":
+            return entry_price - sl_distance, entry_price + tp_distance
+        return entry_price + sl_distance, entry_price - tp_distance
+
+    default_tp = atr_tp_multiplier or atr_stop_multiplier * min_risk_reward
+    if pattern_type and pattern_data and signal_type == "scalping":
+        tp_sl = get_pattern_based_tp_sl(entry_price, direction, pattern_type, pattern_data, atr)
+        if tp_sl:
+            return tp_sl["stop_loss"], tp_sl["take_profit"]
+        return atr_based(default_tp)
+
+    if signal_type == "swing" and support and resistance:
+        sr_margin = atr * 0.3
+        fallback_sl, fallback_tp = atr_based(atr_tp_multiplier or 6.0)
+        if direction == "long":
+            stop_loss = (support - sr_margin) if support > 0 else fallback_sl
+            take_profit = (resistance + sr_margin) if resistance > 0 else fallback_tp
+            risk, reward = entry_price - stop_loss, take_profit - entry_price
+        else:
+            stop_loss = (resistance + sr_margin) if resistance > 0 else fallback_sl
+            take_profit = (support - sr_margin) if support > 0 else fallback_tp
+            risk, reward = stop_loss - entry_price, entry_price - take_profit
+        if risk <= 0 or reward <= 0 or reward / risk < 1.5:
+            return fallback_sl, fallback_tp
+        return stop_loss, take_profit
+
+    return atr_based(default_tp)
+
+
+def check_against_scalar_oracles(m: int = 400, horizon: int = 96, seed: int = 3) -> List[str]:
+    """
+    对照测试：向量化批量模拟 vs 主程序中的标量实现（参照实现）
+
+    Returns:
+        不一致项的描述列表（空列表表示全部一致）
+    """
+    import pandas as pd
+
+    oracle = _load_scalar_oracles()
+    rng = np.random.default_rng(seed)
+
+    entry = 100 * np.exp(rng.normal(0, 0.3, m))
+    is_long = rng.random(m) < 0.5
+    atr = entry * rng.uniform(0.002, 0.03, m)
+    atr[:10] = 0  # 覆盖atr<=0分支
+    is_swing = rng.random(m) < 0.5
+    support = np.where(rng.random(m) < 0.7, entry * (1 - rng.uniform(0.001, 0.05, m)), 0.0)
+    resistance = np.where(rng.random(m) < 0.7, entry * (1 + rng.uniform(0.001, 0.05, m)), 0.0)
+    pattern_names = [None, "bullish_pin", "bearish_pin", "bullish_engulfing", "bearish_engulfing"]
+    pattern_idx = rng.integers(0, len(pattern_names), m)
+    pattern_high = entry * (1 + rng.uniform(-0.002, 0.01, m))
+    pattern_low = entry * (1 - rng.uniform(-0.002, 0.01, m))
+
+    frames = []
+    for i in range(m):
+        k = int(rng.integers(0, horizon + 1))
+        close = entry[i] * np.exp(np.cumsum(rng.normal(0, 0.004, k)))
+        frame = pd.DataFrame({
+            "high": close * (1 + rng.random(k) * 0.003),
+            "low": close * (1 - rng.random(k) * 0.003),
+            "close": close,
+        })
+        frame.iloc[: k // 20, 0] = 0  # 覆盖high<=0跳过分支
+        frames.append(frame)
+    highs, lows, closes, lengths = build_price_matrix(frames)
+
+    mismatches = []
+    for stop_mult, tp_mult, hours in [(1.5, 3.0, 24), (1.0, None, 2), (2.5, 10.0, None), (0.8, 1.2, 6)]:
+        sl, tp = enhanced_levels(
+            entry, is_long, atr, stop_mult, tp_mult, 1.5, is_swing, support, resistance,
+            np.array([PATTERN_CODES.get(p, 0) for p in np.array(pattern_names, dtype=object)[pattern_idx]]),
+            pattern_high, pattern_low,
+        )
+        batch = simulate_path_batch(entry, is_long, sl, tp, highs, lows, closes, lengths, hours)
+        for i in range(m):
+            direction = "long" if is_long[i] else "short"
+            signal_type = "swing" if is_swing[i] else "scalping"
+            pattern_type = pattern_names[pattern_idx[i]]
+            pattern_data = {"high": pattern_high[i], "low": pattern_low[i]} if pattern_type else None
+            batch_exit = EXIT_TYPE_NAMES[int(batch["exit_type"][i])]
+
+            # 1. SL/TP：原标量优先级逻辑
+            ref_sl, ref_tp = _reference_enhanced_levels(
+                oracle["get_pattern_based_tp_sl"], entry[i], direction, atr[i], stop_mult, tp_mult, 1.5,
+                signal_type, support[i] or None, resistance[i] or None, pattern_type, pattern_data,
+            )
+            if abs(ref_sl - sl[i]) > 1e-9 or abs(ref_tp - tp[i]) > 1e-9:
+                mismatches.append(f"SL/TP#{i}: {(ref_sl, ref_tp)} vs {(sl[i], tp[i])}")
+
+            # 2. 路径：主程序iterrows实现按同一组SL/TP逐K线模拟（ATR=1，倍数即价格距离）
+            sign = 1 if is_long[i] else -1
+            ref = oracle["_simulate_trade_with_params"](
+                entry[i], direction, 1.0, frames[i], 80, 3, 2.0, 60, 2, 1.5,
+                sign * (entry[i] - sl[i]), sign * (tp[i] - entry[i]), hours,
+            )
+            if ref["exit_type"] != batch_exit or abs(ref["profit"] - batch["profit"][i]) > 1e-9:
+                mismatches.append(f"路径#{i}: {ref} vs {batch_exit} {batch['profit'][i]}")
+
+            # 3. 主程序增强版（调用本模块）的参数映射
+            enhanced = oracle["_simulate_trade_with_params_enhanced"](
+                entry[i], direction, atr[i], frames[i],
+                80, 3, 2.0, 60, 2, 1.5, stop_mult, tp_mult, hours,
+                signal_type, support[i] or None, resistance[i] or None, pattern_type, pattern_data,
+            )
+            if enhanced["exit_type"] != batch_exit or abs(enhanced["profit"] - batch["profit"][i]) > 1e-9:
+                mismatches.append(f"增强版#{i}: {enhanced} vs {batch_exit} {batch['profit'][i]}")
+
+    # 摘要数据路径（simulate_params_on_opportunities）
+    opportunities = [
+        {
+            "entry_price": float(entry[i]),
+            "direction": "long" if is_long[i] else "short",
+            "atr": float(atr[i]),
+            "consensus": int(rng.integers(0, 5)),
+            "risk_reward": float(rng.uniform(0.5, 3)),
+            "future_data": {
+                "max_high": float(np.nanmax(highs[i])) if lengths[i] else 0.0,
+                "min_low": float(np.nanmin(lows[i])) if lengths[i] else 0.0,
+                "final_close": float(closes[i, lengths[i] - 1]) if lengths[i] else float(entry[i]),
+            },
+        }
+        for i in range(m)
+    ]
+    params = {"min_indicator_consensus": 2, "min_risk_reward": 1.2, "atr_stop_multiplier": 1.2,
+              "atr_tp_multiplier": 2.5, "max_holding_hours": 12}
+    batch = simulate_opportunities_batch(opportunities, params)
+    for i, opp in enumerate(opportunities):
+        ref = oracle["_simulate_trade_with_params"](
+            entry_price=opp["entry_price"], direction=opp["direction"], atr=opp["atr"],
+            future_data=opp["future_data"], signal_score=70, consensus=opp["consensus"],
+            risk_reward=opp["risk_reward"], min_signal_score=60, min_consensus=2,
+            min_risk_reward=1.2, atr_stop_multiplier=1.2, atr_tp_multiplier=2.5, max_holding_hours=12,
+        )
+        if ref["exit_type"] != EXIT_TYPE_NAMES[int(batch["exit_type"][i])] or ref["profit"] != batch["profit"][i]:
+            mismatches.append(f"摘要#{i}: {ref} vs {batch['exit_type'][i]} {batch['profit'][i]}")
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    """
+    对照测试：向量化批量模拟 vs 主程序中的标量实现（参照实现）
+    """
+    mismatches = check_against_scalar_oracles()
+    for line in mismatches[:20]:
+        print(f"❌ {line}")
+    assert not mismatches, f"{len(mismatches)}处不一致"
+    print("✅ 对照测试通过: 路径模拟 400×4组参数, 摘要模拟 400个机会")
@@ -12,10 +12,14 @@
 注意：
 - 使用摘要数据模拟，不如逐根K线精确，但性能和内存占用更优
 - 假设价格在max_high/min_low范围内均匀分布（保守估计）
+- 【V8.9.18】future_data带path（未来K线路径）时按首次触达顺序精确判断，
+  并在max_holding_hours处按收盘价超时平仓
 """
 
 import numpy as np
 
+from future_path_arena import simulate_path_levels
+
 
 def calculate_single_actual_profit(
     opportunity: dict,
@@ -160,8 +164,29 @@ def calculate_single_actual_profit(
 
         # 4. 模拟交易结果
         # 【V8.5.2.4.17】改进：使用概率加权方法判断TP/SL触发顺序
+        path = future_data.get("path")
+
+        if path is not None:
+            # 🆕 V8.9.18: 路径数据 → 首次触达的一方先平仓（同一根K线先止损）
+            exit_method, exit_price, _ = simulate_path_levels(
+                path,
+                entry_price,
+                direction == "long",
+                stop_loss,
+                take_profit,
+                max_holding_hours,
+            )
+            if direction == "long":
+                profit_pct = (exit_price - entry_price) / entry_price * 100
+            else:
+                profit_pct = (entry_price - exit_price) / entry_price * 100
 
-        if direction == "long":
+            if debug_mode:
+                print(
+                    f"     退出方式: {exit_method}(path), 退出价: {exit_price:.2f}, 利润: {profit_pct:.2f}%"
+                )
+
+        elif direction == "long":
             # Long: 止损在下方，止盈在上方
             hit_stop_loss = min_low <= stop_loss
             hit_take_profit = max_high >= take_profit
@@ -254,7 +279,13 @@ def calculate_single_actual_profit(
             pass
 
         # 6. 记录退出原因（用于调试）
-        if direction == "long":
+        if path is not None:
+            opportunity["exit_reason"] = (
+                exit_method
+                if exit_method in ("stop_loss", "take_profit")
+                else "time_exit"
+            )
+        elif direction == "long":
             if min_low <= stop_loss:
                 opportunity["exit_reason"] = "stop_loss"
             elif max_high >= take_profit:
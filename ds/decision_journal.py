@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.11】AI决策日志（追加写JSONL + 尾部索引）
+
+核心功能:
+1. ai_decisions.jsonl：每条决策一行，写入只追加一行（O(1)），不再每个周期读入并重写整个JSON
+2. ai_decisions.jsonl.idx：每条记录起始字节偏移（8字节/条，同样只追加），
+   读取最近N条时直接seek到第N条的位置，不解析更早的记录
+3. 记录数超过 保留条数 × AI_DECISION_COMPACT_FACTOR 时压缩一次（只保留最近的保留条数），
+   摊销后每次写入仍为O(1)，保留条数调大不会让写入变慢
+4. 首次使用时自动从旧版ai_decisions.json导入（旧文件保留不动）；
+   读取方在jsonl不存在时回退读旧版JSON
+
+环境变量:
+    AI_DECISION_RETENTION: 保留的决策条数（默认200，约2天）
+    AI_DECISION_COMPACT_FACTOR: 超过保留条数的多少倍时压缩（默认1.5）
+"""
+
+import json
+import os
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+AI_DECISION_RETENTION = int(os.getenv("AI_DECISION_RETENTION", "200"))
+AI_DECISION_COMPACT_FACTOR = float(os.getenv("AI_DECISION_COMPACT_FACTOR", "1.5"))
+
+JOURNAL_NAME = "ai_decisions.jsonl"
+LEGACY_NAME = "ai_decisions.json"
+_OFFSET = struct.Struct("<q")
+
+
+def _atomic_write(path: Path, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _parse_lines(data: bytes) -> List[Dict]:
+    """逐行解析，跳过空行和写到一半的行"""
+    records = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+class DecisionJournal:
+    """
+    单个模型目录下的决策日志
+
+    用法:
+        journal = DecisionJournal(DATA_DIR)
+        journal.append(record)
+        latest = journal.tail(10)
+    """
+
+    def __init__(self, data_dir, retention: Optional[int] = None):
+        self.data_dir = Path(data_dir)
+        self.path = self.data_dir / JOURNAL_NAME
+        self.index_path = self.data_dir / f"{JOURNAL_NAME}.idx"
+        self.legacy_path = self.data_dir / LEGACY_NAME
+        self.retention = retention or AI_DECISION_RETENTION
+        self._lock = threading.Lock()
+        self._count: Optional[int] = None  # 写入方缓存的记录数
+
+    def append(self, record: Dict):
+        """追加一条记录（必要时先导入旧版JSON，超限时压缩）"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if not self.path.exists():
+                self._import_legacy()
+            if self._count is None:
+                self._count = self._index_count()
+
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            with open(self.index_path, "ab") as f:
+                f.write(_OFFSET.pack(offset))
+            self._count += 1
+
+            if self._count > self.retention * AI_DECISION_COMPACT_FACTOR:
+                self._compact_locked()
+
+    def tail(self, limit: int) -> List[Dict]:
+        """最近limit条记录（按时间先后），只读取这部分字节"""
+        if limit <= 0:
+            return []
+        if not self.path.exists():
+            return self._legacy_records()[-limit:]
+
+        offset = self._tail_offset(limit)
+        with open(self.path, "rb") as f:
+            if offset is None:
+                return _parse_lines(f.read())[-limit:]  # 索引不可用时整文件解析
+            f.seek(offset)
+            return _parse_lines(f.read())[-limit:]
+
+    def read_all(self) -> List[Dict]:
+        """全部保留的记录（最多约 保留条数 × 压缩倍数 条）"""
+        if not self.path.exists():
+            return self._legacy_records()
+        with open(self.path, "rb") as f:
+            return _parse_lines(f.read())
+
+    def compact(self):
+        """只保留最近retention条，重写日志和索引"""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        records = self.read_all()[-self.retention:]
+        data, offsets = bytearray(), bytearray()
+        for record in records:
+            offsets += _OFFSET.pack(len(data))
+            data += (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        # 先替换日志再替换索引；读取方会校验偏移，两者短暂不一致时回退整文件解析
+        _atomic_write(self.path, bytes(data))
+        _atomic_write(self.index_path, bytes(offsets))
+        self._count = len(records)
+
+    def _import_legacy(self):
+        records = self._legacy_records()[-self.retention:]
+        if records:
+            print(f"  📦 导入旧版AI决策记录: {len(records)}条 → {self.path.name}")
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        data, offsets = bytearray(), bytearray()
+        for record in records:
+            offsets += _OFFSET.pack(len(data))
+            data += (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        _atomic_write(self.path, bytes(data))
+        _atomic_write(self.index_path, bytes(offsets))
+
+    def _legacy_records(self) -> List[Dict]:
+        if not self.legacy_path.exists():
+            return []
+        try:
+            with open(self.legacy_path, encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return history if isinstance(history, list) else []
+
+    def _index_count(self) -> int:
+        """记录数；索引缺失或与日志不一致时按日志重建索引"""
+        if self.path.exists() and self.path.stat().st_size > 0:
+            torn = self.index_path.exists() and self.index_path.stat().st_size % _OFFSET.size
+            if torn or self._tail_offset(1) is None:
+                self._rebuild_index()
+        try:
+            return self.index_path.stat().st_size // _OFFSET.size
+        except OSError:
+            return 0
+
+    def _rebuild_index(self):
+        offsets, position = bytearray(), 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    offsets += _OFFSET.pack(position)
+                position += len(line)
+        _atomic_write(self.index_path, bytes(offsets))
+
+    def _tail_offset(self, limit: int) -> Optional[int]:
+        """倒数第limit条记录的字节偏移；索引缺失或与日志对不上时返回None"""
+        try:
+            size = self.path.stat().st_size
+            with open(self.index_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                count = f.tell() // _OFFSET.size
+                if count == 0:
+                    return 0 if size == 0 else None
+                start = max(0, count - limit)
+                f.seek(start * _OFFSET.size)
+                (offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+                f.seek((count - 1) * _OFFSET.size)
+                (last,) = _OFFSET.unpack(f.read(_OFFSET.size))
+            if not 0 <= offset <= last < size:
+                return None
+            with open(self.path, "rb") as f:
+                # 每个偏移都应是一行的开头
+                for position in {offset, last}:
+                    if position > 0:
+                        f.seek(position - 1)
+                        if f.read(1) != b"\n":
+                            return None
+            return offset
+        except (OSError, struct.error):
+            return None
+
+
+_JOURNALS: Dict[str, DecisionJournal] = {}
+
+
+def get_journal(data_dir) -> DecisionJournal:
+    """按目录复用DecisionJournal实例（同一进程内共享锁和计数）"""
+    key = str(Path(data_dir).resolve())
+    if key not in _JOURNALS:
+        _JOURNALS[key] = DecisionJournal(data_dir)
+    return _JOURNALS[key]
+
+
+def load_decisions(data_dir, date_prefix: Optional[str] = None) -> List[Dict]:
+    """
+    读取决策记录（jsonl优先，回退旧版JSON）
+
+    Args:
+        date_prefix: 只返回timestamp以此开头的记录（如"2025-11-20"）
+    """
+    records = get_journal(data_dir).read_all()
+    if date_prefix:
+        records = [r for r in records if str(r.get("timestamp", "")).startswith(date_prefix)]
+    return records
+
+
+if __name__ == "__main__":
+    """
+    自检：追加/尾部读取/压缩/旧版导入/索引损坏回退
+    """
+    import shutil
+    import time
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="decision_journal_"))
+    try:
+        legacy = [{"timestamp": f"2025-01-01 00:{i:02d}:00", "actions": [], "i": i} for i in range(50)]
+        with open(tmp_dir / LEGACY_NAME, "w", encoding="utf-8") as f:
+            json.dump(legacy, f, ensure_ascii=False, indent=2)
+
+        journal = DecisionJournal(tmp_dir, retention=300)
+        assert journal.tail(3) == legacy[-3:], "未导入前应回退读取旧版JSON"
+
+        t0 = time.time()
+        for i in range(50, 2000):
+            journal.append({"timestamp": f"2025-01-02 {i // 60:02d}:{i % 60:02d}:00", "思考过程": "多头" * 50, "i": i})
+        t_append = (time.time() - t0) / 1950
+        expected = list(range(2000))[-journal._count:]
+        assert [r["i"] for r in journal.read_all()] == expected
+        assert [r["i"] for r in journal.tail(10)] == expected[-10:]
+        assert journal._count <= 300 * AI_DECISION_COMPACT_FACTOR
+
+        # 索引损坏：tail回退整文件解析，下次写入重建索引
+        with open(journal.index_path, "ab") as f:
+            f.write(b"\x01\x02")
+        assert [r["i"] for r in DecisionJournal(tmp_dir).tail(5)] == expected[-5:]
+        with open(journal.index_path, "wb") as f:
+            f.write(_OFFSET.pack(10**9))
+        fresh = DecisionJournal(tmp_dir, retention=300)
+        assert [r["i"] for r in fresh.tail(5)] == expected[-5:]
+        fresh.append({"i": 2000})
+        assert fresh._tail_offset(1) is not None and fresh.tail(1) == [{"i": 2000}]
+
+        t0 = time.time()
+        for _ in range(200):
+            fresh.tail(10)
+        print(f"✅ 决策日志自检通过: 追加 {t_append * 1e6:.0f}µs/条, tail(10) {(time.time() - t0) / 200 * 1e6:.0f}µs")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -4,7 +4,6 @@ import hmac
 import json
 import os
 import re  # 🔧 V7.6.7: 用于AI响应解析
-import smtplib
 import time
 from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
@@ -1219,8 +1218,9 @@ class OrderExecutor:
     3. 动态价格调整：获取实时盘口价格
     """
 
-    def __init__(self, exchange, config: dict = None):
+    def __init__(self, exchange, config: dict = None, state_cache=None):
         self.exchange = exchange
+        self.state_cache = state_cache  # 🆕 V8.9.25: 交易周期内的交易所状态缓存
         self.config = config or {
             "aggressive_limit_slippage": 0.05,  # 激进限价单滑点0.05%
             "market_order_slippage": 0.2,  # 市价单最大滑点0.2%
@@ -1259,7 +1259,11 @@ class OrderExecutor:
 
         try:
             # 获取初始盘口价格
-            orderbook = self.exchange.fetch_order_book(symbol, limit=5)
+            # 🆕 V8.9.25: 盘口走周期缓存（短时复用，本币种下单后失效）
+            if self.state_cache is not None:
+                orderbook = self.state_cache.order_book(symbol, limit=5)
+            else:
+                orderbook = self.exchange.fetch_order_book(symbol, limit=5)
 
             if side == "buy":
                 if not orderbook.get("asks") or len(orderbook["asks"]) == 0:
@@ -1310,6 +1314,7 @@ class OrderExecutor:
                     )
 
                 # 下单
+                api_rate_limiter.acquire(endpoint="create_order")
                 order = self.exchange.create_limit_order(symbol, side, amount, price)
 
                 # 等待成交
@@ -1317,6 +1322,7 @@ class OrderExecutor:
 
                 # 检查成交状态
                 try:
+                    api_rate_limiter.acquire(endpoint="fetch_order")
                     order_status = self.exchange.fetch_order(order["id"], symbol)
                     filled_amount = float(order_status.get("filled", 0))
 
@@ -1335,11 +1341,13 @@ class OrderExecutor:
                     # 未成交：撤单准备追价
                     if chase_round < max_chases - 1:  # 不是最后一次
                         try:
+                            api_rate_limiter.acquire(endpoint="cancel_order")
                             self.exchange.cancel_order(order["id"], symbol)
                             time.sleep(0.3)  # 给交易所反应时间
                             print("   ⏳ 未成交，撤单并准备追价...")
                         except Exception as cancel_err:
                             # 可能已经成交了
+                            api_rate_limiter.acquire(endpoint="fetch_order")
                             recheck = self.exchange.fetch_order(order["id"], symbol)
                             if recheck["status"] == "closed":
                                 avg_price = recheck.get("average", price)
@@ -1363,12 +1371,14 @@ class OrderExecutor:
             try:
                 # 先撤掉最后一次的限价单
                 try:
+                    api_rate_limiter.acquire(endpoint="cancel_order")
                     self.exchange.cancel_order(order["id"], symbol)
                     time.sleep(0.2)
                 except:
                     pass
 
                 # 市价单
+                api_rate_limiter.acquire(endpoint="create_order")
                 market_order = self.exchange.create_market_order(symbol, side, amount)
                 print("✅ 市价单已提交（兜底）")
                 return market_order
@@ -1411,6 +1421,7 @@ class OrderExecutor:
                 f"📝 带保护的市价单: {side} {amount:.6f} @ ≤{price:.4f} (滑点≤{max_slippage * 100:.2f}%)"
             )
 
+            api_rate_limiter.acquire(endpoint="create_order")
             return self.exchange.create_limit_order(symbol, side, amount, price)
 
         except Exception as e:
@@ -1433,7 +1444,11 @@ class UnifiedOrderExecutor:
     """
 
     def __init__(
-        self, exchange, config: dict = None, use_adaptive_validator: bool = True
+        self,
+        exchange,
+        config: dict = None,
+        use_adaptive_validator: bool = True,
+        state_cache=None,
     ):
         self.exchange = exchange
 
@@ -1447,7 +1462,7 @@ class UnifiedOrderExecutor:
             self.validator = SignalValidator(config)
             print("[UnifiedOrderExecutor] 使用SignalValidator（标准验证）")
 
-        self.executor = OrderExecutor(exchange, config)
+        self.executor = OrderExecutor(exchange, config, state_cache=state_cache)
         self.config = config or {}
 
         # 执行日志
@@ -1585,6 +1600,7 @@ class UnifiedOrderExecutor:
             # 止损：立即市价单
             print("⚡ 止损快速通道: 市价单")
             try:
+                api_rate_limiter.acquire(endpoint="create_order")
                 order = self.exchange.create_market_order(symbol, side, amount)
                 return {
                     "success": True,
@@ -1942,90 +1958,8 @@ class RuntimeStateManager:
 # ==================== 【V8.7.4】API限频器 ====================
 
 
-class APIRateLimiter:
-    """🆕 V8.7.4: 全局API请求频率控制器（令牌桶算法）
-
-    核心功能：
-    1. 请求计数：追踪每分钟的请求次数和权重
-    2. 自动限流：超限时自动阻塞等待
-    3. 权重感知：不同API调用消耗不同权重
-
-    币安API限制：
-    - 请求频率：1200次/分钟
-    - 权重限制：6000权重/分钟
-
-    权重示例：
-    - 下单/撤单：1权重
-    - 查询订单：2权重
-    - 查询持仓：5权重
-
-    交易员建议：避免触发Rate Limit导致封号
-    """
-
-    def __init__(
-        self, max_requests_per_minute: int = 1200, weight_limit_per_minute: int = 6000
-    ):
-        import threading
-
-        self.max_requests = max_requests_per_minute
-        self.weight_limit = weight_limit_per_minute
-
-        self.request_count = 0
-        self.weight_count = 0
-        self.window_start = time.time()
-        self.lock = threading.Lock()
-
-        print(
-            f"🚦 [API限频器] 已启动: {max_requests_per_minute}次/分, "
-            f"{weight_limit_per_minute}权重/分"
-        )
-
-    def acquire(self, weight: int = 1):
-        """请求许可（阻塞直到获得）"""
-        with self.lock:
-            now = time.time()
-
-            # 每分钟重置
-            if now - self.window_start >= 60:
-                self.request_count = 0
-                self.weight_count = 0
-                self.window_start = now
-
-            # 检查是否超限
-            if (
-                self.request_count >= self.max_requests
-                or self.weight_count + weight > self.weight_limit
-            ):
-                # 计算需要等待的时间
-                wait_time = 60 - (now - self.window_start)
-                if wait_time > 0:
-                    req_msg = f"请求{self.request_count}/{self.max_requests}"
-                    weight_msg = f"权重{self.weight_count}/{self.weight_limit}"
-                    print(f"⏳ [API限频] {req_msg}, {weight_msg}, 等待{wait_time:.1f}s")
-                    time.sleep(wait_time)
-
-                # 重置
-                self.request_count = 0
-                self.weight_count = 0
-                self.window_start = time.time()
-
-            # 计数
-            self.request_count += 1
-            self.weight_count += weight
-
-    def get_status(self) -> dict:
-        """获取当前状态"""
-        with self.lock:
-            elapsed = time.time() - self.window_start
-            return {
-                "request_count": self.request_count,
-                "weight_count": self.weight_count,
-                "max_requests": self.max_requests,
-                "weight_limit": self.weight_limit,
-                "elapsed_seconds": elapsed,
-                "requests_remaining": self.max_requests - self.request_count,
-                "weight_remaining": self.weight_limit - self.weight_count,
-            }
+# 🆕 V8.9.26: 滑动窗口限频器（接口权重表、锁外等待、asyncio、响应头校准）迁至独立模块
+from api_rate_limiter import APIRateLimiter
 
 
 # ==================== 【V8.8】TP/SL精确计算器 ====================
@@ -2703,7 +2637,25 @@ execution_config = {
     **ORDER_EXECUTION_CONFIG.get("slippage_control", {}),
     **ORDER_EXECUTION_CONFIG.get("execution_strategy", {}),
 }
-order_executor = UnifiedOrderExecutor(exchange, execution_config)
+
+# 🆕 V8.9.3: 全局API限频器（并发行情获取共用）
+api_rate_limiter = APIRateLimiter()
+
+# 🆕 V8.9.25: 交易周期内的交易所状态缓存（余额/持仓/挂单/条件单/盘口）
+from exchange_state_cache import ExchangeStateCache
+
+exchange_state = ExchangeStateCache(
+    exchange,
+    rate_limiter=api_rate_limiter,
+    # fetch_papi_conditional_orders定义在后面，调用时再查找
+    conditional_orders_fetcher=lambda binance_symbol: fetch_papi_conditional_orders(
+        binance_symbol
+    ),
+)
+
+order_executor = UnifiedOrderExecutor(
+    exchange, execution_config, state_cache=exchange_state
+)
 print(
     f"✅ V8.7订单执行优化器已初始化 (优化{'启用' if execution_config.get('enabled', True) else '禁用'})"
 )
@@ -2714,6 +2666,33 @@ print(
     f"✅ V8.8投资组合风控已初始化 (风控{'启用' if PORTFOLIO_RISK_CONFIG.get('enabled', True) else '禁用'}, 总敞口上限{PORTFOLIO_RISK_CONFIG['max_total_exposure_multiplier']}x)"
 )
 
+# 🆕 V8.9.4: 增量K线仓库（每轮只拉取新收盘的K线）
+from ohlcv_candle_store import OHLCVCandleStore
+
+ohlcv_candle_store = OHLCVCandleStore()
+
+# 🆕 V8.9.5: 增量指标引擎（EMA/MACD/RSI/ATR状态随K线收盘逐根更新）
+from incremental_indicators import IncrementalIndicatorEngine
+
+incremental_indicator_engine = IncrementalIndicatorEngine()
+
+# 🆕 V8.9.3: 并发行情获取配置
+MARKET_DATA_FETCH_CONFIG = {
+    "max_workers": int(os.getenv("MARKET_DATA_FETCH_WORKERS", "8")),  # 线程池上限
+    "max_retries": 2,  # 单个请求/币种最多重试2次
+    "retry_delay": 1,  # 重试延迟1秒
+    "use_candle_store": os.getenv("USE_CANDLE_STORE", "true").lower()
+    == "true",  # 🆕 V8.9.4: 增量K线仓库
+}
+
+# 🆕 V8.9.27: 流式AI决策配置
+STREAMING_DECISION_CONFIG = {
+    "enabled": os.getenv("USE_STREAMING_DECISION", "true").lower()
+    == "true",  # 流式调用 + 增量解析actions
+    "early_close": os.getenv("STREAMING_EARLY_CLOSE", "true").lower()
+    == "true",  # 解析到CLOSE即提前平仓（不等完整响应）
+}
+
 
 # 🆕 V8.7: 辅助函数 - 智能订单执行
 def smart_create_order(
@@ -2740,10 +2719,12 @@ def smart_create_order(
         订单对象
 
     """
+    # 🆕 V8.9.26: 下单权重在每个实际请求处计入限频器（优化器内部的限价/撤单/追价同样逐次申请）
     try:
         # 检查是否启用优化
         if not execution_config.get("enabled", True):
             # 优化未启用，使用传统市价单
+            api_rate_limiter.acquire(endpoint="create_order")
             return exchange.create_market_order(
                 symbol, side, amount, params=params or {}
             )
@@ -2755,11 +2736,13 @@ def smart_create_order(
                 reference_price = ticker.get("last", 0)
                 if reference_price <= 0:
                     # 如果无法获取有效价格，回退到市价单
+                    api_rate_limiter.acquire(endpoint="create_order")
                     return exchange.create_market_order(
                         symbol, side, amount, params=params or {}
                     )
             except Exception:
                 # 获取价格失败，回退到市价单
+                api_rate_limiter.acquire(endpoint="create_order")
                 return exchange.create_market_order(
                     symbol, side, amount, params=params or {}
                 )
@@ -2793,12 +2776,17 @@ def smart_create_order(
             return result["order"]
         # 优化器执行失败，回退到传统市价单
         print(f"  ⚠️ 优化器执行失败({result['reason']})，使用传统市价单")
+        api_rate_limiter.acquire(endpoint="create_order")
         return exchange.create_market_order(symbol, side, amount, params=params or {})
 
     except Exception as e:
         # 任何异常都回退到传统市价单
         print(f"  ⚠️ 智能执行异常({e!s})，使用传统市价单")
+        api_rate_limiter.acquire(endpoint="create_order")
         return exchange.create_market_order(symbol, side, amount, params=params or {})
+    finally:
+        # 🆕 V8.9.25: 本程序下单后，周期内的余额/持仓/挂单快照失效
+        exchange_state.invalidate(symbol)
 
 
 # ==================== V7.6.5: 信号分级配置 ====================
@@ -2906,9 +2894,12 @@ SYMBOL_PROFILES = {
 DATA_DIR = Path(__file__).parent / "trading_data" / "deepseek"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 TRADES_FILE = DATA_DIR / "trades_history.csv"
+# 【V8.9.12】CSV由交易账本延迟导出，进程内读交易记录先导出待导出的改动
+from trade_ledger import read_trades_csv
 POSITIONS_FILE = DATA_DIR / "current_positions.csv"
 STATUS_FILE = DATA_DIR / "system_status.json"
-AI_DECISIONS_FILE = DATA_DIR / "ai_decisions.json"  # AI决策历史
+AI_DECISIONS_FILE = DATA_DIR / "ai_decisions.json"  # AI决策历史（旧版，只读导入）
+AI_DECISIONS_JOURNAL = DATA_DIR / "ai_decisions.jsonl"  # 【V8.9.11】AI决策日志（追加写）
 PNL_HISTORY_FILE = DATA_DIR / "pnl_history.csv"  # 盈亏历史
 CHAT_HISTORY_FILE = DATA_DIR / "chat_history.json"  # 聊天记录
 LEARNING_CONFIG_FILE = DATA_DIR / "learning_config.json"  # 学习参数
@@ -2957,62 +2948,27 @@ def send_bark_notification(title, content):
             print("⚠️ 没有配置Bark推送地址，跳过推送")
             return
 
-        success_count = 0
-        fail_count = 0
+        # 【V8.9.16】交给后台通知线程发送（每个设备单独重试），调用方立即返回，不再阻塞交易循环
+        from notification_dispatcher import bark_sender, dispatch
 
+        # URL编码标题和内容，支持中文
+        encoded_title = quote(title)
+        encoded_content = quote(content)
+        queued = 0
         for idx, bark_key in enumerate(bark_keys, 1):
-            try:
-                # URL编码标题和内容，支持中文
-                encoded_title = quote(title)
-                encoded_content = quote(content)
-
-                # 添加group参数，将推送归类到"DeepSeek"文件夹
-                url = f"https://api.day.app/{bark_key}/{encoded_title}/{encoded_content}?group=DeepSeek"
-
-                # 🔧 V7.7.0.16: 检查URL长度
-                if len(url) > 1800:  # 预留一些安全余量
-                    print(f"[Bark推送] 设备{idx}: ⚠️ URL过长({len(url)}字符)，可能失败")
-
-                print(f"[Bark推送] 设备{idx}: 正在发送到 {bark_key[:8]}...")
-
-                response = requests.get(url, timeout=10)
-
-                print(f"[Bark推送] 设备{idx}: 响应状态码 {response.status_code}")
-
-                if response.status_code == 200:
-                    success_count += 1
-                    print(f"[Bark推送] 设备{idx}: ✅ 推送成功")
-                else:
-                    fail_count += 1
-                    print(
-                        f"[Bark推送] 设备{idx}: ❌ 推送失败 - 状态码 {response.status_code}"
-                    )
-                    print(f"[Bark推送] 设备{idx}: 响应内容: {response.text[:200]}")
+            # 添加group参数，将推送归类到"DeepSeek"文件夹
+            url = f"https://api.day.app/{bark_key}/{encoded_title}/{encoded_content}?group=DeepSeek"
 
-            except requests.exceptions.Timeout:
-                fail_count += 1
-                print(f"[Bark推送] 设备{idx}: ❌ 请求超时 ({bark_key[:8]}...)")
-            except requests.exceptions.RequestException as e:
-                fail_count += 1
-                print(
-                    f"[Bark推送] 设备{idx}: ❌ 网络错误 ({bark_key[:8]}...): {str(e)[:100]}"
-                )
-            except Exception as e:
-                fail_count += 1
-                print(
-                    f"[Bark推送] 设备{idx}: ❌ 未知错误 ({bark_key[:8]}...): {str(e)[:100]}"
-                )
+            # 🔧 V7.7.0.16: 检查URL长度
+            if len(url) > 1800:  # 预留一些安全余量
+                print(f"[Bark推送] 设备{idx}: ⚠️ URL过长({len(url)}字符)，可能失败")
 
-        print(
-            f"[Bark推送] 推送完成: 成功 {success_count}/{len(bark_keys)}, 失败 {fail_count}/{len(bark_keys)}"
-        )
+            label = f"设备{idx}({bark_key[:8]}...)"
+            # 相同设备+相同内容在短时间内只推送一次（合并连续重复的告警）
+            if dispatch("bark", bark_sender(url, label), label, key=(bark_key, title, content)):
+                queued += 1
 
-        if success_count > 0:
-            print(
-                f"✓ Bark通知已发送到 {success_count}/{len(bark_keys)} 个设备: {title}"
-            )
-        else:
-            print("✗ Bark通知全部失败！请检查网络或Bark Key配置")
+        print(f"[Bark推送] 已加入发送队列: {queued}/{len(bark_keys)} 个设备")
 
     except Exception as e:
         print(f"✗ Bark推送函数异常: {e}")
@@ -3053,23 +3009,17 @@ def send_email_notification(subject, body_html, model_name="DeepSeek"):
         html_part = MIMEText(body_html, "html", "utf-8")
         msg.attach(html_part)
 
-        # 发送邮件
-        smtp_server = str(email_config["smtp_server"])
-        smtp_port = int(email_config["smtp_port"])
-        username = str(email_config["username"])
-        password = str(email_config["password"])
-
-        if email_config["use_ssl"]:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=30)
-        else:
-            server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
-
-        server.login(username, password)
-        server.send_message(msg)
-        server.quit()
+        # 【V8.9.16】交给后台通知线程发送（复用SMTP会话，失败自动重试），调用方立即返回
+        from notification_dispatcher import dispatch, email_sender
 
-        print(f"[邮件通知] ✅ 邮件发送成功: {subject}")
-        return True
+        queued = dispatch(
+            "email",
+            email_sender(msg, email_config),
+            f"邮件[{subject}]",
+            key=(msg["Subject"], hash(body_html)),
+        )
+        print(f"[邮件通知] {'已加入发送队列' if queued else '❌ 未能加入发送队列'}: {subject}")
+        return queued
 
     except Exception as e:
         print(f"[邮件通知] ❌ 邮件发送失败: {e}")
@@ -3080,282 +3030,99 @@ def send_email_notification(subject, body_html, model_name="DeepSeek"):
 
 
 def save_open_position(trade_info):
-    """保存开仓记录（新增）- 加固版"""
-    import fcntl
-    import shutil
-
-    # 定义标准列顺序，确保一致性
-    STANDARD_COLUMNS = [
-        "开仓时间",
-        "平仓时间",
-        "币种",
-        "方向",
-        "数量",
-        "开仓价格",
-        "平仓价格",
-        "仓位(U)",
-        "杠杆率",
-        "止损",
-        "止盈",
-        "盈亏比",
-        "盈亏(U)",
-        "开仓理由",
-        "平仓理由",
-        "信号分数",
-        "共振指标数",
-    ]
-
-    max_retries = 3
-    for attempt in range(max_retries):
-        lock_file = None
-        try:
-            # 1. 创建文件锁，避免并发写入
-            lock_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.lock"
-            lock_file = open(lock_path, "w")
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-            # 2. 创建备份（如果文件存在）
-            if TRADES_FILE.exists():
-                backup_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.backup"
-                shutil.copy2(TRADES_FILE, backup_path)
-
-            # 3. 创建新数据DataFrame，确保列顺序正确
-            df_new = pd.DataFrame([trade_info])
-            # 按标准列顺序重新排列
-            df_new = df_new.reindex(columns=STANDARD_COLUMNS)
-
-            # 4. 读取现有数据（如果存在）
-            if TRADES_FILE.exists():
-                df_existing = pd.read_csv(TRADES_FILE, encoding="utf-8")
-                # 清理列名中的空格和BOM字符
-                df_existing.columns = df_existing.columns.str.strip().str.replace(
-                    "\ufeff", ""
-                )
-                # 确保列顺序一致
-                df_existing = df_existing.reindex(columns=STANDARD_COLUMNS)
-                # 合并数据（移除空行避免FutureWarning）
-                df_combined = pd.concat(
-                    [df_existing.dropna(how="all"), df_new.dropna(how="all")],
-                    ignore_index=True,
-                )
-            else:
-                df_combined = df_new
-
-            # 5. 保存到CSV（使用临时文件，然后重命名，确保原子操作）
-            temp_file = TRADES_FILE.parent / f"{TRADES_FILE.name}.tmp"
-            df_combined.to_csv(temp_file, index=False, encoding="utf-8")
-
-            # 6. 原子性替换文件
-            temp_file.replace(TRADES_FILE)
-
-            print(f"✓ 开仓记录已保存: {TRADES_FILE}")
-
-            # 7. 释放文件锁
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-            lock_file.close()
+    """保存开仓记录（新增）
 
-            # 成功，跳出重试循环
-            break
-
-        except BlockingIOError:
-            # 文件被锁定，等待后重试
-            print(f"⚠️ 文件被锁定，等待重试 (尝试 {attempt + 1}/{max_retries})")
-            if lock_file:
-                lock_file.close()
-            import time
-
-            time.sleep(0.5)
-            continue
-
-        except Exception as e:
-            print(f"✗ 保存开仓记录失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            import traceback
-
-            traceback.print_exc()
-
-            # 如果有备份，尝试恢复
-            backup_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.backup"
-            if backup_path.exists() and attempt == max_retries - 1:
-                print("⚠️ 尝试从备份恢复...")
-                try:
-                    shutil.copy2(backup_path, TRADES_FILE)
-                    print("✓ 已从备份恢复")
-                except Exception:
-                    pass
-
-            # 清理锁
-            if lock_file:
-                try:
-                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                    lock_file.close()
-                except Exception:
-                    pass
+    【V8.9.12】写入SQLite交易账本（单条INSERT，不再读改写整个CSV），
+    trades_history.csv由账本导出，其他读取方不受影响
+    """
+    from trade_ledger import get_ledger
 
-            # 最后一次尝试失败，不再重试
-            if attempt == max_retries - 1:
-                print(f"✗ 保存开仓记录失败，已尝试 {max_retries} 次")
-                # 抛出异常，让上层知道保存失败
-                raise
-            import time
+    try:
+        get_ledger(TRADES_FILE).record_open(trade_info)
+        print(f"✓ 开仓记录已保存: {TRADES_FILE}")
+    except Exception as e:
+        print(f"✗ 保存开仓记录失败: {e}")
+        import traceback
 
-            time.sleep(0.5)
-            continue
+        traceback.print_exc()
+        # 抛出异常，让上层知道保存失败
+        raise
 
 
 def update_close_position(
     coin_name, side, close_time, close_price, pnl, close_reason, close_pct=100
 ):
-    """更新平仓记录（找到对应的开仓记录并更新）- 支持分批平仓"""
-    import fcntl
-    import shutil
-
-    max_retries = 3
-    for attempt in range(max_retries):
-        lock_file = None
-        try:
-            # 1. 检查文件是否存在
-            if not TRADES_FILE.exists():
-                print("✗ 交易记录文件不存在")
-                return
+    """更新平仓记录（找到对应的开仓记录并更新）- 支持分批平仓
 
-            # 2. 创建文件锁，避免并发写入
-            lock_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.lock"
-            lock_file = open(lock_path, "w")
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-            # 3. 创建备份
-            backup_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.backup"
-            shutil.copy2(TRADES_FILE, backup_path)
-
-            # 4. 读取现有数据
-            df = pd.read_csv(TRADES_FILE, encoding="utf-8")
-            # 清理列名中的空格和BOM字符
-            df.columns = df.columns.str.strip().str.replace("\ufeff", "")
+    【V8.9.12】在交易账本中按(币种, 方向, 未平仓)索引定位最后一条记录并更新
+    """
+    from trade_ledger import get_ledger
 
-            # 5. 找到该币种、该方向、未平仓的最后一条记录
-            mask = (
-                (df["币种"] == coin_name)
-                & (df["方向"] == side)
-                & (df["平仓时间"].isna())
-            )
-            matching_rows = df[mask]
+    try:
+        ledger = get_ledger(TRADES_FILE)
+        closed = ledger.record_close(
+            coin_name, side, close_time, close_price, pnl, close_reason, close_pct
+        )
 
-            if matching_rows.empty:
-                print(f"⚠️ 未找到 {coin_name} {side} 的开仓记录")
-                
-                # 🆕 V8.8.1: 检查是否已经有已平仓记录（可能是重复平仓或被SL/TP触发）
-                closed_mask = (
-                    (df["币种"] == coin_name)
-                    & (df["方向"] == side)
-                    & (df["平仓时间"].notna())
-                )
-                recent_closed = df[closed_mask].tail(3)
-                
-                if not recent_closed.empty:
-                    print(f"   💡 发现最近的已平仓记录:")
-                    for idx, row in recent_closed.iterrows():
-                        open_t = str(row.get('开仓时间', ''))[:16]
-                        close_t = str(row.get('平仓时间', ''))[:16]
-                        reason = str(row.get('平仓理由', ''))[:50]
-                        print(f"      - {open_t} → {close_t}: {reason}")
-                    print(f"   可能原因: 1) 已被止盈/止损自动平仓; 2) 持仓来自其他程序; 3) 重复平仓")
-                else:
-                    print(f"   💡 CSV中无任何 {coin_name} {side} 记录，可能是从其他程序开的仓")
-                
-                # 释放锁
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                lock_file.close()
-                return
+        if closed is None:
+            print(f"⚠️ 未找到 {coin_name} {side} 的开仓记录")
 
-            # 6. 处理平仓记录
-            last_idx = matching_rows.index[-1]
-            original_row = df.loc[last_idx].copy()
+            # 🆕 V8.8.1: 检查是否已经有已平仓记录（可能是重复平仓或被SL/TP触发）
+            recent_closed = ledger.recent_closed(coin_name, side, limit=3)
 
-            if close_pct >= 100:
-                # 完全平仓：直接更新记录
-                df.at[last_idx, "平仓时间"] = close_time
-                df.at[last_idx, "平仓价格"] = close_price
-                df.at[last_idx, "盈亏(U)"] = pnl
-                df.at[last_idx, "平仓理由"] = close_reason
+            if recent_closed:
+                print(f"   💡 发现最近的已平仓记录:")
+                for row in recent_closed:
+                    open_t = str(row.get('开仓时间', ''))[:16]
+                    close_t = str(row.get('平仓时间', ''))[:16]
+                    reason = str(row.get('平仓理由', ''))[:50]
+                    print(f"      - {open_t} → {close_t}: {reason}")
+                print(f"   可能原因: 1) 已被止盈/止损自动平仓; 2) 持仓来自其他程序; 3) 重复平仓")
             else:
-                # 分批平仓：创建一条已平仓记录，保留一条未平仓记录
-                # 更新当前记录为已平仓（代表平掉的部分）
-                df.at[last_idx, "平仓时间"] = close_time
-                df.at[last_idx, "平仓价格"] = close_price
-                df.at[last_idx, "盈亏(U)"] = pnl
-                df.at[last_idx, "平仓理由"] = close_reason
-
-                # 创建新记录代表剩余仓位（复制原记录，清空平仓信息）
-                remaining_row = original_row.copy()
-                remaining_row["平仓时间"] = pd.NA
-                remaining_row["平仓价格"] = pd.NA
-                remaining_row["盈亏(U)"] = pd.NA
-                remaining_row["平仓理由"] = pd.NA
-                remaining_row["开仓理由"] = (
-                    original_row["开仓理由"] + f" [剩余{100 - close_pct:.0f}%]"
-                )
-
-                # 将新记录追加到DataFrame
-                df = pd.concat([df, pd.DataFrame([remaining_row])], ignore_index=True)
-                print(f"  📝 已创建剩余{100 - close_pct:.0f}%仓位的新记录")
-
-            # 7. 保存到临时文件，然后原子性替换
-            temp_file = TRADES_FILE.parent / f"{TRADES_FILE.name}.tmp"
-            df.to_csv(temp_file, index=False, encoding="utf-8")
-            temp_file.replace(TRADES_FILE)
-
-            print(f"✓ 平仓记录已更新: {TRADES_FILE}")
-
-            # 8. 释放文件锁
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-            lock_file.close()
-
-            # 成功，跳出重试循环
-            break
+                print(f"   💡 CSV中无任何 {coin_name} {side} 记录，可能是从其他程序开的仓")
+            return
 
-        except BlockingIOError:
-            # 文件被锁定，等待后重试
-            print(f"⚠️ 文件被锁定，等待重试 (尝试 {attempt + 1}/{max_retries})")
-            if lock_file:
-                lock_file.close()
-            import time
+        if close_pct < 100:
+            print(f"  📝 已创建剩余{100 - close_pct:.0f}%仓位的新记录")
 
-            time.sleep(0.5)
-            continue
+        print(f"✓ 平仓记录已更新: {TRADES_FILE}")
 
-        except Exception as e:
-            print(f"✗ 更新平仓记录失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            import traceback
+    except Exception as e:
+        print(f"✗ 更新平仓记录失败: {e}")
+        import traceback
 
-            traceback.print_exc()
+        traceback.print_exc()
+        # 抛出异常，让上层知道更新失败
+        raise
 
-            # 如果有备份，尝试恢复
-            backup_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.backup"
-            if backup_path.exists() and attempt == max_retries - 1:
-                print("⚠️ 尝试从备份恢复...")
-                try:
-                    shutil.copy2(backup_path, TRADES_FILE)
-                    print("✓ 已从备份恢复")
-                except Exception:
-                    pass
 
-            # 清理锁
-            if lock_file:
-                try:
-                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                    lock_file.close()
-                except Exception:
-                    pass
+def fetch_papi_conditional_orders(binance_symbol: str = None) -> list:
+    """🆕 V8.9.25: 查询papi条件单（止盈止损策略单）
 
-            # 最后一次尝试失败
-            if attempt == max_retries - 1:
-                print(f"✗ 更新平仓记录失败，已尝试 {max_retries} 次")
-                # 抛出异常，让上层知道更新失败
-                raise
-            import time
+    Args:
+        binance_symbol: BTCUSDT格式；None表示全部币种（一次请求，供exchange_state批量缓存）
 
-            time.sleep(0.5)
-            continue
+    Returns:
+        papi原始条件单列表（HTTP非200时抛出异常）
+    """
+    params = {"timestamp": int(time.time() * 1000)}
+    if binance_symbol:
+        params["symbol"] = binance_symbol
+
+    query_string = urlencode(sorted(params.items()))
+    signature = hmac.new(
+        exchange.secret.encode("utf-8"),
+        query_string.encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+
+    url = f"https://papi.binance.com/papi/v1/um/conditional/openOrders?{query_string}&signature={signature}"
+    headers = {"X-MBX-APIKEY": exchange.apiKey}
+    response = requests.get(url, headers=headers, timeout=10)
+    api_rate_limiter.record_headers(response.headers)  # 🆕 V8.9.26: 用实际已用权重校准限频器
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code} - {response.text[:100]}")
+    return response.json()
 
 
 def fetch_tpsl_orders_for_positions(symbol: str) -> dict:
@@ -3371,52 +3138,29 @@ def fetch_tpsl_orders_for_positions(symbol: str) -> dict:
         }
     """
     try:
-        import requests
-        import hmac
-        import hashlib
-        from urllib.parse import urlencode
-        
         # 转换symbol格式
         binance_symbol = symbol.split("/")[0] + symbol.split(":")[0].split("/")[1]
-        timestamp = int(time.time() * 1000)
-        
-        params = {
-            "symbol": binance_symbol,
-            "timestamp": timestamp,
+
+        # 🆕 V8.9.25: 条件单从周期快照读取（全部币种一次拉取，不再每个持仓单独请求）
+        orders = exchange_state.conditional_orders(symbol)
+
+        sl_price = None
+        tp_price = None
+
+        for order in orders:
+            if order.get('reduceOnly') and order.get('symbol') == binance_symbol:
+                strategy_type = order.get('strategyType', '')
+                stop_price = float(order.get('stopPrice', 0))
+
+                if strategy_type == 'STOP_MARKET' and stop_price > 0:
+                    sl_price = stop_price
+                elif strategy_type == 'TAKE_PROFIT_MARKET' and stop_price > 0:
+                    tp_price = stop_price
+
+        return {
+            'stop_loss': sl_price,
+            'take_profit': tp_price
         }
-        
-        query_string = urlencode(sorted(params.items()))
-        signature = hmac.new(
-            exchange.secret.encode("utf-8"),
-            query_string.encode("utf-8"),
-            hashlib.sha256,
-        ).hexdigest()
-        
-        url = f"https://papi.binance.com/papi/v1/um/conditional/openOrders?{query_string}&signature={signature}"
-        headers = {"X-MBX-APIKEY": exchange.apiKey}
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            orders = response.json()
-            
-            sl_price = None
-            tp_price = None
-            
-            for order in orders:
-                if order.get('reduceOnly') and order.get('symbol') == binance_symbol:
-                    strategy_type = order.get('strategyType', '')
-                    stop_price = float(order.get('stopPrice', 0))
-                    
-                    if strategy_type == 'STOP_MARKET' and stop_price > 0:
-                        sl_price = stop_price
-                    elif strategy_type == 'TAKE_PROFIT_MARKET' and stop_price > 0:
-                        tp_price = stop_price
-            
-            return {
-                'stop_loss': sl_price,
-                'take_profit': tp_price
-            }
     except Exception as e:
         # 静默失败，不打印错误（避免刷屏）
         pass
@@ -3438,15 +3182,14 @@ def save_positions_snapshot(positions, total_value):
         trades_dict = {}
         if TRADES_FILE.exists():
             try:
-                df_trades = pd.read_csv(TRADES_FILE, encoding="utf-8")
-                df_trades.columns = df_trades.columns.str.strip()
-                open_trades = df_trades[df_trades["平仓时间"].isna()]
-                
-                for _, row in open_trades.iterrows():
+                # 【V8.9.12】未平仓记录直接从交易账本查询
+                from trade_ledger import get_ledger
+
+                for row in get_ledger(TRADES_FILE).open_trades():
                     coin = str(row.get("币种", "")).strip()
                     side = str(row.get("方向", "")).strip()
                     key = f"{coin}_{side}"
-                    trades_dict[key] = row.to_dict()
+                    trades_dict[key] = row
             except Exception as e:
                 print(f"  ⚠️ 读取trades_history失败: {e}")
         
@@ -3556,7 +3299,8 @@ def clear_symbol_orders(symbol, verbose=True):
 
     # 第1步：取消普通订单
     try:
-        open_orders = exchange.fetch_open_orders(symbol)
+        # 🆕 V8.9.25: 普通挂单从周期快照读取（全部币种一次拉取）
+        open_orders = exchange_state.open_orders(symbol)
         if verbose and len(open_orders) > 0:
             print(f"  发现 {len(open_orders)} 个普通订单")
 
@@ -3582,6 +3326,7 @@ def clear_symbol_orders(symbol, verbose=True):
             # 清理所有止损止盈相关订单
             if is_reduce_only or is_tp_sl_type:
                 try:
+                    api_rate_limiter.acquire(endpoint="cancel_order")
                     exchange.cancel_order(order_id, symbol)
                     success_count += 1
                     if verbose:
@@ -3607,34 +3352,13 @@ def clear_symbol_orders(symbol, verbose=True):
         else:
             binance_symbol = symbol
 
-        # 使用ccxt的底层方法调用papi API
-        # GET /papi/v1/um/conditional/openOrders
-        timestamp: int = int(time.time() * 1000)
-
         # 尝试查询条件单
+        # 🆕 V8.9.25: GET /papi/v1/um/conditional/openOrders 走周期快照（全部币种一次拉取）
         try:
-            params = {"symbol": binance_symbol, "timestamp": timestamp}
-
-            # 按字母顺序排序并生成query string
-            sorted_params = sorted(params.items())
-            query_string = urlencode(sorted_params)
-
-            # 生成签名
-            signature = hmac.new(
-                exchange.secret.encode("utf-8"),
-                query_string.encode("utf-8"),
-                hashlib.sha256,
-            ).hexdigest()
-
-            # 构建完整URL
-            url = f"https://papi.binance.com/papi/v1/um/conditional/openOrders?{query_string}&signature={signature}"
-
             headers = {"X-MBX-APIKEY": exchange.apiKey}
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                conditional_orders = response.json()
+            conditional_orders = exchange_state.conditional_orders(symbol)
 
+            if conditional_orders:
                 if verbose and len(conditional_orders) > 0:
                     print(f"  发现 {len(conditional_orders)} 个条件单")
 
@@ -3671,7 +3395,9 @@ def clear_symbol_orders(symbol, verbose=True):
                             url = f"https://papi.binance.com/papi/v1/um/conditional/order?{cancel_query}&signature={cancel_signature}"
 
                             # 调用取消API
+                            api_rate_limiter.acquire(endpoint="papi_cancel_conditional_order")  # 🆕 V8.9.26: 条件单下单/撤单计入限频器
                             cancel_response = requests.delete(url, headers=headers)
+                            api_rate_limiter.record_headers(cancel_response.headers)
 
                             if cancel_response.status_code == 200:
                                 success_count += 1
@@ -3721,6 +3447,10 @@ def clear_symbol_orders(symbol, verbose=True):
         if verbose:
             print(f"  ⚠️ 处理条件单异常: {str(e)[:50]}")
 
+    # 🆕 V8.9.25: 撤单后周期内的挂单/持仓快照失效
+    if success_count > 0 or fail_count > 0:
+        exchange_state.invalidate(symbol)
+
     # 汇总结果
     if verbose and (success_count > 0 or fail_count > 0):
         print(f"  清理完成: 成功{success_count}个, 失败{fail_count}个")
@@ -3839,7 +3569,9 @@ def set_tpsl_orders_via_papi(
 
             # 构建完整URL
             url = f"https://papi.binance.com/papi/v1/um/conditional/order?{query_string}&signature={signature}"
+            api_rate_limiter.acquire(endpoint="papi_conditional_order")  # 🆕 V8.9.26: 条件单下单/撤单计入限频器
             response = requests.post(url, headers=headers)
+            api_rate_limiter.record_headers(response.headers)
 
             if response.status_code == 200:
                 sl_success = True
@@ -3880,7 +3612,9 @@ def set_tpsl_orders_via_papi(
 
             # 构建完整URL
             url = f"https://papi.binance.com/papi/v1/um/conditional/order?{query_string}&signature={signature}"
+            api_rate_limiter.acquire(endpoint="papi_conditional_order")  # 🆕 V8.9.26: 条件单下单/撤单计入限频器
             response = requests.post(url, headers=headers)
+            api_rate_limiter.record_headers(response.headers)
 
             if response.status_code == 200:
                 tp_success = True
@@ -3894,6 +3628,9 @@ def set_tpsl_orders_via_papi(
             if verbose:
                 print(f"  ❌ 止盈单设置异常: {str(e)[:80]}")
 
+    # 🆕 V8.9.25: 新挂的条件单使周期快照失效
+    exchange_state.invalidate(symbol)
+
     return sl_success, tp_success
 
 
@@ -3906,13 +3643,12 @@ def sync_csv_with_exchange_positions(current_positions):
         if not TRADES_FILE.exists():
             return
 
-        df = pd.read_csv(TRADES_FILE, encoding="utf-8")
-        df.columns = df.columns.str.strip().str.replace("\ufeff", "")
+        # 【V8.9.12】未平仓记录直接从交易账本查询
+        from trade_ledger import get_ledger
 
-        # 找出未平仓的记录
-        open_trades = df[df["平仓时间"].isna()]
+        open_trades = get_ledger(TRADES_FILE).open_trades()
 
-        if open_trades.empty:
+        if not open_trades:
             return
 
         # 2. 构建交易所实际持仓的映射
@@ -3925,7 +3661,7 @@ def sync_csv_with_exchange_positions(current_positions):
 
         # 3. 对比找出CSV有但交易所没有的持仓
         synced_count = 0
-        for idx, trade in open_trades.iterrows():
+        for trade in open_trades:
             coin = trade.get("币种", "")
             side = trade.get("方向", "")
             key = f"{coin}_{side}"
@@ -4106,25 +3842,13 @@ def save_ai_decision(decision_data):
             "actions": decision_data.get("actions", []),
         }
 
-        # 加载现有历史
-        if AI_DECISIONS_FILE.exists():
-            with open(AI_DECISIONS_FILE, encoding="utf-8") as f:
-                history = json.load(f)
-        else:
-            history = []
-
-        # 添加新记录
-        history.append(decision_record)
+        # 【V8.9.11】追加一行到JSONL日志（不再读入并重写整个JSON），
+        # 保留条数由AI_DECISION_RETENTION控制（默认200条，约2天），超限时自动压缩
+        from decision_journal import get_journal
 
-        # 🔧 V8.3.32.9: 保留最近200条（覆盖约2天，每天96条）
-        if len(history) > 200:
-            history = history[-200:]
+        get_journal(DATA_DIR).append(decision_record)
 
-        # 保存
-        with open(AI_DECISIONS_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-
-        print(f"✓ AI决策已记录: {AI_DECISIONS_FILE}")
+        print(f"✓ AI决策已记录: {AI_DECISIONS_JOURNAL}")
     except Exception as e:
         print(f"✗ 保存AI决策失败: {e}")
 
@@ -4142,22 +3866,11 @@ def save_pnl_snapshot(current_positions, balance, total_position_value):
             "总资产": balance + total_pnl,
         }
 
-        df_new = pd.DataFrame([snapshot])
-
-        if PNL_HISTORY_FILE.exists():
-            df_existing = pd.read_csv(PNL_HISTORY_FILE)
-            df_combined = pd.concat(
-                [df_existing.dropna(how="all"), df_new.dropna(how="all")],
-                ignore_index=True,
-            )
-        else:
-            df_combined = df_new
+        # 【V8.9.14】追加一行CSV + 一条时间索引（pnl_history.csv.idx），不再读入并重写整个文件；
+        # 保留条数由PNL_HISTORY_RETENTION控制（默认1000条），超限时自动压缩
+        from pnl_time_index import get_pnl_history
 
-        # 只保留最近1000条记录
-        if len(df_combined) > 1000:
-            df_combined = df_combined.tail(1000)
-
-        df_combined.to_csv(PNL_HISTORY_FILE, index=False, encoding="utf-8")
+        get_pnl_history(PNL_HISTORY_FILE).append(snapshot)
         print(f"✓ 盈亏快照已保存: {PNL_HISTORY_FILE}")
     except Exception as e:
         print(f"✗ 保存盈亏快照失败: {e}")
@@ -4358,7 +4071,7 @@ def get_trading_experience_level():
         if not TRADES_FILE.exists():
             return 0, "新手"
 
-        df = pd.read_csv(TRADES_FILE)
+        df = read_trades_csv(TRADES_FILE)
         df = df[df["平仓时间"].notna()]  # 只看已平仓交易
         trade_count = len(df)
 
@@ -4595,7 +4308,7 @@ def should_pause_trading_v7(config):
                 / "learning_config.json"
             )
             with open(config_file, "w", encoding="utf-8") as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+                json.dump(persisted_config(config), f, indent=2, ensure_ascii=False)
 
             # 发送盈利恢复通知
             send_recovery_notification_v7(
@@ -4625,7 +4338,7 @@ def should_pause_trading_v7(config):
                 / "learning_config.json"
             )
             with open(config_file, "w", encoding="utf-8") as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+                json.dump(persisted_config(config), f, indent=2, ensure_ascii=False)
 
             # 发送恢复通知
             send_recovery_notification_v7(
@@ -4669,7 +4382,7 @@ def _get_trigger_losses_before_cooldown(pause_start):
         if not trades_file.exists():
             return 0
 
-        df = pd.read_csv(trades_file)
+        df = read_trades_csv(trades_file)
         if df.empty:
             return 0
 
@@ -4719,7 +4432,7 @@ def _check_profit_during_cooldown(pause_start, pause_level=1):
         if not trades_file.exists():
             return False
 
-        df = pd.read_csv(trades_file)
+        df = read_trades_csv(trades_file)
         if df.empty:
             return False
 
@@ -5661,17 +5374,23 @@ def save_market_snapshot_v7(market_data_list):
             print("⚠️ 市场快照为空，无数据保存（所有币种获取失败）")
             return
 
+        # 【V8.9.9】列式存储（SNAPSHOT_STORE_MODE: csv / dual / columnar）
+        import market_snapshot_store as snapshot_store
+
         # 【V8.5.2新增】去重逻辑：检查当前时间点是否已有数据
-        if snapshot_file.exists():
+        # 【V8.9.9】有列式分区时只读time一列，不再解析整个CSV
+        if snapshot_file.exists() or snapshot_store.has_snapshot_day(snapshot_dir, today):
             try:
-                existing_df = pd.read_csv(snapshot_file, dtype={"time": str})
+                existing_times = snapshot_store.snapshot_times(snapshot_dir, today)
+                if existing_times is None:
+                    existing_df = pd.read_csv(snapshot_file, dtype={"time": str})
+                    existing_times = set(existing_df["time"].values)
 
                 # 获取当前要保存的时间点
                 current_time_str = snapshot_data[0].get("time")
 
                 if current_time_str:
                     # 检查这个时间点是否已存在
-                    existing_times = set(existing_df["time"].values)
 
                     if current_time_str in existing_times:
                         print(f"⏭️  跳过保存：时间点 {current_time_str} 的数据已存在")
@@ -5682,25 +5401,45 @@ def save_market_snapshot_v7(market_data_list):
                 print(f"⚠️ 读取现有文件失败: {e}，将直接追加")
 
         df = pd.DataFrame(snapshot_data)
-        if snapshot_file.exists():
-            df.to_csv(
-                snapshot_file,
-                mode="a",
-                header=False,
-                index=False,
-                encoding="utf-8",
-                quoting=csv.QUOTE_MINIMAL,
-            )
-        else:
+        if snapshot_store.writes_csv():
+            csv_exists = snapshot_file.exists()
             df.to_csv(
                 snapshot_file,
-                mode="w",
-                header=True,
+                mode="a" if csv_exists else "w",
+                header=not csv_exists,
                 index=False,
                 encoding="utf-8",
                 quoting=csv.QUOTE_MINIMAL,
             )
 
+        if snapshot_store.writes_columnar():
+            try:
+                if snapshot_file.exists() and not snapshot_store.has_snapshot_day(
+                    snapshot_dir, today
+                ):
+                    # 当天首次写列式：先把当天CSV整体转换，避免列式分区缺前半天
+                    # （dual模式下CSV已包含本次数据）
+                    snapshot_store.migrate_csv_day(snapshot_file)
+                    if not snapshot_store.writes_csv():
+                        snapshot_store.append_snapshot_rows(
+                            snapshot_dir, today, snapshot_data
+                        )
+                else:
+                    snapshot_store.append_snapshot_rows(snapshot_dir, today, snapshot_data)
+            except Exception as e:
+                # dual模式下CSV已写入，列式失败不影响主流程（可用迁移工具补齐）
+                print(f"⚠️ 列式快照写入失败: {e}")
+                if not snapshot_store.writes_csv():
+                    raise
+
+        # 【V8.9.15】按币种的K线侧车索引（看板价格图只读需要的币种），失败时看板回退解析快照
+        try:
+            from snapshot_ohlc_index import write_day_index
+
+            write_day_index(snapshot_dir, today)
+        except Exception as e:
+            print(f"⚠️ K线索引写入失败: {e}")
+
         print(f"✓ 市场快照已保存: {current_time} ({len(snapshot_data)}个币种)")
 
     except Exception as e:
@@ -5732,7 +5471,7 @@ def daily_review_with_kline_v7():
         if not trades_file.exists():
             return "无交易记录"
 
-        df = pd.read_csv(trades_file)
+        df = read_trades_csv(trades_file)
         df["平仓日期"] = pd.to_datetime(df["平仓时间"], errors="coerce").dt.strftime(
             "%Y%m%d"
         )
@@ -6070,6 +5809,15 @@ def load_learning_config():
     return config
 
 
+# 只在内存中使用、不写入learning_config.json的键
+RUNTIME_CONFIG_KEYS = ("_phase1_cache",)
+
+
+def persisted_config(config):
+    """去掉运行期缓存键后的配置（写文件、比较参数是否变化都用它）"""
+    return {k: v for k, v in config.items() if k not in RUNTIME_CONFIG_KEYS}
+
+
 def save_learning_config(config):
     """保存学习参数"""
     try:
@@ -6093,9 +5841,11 @@ def save_learning_config(config):
             print("  💡 原因：共振≥2会错过98%的高质量机会（如BNB 82分/2共振 盈利20%）")
 
         config["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # 【V8.9.18】运行期缓存（Phase 1机会含价格路径数组）只在内存中使用，不写入配置文件
+        persisted = persisted_config(config)
         with open(LEARNING_CONFIG_FILE, "w", encoding="utf-8") as f:
             json.dump(
-                config, f, ensure_ascii=False, indent=2, default=str
+                persisted, f, ensure_ascii=False, indent=2, default=str
             )  # 🔧 V7.6.7: 添加default=str防止bool序列化错误
         print(f"✓ 学习参数已更新: {LEARNING_CONFIG_FILE}")
     except Exception as e:
@@ -6361,7 +6111,7 @@ def check_signal_type_risk_budget(
             if TRADES_FILE.exists():
                 import pandas as pd
 
-                df = pd.read_csv(TRADES_FILE)
+                df = read_trades_csv(TRADES_FILE)
                 if not df.empty and "仓位(U)" in df.columns:
                     recent_positions = df["仓位(U)"].dropna()
                     if len(recent_positions) > 0:
@@ -6417,7 +6167,7 @@ def check_scalping_frequency(coin_name, config):
 
         import pandas as pd
 
-        df = pd.read_csv(TRADES_FILE)
+        df = read_trades_csv(TRADES_FILE)
         if df.empty:
             return True, "无交易记录"
 
@@ -6564,93 +6314,45 @@ def update_position_after_adding(
         price_improvement_pct: 价格改善百分比
 
     """
-    import fcntl
-    import shutil
+    from trade_ledger import get_ledger
 
     coin_name = symbol.split("/")[0]
     side_cn = "多" if side == "long" else "空"
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        lock_file = None
-        try:
-            # 1. 创建文件锁
-            lock_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.lock"
-            lock_file = open(lock_path, "w")
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-            # 2. 创建备份
-            backup_path = TRADES_FILE.parent / f"{TRADES_FILE.name}.backup"
-            if TRADES_FILE.exists():
-                shutil.copy2(TRADES_FILE, backup_path)
-
-            # 3. 读取现有数据
-            df = pd.read_csv(TRADES_FILE, encoding="utf-8")
-            df.columns = df.columns.str.strip().str.replace("\ufeff", "")
-
-            # 4. 找到该币种、该方向、未平仓的记录
-            mask = (
-                (df["币种"] == coin_name)
-                & (df["方向"] == side_cn)
-                & (df["平仓时间"].isna())
-            )
-            matching_rows = df[mask]
-
-            if matching_rows.empty:
-                print(f"  ⚠️ 未找到 {coin_name} {side_cn} 的未平仓记录，无法记录加仓")
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                lock_file.close()
-                return
-
-            # 5. 更新记录
-            last_idx = matching_rows.index[-1]
-            original_reason = str(df.at[last_idx, "开仓理由"])
-
-            # 计算是第几次加仓
-            add_count = original_reason.count("[加仓") + 1
-
-            # 构建加仓记录
-            current_time = datetime.now().strftime("%H:%M")
-            add_entry = (
-                f" | [加仓{add_count}] {current_time} "
-                f"+{new_amount:.3f}@{new_price:.2f} "
-                f"理由:{add_reason}+价格优{abs(price_improvement_pct):.1f}%+信号分{signal_score}"
-            )
+    try:
+        # 【V8.9.12】在交易账本中定位最后一条未平仓记录
+        ledger = get_ledger(TRADES_FILE)
+        open_trade = ledger.open_trade(coin_name, side_cn)
 
-            # 更新字段
-            df.at[last_idx, "开仓价"] = new_avg_price
-            df.at[last_idx, "开仓理由"] = original_reason + add_entry
+        if open_trade is None:
+            print(f"  ⚠️ 未找到 {coin_name} {side_cn} 的未平仓记录，无法记录加仓")
+            return
 
-            # 6. 保存
-            temp_file = TRADES_FILE.parent / f"{TRADES_FILE.name}.tmp"
-            df.to_csv(temp_file, index=False, encoding="utf-8")
-            temp_file.replace(TRADES_FILE)
+        original_reason = str(open_trade["开仓理由"])
 
-            print(
-                f"  📝 已记录加仓{add_count}: +{new_amount:.3f}@{new_price:.2f}, 新平均价{new_avg_price:.2f}"
-            )
+        # 计算是第几次加仓
+        add_count = original_reason.count("[加仓") + 1
 
-            # 7. 释放锁
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-            lock_file.close()
-            break
+        # 构建加仓记录
+        current_time = datetime.now().strftime("%H:%M")
+        add_entry = (
+            f" | [加仓{add_count}] {current_time} "
+            f"+{new_amount:.3f}@{new_price:.2f} "
+            f"理由:{add_reason}+价格优{abs(price_improvement_pct):.1f}%+信号分{signal_score}"
+        )
 
-        except Exception as e:
-            print(f"  ⚠️ 更新加仓记录失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if lock_file:
-                try:
-                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-                    lock_file.close()
-                except Exception:
-                    pass
+        # 更新字段（旧版额外写入的"开仓价"列不在标准列中，下次开仓时即被丢弃，账本不再保存）
+        ledger.update_open_trade(
+            coin_name, side_cn, {"开仓理由": original_reason + add_entry}
+        )
 
-            if attempt == max_retries - 1:
-                print("  ❌ 加仓记录更新失败")
-            else:
-                import time
+        print(
+            f"  📝 已记录加仓{add_count}: +{new_amount:.3f}@{new_price:.2f}, 新平均价{new_avg_price:.2f}"
+        )
 
-                time.sleep(0.5)
-                continue
+    except Exception as e:
+        print(f"  ⚠️ 更新加仓记录失败: {e}")
+        print("  ❌ 加仓记录更新失败")
 
 
 def add_to_position(
@@ -7506,38 +7208,41 @@ def backtest_parameters(config_variant, days=7, verbose=False):
 
     """
     try:
-        from datetime import datetime, timedelta
+        from datetime import datetime
 
         print(f"\n{'=' * 60}")
         print(f"【📊 参数回测引擎】回测最近{days}天数据（近期权重递减）")
         print(f"{'=' * 60}")
 
+        from snapshot_window_store import SnapshotWindow, recent_dates
+
         # 读取历史快照数据（近期优先）
         model_dir = os.getenv("MODEL_NAME", "deepseek")
         snapshot_dir = f"trading_data/{model_dir}/market_snapshots"
 
         end_date = datetime.now()
 
-        # 🆕 V7.6.3.1: 按日期分组存储，便于加权
+        # 【V8.9.10】多天快照合并为一个mmap窗口（按币种预建区间），
+        # 每次只取单币种单天的切片，内存不随回测天数增长
+        target_dates = recent_dates(days, end_date)
+        window = SnapshotWindow.open(snapshot_dir, target_dates)
+
+        # 🆕 V7.6.3.1: 按日期分组，便于加权（day_offset → 日期）
         daily_snapshots = {}
         total_records = 0
 
-        for i in range(days):
-            target_date = (end_date - timedelta(days=i)).strftime("%Y%m%d")
-            snapshot_file = f"{snapshot_dir}/{target_date}.csv"
-
-            try:
-                df = pd.read_csv(snapshot_file)
-                daily_snapshots[i] = df  # i=0是今天，i=1是昨天...
-                total_records += len(df)
-                if verbose:
-                    print(
-                        f"✓ 读取 {target_date}: {len(df)}条记录 (权重: {1.0 - i * 0.1:.1f})"
-                    )
-            except FileNotFoundError:
+        for i, target_date in enumerate(target_dates):
+            day_rows = window.day_rows(target_date) if window is not None else 0
+            if day_rows == 0:
                 if verbose:
                     print(f"✗ 未找到 {target_date} 数据")
                 continue
+            daily_snapshots[i] = target_date  # i=0是今天，i=1是昨天...
+            total_records += day_rows
+            if verbose:
+                print(
+                    f"✓ 读取 {target_date}: {day_rows}条记录 (权重: {1.0 - i * 0.1:.1f})"
+                )
 
         if not daily_snapshots:
             print("⚠️ 未找到历史快照数据")
@@ -7584,13 +7289,13 @@ def backtest_parameters(config_variant, days=7, verbose=False):
         import gc
 
         # 🆕 V7.6.3.1: 按天回测，每天分配权重
-        for day_offset, history_df in daily_snapshots.items():
+        for day_offset, target_date in daily_snapshots.items():
             # 计算当天权重：今天1.0，昨天0.9，前天0.8...
             day_weight = max(0.3, 1.0 - day_offset * 0.1)  # 最低0.3权重
 
-            # 按币种和时间分组
-            for coin in history_df["coin"].unique():
-                coin_data = history_df[history_df["coin"] == coin].sort_values("time")
+            # 按币种和时间分组（窗口内已按时间排序，index为当天文件行号）
+            for coin in window.day_coins(target_date):
+                coin_data = window.coin_frame(coin, target_date)
 
                 for idx, row in coin_data.iterrows():
                     # 模拟信号质量检查
@@ -7871,12 +7576,8 @@ def backtest_parameters(config_variant, days=7, verbose=False):
                         else:
                             missed_opps += 1
 
-            # 【V8.3.21】处理完每天的数据后释放内存
-            del history_df
-            gc.collect()
-
-        # 【V8.3.21】回测完成，释放daily_snapshots
-        del daily_snapshots
+        # 【V8.3.21】回测完成，释放窗口映射
+        del window, daily_snapshots
         gc.collect()
 
         # 【V7.9】计算回测统计（增加分类型统计）
@@ -9600,6 +9301,7 @@ def quick_global_search_v8316(
         data_summary: 数据摘要（传统参数，保持兼容）
         current_config: 当前配置
         confirmed_opportunities: 【V8.3.25.23新增】确认的盈利机会 {'scalping': {...}, 'swing': {...}}
+            【V8.9.20】其中的机会列表移交给本函数（取出后不再留在该dict中）
         phase1_baseline: 【V8.5.2.4.9新增】Phase 1统计基准 {
             'scalping': {'count': int, 'avg_objective_profit': float},
             'swing': {'count': int, 'avg_objective_profit': float}
@@ -11017,16 +10719,13 @@ def quick_global_search_v8316(
         )
 
     # 【V8.5.2.4.89.23】修复：分别处理超短线和波段机会
-    # 【V8.5.2.4.89.56】修复：深拷贝数据，避免后续修改影响原始缓存
-    import copy
-
+    # 【V8.9.20】Phase 1缓存不再保存机会列表，无需再复制一份：直接取出调用方的列表，
+    # 释放前面各步骤的引用，Phase 3/4的列式表构建后这批机会dict即可全部回收
     print("  ✅ 使用confirmed_opportunities（真实盈利机会）")
-    scalping_opportunities = copy.deepcopy(
-        confirmed_opportunities["scalping"]["opportunities"]
-    )
-    swing_opportunities = copy.deepcopy(
-        confirmed_opportunities["swing"]["opportunities"]
-    )
+    scalping_opportunities = confirmed_opportunities["scalping"].pop("opportunities")
+    swing_opportunities = confirmed_opportunities["swing"].pop("opportunities")
+    scalping_opps = swing_opps = all_opps_for_recalc = None
+    scalping_opps_full = swing_opps_full = scalping_sample = swing_sample = None
     print(
         f"     ✓ 真实盈利机会: 超短线{len(scalping_opportunities)}个 + 波段{len(swing_opportunities)}个 = {len(scalping_opportunities) + len(swing_opportunities)}个"
     )
@@ -11074,9 +10773,15 @@ def quick_global_search_v8316(
             test_results: 测试结果列表
 
         """
-        from calculate_actual_profit import calculate_single_actual_profit
+        # 【V8.9.8】先在主进程筛选每组参数捕获的机会，再把实际利润计算并行分发
+        from parallel_grid_search import (
+            ActualProfitColumns,
+            actual_profit_task,
+            evaluate_param_grid,
+        )
 
         test_results = []
+        pending = []
 
         for i, test_params in enumerate(test_points):
             config_variant = {
@@ -11089,9 +10794,9 @@ def quick_global_search_v8316(
             }
 
             # 筛选满足参数条件的机会
-            captured_opps = [
-                opp
-                for opp in opportunities
+            captured_indices = [
+                idx
+                for idx, opp in enumerate(opportunities)
                 if (
                     opp.get("signal_score", 0)
                     >= config_variant.get("min_signal_score", 50)
@@ -11099,6 +10804,7 @@ def quick_global_search_v8316(
                     >= config_variant.get("min_indicator_consensus", 2)
                 )
             ]
+            captured_opps = [opportunities[idx] for idx in captured_indices]
 
             if captured_opps:
                 # 使用最优TP/SL或默认值
@@ -11110,23 +10816,33 @@ def quick_global_search_v8316(
                     default_sl = params_range["atr_sl"][1]
                 default_holding = params_range["max_holding"][1]
 
-                # 计算每个机会的实际利润
-                for opp in captured_opps:
-                    strategy_params = {
-                        **config_variant,
-                        "atr_tp_multiplier": config_variant.get("atr_tp_multiplier")
-                        or default_tp,
-                        "atr_stop_multiplier": config_variant.get("atr_stop_multiplier")
-                        or default_sl,
-                        "max_holding_hours": config_variant.get("max_holding_hours")
-                        or default_holding,
-                    }
+                strategy_params = {
+                    **config_variant,
+                    "atr_tp_multiplier": config_variant.get("atr_tp_multiplier")
+                    or default_tp,
+                    "atr_stop_multiplier": config_variant.get("atr_stop_multiplier")
+                    or default_sl,
+                    "max_holding_hours": config_variant.get("max_holding_hours")
+                    or default_holding,
+                }
+                pending.append(
+                    (i, test_params, captured_opps, (captured_indices, strategy_params))
+                )
 
-                    actual_profit = calculate_single_actual_profit(
-                        opp, strategy_params=strategy_params, use_dynamic_atr=False
-                    )
-                    opp["_test_actual_profit"] = actual_profit
+        # 计算每个机会的实际利润（多进程，结果按参数组顺序返回）
+        # 数值列+价格路径arena映射到共享内存；无法列式表示时传原列表（串行）
+        profit_source = ActualProfitColumns.from_opportunities(opportunities)
+        profit_lists = evaluate_param_grid(
+            profit_source if profit_source is not None else opportunities,
+            [job[3] for job in pending],
+            actual_profit_task,
+        )
+
+        for (i, test_params, captured_opps, _), profits in zip(pending, profit_lists):
+            for opp, actual_profit in zip(captured_opps, profits):
+                opp["_test_actual_profit"] = actual_profit
 
+            if captured_opps:
                 # 统计结果
                 avg_profit = sum([
                     o.get("_test_actual_profit", 0) for o in captured_opps
@@ -11603,9 +11319,17 @@ def quick_global_search_v8316(
     phase4_result = None
 
     # 【V8.5.2.4.89.38】合并scalping和swing opportunities供Phase 3使用
-    all_opportunities_for_phase3 = scalping_opportunities + swing_opportunities
+    # 【V8.9.20】Phase 3/4和邮件分析共用的列式表只在这里构建一次，构建后释放dict列表，
+    # 之后只在重算signal_score、利润计算和邮件分析处按需还原为dict
+    from opportunity_table import OpportunityTable
 
-    if phase2_baseline and all_opportunities_for_phase3:
+    opportunity_table = OpportunityTable.from_dicts(
+        scalping_opportunities + swing_opportunities
+    )
+    del scalping_opportunities, swing_opportunities, scalping_sorted, swing_sorted
+    del train_scalping, train_swing, validation_scalping, validation_swing
+
+    if phase2_baseline and len(opportunity_table):
         try:
             from phase3_enhanced_optimizer import phase3_enhanced_optimization
 
@@ -11617,7 +11341,7 @@ def quick_global_search_v8316(
             model_name = os.getenv("MODEL_NAME", "deepseek")
             # 【V8.5.2.4.46】kline_snapshots参数可选，传None即可（所有数据已在opportunities中）
             phase3_result = phase3_enhanced_optimization(
-                all_opportunities=all_opportunities_for_phase3,
+                all_opportunities=opportunity_table,
                 phase1_baseline=phase1_baseline,
                 phase2_baseline=phase2_baseline,
                 kline_snapshots=None,
@@ -11636,10 +11360,10 @@ def quick_global_search_v8316(
         try:
             from phase4_validator import phase4_validation_and_overfitting_detection
 
-            # 【V8.5.2.4.89.38】使用合并后的opportunities
+            # 【V8.5.2.4.89.38】使用合并后的opportunities（【V8.9.20】与Phase 3同一张列式表）
             phase4_result = phase4_validation_and_overfitting_detection(
                 phase3_result=phase3_result,
-                all_opportunities=all_opportunities_for_phase3,
+                all_opportunities=opportunity_table,
                 phase1_baseline=phase1_baseline,
             )
 
@@ -11863,9 +11587,7 @@ def quick_global_search_v8316(
         "phase2_baseline": phase2_baseline,  # 🆕 V8.5.2.4.10
         "phase3_result": phase3_result,  # 🆕 V8.5.2.4.41
         "phase4_result": phase4_result,  # 🆕 V8.5.2.4.42
-        "all_opportunities_sorted": all_opportunities_for_phase3
-        if "all_opportunities_for_phase3" in locals()
-        else [],  # 🆕 V8.5.2.4.47: 供邮件使用
+        "opportunity_table": opportunity_table,  # 🆕 V8.5.2.4.47: 供邮件使用（V8.9.20改为列式表）
     }
 
 
@@ -13456,69 +13178,90 @@ def analyze_and_adjust_params():
     min_days = 7  # 至少7天
     days_loaded = 0
 
-    for days_ago in range(max_days):
-        date_str = (datetime.now() - timedelta(days=days_ago)).strftime("%Y%m%d")
-        snapshot_file = snapshot_dir / f"{date_str}.csv"
-        if snapshot_file.exists():
-            try:
-                df = pd.read_csv(
-                    snapshot_file,
-                    on_bad_lines="skip",
-                    quoting=1,
-                    encoding="utf-8-sig",
-                    dtype={"time": str},
-                )
-                # 🔧 V8.3.25.8: 添加日期列（从文件名提取），便于后续筛选昨日数据
-                df["snapshot_date"] = date_str  # 格式：YYYYMMDD
-                # 🔧 V8.3.25.12: 构建完整时间戳（修复time列被读为整数的问题）
-                if "time" in df.columns:
-                    # 先将time列转为字符串，并确保HH:MM格式
-                    def format_time_str(t):
-                        if pd.isna(t):
-                            return None
-                        t_str = str(t).strip()
-                        # 如果是纯数字（如"0"），格式化为"00:00"
-                        if t_str.isdigit():
-                            hour = int(t_str) // 100
-                            minute = int(t_str) % 100
-                            return f"{hour:02d}:{minute:02d}"
-                        # 如果已经是"HH:MM"格式，直接返回
-                        if ":" in t_str:
-                            return t_str
-                        # 如果是"HHMM"格式（无冒号），插入冒号
-                        if len(t_str) == 4:
-                            return f"{t_str[:2]}:{t_str[2:]}"
-                        # 如果是"HMM"或"H:MM"等，补齐
-                        try:
-                            # 尝试解析为整数再格式化
-                            t_int = int(t_str)
-                            hour = t_int // 100
-                            minute = t_int % 100
-                            return f"{hour:02d}:{minute:02d}"
-                        except Exception:
-                            return t_str
+    # 先将time列转为字符串，并确保HH:MM格式
+    def format_time_str(t):
+        if pd.isna(t):
+            return None
+        t_str = str(t).strip()
+        # 如果是纯数字（如"0"），格式化为"00:00"
+        if t_str.isdigit():
+            hour = int(t_str) // 100
+            minute = int(t_str) % 100
+            return f"{hour:02d}:{minute:02d}"
+        # 如果已经是"HH:MM"格式，直接返回
+        if ":" in t_str:
+            return t_str
+        # 如果是"HHMM"格式（无冒号），插入冒号
+        if len(t_str) == 4:
+            return f"{t_str[:2]}:{t_str[2:]}"
+        # 如果是"HMM"或"H:MM"等，补齐
+        try:
+            # 尝试解析为整数再格式化
+            t_int = int(t_str)
+            hour = t_int // 100
+            minute = t_int % 100
+            return f"{hour:02d}:{minute:02d}"
+        except Exception:
+            return t_str
 
-                    df["time"] = df["time"].apply(format_time_str)
-                    df["full_datetime"] = pd.to_datetime(
-                        date_str + " " + df["time"],
-                        format="%Y%m%d %H:%M",
-                        errors="coerce",
-                    )
-                dataframes_to_merge.append(df)
+    # 【V8.9.10】优先从多日mmap窗口读取：与backtest_parameters一样按天、按币种取切片
+    # （coin_frame只复制该币种当天的行），time格式化和完整时间戳在每个切片上计算，
+    # 不再把整个窗口一次转成DataFrame；下游按行位置切分训练/验证集，所以每天按文件行号
+    # 还原行序，再按近期在前拼接（与逐天读取后concat一致）；窗口不可用时回退逐天读取
+    from snapshot_window_store import SnapshotWindow, recent_dates
+
+    window_loaded = False
+    try:
+        window = SnapshotWindow.open(snapshot_dir, recent_dates(max_days))
+        if window is not None:
+            for date_str in reversed(window.dates):
+                coin_parts = []
+                for coin in window.day_coins(date_str):
+                    coin_df = window.coin_frame(coin, date_str)
+                    coin_df["snapshot_date"] = date_str
+                    if "time" in coin_df.columns:
+                        coin_df["time"] = coin_df["time"].apply(format_time_str)
+                        coin_df["full_datetime"] = pd.to_datetime(
+                            date_str + " " + coin_df["time"],
+                            format="%Y%m%d %H:%M",
+                            errors="coerce",
+                        )
+                    coin_parts.append(coin_df)
+                if coin_parts:
+                    dataframes_to_merge.append(pd.concat(coin_parts).sort_index(kind="stable"))
+                del coin_parts
                 days_loaded += 1
-                print(f"✓ 读取{date_str}市场快照: {len(df)}条 (第{days_loaded}天)")
-            except Exception as e:
-                print(f"⚠️ 读取{date_str}快照失败: {e}")
+                print(
+                    f"✓ 读取{date_str}市场快照: {window.day_rows(date_str)}条 (第{days_loaded}天)"
+                )
+            del window
+            window_loaded = True
+    except Exception as e:
+        print(f"⚠️ 快照窗口构建失败，改为逐天读取: {e}")
+        dataframes_to_merge = []
+        days_loaded = 0
+
+    # 【V8.9.9】优先读列式分区（不解析文本），没有再读CSV
+    from market_snapshot_store import has_snapshot_day, load_snapshot_day
+
+    if not window_loaded:
+        for days_ago in range(max_days):
+            date_str = (datetime.now() - timedelta(days=days_ago)).strftime("%Y%m%d")
+            snapshot_file = snapshot_dir / f"{date_str}.csv"
+            if snapshot_file.exists() or has_snapshot_day(snapshot_dir, date_str):
                 try:
-                    df = pd.read_csv(
-                        snapshot_file,
-                        on_bad_lines="skip",
-                        encoding="utf-8-sig",
-                        dtype={"time": str},
-                    )
-                    # 🔧 V8.3.25.8: 备用方式也添加日期列
-                    df["snapshot_date"] = date_str
-                    # 🔧 V8.3.25.12: 备用方式也格式化time列
+                    df = load_snapshot_day(snapshot_dir, date_str)
+                    if df is None:
+                        df = pd.read_csv(
+                            snapshot_file,
+                            on_bad_lines="skip",
+                            quoting=1,
+                            encoding="utf-8-sig",
+                            dtype={"time": str},
+                        )
+                    # 🔧 V8.3.25.8: 添加日期列（从文件名提取），便于后续筛选昨日数据
+                    df["snapshot_date"] = date_str  # 格式：YYYYMMDD
+                    # 🔧 V8.3.25.12: 构建完整时间戳（修复time列被读为整数的问题）
                     if "time" in df.columns:
                         df["time"] = df["time"].apply(format_time_str)
                         df["full_datetime"] = pd.to_datetime(
@@ -13528,19 +13271,42 @@ def analyze_and_adjust_params():
                         )
                     dataframes_to_merge.append(df)
                     days_loaded += 1
-                    print(
-                        f"✓ 使用备用方式读取{date_str}: {len(df)}条 (第{days_loaded}天)"
-                    )
-                except Exception:
-                    pass
+                    print(f"✓ 读取{date_str}市场快照: {len(df)}条 (第{days_loaded}天)")
+                except Exception as e:
+                    print(f"⚠️ 读取{date_str}快照失败: {e}")
+                    try:
+                        df = pd.read_csv(
+                            snapshot_file,
+                            on_bad_lines="skip",
+                            encoding="utf-8-sig",
+                            dtype={"time": str},
+                        )
+                        # 🔧 V8.3.25.8: 备用方式也添加日期列
+                        df["snapshot_date"] = date_str
+                        # 🔧 V8.3.25.12: 备用方式也格式化time列
+                        if "time" in df.columns:
+                            df["time"] = df["time"].apply(format_time_str)
+                            df["full_datetime"] = pd.to_datetime(
+                                date_str + " " + df["time"],
+                                format="%Y%m%d %H:%M",
+                                errors="coerce",
+                            )
+                        dataframes_to_merge.append(df)
+                        days_loaded += 1
+                        print(
+                            f"✓ 使用备用方式读取{date_str}: {len(df)}条 (第{days_loaded}天)"
+                        )
+                    except Exception:
+                        pass
 
-        # 如果已加载14天，停止
-        if days_loaded >= max_days:
-            break
+            # 如果已加载14天，停止
+            if days_loaded >= max_days:
+                break
 
     # 合并数据
     if dataframes_to_merge:
         kline_snapshots = pd.concat(dataframes_to_merge, ignore_index=True)
+    if kline_snapshots is not None:
         print(
             f"✓ 合并市场快照: 共{len(kline_snapshots)}条记录（覆盖{days_loaded}天，近期权重更高）"
         )
@@ -13565,7 +13331,7 @@ def analyze_and_adjust_params():
         return
 
     try:
-        df = pd.read_csv(TRADES_FILE)
+        df = read_trades_csv(TRADES_FILE)
         df = df[df["平仓时间"].notna()]  # 只看已平仓交易
 
         trade_count = len(df)
@@ -13592,8 +13358,9 @@ def analyze_and_adjust_params():
         # 加载当前配置
         config = load_learning_config()
         # 🔧 V8.5.1.5: 修复参数变化检测 - 使用一致的序列化参数
+        # 【V8.9.18】不含运行期缓存（Phase 1价格路径数组被default=str整体转字符串既慢又无意义）
         original_config = json.dumps(
-            config, ensure_ascii=False, sort_keys=True, default=str
+            persisted_config(config), ensure_ascii=False, sort_keys=True, default=str
         )
 
         print(f"📊 全部交易样本: {len(df)}笔 | 学习模式: {learning_mode}")
@@ -13793,24 +13560,18 @@ def analyze_and_adjust_params():
         # 🔧 V8.3.25.12: 提前加载AI决策（用于开仓分析）
         ai_decisions_for_entry = []
         try:
-            ai_decisions_file = (
-                Path("trading_data")
-                / os.getenv("MODEL_NAME", "deepseek")
-                / "ai_decisions.json"
-            )
-            if ai_decisions_file.exists():
-                with open(ai_decisions_file, encoding="utf-8") as f:
-                    all_decisions = json.load(f)
+            # 【V8.9.11】从决策日志读取（jsonl不存在时回退旧版JSON）
+            from decision_journal import load_decisions
 
+            ai_decisions_dir = Path("trading_data") / os.getenv("MODEL_NAME", "deepseek")
+            if (ai_decisions_dir / "ai_decisions.jsonl").exists() or (
+                ai_decisions_dir / "ai_decisions.json"
+            ).exists():
                 # 筛选目标日期的决策（前一天）
                 yesterday_dt = datetime.strptime(yesterday, "%Y%m%d")
-                ai_decisions_for_entry = [
-                    d
-                    for d in all_decisions
-                    if d.get("timestamp", "").startswith(
-                        yesterday_dt.strftime("%Y-%m-%d")
-                    )
-                ]
+                ai_decisions_for_entry = load_decisions(
+                    ai_decisions_dir, date_prefix=yesterday_dt.strftime("%Y-%m-%d")
+                )
                 print(
                     f"  ✓ 加载了{len(ai_decisions_for_entry)}条AI决策（{yesterday}）用于开仓分析"
                 )
@@ -13954,25 +13715,23 @@ def analyze_and_adjust_params():
                 # 🔧 V8.3.25: 只读取目标日期的决策（控制数据量）
                 ai_decisions = []
                 try:
-                    ai_decisions_file = (
-                        Path("trading_data")
-                        / os.getenv("MODEL_NAME", "deepseek")
-                        / "ai_decisions.json"
-                    )
-                    if ai_decisions_file.exists():
-                        with open(ai_decisions_file, encoding="utf-8") as f:
-                            all_decisions = json.load(f)
+                    # 【V8.9.11】从决策日志读取（jsonl不存在时回退旧版JSON）
+                    from decision_journal import load_decisions
 
+                    ai_decisions_dir = Path("trading_data") / os.getenv(
+                        "MODEL_NAME", "deepseek"
+                    )
+                    if (ai_decisions_dir / "ai_decisions.jsonl").exists() or (
+                        ai_decisions_dir / "ai_decisions.json"
+                    ).exists():
                         # 筛选目标日期的决策（前一天）
                         # datetime已在函数开头导入
                         yesterday_dt = datetime.strptime(yesterday, "%Y%m%d")
                         target_date = yesterday_dt.strftime("%Y-%m-%d")
 
-                        ai_decisions = [
-                            d
-                            for d in all_decisions
-                            if d.get("timestamp", "").startswith(target_date)
-                        ]
+                        ai_decisions = load_decisions(
+                            ai_decisions_dir, date_prefix=target_date
+                        )
 
                         print(
                             f"  ✓ 加载了{len(ai_decisions)}条AI决策（{target_date}）用于自我反思"
@@ -14060,19 +13819,8 @@ def analyze_and_adjust_params():
             quick_search_baseline = None
 
             # 【V8.5.2.4.89.57】禁用缓存，每次重新计算（避免深拷贝问题，多2分钟但更稳定）
-            # 检查是否有今日缓存
-            if False:  # 禁用缓存
-                print("  💾 【使用Phase 1缓存】避免重复计算（节省约2分钟）")
-                # 【V8.5.2.4.89.55】直接使用缓存引用（已在保存时深拷贝）
-                quick_search_opportunities = config["_phase1_cache"]["opportunities"]
-                quick_search_baseline = config["_phase1_cache"]["baseline"]
-                print(
-                    f"     ✓ 超短线机会: {len(quick_search_opportunities['scalping']['opportunities'])}个"
-                )
-                print(
-                    f"     ✓ 波段机会: {len(quick_search_opportunities['swing']['opportunities'])}个"
-                )
-            elif kline_snapshots is not None and not kline_snapshots.empty:
+            # 【V8.9.20】_phase1_cache不再保存机会列表，已禁用的缓存读取分支一并删除
+            if kline_snapshots is not None and not kline_snapshots.empty:
                 try:
                     print("  📊 准备confirmed_opportunities用于快速探索...")
                     # 【V8.4.5】快速探索也使用带验证的函数，但禁用验证以节省时间
@@ -14095,16 +13843,13 @@ def analyze_and_adjust_params():
                     )
 
                     # 【V8.5.2.4.86】缓存Phase 1结果（供后续使用）
-                    # 【V8.5.2.4.89.55】修复：深拷贝数据，避免Phase 2/3修改影响缓存
-                    import copy
-
+                    # 【V8.9.20】只缓存baseline：机会列表移交给Phase 2-4，不再额外保留一份副本
                     config["_phase1_cache"] = {
-                        "opportunities": copy.deepcopy(quick_search_opportunities),
                         "baseline": quick_search_baseline,  # baseline是基础数据，无需深拷贝
                         "date": datetime.now().strftime("%Y-%m-%d"),
                         "timestamp": datetime.now().isoformat(),
                     }
-                    print("     ✅ Phase 1结果已缓存（深拷贝保护，供后续使用）")
+                    print("     ✅ Phase 1 baseline已缓存（机会列表移交给Phase 2-4）")
 
                     # 【V8.5.2.4.21】Phase 1阶段总结输出
                     try:
@@ -14143,9 +13888,21 @@ def analyze_and_adjust_params():
             phase3_result_extracted = iterative_result.get("phase3_result")
             phase4_result_extracted = iterative_result.get("phase4_result")
             # 【V8.5.2.4.47】提取all_opportunities_sorted（供邮件使用）
-            all_opportunities_sorted = iterative_result.get(
-                "all_opportunities_sorted", []
+            # 【V8.9.20】Phase 3/4已结束，此时才从列式表还原dict，只还原顶层字段
+            # （邮件分析不读快照和价格路径）；取出后列式表不随_iterative_history写入配置
+            from opportunity_table import NESTED_FIELDS
+
+            opportunity_table = iterative_result.pop("opportunity_table", None)
+            all_opportunities_sorted = (
+                opportunity_table.to_dicts(
+                    name
+                    for name in opportunity_table.fields
+                    if name.partition(".")[0] not in NESTED_FIELDS
+                )
+                if opportunity_table is not None
+                else []
             )
+            del opportunity_table
 
             # 【V8.5.2.4.21】Phase 2阶段总结输出
             if global_initial_params and phase2_baseline_result:
@@ -15076,7 +14833,7 @@ def analyze_and_adjust_params():
         # ========== 第5步：保存并通知 ==========
         # 🔧 V8.5.1.5: 修复参数变化检测 - 使用一致的序列化参数（sort_keys确保key顺序一致）
         current_config = json.dumps(
-            config, ensure_ascii=False, sort_keys=True, default=str
+            persisted_config(config), ensure_ascii=False, sort_keys=True, default=str
         )
         config_changed = current_config != original_config
 
@@ -17135,7 +16892,7 @@ def analyze_and_adjust_params():
 
                         import pandas as pd
 
-                        df = pd.read_csv(TRADES_FILE)
+                        df = read_trades_csv(TRADES_FILE)
                         if not df.empty and "信号类型" in df.columns:
                             # 最近7天已平仓交易
                             df["开仓时间_dt"] = pd.to_datetime(
@@ -18249,6 +18006,7 @@ def setup_exchange(is_manual_backtest=False):
         # 为每个币种设置杠杆
         for symbol in TRADE_CONFIG["symbols"]:
             try:
+                api_rate_limiter.acquire(endpoint="set_leverage")
                 exchange.set_leverage(
                     TRADE_CONFIG["max_leverage"], symbol, {"mgnMode": "cross"}
                 )
@@ -18262,16 +18020,6 @@ def setup_exchange(is_manual_backtest=False):
         return False
 
 
-def calculate_macd(df, fast=12, slow=26, signal=9):
-    """计算MACD指标"""
-    ema_fast = df["close"].ewm(span=fast, adjust=False).mean()
-    ema_slow = df["close"].ewm(span=slow, adjust=False).mean()
-    macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    histogram = macd_line - signal_line
-    return macd_line.iloc[-1], signal_line.iloc[-1], histogram.iloc[-1]
-
-
 def detect_pin_bar(ohlc):
     """识别Pin Bar（长影线反转信号）"""
     try:
@@ -20428,101 +20176,130 @@ def get_adjusted_params_for_signal(
     }
 
 
-def get_ohlcv_data(symbol, skip_timing_check=False):
+def get_ohlcv_fetch_limits(skip_timing_check=False):
+    """🆕 V8.9.3: 各周期K线拉取数量（get_ohlcv_data与并发获取共用）
+
+    【V8.5.2.4.88修复】区分实盘和回测的数据量
+    实盘：只需要计算指标的最少数据（MA72需要72根，留余量100根）
+    回测：需要完整历史数据用于模拟
+    """
+    is_backtest = os.getenv("MANUAL_BACKTEST") == "true" or skip_timing_check
+    if is_backtest:
+        # 回测：15m 14天数据 + 1根，4h/1h 约1个月
+        return {TRADE_CONFIG["timeframe"]: 1345, "4h": 169, "1h": 673}
+    # 实盘：15m只需100根（足够计算MA72），4h约8天，1h约4天（足够S/R分析）
+    return {TRADE_CONFIG["timeframe"]: 100, "4h": 50, "1h": 100}
+
+
+def get_ohlcv_data(symbol, skip_timing_check=False, prefetched=None):
     """获取单个币种的K线数据和技术指标（已移除signal.alarm以兼容supervisor）
 
     Args:
         symbol: 交易对符号
         skip_timing_check: 是否跳过时机检查（回测模式使用）
+        prefetched: 🆕 V8.9.3 已并发拉取的原始K线 {timeframe: K线列表或异常}，
+            为None时直接请求交易所
 
     """
     try:
-        # 【V8.5.2.4.88修复】区分实盘和回测的数据量
-        # 实盘：只需要计算指标的最少数据（MA72需要72根，留余量100根）
-        # 回测：需要完整历史数据用于模拟
-        import os
         from datetime import datetime
 
-        is_backtest = os.getenv("MANUAL_BACKTEST") == "true" or skip_timing_check
+        from ohlcv_candle_store import StoredCandles
+
+        fetch_limits = get_ohlcv_fetch_limits(skip_timing_check)
+
+        def _fetch_ohlcv(timeframe):
+            # 🆕 V8.9.3: 优先使用并发阶段的结果（异常原样抛出，走原有降级逻辑）
+            # 🆕 V8.9.4: 来自K线仓库的StoredCandles已剔除未完成K线，原样返回
+            if prefetched is not None and timeframe in prefetched:
+                rows = prefetched[timeframe]
+                if isinstance(rows, Exception):
+                    raise rows
+                if isinstance(rows, StoredCandles):
+                    return rows
+                return list(rows)
+            return exchange.fetch_ohlcv(
+                symbol, timeframe, limit=fetch_limits[timeframe]
+            )
 
         # === 15分钟K线数据（短期） ===
         # 多获取1根，然后移除最后一根（可能未完成）
-        if is_backtest:
-            limit_15m = 1345  # 回测：14天数据 + 1根
+        ohlcv_15m = _fetch_ohlcv(TRADE_CONFIG["timeframe"])
+
+        # 🆕 V8.9.5: 记录哪些周期来自K线仓库（连续的已收盘序列，可走增量指标）
+        stored_timeframes = set()
+
+        if isinstance(ohlcv_15m, StoredCandles):
+            # 🆕 V8.9.4: K线仓库已完成未收盘K线判断和DataFrame转换
+            stored_timeframes.add(TRADE_CONFIG["timeframe"])
+            df_15m = ohlcv_15m.frame
+            ohlcv_15m = ohlcv_15m.rows
         else:
-            limit_15m = 100  # 实盘：只需100根（足够计算MA72和其他指标）
+            # 【V8.5.2.3优化】智能判断是否需要移除最后一根K线
+            if len(ohlcv_15m) > 0:
+                current_time = datetime.now()
+                last_kline_time = datetime.fromtimestamp(ohlcv_15m[-1][0] / 1000)
 
-        ohlcv_15m = exchange.fetch_ohlcv(
-            symbol, TRADE_CONFIG["timeframe"], limit=limit_15m
-        )
+                # 计算当前应该完成的K线时间（向下取整到15分钟）
+                current_minute = current_time.minute
+                completed_minute = (current_minute // 15) * 15
+                expected_completed_time = current_time.replace(
+                    minute=completed_minute, second=0, microsecond=0
+                )
 
-        # 【V8.5.2.3优化】智能判断是否需要移除最后一根K线
-        if len(ohlcv_15m) > 0:
-            current_time = datetime.now()
-            last_kline_time = datetime.fromtimestamp(ohlcv_15m[-1][0] / 1000)
-
-            # 计算当前应该完成的K线时间（向下取整到15分钟）
-            current_minute = current_time.minute
-            completed_minute = (current_minute // 15) * 15
-            expected_completed_time = current_time.replace(
-                minute=completed_minute, second=0, microsecond=0
-            )
-
-            # 如果最后一根K线的开始时间 >= 当前周期，说明是未完成的，需要移除
-            if last_kline_time >= expected_completed_time:
-                second_last_time = (
-                    datetime.fromtimestamp(ohlcv_15m[-2][0] / 1000)
-                    if len(ohlcv_15m) > 1
-                    else None
-                )
-                print(f"📊 {symbol}: 移除未完成K线 {last_kline_time.strftime('%H:%M')}")
-                if second_last_time:
-                    delay_minutes = (
-                        current_time - second_last_time - timedelta(minutes=15)
-                    ).total_seconds() / 60
+                # 如果最后一根K线的开始时间 >= 当前周期，说明是未完成的，需要移除
+                if last_kline_time >= expected_completed_time:
+                    second_last_time = (
+                        datetime.fromtimestamp(ohlcv_15m[-2][0] / 1000)
+                        if len(ohlcv_15m) > 1
+                        else None
+                    )
+                    print(f"📊 {symbol}: 移除未完成K线 {last_kline_time.strftime('%H:%M')}")
+                    if second_last_time:
+                        delay_minutes = (
+                            current_time - second_last_time - timedelta(minutes=15)
+                        ).total_seconds() / 60
+                        print(
+                            f"   → 使用已完成K线: {second_last_time.strftime('%H:%M')}-{(second_last_time + timedelta(minutes=15)).strftime('%H:%M')} (延后{delay_minutes:.0f}分钟)"
+                        )
+                    ohlcv_15m = ohlcv_15m[:-1]  # 移除未完成的最后一根
+                else:
+                    # 最后一根是已完成的，保留
+                    end_time = last_kline_time + timedelta(minutes=15)
+                    delay_minutes = (current_time - end_time).total_seconds() / 60
                     print(
-                        f"   → 使用已完成K线: {second_last_time.strftime('%H:%M')}-{(second_last_time + timedelta(minutes=15)).strftime('%H:%M')} (延后{delay_minutes:.0f}分钟)"
+                        f"📊 {symbol}: 使用已完成K线 {last_kline_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')} (延后{delay_minutes:.0f}分钟)"
                     )
-                ohlcv_15m = ohlcv_15m[:-1]  # 移除未完成的最后一根
-            else:
-                # 最后一根是已完成的，保留
-                end_time = last_kline_time + timedelta(minutes=15)
-                delay_minutes = (current_time - end_time).total_seconds() / 60
-                print(
-                    f"📊 {symbol}: 使用已完成K线 {last_kline_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')} (延后{delay_minutes:.0f}分钟)"
-                )
 
-        df_15m = pd.DataFrame(
-            ohlcv_15m, columns=["timestamp", "open", "high", "low", "close", "volume"]
-        )
-        df_15m["timestamp"] = pd.to_datetime(df_15m["timestamp"], unit="ms")
+            df_15m = pd.DataFrame(
+                ohlcv_15m, columns=["timestamp", "open", "high", "low", "close", "volume"]
+            )
+            df_15m["timestamp"] = pd.to_datetime(df_15m["timestamp"], unit="ms")
 
         # === 4小时K线数据（长期趋势） ===
         try:
-            # 【V8.5.2.4.88修复】区分实盘和回测
-            if is_backtest:
-                limit_4h = 169  # 回测：约1个月
+            ohlcv_4h = _fetch_ohlcv("4h")
+            if isinstance(ohlcv_4h, StoredCandles):
+                stored_timeframes.add("4h")
+                df_4h = ohlcv_4h.frame
             else:
-                limit_4h = 50  # 实盘：约8天（足够计算趋势）
-
-            ohlcv_4h = exchange.fetch_ohlcv(symbol, "4h", limit=limit_4h)
-            # 【V8.5.2.3优化】智能判断是否需要移除4H K线
-            if len(ohlcv_4h) > 0:
-                current_time = datetime.now()
-                last_kline_time = datetime.fromtimestamp(ohlcv_4h[-1][0] / 1000)
-                # 计算当前应该完成的4H K线时间
-                current_hour = current_time.hour
-                completed_hour = (current_hour // 4) * 4
-                expected_completed_time = current_time.replace(
-                    hour=completed_hour, minute=0, second=0, microsecond=0
+                # 【V8.5.2.3优化】智能判断是否需要移除4H K线
+                if len(ohlcv_4h) > 0:
+                    current_time = datetime.now()
+                    last_kline_time = datetime.fromtimestamp(ohlcv_4h[-1][0] / 1000)
+                    # 计算当前应该完成的4H K线时间
+                    current_hour = current_time.hour
+                    completed_hour = (current_hour // 4) * 4
+                    expected_completed_time = current_time.replace(
+                        hour=completed_hour, minute=0, second=0, microsecond=0
+                    )
+                    if last_kline_time >= expected_completed_time:
+                        ohlcv_4h = ohlcv_4h[:-1]  # 移除未完成的
+                df_4h = pd.DataFrame(
+                    ohlcv_4h,
+                    columns=["timestamp", "open", "high", "low", "close", "volume"],
                 )
-                if last_kline_time >= expected_completed_time:
-                    ohlcv_4h = ohlcv_4h[:-1]  # 移除未完成的
-            df_4h = pd.DataFrame(
-                ohlcv_4h,
-                columns=["timestamp", "open", "high", "low", "close", "volume"],
-            )
-            df_4h["timestamp"] = pd.to_datetime(df_4h["timestamp"], unit="ms")
+                df_4h["timestamp"] = pd.to_datetime(df_4h["timestamp"], unit="ms")
         except Exception as e:
             print(f"⚠️ {symbol} 4H数据获取失败({e})，重采样15m数据")
             # V7.6.2: 重采样15m到4h，保持时间框架一致
@@ -20543,28 +20320,26 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
 
         # === 1小时K线数据（止损止盈位 + 中期趋势）V6.5 ===
         try:
-            # 【V8.5.2.4.88修复】区分实盘和回测
-            if is_backtest:
-                limit_1h = 673  # 回测：约1个月
+            ohlcv_1h = _fetch_ohlcv("1h")
+            if isinstance(ohlcv_1h, StoredCandles):
+                stored_timeframes.add("1h")
+                df_1h = ohlcv_1h.frame
             else:
-                limit_1h = 100  # 实盘：约4天（足够S/R分析）
-
-            ohlcv_1h = exchange.fetch_ohlcv(symbol, "1h", limit=limit_1h)
-            # 【V8.5.2.3优化】智能判断是否需要移除1H K线
-            if len(ohlcv_1h) > 0:
-                current_time = datetime.now()
-                last_kline_time = datetime.fromtimestamp(ohlcv_1h[-1][0] / 1000)
-                # 当前应该完成的1H K线时间
-                expected_completed_time = current_time.replace(
-                    minute=0, second=0, microsecond=0
+                # 【V8.5.2.3优化】智能判断是否需要移除1H K线
+                if len(ohlcv_1h) > 0:
+                    current_time = datetime.now()
+                    last_kline_time = datetime.fromtimestamp(ohlcv_1h[-1][0] / 1000)
+                    # 当前应该完成的1H K线时间
+                    expected_completed_time = current_time.replace(
+                        minute=0, second=0, microsecond=0
+                    )
+                    if last_kline_time >= expected_completed_time:
+                        ohlcv_1h = ohlcv_1h[:-1]  # 移除未完成的
+                df_1h = pd.DataFrame(
+                    ohlcv_1h,
+                    columns=["timestamp", "open", "high", "low", "close", "volume"],
                 )
-                if last_kline_time >= expected_completed_time:
-                    ohlcv_1h = ohlcv_1h[:-1]  # 移除未完成的
-            df_1h = pd.DataFrame(
-                ohlcv_1h,
-                columns=["timestamp", "open", "high", "low", "close", "volume"],
-            )
-            df_1h["timestamp"] = pd.to_datetime(df_1h["timestamp"], unit="ms")
+                df_1h["timestamp"] = pd.to_datetime(df_1h["timestamp"], unit="ms")
 
             # V7.6.2: 数据质量检查
             if len(df_1h) < 50:
@@ -20573,6 +20348,7 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
 
         except Exception as e:
             print(f"⚠️ {symbol} 1H数据获取失败({e})，重采样15m数据")
+            stored_timeframes.discard("1h")
             # V7.6.2: 重采样15m到1h，保持时间框架一致
             df_15m_copy = df_15m.copy()
             df_15m_copy.set_index("timestamp", inplace=True)
@@ -20592,10 +20368,25 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
         current_data = df_15m.iloc[-1]
         previous_data = df_15m.iloc[-2] if len(df_15m) > 1 else current_data
 
+        # 🆕 V8.9.5: 仓库K线走增量指标引擎（每根新K线O(1)更新），
+        # 其余情况（回测/直连交易所/重采样）全量计算（compute_indicator_snapshot）
+        from incremental_indicators import compute_indicator_snapshot
+
+        def _indicators(timeframe, df):
+            if timeframe in stored_timeframes:
+                return incremental_indicator_engine.update(symbol, timeframe, df)
+            return compute_indicator_snapshot(df)
+
+        ind_15m = _indicators(TRADE_CONFIG["timeframe"], df_15m)
+        ind_4h = _indicators("4h", df_4h)
+        ind_1h = _indicators("1h", df_1h)
+
         # === 短期指标（15分钟） ===
 
         # MACD
-        macd_line, signal_line, histogram = calculate_macd(df_15m)
+        macd_line = ind_15m["macd_line"]
+        signal_line = ind_15m["macd_signal"]
+        histogram = ind_15m["macd_histogram"]
         macd_trend = "多头" if histogram > 0 else "空头"
 
         # 成交量分析
@@ -20611,50 +20402,35 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
         ma7 = df_15m["close"].tail(28).mean()
         ma24 = df_15m["close"].tail(96).mean()
         ma72 = df_15m["close"].tail(288).mean()
-        ema20 = df_15m["close"].ewm(span=20, adjust=False).mean().iloc[-1]
-        ema50 = df_15m["close"].ewm(span=50, adjust=False).mean().iloc[-1]
+        ema20 = ind_15m["ema20"]
+        ema50 = ind_15m["ema50"]
 
         # 多周期RSI
-        def calculate_rsi(data, period):
-            delta = data.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
-            return rsi.iloc[-1] if not pd.isna(rsi.iloc[-1]) else 50
-
-        rsi_7 = calculate_rsi(df_15m["close"], 7)
-        rsi_14 = calculate_rsi(df_15m["close"], 14)
+        rsi_7 = ind_15m["rsi_7"]
+        rsi_14 = ind_15m["rsi_14"]
 
         # ATR（波动率）
-        def calculate_atr(df, period):
-            high_low = df["high"] - df["low"]
-            high_close = abs(df["high"] - df["close"].shift())
-            low_close = abs(df["low"] - df["close"].shift())
-            tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-            atr = tr.rolling(window=period).mean()
-            return atr.iloc[-1] if not pd.isna(atr.iloc[-1]) else 0
-
-        atr_3 = calculate_atr(df_15m, 3)
-        atr_14 = calculate_atr(df_15m, 14)
+        atr_3 = ind_15m["atr_3"]
+        atr_14 = ind_15m["atr_14"]
 
         # === 长期指标（4小时） ===
         current_4h = df_4h.iloc[-1]
 
         # 4小时均线
-        ema20_4h = df_4h["close"].ewm(span=20, adjust=False).mean().iloc[-1]
-        ema50_4h = df_4h["close"].ewm(span=50, adjust=False).mean().iloc[-1]
+        ema20_4h = ind_4h["ema20"]
+        ema50_4h = ind_4h["ema50"]
 
         # 4小时MACD
-        macd_line_4h, signal_line_4h, histogram_4h = calculate_macd(df_4h)
+        macd_line_4h = ind_4h["macd_line"]
+        histogram_4h = ind_4h["macd_histogram"]
         macd_trend_4h = "多头" if histogram_4h > 0 else "空头"
 
         # 4小时RSI
-        rsi_14_4h = calculate_rsi(df_4h["close"], 14)
+        rsi_14_4h = ind_4h["rsi_14"]
 
         # 4小时ATR
-        atr_3_4h = calculate_atr(df_4h, 3)
-        atr_14_4h = calculate_atr(df_4h, 14)
+        atr_3_4h = ind_4h["atr_3"]
+        atr_14_4h = ind_4h["atr_14"]
 
         # 4小时成交量
         volume_ma_4h = df_4h["volume"].tail(20).mean()
@@ -20700,15 +20476,17 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
         current_1h = df_1h.iloc[-1]
 
         # 1小时均线
-        ema20_1h = df_1h["close"].ewm(span=20, adjust=False).mean().iloc[-1]
-        ema50_1h = df_1h["close"].ewm(span=50, adjust=False).mean().iloc[-1]
+        ema20_1h = ind_1h["ema20"]
+        ema50_1h = ind_1h["ema50"]
 
         # 1小时MACD（V6.5新增：用于趋势判断）
-        macd_line_1h, signal_line_1h, histogram_1h = calculate_macd(df_1h)
+        macd_line_1h = ind_1h["macd_line"]
+        signal_line_1h = ind_1h["macd_signal"]
+        histogram_1h = ind_1h["macd_histogram"]
         macd_trend_1h = "多头" if histogram_1h > 0 else "空头"
 
         # 1小时ATR
-        atr_14_1h = calculate_atr(df_1h, 14)
+        atr_14_1h = ind_1h["atr_14"]
 
         # 1小时趋势判断（V6.5新增：用于过滤趋势末期）
         if ema20_1h > ema50_1h:
@@ -20937,25 +20715,21 @@ def get_ohlcv_data(symbol, skip_timing_check=False):
 
 
 def get_trade_info_from_csv(symbol, side):
-    """从CSV文件中获取完整的交易信息（开仓时间、杠杆、止盈止损、开仓理由等）"""
+    """从交易记录中获取完整的交易信息（开仓时间、杠杆、止盈止损、开仓理由等）
+
+    【V8.9.12】走交易账本的(币种, 方向, 未平仓)索引，不再为每个持仓重读整个CSV
+    """
+    from trade_ledger import get_ledger
+
     try:
-        if TRADES_FILE.exists():
-            df = pd.read_csv(TRADES_FILE)
-            # 清理列名中的前导/尾随空格
-            df.columns = df.columns.str.strip()
+        if TRADES_FILE.exists() or TRADES_FILE.with_suffix(".db").exists():
             coin_name = symbol.split("/")[0]
             side_cn = "多" if side == "long" else "空"
 
-            # 找到该币种、该方向、未平仓的记录
-            mask = (
-                (df["币种"] == coin_name)
-                & (df["方向"] == side_cn)
-                & (df["平仓时间"].isna())
-            )
-            matching_rows = df[mask]
+            # 找到该币种、该方向、未平仓的最后一条记录
+            row = get_ledger(TRADES_FILE).open_trade(coin_name, side_cn)
 
-            if not matching_rows.empty:
-                row = matching_rows.iloc[-1]
+            if row is not None:
                 return {
                     "open_time": row["开仓时间"],
                     "leverage": (
@@ -20994,7 +20768,8 @@ def get_all_positions():
         signal.signal(signal.SIGALRM, timeout_handler)
         signal.alarm(10)
 
-        all_positions = exchange.fetch_positions()
+        # 🆕 V8.9.25: 周期内复用持仓快照（本程序下单/撤单后自动失效）
+        all_positions = exchange_state.positions()
 
         # 取消超时
         signal.alarm(0)
@@ -21405,11 +21180,15 @@ def ai_portfolio_decision(
     current_balance,
     available_balance,
     deterministic_exit_symbols=None,
+    on_action=None,
+    on_content_start=None,
 ):
     """AI进行投资组合决策（使用学习参数）
 
     Args:
         deterministic_exit_symbols: 已通过Python确定性EXIT处理的币种列表（V8.9.1.1新增）
+        on_action: 流式解析出一个完整action时调用（V8.9.27新增，在调用方线程执行）
+        on_content_start: 模型开始输出正文时调用（V8.9.27新增，在流式读取线程执行）
 
     """
     if deterministic_exit_symbols is None:
@@ -21786,13 +21565,10 @@ Price: ${price:,.2f} ({data["price_change"]:+.2f}%)
     # 计算已完成的交易数量
     try:
         if TRADES_FILE.exists():
-            trades_count = (
-                len([
-                    line for line in TRADES_FILE.read_text().split("\n") if line.strip()
-                ])
-                - 1
-            )  # 减去表头
-            trades_count = max(0, trades_count)
+            # 【V8.9.12】从交易账本计数（CSV视图可能还没导出分批平仓新增的记录）
+            from trade_ledger import get_ledger
+
+            trades_count = get_ledger(TRADES_FILE).count()
         else:
             trades_count = 0
     except Exception:
@@ -22291,21 +22067,48 @@ Adapt your strategy based on the Market Regime Analysis provided:
 • HOLD MODE (low-vol/neutral): Raise thresholds (consensus≥4/5), reduce exposure, wait for clarity
 The regime recommendation is advisory - final decision depends on specific coin technicals."""
 
-        response = deepseek_client.chat.completions.create(
-            model="deepseek-reasoner",  # DeepSeek模型（思考模式，提升复杂策略分析能力）
-            messages=[
+        ai_request = {
+            "model": "deepseek-reasoner",  # DeepSeek模型（思考模式，提升复杂策略分析能力）
+            "messages": [
                 {
                     "role": "system",
                     "content": optimized_system_prompt,
                 },
                 {"role": "user", "content": prompt},
             ],
-            stream=False,
-            max_tokens=8000,  # 🔧 增加到8000，避免复杂决策时JSON被截断
-        )
+            "max_tokens": 8000,  # 🔧 增加到8000，避免复杂决策时JSON被截断
+        }
 
-        result = response.choices[0].message.content
-        finish_reason = response.choices[0].finish_reason
+        # 🆕 V8.9.27: 流式调用，actions数组中每个动作一闭合就交给on_action（如提前平仓），
+        # 完整响应仍按下面的原逻辑整体解析
+        result = None
+        if STREAMING_DECISION_CONFIG["enabled"]:
+            from streaming_decision import StreamingDecisionCall
+
+            call = StreamingDecisionCall(
+                deepseek_client, ai_request, on_content_start=on_content_start
+            )
+            call.start()
+            for streamed_action in call.actions():
+                if on_action is None:
+                    continue
+                try:
+                    on_action(streamed_action)
+                except Exception as e:
+                    print(f"⚠️ [流式决策] 处理流式动作失败: {e}")
+            try:
+                result, finish_reason = call.result()
+            except Exception as e:
+                if call.emitted_actions > 0:
+                    raise
+                print(f"⚠️ [流式决策] 流式调用失败，回退普通调用: {e}")
+                result = None
+            print(call.format_latency())
+
+        if result is None:
+            response = deepseek_client.chat.completions.create(**ai_request, stream=False)
+            result = response.choices[0].message.content
+            finish_reason = response.choices[0].finish_reason
 
         # 🔍 调试：查看 AI 完整响应
         print(f"\n{'=' * 70}")
@@ -24416,7 +24219,7 @@ def ai_adjust_tp_sl_if_needed(symbol, position, market_data, entry_context, conf
 
         # 获取当前的止盈止损价格（从交易所查询）
         try:
-            open_orders = exchange.fetch_open_orders(symbol)
+            open_orders = exchange_state.open_orders(symbol)
             current_tp = None
             current_sl = None
 
@@ -24602,6 +24405,7 @@ def execute_tp_sl_adjustment(symbol, position, adjustment_result):
         # 2.1 设置新止盈
         if new_tp:
             try:
+                api_rate_limiter.acquire(endpoint="create_order")
                 exchange.create_order(
                     symbol,
                     "take_profit_market",
@@ -24614,6 +24418,7 @@ def execute_tp_sl_adjustment(symbol, position, adjustment_result):
                         "tag": "f1ee03b510d5SUDE",
                     },
                 )
+                exchange_state.invalidate(symbol)
                 print(f"   ✓ 新止盈单已设置: ${new_tp:,.2f}")
                 success_count += 1
             except Exception as e:
@@ -24622,6 +24427,7 @@ def execute_tp_sl_adjustment(symbol, position, adjustment_result):
         # 2.2 设置新止损
         if new_sl:
             try:
+                api_rate_limiter.acquire(endpoint="create_order")
                 exchange.create_order(
                     symbol,
                     "stop_market",
@@ -24634,6 +24440,7 @@ def execute_tp_sl_adjustment(symbol, position, adjustment_result):
                         "tag": "f1ee03b510d5SUDE",
                     },
                 )
+                exchange_state.invalidate(symbol)
                 print(f"   ✓ 新止损单已设置: ${new_sl:,.2f}")
                 success_count += 1
             except Exception as e:
@@ -24752,7 +24559,7 @@ def get_time_of_day_preference():
         if not TRADES_FILE.exists():
             return default_prefs[current_period]
 
-        df = pd.read_csv(TRADES_FILE)
+        df = read_trades_csv(TRADES_FILE)
         if df.empty or "信号类型" not in df.columns:
             return default_prefs[current_period]
 
@@ -25480,6 +25287,7 @@ def monitor_positions_for_invalidation(
                                 time.sleep(0.3)
 
                             # 设置新止损
+                            api_rate_limiter.acquire(endpoint="create_order")
                             exchange.create_order(
                                 symbol,
                                 "stop_market",
@@ -25488,6 +25296,7 @@ def monitor_positions_for_invalidation(
                                 None,
                                 params={"stopPrice": new_sl, "reduceOnly": "true"},
                             )
+                            exchange_state.invalidate(symbol)
                             print(f"   ✓ 追踪止损已更新: ${new_sl:,.2f}")
                             send_bark_notification(
                                 f"[{model_name.upper()}]{coin_name}追踪止损🔧",
@@ -25766,7 +25575,12 @@ def monitor_positions_for_invalidation(
 
 
 def _execute_single_close_action(action, current_positions):
-    """执行单个平仓操作（V5.5辅助函数）- 实时持仓验证版"""
+    """执行单个平仓操作（V5.5辅助函数）- 实时持仓验证版
+
+    Returns:
+        bool: 【V8.9.27】该持仓已不在场上（本次平仓成功、已被止损/止盈自动平仓、
+        测试模式模拟平仓）时为True；最小盈利保护拒绝平仓或平仓失败时为False
+    """
     symbol = action.get("symbol", "")
     coin_name = symbol.split("/")[0]
 
@@ -25779,11 +25593,11 @@ def _execute_single_close_action(action, current_positions):
         )
         if not current_pos:
             print("⚠️ 无持仓，跳过平仓")
-            return
+            return True
         print("✓ 测试模式 - 仅模拟平仓")
         print(f"  拟平仓: {current_pos['side']}仓 {current_pos['size']}个")
         print(f"  当前盈亏: {current_pos['unrealized_pnl']:+.2f}U")
-        return
+        return True
 
     try:
         # 🆕 关键改进：实时获取持仓状态，不信任快照数据
@@ -25836,7 +25650,7 @@ def _execute_single_close_action(action, current_positions):
                     clear_position_context(coin=coin_name)
                 except Exception:
                     pass
-            return
+            return True
 
         print(f"✓ 确认持仓: {real_pos['side']}仓 {real_pos['size']}个")
         print(f"  当前盈亏: {real_pos['unrealized_pnl']:+.2f}U")
@@ -25853,7 +25667,7 @@ def _execute_single_close_action(action, current_positions):
                 f"⚠️ 利润${unrealized_pnl:.2f}U < 最小盈利${MIN_PROFIT_USD:.2f}U（手续费×1.5），禁止主动平仓"
             )
             print("   只能被SL/TP订单触发，继续持有等待")
-            return
+            return False
 
         side = "sell" if real_pos["side"] == "long" else "buy"
 
@@ -25996,7 +25810,7 @@ def _execute_single_close_action(action, current_positions):
 
             # 读取开仓时间计算实际持仓
             if TRADES_FILE.exists():
-                df = pd.read_csv(TRADES_FILE)
+                df = read_trades_csv(TRADES_FILE)
                 df.columns = df.columns.str.strip()
                 open_records = df[
                     (df["币种"] == coin_name)
@@ -26078,6 +25892,8 @@ def _execute_single_close_action(action, current_positions):
         except Exception:
             pass
 
+        return True
+
     except Exception as e:
         print(f"❌ 平仓失败: {e}")
         # 尝试从快照获取信息用于通知
@@ -26091,6 +25907,7 @@ def _execute_single_close_action(action, current_positions):
                 f"失败原因: {str(e)[:80]}\n"
                 f"平仓理由: {action.get('reason', 'N/A')[:60]}",
             )
+        return False
 
 
 def _execute_single_open_action_v55(
@@ -26849,7 +26666,7 @@ def _execute_single_open_action_v55(
         # 🆕 开仓前清理该币种的残留订单（防止旧止损止盈干扰新仓位）
         try:
             print("正在清理残留订单...")
-            open_orders = exchange.fetch_open_orders(symbol)
+            open_orders = exchange_state.open_orders(symbol)
             canceled_count = 0
             for order in open_orders:
                 # 修复：reduceOnly 可能是字符串 "true" 或布尔值 True
@@ -26860,6 +26677,7 @@ def _execute_single_open_action_v55(
 
                 if is_reduce_only:
                     try:
+                        api_rate_limiter.acquire(endpoint="cancel_order")
                         exchange.cancel_order(order["id"], symbol)
                         print(f"✓ 已清理旧订单: {order['type']}")
                         canceled_count += 1
@@ -26867,11 +26685,13 @@ def _execute_single_open_action_v55(
                         pass
             if canceled_count > 0:
                 print(f"✓ 共清理 {canceled_count} 个旧订单")
+                exchange_state.invalidate(symbol)
         except Exception as e:
             print(f"⚠️ 清理旧订单失败（可继续）: {e}")
 
         # 设置杠杆
         try:
+            api_rate_limiter.acquire(endpoint="set_leverage")
             exchange.set_leverage(leverage, symbol, {"mgnMode": "cross"})
             print(f"✓ 设置杠杆率: {leverage}x")
         except Exception as e:
@@ -27224,6 +27044,7 @@ def _execute_single_open_action_v55(
                 ytc_detected = action.get("ytc_signal_detected", False)
                 sl_tag = "YTC_SL_HARD" if ytc_detected else "f1ee03b510d5SUDE"
 
+                api_rate_limiter.acquire(endpoint="create_order")
                 exchange.create_order(
                     symbol,
                     "stop_market",
@@ -27236,6 +27057,7 @@ def _execute_single_open_action_v55(
                         "tag": sl_tag,
                     },
                 )
+                exchange_state.invalidate(symbol)
                 print(f"✓ 止损单已设置: ${stop_loss:,.2f} (Tag: {sl_tag})")
 
             # 2. 设置止盈订单（允许AI提前平仓）
@@ -27244,6 +27066,7 @@ def _execute_single_open_action_v55(
                 ytc_detected = action.get("ytc_signal_detected", False)
                 tp_tag = "YTC_TP_HARD" if ytc_detected else "f1ee03b510d5SUDE"
 
+                api_rate_limiter.acquire(endpoint="create_order")
                 exchange.create_order(
                     symbol,
                     "take_profit_market",
@@ -27256,6 +27079,7 @@ def _execute_single_open_action_v55(
                         "tag": tp_tag,
                     },
                 )
+                exchange_state.invalidate(symbol)
                 print(f"✓ 止盈单已设置: ${take_profit:,.2f} (Tag: {tp_tag})")
 
         except Exception as e:
@@ -27432,6 +27256,9 @@ def execute_portfolio_actions(
     print(f"风险评估: {decision.get('risk_assessment', 'N/A')}")
     print("=" * 70)
 
+    # 🆕 V8.9.27: 流式决策阶段已提前执行的平仓不再重复执行
+    early_closed_symbols = set(decision.get("_early_closed_symbols", []))
+
     # === V5.5 智能仓位管理 ===
     use_smart_position = (
         market_data_list is not None
@@ -27446,7 +27273,11 @@ def execute_portfolio_actions(
             for a in decision["actions"]
             if a.get("action") in ["OPEN_LONG", "OPEN_SHORT"]
         ]
-        close_actions = [a for a in decision["actions"] if a.get("action") == "CLOSE"]
+        close_actions = [
+            a
+            for a in decision["actions"]
+            if a.get("action") == "CLOSE" and a.get("symbol") not in early_closed_symbols
+        ]
         hold_actions = [a for a in decision["actions"] if a.get("action") == "HOLD"]
 
         # 先执行平仓（释放资金）
@@ -27698,6 +27529,10 @@ def execute_portfolio_actions(
             print("→ 观望，不操作")
             continue
 
+        if operation == "CLOSE" and symbol in early_closed_symbols:
+            print("→ 已在流式决策阶段提前平仓")
+            continue
+
         # 过滤低信心度信号
         if action.get("confidence") == "LOW":
             print("⚠️  信心度过低，跳过")
@@ -27776,7 +27611,7 @@ def execute_portfolio_actions(
                     # 【V7.9.1修复】清理该币种的止损/止盈订单
                     try:
                         print("正在清理残留的止损/止盈订单...")
-                        open_orders = exchange.fetch_open_orders(symbol)
+                        open_orders = exchange_state.open_orders(symbol)
                         canceled_count = 0
                         for ord in open_orders:
                             # 修复：reduceOnly 可能是字符串 "true" 或布尔值 True
@@ -27789,6 +27624,7 @@ def execute_portfolio_actions(
 
                             if is_reduce_only:
                                 try:
+                                    api_rate_limiter.acquire(endpoint="cancel_order")
                                     exchange.cancel_order(ord["id"], symbol)
                                     print(f"  ✓ 已清理订单: {ord['type']}")
                                     canceled_count += 1
@@ -27796,6 +27632,7 @@ def execute_portfolio_actions(
                                     pass
                         if canceled_count > 0:
                             print(f"✓ 共清理 {canceled_count} 个订单")
+                            exchange_state.invalidate(symbol)
                     except Exception as e:
                         print(f"⚠️ 清理订单失败（可忽略）: {e}")
 
@@ -27866,6 +27703,7 @@ def execute_portfolio_actions(
 
                     # 设置本次交易的杠杆率
                     try:
+                        api_rate_limiter.acquire(endpoint="set_leverage")
                         exchange.set_leverage(leverage, symbol, {"mgnMode": "cross"})
                         print(f"✓ 设置杠杆率: {leverage}x")
                     except Exception as e:
@@ -28012,6 +27850,7 @@ def execute_portfolio_actions(
 
                     # 设置本次交易的杠杆率
                     try:
+                        api_rate_limiter.acquire(endpoint="set_leverage")
                         exchange.set_leverage(leverage, symbol, {"mgnMode": "cross"})
                         print(f"✓ 设置杠杆率: {leverage}x")
                     except Exception as e:
@@ -28155,65 +27994,33 @@ def trading_bot():
             return  # 直接返回，不阻塞
 
     try:
-        print("⏳ [1/6] 获取市场数据...")
-        # 1. 获取所有币种的市场数据【V8.1.3增强：添加重试机制和延迟】
-        market_data_list = []
-        max_retries = 2  # 最多重试2次
-        retry_delay = 1  # 重试延迟1秒
-        inter_symbol_delay = 0.3  # 币种间延迟0.3秒，避免速率限制
-
-        for idx, symbol in enumerate(TRADE_CONFIG["symbols"]):
-            coin_name = symbol.split("/")[0]
-            data = None
+        # 🆕 V8.9.25: 本轮内余额/持仓/挂单快照共享，下单/撤单后显式失效
+        # （币种数决定挂单/条件单逐币种缓存还是全币种批量拉取）
+        exchange_state.begin_cycle(TRADE_CONFIG["symbols"])
 
-            # 重试机制
-            for attempt in range(max_retries + 1):
-                try:
-                    data = get_ohlcv_data(symbol)
-
-                    # 【V8.1.3关键】检查kline_data是否完整
-                    if data:
-                        kline_data = data.get("kline_data", [])
-                        if not kline_data or len(kline_data) == 0:
-                            if attempt < max_retries:
-                                print(
-                                    f"⚠️ {coin_name}: kline_data为空，{retry_delay}秒后重试({attempt + 1}/{max_retries})..."
-                                )
-                                time.sleep(retry_delay)
-                                continue  # 重试
-                            print(
-                                f"⚠️ {coin_name}: kline_data为空（已重试{max_retries}次），使用不完整数据"
-                            )
-                        # 数据完整，跳出重试循环
-                        break
-                    if attempt < max_retries:
-                        print(
-                            f"⚠️ {coin_name}: 数据获取失败，{retry_delay}秒后重试({attempt + 1}/{max_retries})..."
-                        )
-                        time.sleep(retry_delay)
-                    else:
-                        print(f"❌ {coin_name}: 数据获取失败（已重试{max_retries}次）")
-                except Exception as e:
-                    if attempt < max_retries:
-                        print(
-                            f"⚠️ {coin_name}: 异常({e})，{retry_delay}秒后重试({attempt + 1}/{max_retries})..."
-                        )
-                        time.sleep(retry_delay)
-                    else:
-                        print(f"❌ {coin_name}: 异常({e})，已重试{max_retries}次")
-                        data = None
-
-            if data:
-                market_data_list.append(data)
-                print(
-                    f"✓ {coin_name}: ${data['price']:,.2f} ({data['price_change']:+.2f}%)"
-                )
-            else:
-                market_data_list.append(None)  # 保持索引一致
+        print("⏳ [1/6] 获取市场数据...")
+        # 1. 获取所有币种的市场数据
+        # 🆕 V8.9.3: 所有币种×周期并发拉取（受APIRateLimiter权重约束），
+        # 取代原来逐币种串行 + 0.3秒间隔的写法；重试逻辑与kline_data完整性检查保留
+        from market_data_fetcher import (
+            fetch_market_data_concurrent,
+            format_latency_summary,
+        )
 
-            # 【V8.1.3】币种间延迟，避免触发速率限制（最后一个币种不需要延迟）
-            if idx < len(TRADE_CONFIG["symbols"]) - 1:
-                time.sleep(inter_symbol_delay)
+        fetch_start = time.time()
+        market_data_list, fetch_latency = fetch_market_data_concurrent(
+            TRADE_CONFIG["symbols"],
+            exchange,
+            get_ohlcv_data,
+            get_ohlcv_fetch_limits(),
+            rate_limiter=api_rate_limiter,
+            max_workers=MARKET_DATA_FETCH_CONFIG["max_workers"],
+            max_retries=MARKET_DATA_FETCH_CONFIG["max_retries"],
+            retry_delay=MARKET_DATA_FETCH_CONFIG["retry_delay"],
+            candle_store=ohlcv_candle_store
+            if MARKET_DATA_FETCH_CONFIG["use_candle_store"]
+            else None,
+        )
 
         # 检查是否至少有一个有效数据
         valid_data_count = sum(1 for d in market_data_list if d is not None)
@@ -28221,7 +28028,18 @@ def trading_bot():
             print("❌ 未能获取任何有效市场数据")
             return
 
-        print(f"✓ 成功获取 {valid_data_count}/{len(market_data_list)} 个币种数据")
+        print(
+            f"✓ 成功获取 {valid_data_count}/{len(market_data_list)} 个币种数据 "
+            f"(耗时{time.time() - fetch_start:.1f}秒, {format_latency_summary(fetch_latency)})"
+        )
+        if MARKET_DATA_FETCH_CONFIG["use_candle_store"]:
+            store_stats = ohlcv_candle_store.get_stats()
+            print(
+                f"  💾 K线仓库: 全量{store_stats['full_fetches']}次 / "
+                f"增量{store_stats['incremental_fetches']}次, "
+                f"累计下载{store_stats['candles_downloaded']}根, "
+                f"权重{store_stats['request_weight']}"
+            )
 
         # 【V8.5.2.4.69 DEBUG】market_data_list构建完成后立即验证共振字段
         print("\n  📊 【DEBUG】market_data_list构建完成后验证:")
@@ -28246,7 +28064,7 @@ def trading_bot():
 
         print("⏳ [2/6] 获取余额和持仓...")
         # 2. 获取当前余额和持仓
-        balance = exchange.fetch_balance()
+        balance = exchange_state.balance()
         usdt_balance = balance["USDT"]["total"]  # 总余额
         available_balance = balance["USDT"]["free"]  # 可用余额（已扣除保证金）
         current_positions, total_position_value = get_all_positions()
@@ -28408,7 +28226,50 @@ def trading_bot():
                 deterministic_exit_symbols = []  # 🆕 V8.9.1.1: 初始化空列表
 
         print("⏳ [4/6] AI决策分析...")
+        # 🆕 V8.9.27: 流式决策回调——CLOSE在模型仍在输出时提前执行（主线程）；
+        # 正文开始输出时后台预取余额/持仓到周期缓存，供执行阶段使用
+        early_closed_symbols = []
+        first_action_elapsed = None
+
+        def _prefetch_execution_state():
+            try:
+                exchange_state.positions()
+                exchange_state.balance()
+            except Exception as e:
+                print(f"⚠️ [流式决策] 预取余额/持仓失败: {e}")
+
+        def _on_content_start():
+            import threading
+
+            threading.Thread(
+                target=_prefetch_execution_state, name="execution-prefetch", daemon=True
+            ).start()
+
+        def _on_stream_action(action):
+            nonlocal first_action_elapsed
+            if first_action_elapsed is None:
+                first_action_elapsed = time.time() - start_time
+            if not STREAMING_DECISION_CONFIG["early_close"] or action.get("action") != "CLOSE":
+                return
+            symbol = action.get("symbol")
+            if symbol in early_closed_symbols or symbol in deterministic_exit_symbols:
+                return
+            if not any(p.get("symbol") == symbol for p in current_positions):
+                return
+            print(f"⚡ [流式决策] {symbol.split('/')[0]}: 收到CLOSE，模型输出未完成即提前平仓")
+            # 【V8.9.27】平仓辅助函数内部捕获下单异常，按返回值判断是否真正平掉
+            try:
+                closed = _execute_single_close_action(action, current_positions)
+            except Exception as e:
+                print(f"⚠️ [流式决策] 提前平仓异常: {e}")
+                closed = False
+            if closed:
+                early_closed_symbols.append(symbol)
+            else:
+                print("⚠️ [流式决策] 提前平仓失败，留待执行阶段处理")
+
         # 3. AI决策
+        ai_start = time.time()
         decision = ai_portfolio_decision(
             market_data_list,
             current_positions,
@@ -28418,10 +28279,27 @@ def trading_bot():
             deterministic_exit_symbols=deterministic_exit_symbols
             if "deterministic_exit_symbols" in locals()
             else [],
+            on_action=_on_stream_action,
+            on_content_start=_on_content_start,
         )
+        ai_elapsed = time.time() - ai_start
         if not decision:
             print("❌ AI决策失败")
             return
+        decision["_early_closed_symbols"] = early_closed_symbols
+
+        # 🆕 V8.9.27: 执行阶段使用模型输出期间刷新的余额/持仓（提前平仓后缓存已失效，会重新拉取）
+        if STREAMING_DECISION_CONFIG["enabled"]:
+            try:
+                current_positions, total_position_value = get_all_positions()
+                balance = exchange_state.balance()
+                usdt_balance = balance["USDT"]["total"]
+                available_balance = balance["USDT"]["free"]
+                total_assets = usdt_balance + sum(
+                    pos["unrealized_pnl"] for pos in current_positions
+                )
+            except Exception as e:
+                print(f"⚠️ 刷新执行数据失败，沿用决策前数据: {e}")
 
         print("⏳ [5/6] 保存AI决策...")
         # 保存AI决策历史
@@ -28438,7 +28316,7 @@ def trading_bot():
         )
 
         # 5. 更新系统状态（重新获取以获得最新数据）
-        balance = exchange.fetch_balance()
+        balance = exchange_state.balance()
         usdt_balance = balance["USDT"]["total"]  # 使用total余额（包含所有资产）
         current_positions_updated, total_position_value_updated = get_all_positions()
 
@@ -28481,6 +28359,21 @@ def trading_bot():
         }
         save_system_status(status_data)
 
+        first_action_text = (
+            f"{first_action_elapsed:.1f}s" if first_action_elapsed is not None else "-"
+        )
+        print(
+            f"  ⏱️ 本轮延迟: 首个动作{first_action_text} / AI决策{ai_elapsed:.1f}s / "
+            f"整轮{time.time() - start_time:.1f}s (提前平仓{len(early_closed_symbols)}个)"
+        )
+
+        state_stats = exchange_state.get_stats()
+        print(
+            f"  🗂️ 交易所状态缓存: 请求{state_stats['requests']}次(权重{state_stats['weight']}) / "
+            f"复用{state_stats['hits']}次(净节省权重{state_stats['weight_saved']}), "
+            f"下单/撤单失效{state_stats['invalidations']}次"
+        )
+
         elapsed = time.time() - start_time
         print("\n" + "=" * 70)
         print(f"✅ 本轮执行完成 (耗时: {elapsed:.1f}秒)")
@@ -28528,6 +28421,12 @@ def trading_bot():
             print(f"\n完整异常堆栈：\n{error_trace}")
 
             send_bark_notification("[DeepSeek]系统异常⚠️", f"交易循环出错 {e!s}")
+    finally:
+        exchange_state.end_cycle()
+        # 【V8.9.12】本轮平仓/修改合并导出到trades_history.csv
+        from trade_ledger import flush_trade_ledgers
+
+        flush_trade_ledgers()
 
 
 def main():
@@ -29752,150 +29651,52 @@ def _simulate_trade_with_params_enhanced(
     if not can_entry:
         return {"can_entry": False, "profit": 0, "exit_type": "no_entry"}
 
-    # 2. 计算TP/SL
-    if atr <= 0:
-        atr = entry_price * 0.02
-
-    # 优先级1: 形态识别 (scalping)
-    if pattern_type and pattern_data and signal_type == "scalping":
-        tp_sl = get_pattern_based_tp_sl(
-            entry_price, direction, pattern_type, pattern_data, atr
-        )
-        if tp_sl:
-            stop_loss = tp_sl["stop_loss"]
-            take_profit = tp_sl["take_profit"]
-        else:
-            # Fallback
-            stop_loss_distance = atr * atr_stop_multiplier
-            take_profit_distance = atr * (
-                atr_tp_multiplier or atr_stop_multiplier * min_risk_reward
-            )
-            stop_loss = (
-                entry_price - stop_loss_distance
-                if direction == "long"
-                else entry_price + stop_loss_distance
-            )
-            take_profit = (
-                entry_price + take_profit_distance
-                if direction == "long"
-                else entry_price - take_profit_distance
-            )
-
-    # 优先级2: SR Levels (swing)
-    elif signal_type == "swing" and support and resistance:
-        sr_margin = atr * 0.3
-        if direction == "long":
-            stop_loss = (
-                (support - sr_margin)
-                if support > 0
-                else (entry_price - atr * atr_stop_multiplier)
-            )
-            take_profit = (
-                (resistance + sr_margin)
-                if resistance > 0
-                else (entry_price + atr * (atr_tp_multiplier or 6.0))
-            )
-
-            # 验证合理性
-            if (
-                (entry_price - stop_loss) <= 0
-                or (take_profit - entry_price) <= 0
-                or ((take_profit - entry_price) / (entry_price - stop_loss)) < 1.5
-            ):
-                stop_loss = entry_price - atr * atr_stop_multiplier
-                take_profit = entry_price + atr * (atr_tp_multiplier or 6.0)
-        else:
-            stop_loss = (
-                (resistance + sr_margin)
-                if resistance > 0
-                else (entry_price + atr * atr_stop_multiplier)
-            )
-            take_profit = (
-                (support - sr_margin)
-                if support > 0
-                else (entry_price - atr * (atr_tp_multiplier or 6.0))
-            )
-
-            if (
-                (stop_loss - entry_price) <= 0
-                or (entry_price - take_profit) <= 0
-                or ((entry_price - take_profit) / (stop_loss - entry_price)) < 1.5
-            ):
-                stop_loss = entry_price + atr * atr_stop_multiplier
-                take_profit = entry_price - atr * (atr_tp_multiplier or 6.0)
-
-    # 优先级3: ATR-based
-    else:
-        stop_loss_distance = atr * atr_stop_multiplier
-        take_profit_distance = atr * (
-            atr_tp_multiplier or atr_stop_multiplier * min_risk_reward
-        )
-
-        if direction == "long":
-            stop_loss = entry_price - stop_loss_distance
-            take_profit = entry_price + take_profit_distance
-        else:
-            stop_loss = entry_price + stop_loss_distance
-            take_profit = entry_price - take_profit_distance
-
-    # 3. 模拟交易
     if future_data.empty:
         return {"can_entry": True, "profit": 0, "exit_type": "no_data"}
 
-    max_candles = None
-    if max_holding_hours:
-        max_candles = int(max_holding_hours * 4)
-
-    for idx, row in future_data.iterrows():
-        if max_candles and idx >= max_candles:
-            close_price = float(row.get("close", entry_price))
-            profit_pct = (
-                (close_price - entry_price) / entry_price * 100
-                if direction == "long"
-                else (entry_price - close_price) / entry_price * 100
-            )
-            return {"can_entry": True, "profit": profit_pct, "exit_type": "time_exit"}
-
-        high = float(row.get("high", row.get("close", 0)))
-        low = float(row.get("low", row.get("close", 0)))
-
-        if high <= 0 or low <= 0:
-            continue
-
-        if direction == "long":
-            if low <= stop_loss:
-                return {
-                    "can_entry": True,
-                    "profit": (stop_loss - entry_price) / entry_price * 100,
-                    "exit_type": "stop_loss",
-                }
-            if high >= take_profit:
-                return {
-                    "can_entry": True,
-                    "profit": (take_profit - entry_price) / entry_price * 100,
-                    "exit_type": "take_profit",
-                }
-        else:
-            if high >= stop_loss:
-                return {
-                    "can_entry": True,
-                    "profit": (entry_price - stop_loss) / entry_price * 100,
-                    "exit_type": "stop_loss",
-                }
-            if low <= take_profit:
-                return {
-                    "can_entry": True,
-                    "profit": (entry_price - take_profit) / entry_price * 100,
-                    "exit_type": "take_profit",
-                }
+    # 2. 计算TP/SL + 3. 模拟交易
+    # 【V8.9.7】走batch_trade_simulator的向量化实现（单个机会即1行矩阵），不再逐行iterrows；
+    # 优先级不变：形态(scalping) → SR Levels(swing) → ATR
+    from batch_trade_simulator import (
+        EXIT_TYPE_NAMES,
+        PATTERN_CODES,
+        build_price_matrix,
+        enhanced_levels,
+        simulate_path_batch,
+    )
 
-    last_close = float(future_data.iloc[-1].get("close", entry_price))
-    profit_pct = (
-        (last_close - entry_price) / entry_price * 100
-        if direction == "long"
-        else (entry_price - last_close) / entry_price * 100
+    use_pattern = bool(
+        pattern_type and signal_type == "scalping" and isinstance(pattern_data, dict)
     )
-    return {"can_entry": True, "profit": profit_pct, "exit_type": "holding"}
+    entry = np.array([float(entry_price)])
+    is_long = np.array([direction == "long"])
+    stop_loss, take_profit = enhanced_levels(
+        entry,
+        is_long,
+        np.array([float(atr)]),
+        atr_stop_multiplier,
+        atr_tp_multiplier,
+        min_risk_reward,
+        np.array([signal_type == "swing"]),
+        support=np.array([float(support or 0)]),
+        resistance=np.array([float(resistance or 0)]),
+        pattern_codes=np.array([PATTERN_CODES.get(pattern_type, 0) if use_pattern else 0]),
+        pattern_high=np.array(
+            [float(pattern_data.get("high", entry_price)) if use_pattern else entry_price]
+        ),
+        pattern_low=np.array(
+            [float(pattern_data.get("low", entry_price)) if use_pattern else entry_price]
+        ),
+    )
+    highs, lows, closes, lengths = build_price_matrix([future_data])
+    result = simulate_path_batch(
+        entry, is_long, stop_loss, take_profit, highs, lows, closes, lengths, max_holding_hours
+    )
+    return {
+        "can_entry": True,
+        "profit": float(result["profit"][0]),
+        "exit_type": EXIT_TYPE_NAMES[int(result["exit_type"][0])],
+    }
 
 
 def _simulate_with_summary(
@@ -29914,12 +29715,28 @@ def _simulate_with_summary(
         stop_loss: 止损价
         take_profit: 止盈价
         future_summary: dict {'max_high': float, 'min_low': float, 'final_close': float, 'data_points': int}
+            【V8.9.18】含'path'（未来K线的(n, 3) high/low/close数组）时按路径精确模拟
         max_holding_hours: 最长持仓小时（可选）
 
     Returns:
         {'can_entry': True, 'profit': float, 'exit_type': str}
 
     """
+    path = future_summary.get("path")
+    if path is not None:
+        from future_path_arena import simulate_path_levels
+
+        exit_type, exit_price, _ = simulate_path_levels(
+            path, entry_price, direction == "long", stop_loss, take_profit, max_holding_hours
+        )
+        if exit_type == "no_data":
+            return {"can_entry": True, "profit": 0, "exit_type": "no_data"}
+        if direction == "long":
+            profit_pct = (exit_price - entry_price) / entry_price * 100
+        else:
+            profit_pct = (entry_price - exit_price) / entry_price * 100
+        return {"can_entry": True, "profit": profit_pct, "exit_type": exit_type}
+
     max_high = future_summary.get("max_high", 0)
     min_low = future_summary.get("min_low", 0)
     final_close = future_summary.get("final_close", entry_price)
@@ -30287,8 +30104,16 @@ def analyze_separated_opportunities(market_snapshots, old_config):
 
             print(f"  🔍 [{coin_idx}/{total_coins}] {coin}...", end="", flush=True)
 
-            # 全点位分析（不采样）
-            sampled_indices = list(range(total_points))
+            # 🆕 V8.9.6: 向量化预扫描（滑动窗口一次算出所有点位的未来96根极值、
+            # 方向和最高利润位置），只对达到利润门槛的候选点做逐行字段解析
+            from opportunity_scanner import scan_forward_extremes
+
+            forward_scan = scan_forward_extremes(
+                coin_data, horizon=96, min_profit=MIN_PROFIT_THRESHOLD
+            )
+
+            # 全点位分析（不采样），候选集为原逐行逻辑可能入选点位的超集
+            sampled_indices = forward_scan["candidates"].tolist()
 
             for idx_count, idx in enumerate(sampled_indices):
                 # 每200个点显示进度
@@ -30377,64 +30202,18 @@ def analyze_separated_opportunities(market_snapshots, old_config):
                     if not trend_4h or volume_ratio < 1.2 or abs(rsi_15m - 50) < 15:
                         continue
 
-                    # 获取后续24小时数据
-                    later_24h = coin_data.iloc[idx + 1 : idx + 97].copy()
-                    if later_24h.empty:
-                        continue
-
-                    max_high = float(later_24h["high"].max())
-                    min_low = float(later_24h["low"].min())
-
-                    # 计算两个方向的最大潜在利润
-                    long_max_profit = (max_high - entry_price) / entry_price * 100
-                    short_max_profit = (entry_price - min_low) / entry_price * 100
+                    # 后续24小时数据（🆕 V8.9.6: 取自向量化预扫描结果）
+                    max_high = float(forward_scan["max_high"][idx])
+                    min_low = float(forward_scan["min_low"][idx])
 
                     # 选择利润更大的方向
-                    if long_max_profit > short_max_profit:
-                        direction = "long"
-                        max_profit = long_max_profit
-                    else:
-                        direction = "short"
-                        max_profit = short_max_profit
+                    direction = "long" if forward_scan["is_long"][idx] else "short"
 
-                    # 【V8.5.2.4.48】统一跟踪：只要达到5%就开始跟踪
-                    if max_profit < MIN_PROFIT_THRESHOLD:
-                        continue
-
-                    # 动态跟踪：找到最高点的时间
-                    tracking_started = False
-                    max_profit_seen = 0
-                    bars_to_max_profit = 0
-
-                    for bar_idx, future_row in enumerate(later_24h.iterrows()):
-                        _, row_data = future_row
-
-                        # 计算当前利润
-                        if direction == "long":
-                            profit_pct = (
-                                (float(row_data["high"]) - entry_price)
-                                / entry_price
-                                * 100
-                            )
-                        else:
-                            profit_pct = (
-                                (entry_price - float(row_data["low"]))
-                                / entry_price
-                                * 100
-                            )
-
-                        # 启动跟踪
-                        if not tracking_started and profit_pct >= MIN_PROFIT_THRESHOLD:
-                            tracking_started = True
-                            max_profit_seen = profit_pct
-                            bars_to_max_profit = bar_idx
-
-                        # 更新最大利润
-                        if tracking_started and profit_pct > max_profit_seen:
-                            max_profit_seen = profit_pct
-                            bars_to_max_profit = bar_idx
-
-                    if not tracking_started:
+                    # 【V8.5.2.4.48】统一跟踪：达到门槛后，从首次达标到窗口结束的最高利润
+                    # 即整个窗口的最高利润（达标前的K线利润都低于门槛）
+                    max_profit_seen = float(forward_scan["max_profit"][idx])
+                    bars_to_max_profit = int(forward_scan["bars_to_max"][idx])
+                    if max_profit_seen < MIN_PROFIT_THRESHOLD or bars_to_max_profit < 0:
                         continue
 
                     # 计算持仓时间（从入场到最高点）
@@ -30485,10 +30264,12 @@ def analyze_separated_opportunities(market_snapshots, old_config):
                         if hasattr(current, "to_dict")
                         else dict(current),
                         "future_data": {
-                            "max_high": float(later_24h["high"].max()),
-                            "min_low": float(later_24h["low"].min()),
-                            "final_close": float(later_24h.iloc[-1]["close"]),
-                            "data_points": len(later_24h),
+                            "max_high": max_high,
+                            "min_low": min_low,
+                            "final_close": float(forward_scan["final_close"][idx]),
+                            "data_points": 96,
+                            # 🆕 V8.9.18: 完整未来路径（共享数组的视图），模拟时按首次触达判断TP/SL
+                            "path": forward_scan["path_arena"].window(idx, 96),
                         },
                         # 暂不设置signal_type，等Phase 1.3分类
                     }
@@ -30507,7 +30288,7 @@ def analyze_separated_opportunities(market_snapshots, old_config):
             )
 
             # 【V8.5.2.4.48】及时释放内存
-            del coin_data
+            del coin_data, forward_scan
             gc.collect()
 
         print(f"\n  ✅ Phase 1.1完成: 收集到{len(all_profit_opportunities)}个盈利机会")
@@ -30988,11 +30769,13 @@ def analyze_separated_opportunities(market_snapshots, old_config):
         }
 
 
-def simulate_params_on_opportunities(opportunities, params):
+def simulate_params_on_opportunities(opportunities, params, arrays=None):
     """【V8.3.12】用指定参数模拟交易机会
 
     参数:
         opportunities: 机会列表
+        arrays: 【V8.9.7】batch_trade_simulator.opportunity_arrays(opportunities)，
+            网格搜索在循环外构建一次传入；None时按当前列表内容现场构建
         params: 参数字典 {
             'min_signal_score': int,
             'min_indicator_consensus': int,
@@ -31013,6 +30796,13 @@ def simulate_params_on_opportunities(opportunities, params):
             'stop_loss_count': int
         }
     """
+    # 【V8.9.7】摘要数据走向量化批量模拟（与逐个模拟结果一致），否则回退逐个模拟
+    from batch_trade_simulator import simulate_opportunities_batch, summarize_batch_result
+
+    batch = simulate_opportunities_batch(opportunities, params, arrays=arrays)
+    if batch is not None:
+        return summarize_batch_result(batch, len(opportunities))
+
     captured_count = 0
     total_profit = 0
     time_exit_count = 0
@@ -31063,9 +30853,11 @@ def simulate_params_on_opportunities(opportunities, params):
     }
 
 
-def simulate_params_on_opportunities_with_details(opportunities, params):
+def simulate_params_on_opportunities_with_details(opportunities, params, arrays=None):
     """【V8.3.12.1】增强版：记录详细的exit信息，用于AI分析
 
+    arrays: 【V8.9.7】同simulate_params_on_opportunities
+
     返回：
     {
         'summary': {...},  # 基本统计
@@ -31080,25 +30872,37 @@ def simulate_params_on_opportunities_with_details(opportunities, params):
 
     exit_details = []
 
-    for opp in opportunities:
-        # 模拟这个机会
-        sim_result = _simulate_trade_with_params(
-            entry_price=opp["entry_price"],
-            direction=opp["direction"],
-            atr=opp["atr"],
-            future_data=opp["future_data"],
-            signal_score=70,
-            consensus=opp["consensus"],
-            risk_reward=opp["risk_reward"],
-            min_signal_score=params.get("min_signal_score", 60),
-            min_consensus=params.get("min_indicator_consensus", 2),
-            min_risk_reward=params.get("min_risk_reward", 1.5),
-            atr_stop_multiplier=params.get("atr_stop_multiplier", 1.5),
-            atr_tp_multiplier=params.get("atr_tp_multiplier", 3.0),
-            max_holding_hours=params.get("max_holding_hours", 24),
-            signal_type=opp.get("signal_type", "swing"),
-            market_data=None,  # 暂不传入完整market_data
-        )
+    # 【V8.9.7】摘要数据先批量模拟，循环中只取结果（market_data=None时signal_type不影响SL/TP）
+    from batch_trade_simulator import EXIT_TYPE_NAMES, simulate_opportunities_batch
+
+    batch = simulate_opportunities_batch(opportunities, params, arrays=arrays)
+
+    for opp_idx, opp in enumerate(opportunities):
+        if batch is not None:
+            sim_result = {
+                "can_entry": bool(batch["can_entry"][opp_idx]),
+                "profit": float(batch["profit"][opp_idx]),
+                "exit_type": EXIT_TYPE_NAMES[int(batch["exit_type"][opp_idx])],
+            }
+        else:
+            # 模拟这个机会
+            sim_result = _simulate_trade_with_params(
+                entry_price=opp["entry_price"],
+                direction=opp["direction"],
+                atr=opp["atr"],
+                future_data=opp["future_data"],
+                signal_score=70,
+                consensus=opp["consensus"],
+                risk_reward=opp["risk_reward"],
+                min_signal_score=params.get("min_signal_score", 60),
+                min_consensus=params.get("min_indicator_consensus", 2),
+                min_risk_reward=params.get("min_risk_reward", 1.5),
+                atr_stop_multiplier=params.get("atr_stop_multiplier", 1.5),
+                atr_tp_multiplier=params.get("atr_tp_multiplier", 3.0),
+                max_holding_hours=params.get("max_holding_hours", 24),
+                signal_type=opp.get("signal_type", "swing"),
+                market_data=None,  # 暂不传入完整market_data
+            )
 
         if sim_result["can_entry"]:
             captured_count += 1
@@ -33165,6 +32969,11 @@ def optimize_scalping_params(
     # ===== 【旧版】Grid Search（降级或use_v8321=False） =====
     print(f"\n  📊 使用旧版Grid Search优化器（{len(opportunities)}个机会）")
 
+    # 🆕 V8.9.7: 机会数组只构建一次，显式传给每组参数的模拟（网格搜索期间机会列表不变）
+    from batch_trade_simulator import opportunity_arrays
+
+    opp_arrays = opportunity_arrays(opportunities)
+
     # ========== 【V8.3.19 NEW】信号类型分析 ==========
     print(f"\n  📊 【V8.3.19】分析信号类型表现（共{len(opportunities)}个机会）...")
     signal_performance = analyze_signal_type_performance(opportunities)
@@ -33226,7 +33035,7 @@ def optimize_scalping_params(
         test_params.update(combination)
 
         # 模拟
-        result = simulate_params_on_opportunities(opportunities, test_params)
+        result = simulate_params_on_opportunities(opportunities, test_params, arrays=opp_arrays)
         score = calculate_scalping_optimization_score(result)
 
         round1_results.append({
@@ -33291,7 +33100,7 @@ def optimize_scalping_params(
             test_params = current_params.copy()
             test_params.update(combination)
 
-            result = simulate_params_on_opportunities(opportunities, test_params)
+            result = simulate_params_on_opportunities(opportunities, test_params, arrays=opp_arrays)
             score = calculate_scalping_optimization_score(result)
 
             round2_results.append({
@@ -33418,7 +33227,7 @@ def optimize_scalping_params(
 
             round3_results = []
             for idx, test_params in enumerate(round3_combinations, 1):
-                result = simulate_params_on_opportunities(opportunities, test_params)
+                result = simulate_params_on_opportunities(opportunities, test_params, arrays=opp_arrays)
                 score = calculate_scalping_optimization_score(result)
 
                 round3_results.append({
@@ -33463,7 +33272,7 @@ def optimize_scalping_params(
                     f"\n  ❌ Round 3仍然失败（time_exit={best_round3_te_rate:.0f}%），保持原参数"
                 )
                 baseline_result = simulate_params_on_opportunities(
-                    opportunities, current_params
+                    opportunities, current_params, arrays=opp_arrays
                 )
                 return {
                     "optimized_params": current_params,
@@ -33487,7 +33296,7 @@ def optimize_scalping_params(
             print("\n  ❌ AI拒绝优化结果，且未提供Round 3建议")
             print(f"     原因: {final_decision.get('reasoning', 'N/A')[:100]}...")
             baseline_result = simulate_params_on_opportunities(
-                opportunities, current_params
+                opportunities, current_params, arrays=opp_arrays
             )
             return {
                 "optimized_params": current_params,
@@ -33510,7 +33319,7 @@ def optimize_scalping_params(
             }
 
     # ========== 计算改进指标 ==========
-    baseline_result = simulate_params_on_opportunities(opportunities, current_params)
+    baseline_result = simulate_params_on_opportunities(opportunities, current_params, arrays=opp_arrays)
 
     # ========== 返回优化结果 ==========
     return {
@@ -33829,6 +33638,11 @@ def optimize_swing_params(
     # ===== 【旧版】Grid Search（降级或use_v8321=False） =====
     print(f"\n  📊 使用旧版Grid Search优化器（{len(opportunities)}个机会）")
 
+    # 🆕 V8.9.7: 机会数组只构建一次，显式传给每组参数的模拟（网格搜索期间机会列表不变）
+    from batch_trade_simulator import opportunity_arrays
+
+    opp_arrays = opportunity_arrays(opportunities)
+
     # 【V8.3.16】使用initial_params作为Grid Search的起点
     if initial_params:
         print("     ℹ️  应用V7.7.0初始参数到Grid Search")
@@ -33854,7 +33668,7 @@ def optimize_swing_params(
 
     # 计算基准表现
     baseline_params = current_params.copy()
-    baseline_result = simulate_params_on_opportunities(opportunities, baseline_params)
+    baseline_result = simulate_params_on_opportunities(opportunities, baseline_params, arrays=opp_arrays)
     calculate_swing_optimization_score(baseline_result)
 
     print(
@@ -33892,7 +33706,7 @@ def optimize_swing_params(
 
                     # 模拟
                     result = simulate_params_on_opportunities(
-                        opportunities, test_params
+                        opportunities, test_params, arrays=opp_arrays
                     )
                     score = calculate_swing_optimization_score(result)
 
@@ -33913,7 +33727,7 @@ def optimize_swing_params(
     # ========== 阶段2: Exit Analysis ==========
     print("\n  🔍 阶段2: Exit Analysis")
     detailed_result = simulate_params_on_opportunities_with_details(
-        opportunities, best_params
+        opportunities, best_params, arrays=opp_arrays
     )
     exit_analysis = analyze_exit_patterns(detailed_result["exit_details"])
 
@@ -34000,7 +33814,7 @@ def optimize_swing_params(
 
         # 验证AI调整后的效果
         print("\n  ✅ 验证AI调整后的效果...")
-        final_result = simulate_params_on_opportunities(opportunities, final_params)
+        final_result = simulate_params_on_opportunities(opportunities, final_params, arrays=opp_arrays)
         final_score = calculate_swing_optimization_score(final_result)
 
         print(
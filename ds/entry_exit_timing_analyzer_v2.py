@@ -5,6 +5,8 @@
 1. 开仓分析：对比昨日市场快照（所有识别的机会点）vs AI实际开仓决策
 2. 平仓分析：对比实际平仓点 vs 最优平仓点（基于后续K线走势）
 3. 结合AI决策记录，分析决策逻辑是否正确
+4. 【V8.9.24】交易/快照/K线/AI决策先按币种和时间建索引（timing_join），
+   窗口匹配和最近决策查找为二分查找，不再逐条重扫、重复解析时间
 
 作者：AI Assistant
 日期：2025-11-12
@@ -13,6 +15,8 @@
 import pandas as pd
 from datetime import timedelta
 
+from timing_join import DecisionTimeIndex, TimeIndex
+
 
 def classify_entry_quality(trade, objective_profit=None, matched_opportunity=None):
     """
@@ -285,6 +289,11 @@ def analyze_entry_timing_v2(
         matched_trades_count = 0
         debug_first_snapshot = True  # 调试第一个snapshot
         
+        # 【V8.9.24】交易按币种+开仓时间建索引，AI决策时间只解析一次
+        trade_index = TimeIndex(yesterday_trades_df, '开仓时间', '币种')
+        decision_index = DecisionTimeIndex(ai_decisions_list) if ai_decisions_list else None
+        snapshot_index = None  # 原逻辑路径中首次需要后续K线时构建
+        
         if opportunities_to_check is not None:
             # 【新逻辑】使用confirmed_opportunities
             for opp in opportunities_to_check:
@@ -299,13 +308,13 @@ def analyze_entry_timing_v2(
                     opp_time_dt = pd.to_datetime(timestamp_str)
                 except (ValueError, TypeError):
                     continue
+                if opp_time_dt is None or pd.isna(opp_time_dt):
+                    continue
                 
                 # 匹配AI开仓记录（±5分钟）
-                matching_trades = yesterday_trades_df[
-                    (yesterday_trades_df['币种'] == coin) &
-                    (pd.to_datetime(yesterday_trades_df['开仓时间']) >= opp_time_dt - timedelta(minutes=5)) &
-                    (pd.to_datetime(yesterday_trades_df['开仓时间']) <= opp_time_dt + timedelta(minutes=5))
-                ]
+                matching_trades = trade_index.rows(
+                    coin, opp_time_dt - timedelta(minutes=5), opp_time_dt + timedelta(minutes=5)
+                )
                 
                 if matching_trades.empty:
                     # AI没开仓 → 错过的机会
@@ -326,16 +335,9 @@ def analyze_entry_timing_v2(
                     
                     if ai_decisions_list:
                         # 🔧 V8.3.32.8: 优化AI决策匹配，区分"未运行"和"主动不开仓"
-                        # 1. 获取AI决策的时间范围
-                        earliest_ai_time = None
-                        latest_ai_time = None
-                        try:
-                            timestamps_ai = [pd.to_datetime(d.get('timestamp', '')) for d in ai_decisions_list if d.get('timestamp')]
-                            if timestamps_ai:
-                                earliest_ai_time = min(timestamps_ai)
-                                latest_ai_time = max(timestamps_ai)
-                        except (ValueError, TypeError):
-                            pass
+                        # 1. 获取AI决策的时间范围（【V8.9.24】索引构建时已算好）
+                        earliest_ai_time = decision_index.earliest
+                        latest_ai_time = decision_index.latest
                         
                         # 2. 判断机会时间是否在AI运行期间
                         if earliest_ai_time and opp_time_dt < earliest_ai_time:
@@ -347,23 +349,8 @@ def analyze_entry_timing_v2(
                             time_after_stop = (opp_time_dt - latest_ai_time).total_seconds() / 3600
                             ai_reason = f"机器人可能已停止（机会时间晚于AI最晚记录{time_after_stop:.1f}小时）"
                         else:
-                            # 机会在AI运行期间 → 找最接近的决策
-                            closest_decision = None
-                            min_time_diff = float('inf')
-                            
-                            for decision in ai_decisions_list:
-                                decision_time_str = decision.get('timestamp', '')
-                                if decision_time_str:
-                                    try:
-                                        decision_time = pd.to_datetime(decision_time_str)
-                                        time_diff_seconds = abs((decision_time - opp_time_dt).total_seconds())
-                                        
-                                        # 只匹配2小时内的决策
-                                        if time_diff_seconds < 7200 and time_diff_seconds < min_time_diff:
-                                            min_time_diff = time_diff_seconds
-                                            closest_decision = decision
-                                    except Exception:
-                                        continue
+                            # 机会在AI运行期间 → 找最接近的决策（只匹配2小时内的决策）
+                            closest_decision, min_time_diff = decision_index.closest(opp_time_dt, max_seconds=7200)
                             
                             # 如果找到最接近的决策
                             if closest_decision:
@@ -491,22 +478,20 @@ def analyze_entry_timing_v2(
                         print(f"      第一笔交易开仓时间: {first_trade_open_time}")
                     debug_first_snapshot = False
                 
-                matching_trades = yesterday_trades_df[
-                    (yesterday_trades_df['币种'] == coin) &
-                    (pd.to_datetime(yesterday_trades_df['开仓时间']) >= snapshot_time_dt - timedelta(minutes=5)) &
-                    (pd.to_datetime(yesterday_trades_df['开仓时间']) <= snapshot_time_dt + timedelta(minutes=5))
-                ]
+                matching_trades = trade_index.rows(
+                    coin, snapshot_time_dt - timedelta(minutes=5), snapshot_time_dt + timedelta(minutes=5)
+                )
                 
                 if matching_trades.empty:
                     # 情况1: AI没开仓（错过机会 or 正确过滤）
                     # 🔧 V8.3.25.14: 使用K线回测确认是否真的错过盈利机会
                     
                     # 获取这个snapshot的后续K线数据（后续4小时）
-                    coin_klines = market_snapshots_df[
-                        (market_snapshots_df['coin'] == coin) &
-                        (market_snapshots_df['full_datetime'] > snapshot_time_dt) &
-                        (market_snapshots_df['full_datetime'] <= snapshot_time_dt + timedelta(hours=4))
-                    ].copy()
+                    if snapshot_index is None:
+                        snapshot_index = TimeIndex(market_snapshots_df, 'full_datetime', 'coin')
+                    coin_klines = snapshot_index.rows(
+                        coin, snapshot_time_dt, snapshot_time_dt + timedelta(hours=4), include_start=False
+                    )
                     
                     is_truly_missed = False
                     potential_profit_pct = 0
@@ -918,6 +903,15 @@ def analyze_exit_timing_v2(
     
     print(f"  ✓ 分析 {exit_stats['total_exits']} 笔平仓交易")
     
+    # 【V8.9.24】K线按币种+时间建索引（time列只解析一次）
+    kline_index = None
+    if kline_snapshots_df is not None and not kline_snapshots_df.empty:
+        # 🔧 V8.3.25.15: 指定format避免warning
+        kline_index = TimeIndex(
+            kline_snapshots_df, 'time', 'coin',
+            parse=lambda col: pd.to_datetime(col, format='mixed', errors='coerce')
+        )
+    
     # ===== 分析每笔平仓交易 =====
     for idx, trade in yesterday_closed_trades_df.iterrows():
         coin = trade.get('币种', '')
@@ -951,104 +945,97 @@ def analyze_exit_timing_v2(
             exit_stats['manual_exits'] += 1
         
         # 获取平仓后的K线数据（后续4小时）
-        if kline_snapshots_df is not None and not kline_snapshots_df.empty:
-            coin_klines = kline_snapshots_df[kline_snapshots_df['coin'] == coin].copy()
-            if not coin_klines.empty:
-                # 🔧 V8.3.25.15: 指定format避免warning
-                coin_klines['time'] = pd.to_datetime(coin_klines['time'], format='mixed', errors='coerce')
-                coin_klines = coin_klines.sort_values('time')
+        if kline_index is not None:
+            future_klines = kline_index.rows(
+                coin, exit_time, exit_time + timedelta(hours=4), include_start=False
+            )
+            
+            if not future_klines.empty:
+                # 计算最大潜在利润
+                if side == '多':
+                    max_price_after = future_klines['high'].max()
+                    missed_profit_pct = (max_price_after - exit_price) / exit_price * 100
+                else:  # 空单
+                    min_price_after = future_klines['low'].min()
+                    missed_profit_pct = (exit_price - min_price_after) / exit_price * 100
                 
-                future_klines = coin_klines[
-                    (coin_klines['time'] > exit_time) &
-                    (coin_klines['time'] <= exit_time + timedelta(hours=4))
-                ]
+                # 判断平仓质量
+                is_premature = False
+                is_delayed = False
                 
-                if not future_klines.empty:
-                    # 计算最大潜在利润
-                    if side == '多':
-                        max_price_after = future_klines['high'].max()
-                        missed_profit_pct = (max_price_after - exit_price) / exit_price * 100
-                    else:  # 空单
-                        min_price_after = future_klines['low'].min()
-                        missed_profit_pct = (exit_price - min_price_after) / exit_price * 100
-                    
-                    # 判断平仓质量
-                    is_premature = False
-                    is_delayed = False
-                    
-                    # 🔧 V8.3.25.12: 提取完整的开仓/平仓理由，传递给AI深度分析
-                    ai_open_reason = trade.get('开仓理由', 'N/A')
-                    ai_close_reason = trade.get('平仓理由', 'N/A')
-                    
-                    if exit_type == '止盈' and missed_profit_pct > 2:
-                        # 止盈后还有>2%利润，说明过早平仓
-                        is_premature = True
-                        exit_stats['premature_exits'] += 1
-                        premature_exits.append({
-                            'coin': coin,
-                            'side': side,
-                            'entry_price': entry_price,
-                            'exit_price': exit_price,
-                            'exit_type': exit_type,
-                            'exit_reason': exit_reason[:50],
-                            'pnl': pnl,
-                            'missed_profit_pct': missed_profit_pct,
-                            'recommendation': f'TP扩大{1.3:.1f}倍' if missed_profit_pct > 3 else 'TP扩大1.2倍',
-                            'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
-                            'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
-                        })
-                    elif exit_type == '止损' and pnl < -1 and missed_profit_pct < -1:
-                        # 止损后价格继续朝不利方向走，说明延迟止损
-                        is_delayed = True
-                        exit_stats['delayed_exits'] += 1
-                        delayed_exits.append({
-                            'coin': coin,
-                            'side': side,
-                            'entry_price': entry_price,
-                            'exit_price': exit_price,
-                            'exit_type': exit_type,
-                            'exit_reason': exit_reason[:50],
-                            'pnl': pnl,
-                            'extra_loss_pct': abs(missed_profit_pct),
-                            'recommendation': '提前止损或扩大止损距离',
-                            'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
-                            'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
-                        })
-                    else:
-                        # 最优平仓
-                        exit_stats['optimal_exits'] += 1
-                        optimal_exits.append({
-                            'coin': coin,
-                            'side': side,
-                            'entry_price': entry_price,
-                            'exit_price': exit_price,
-                            'exit_type': exit_type,
-                            'pnl': pnl,
-                            'recommendation': '继续保持',
-                            'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
-                            'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
-                        })
-                    
-                    # 添加到表格数据
-                    # 🔧 V8.3.25.9: 添加entry_time, signal_score, consensus字段
-                    exit_table_data.append({
+                # 🔧 V8.3.25.12: 提取完整的开仓/平仓理由，传递给AI深度分析
+                ai_open_reason = trade.get('开仓理由', 'N/A')
+                ai_close_reason = trade.get('平仓理由', 'N/A')
+                
+                if exit_type == '止盈' and missed_profit_pct > 2:
+                    # 止盈后还有>2%利润，说明过早平仓
+                    is_premature = True
+                    exit_stats['premature_exits'] += 1
+                    premature_exits.append({
                         'coin': coin,
                         'side': side,
-                        'entry_time': entry_time_str,  # 🆕 开仓时间
                         'entry_price': entry_price,
                         'exit_price': exit_price,
                         'exit_type': exit_type,
+                        'exit_reason': exit_reason[:50],
                         'pnl': pnl,
-                        'signal_score': signal_score,  # 🆕 信号评分
-                        'consensus': consensus,  # 🆕 共振数
-                        'max_potential_profit_pct': missed_profit_pct if not is_delayed else 0,
-                        'evaluation': '⚠️ 早平' if is_premature else '⚠️ 延迟' if is_delayed else '✅ 最优',
-                        'recommendation': premature_exits[-1]['recommendation'] if is_premature else 
-                                        delayed_exits[-1]['recommendation'] if is_delayed else '继续保持'
+                        'missed_profit_pct': missed_profit_pct,
+                        'recommendation': f'TP扩大{1.3:.1f}倍' if missed_profit_pct > 3 else 'TP扩大1.2倍',
+                        'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
+                        'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
                     })
-                    
-                    continue
-        
+                elif exit_type == '止损' and pnl < -1 and missed_profit_pct < -1:
+                    # 止损后价格继续朝不利方向走，说明延迟止损
+                    is_delayed = True
+                    exit_stats['delayed_exits'] += 1
+                    delayed_exits.append({
+                        'coin': coin,
+                        'side': side,
+                        'entry_price': entry_price,
+                        'exit_price': exit_price,
+                        'exit_type': exit_type,
+                        'exit_reason': exit_reason[:50],
+                        'pnl': pnl,
+                        'extra_loss_pct': abs(missed_profit_pct),
+                        'recommendation': '提前止损或扩大止损距离',
+                        'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
+                        'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
+                    })
+                else:
+                    # 最优平仓
+                    exit_stats['optimal_exits'] += 1
+                    optimal_exits.append({
+                        'coin': coin,
+                        'side': side,
+                        'entry_price': entry_price,
+                        'exit_price': exit_price,
+                        'exit_type': exit_type,
+                        'pnl': pnl,
+                        'recommendation': '继续保持',
+                        'ai_open_reason': ai_open_reason,  # 🆕 AI开仓理由
+                        'ai_close_reason': ai_close_reason  # 🆕 AI平仓理由
+                    })
+                
+                # 添加到表格数据
+                # 🔧 V8.3.25.9: 添加entry_time, signal_score, consensus字段
+                exit_table_data.append({
+                    'coin': coin,
+                    'side': side,
+                    'entry_time': entry_time_str,  # 🆕 开仓时间
+                    'entry_price': entry_price,
+                    'exit_price': exit_price,
+                    'exit_type': exit_type,
+                    'pnl': pnl,
+                    'signal_score': signal_score,  # 🆕 信号评分
+                    'consensus': consensus,  # 🆕 共振数
+                    'max_potential_profit_pct': missed_profit_pct if not is_delayed else 0,
+                    'evaluation': '⚠️ 早平' if is_premature else '⚠️ 延迟' if is_delayed else '✅ 最优',
+                    'recommendation': premature_exits[-1]['recommendation'] if is_premature else 
+                                    delayed_exits[-1]['recommendation'] if is_delayed else '继续保持'
+                })
+                
+                continue
+    
         # 如果没有K线数据，只能基于PNL判断
         if pnl > 0:
             exit_stats['optimal_exits'] += 1
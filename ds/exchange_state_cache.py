@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.25】交易周期内共享的交易所状态快照
+
+核心功能:
+1. 一轮trading_bot()内余额、持仓只向交易所请求一次；普通挂单、条件单按币种缓存，
+   本周期币种数超过批量查询的保本点（全币种权重40 / 单币种权重1）时改为全币种批量拉取再按币种分发
+2. 本程序自己下单/撤单/挂止盈止损后显式invalidate(symbol)：只失效该币种的挂单/条件单/盘口
+   （批量快照中该币种改为单独重新查询），余额和持仓是全账户数据（按币种查询权重相同），整体重新拉取
+3. 盘口（fetch_order_book）按币种短时缓存，同样在本币种下单后失效
+4. 每次实际请求按币安权重向APIRateLimiter申请配额；weight_saved为净节省
+   （不使用缓存时逐次查询的权重 - 实际花费的权重，批量拉取多花的权重会抵扣）
+
+不在周期内（begin_cycle之前/end_cycle之后）时所有读取直接透传到交易所，
+其他定时任务的行为与原来一致。快照超过max_age_seconds（如AI决策耗时较长）时也会重新拉取，
+避免交易所侧止盈止损触发后仍读到旧持仓。
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from api_rate_limiter import endpoint_weight
+
+# 币安统一账户(papi)各接口的请求权重（【V8.9.26】取自限频器的接口权重表）
+REQUEST_WEIGHTS = {
+    "balance": endpoint_weight("fetch_balance"),
+    "positions": endpoint_weight("fetch_positions"),
+    "open_orders_all": endpoint_weight("fetch_open_orders", all_symbols=True),
+    "conditional_orders_all": endpoint_weight("papi_conditional_open_orders", all_symbols=True),
+    "order_book": endpoint_weight("fetch_order_book", limit=5),
+}
+
+# 逐币种查询时的权重（用于统计节省量）
+PER_SYMBOL_WEIGHTS = {
+    "open_orders": endpoint_weight("fetch_open_orders"),
+    "conditional_orders": endpoint_weight("papi_conditional_open_orders"),
+}
+
+
+def binance_symbol(symbol: str) -> str:
+    """BTC/USDT:USDT -> BTCUSDT"""
+    if "/" in symbol:
+        return symbol.split("/")[0] + symbol.split(":")[0].split("/")[1]
+    return symbol
+
+
+class _Snapshot:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class ExchangeStateCache:
+    """
+    交易周期级别的交易所状态缓存
+
+    Args:
+        exchange: ccxt交易所实例
+        rate_limiter: APIRateLimiter（可选），每次实际请求前acquire对应权重
+        conditional_orders_fetcher: fetcher(binance_symbol或None) → papi条件单原始dict列表，
+            None表示全部币种；为None时conditional_orders()返回空列表
+        max_age_seconds: 周期内快照的最长使用时间
+        order_book_ttl: 盘口缓存时间（秒）
+        bulk_min_symbols: 本周期币种数达到该值时挂单/条件单改为全币种批量拉取；
+            None为按权重计算的保本点（全币种权重 / 单币种权重 + 1）
+    """
+
+    def __init__(
+        self,
+        exchange,
+        rate_limiter=None,
+        conditional_orders_fetcher: Optional[Callable[[Optional[str]], List[Dict]]] = None,
+        max_age_seconds: float = 30.0,
+        order_book_ttl: float = 2.0,
+        bulk_min_symbols: Optional[int] = None,
+    ):
+        self.exchange = exchange
+        self.rate_limiter = rate_limiter
+        self.conditional_orders_fetcher = conditional_orders_fetcher
+        self.max_age_seconds = max_age_seconds
+        self.order_book_ttl = order_book_ttl
+        self.bulk_min_symbols = bulk_min_symbols
+
+        self._lock = threading.RLock()
+        self._active = False
+        self._cycle_symbols = 0
+        self._snapshots: Dict[str, _Snapshot] = {}  # 全账户：balance / positions / 批量挂单
+        self._symbol_snapshots: Dict[tuple, _Snapshot] = {}  # (kind, symbol) → 单币种挂单/条件单
+        self._stale: Set[tuple] = set()  # 批量快照中已失效的(kind, symbol)
+        self._order_books: Dict[tuple, _Snapshot] = {}
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict:
+        # baseline_weight: 不使用缓存时（每次读取都逐币种查询）会花费的权重
+        return {"hits": 0, "requests": 0, "weight": 0, "baseline_weight": 0, "invalidations": 0}
+
+    def _clear(self):
+        self._snapshots.clear()
+        self._symbol_snapshots.clear()
+        self._stale.clear()
+        self._order_books.clear()
+
+    # ------------------------------------------------------------------
+    # 周期管理
+    # ------------------------------------------------------------------
+
+    def begin_cycle(self, symbols: Optional[List[str]] = None):
+        """
+        新一轮交易周期开始：清空上一轮的快照和统计
+
+        Args:
+            symbols: 本周期要查询的币种，用于决定挂单/条件单是否批量拉取（None按逐币种缓存）
+        """
+        with self._lock:
+            self._active = True
+            self._cycle_symbols = len(symbols) if symbols else 0
+            self._clear()
+            self.stats = self._empty_stats()
+
+    def end_cycle(self):
+        """周期结束：之后的读取直接透传"""
+        with self._lock:
+            self._active = False
+            self._clear()
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def invalidate(self, symbol: Optional[str] = None):
+        """
+        本程序下单/撤单/设置止盈止损后调用
+
+        symbol为None时全部失效；否则只失效该币种的挂单/条件单/盘口，批量快照保留
+        （其他币种继续复用，该币种下次读取单独查询）。余额和持仓随任何订单变化，
+        且按币种查询与全账户查询权重相同，整体失效
+        """
+        with self._lock:
+            self.stats["invalidations"] += 1
+            if symbol is None:
+                self._clear()
+                return
+            self._snapshots.pop("balance", None)
+            self._snapshots.pop("positions", None)
+            for kind in PER_SYMBOL_WEIGHTS:
+                self._symbol_snapshots.pop((kind, symbol), None)
+                if kind in self._snapshots:
+                    self._stale.add((kind, symbol))
+            for key in [k for k in self._order_books if k[0] == symbol]:
+                del self._order_books[key]
+
+    def uses_bulk(self, kind: str) -> bool:
+        """本周期该类挂单是否批量拉取（币种数达到保本点）"""
+        threshold = self.bulk_min_symbols
+        if threshold is None:
+            threshold = REQUEST_WEIGHTS[f"{kind}_all"] // PER_SYMBOL_WEIGHTS[kind] + 1
+        return self._cycle_symbols >= threshold
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def _request(self, weight: int, fetch: Callable, observe: bool = True):
+        """实际请求；observe=True时用ccxt最近一次响应头校准限频器（papi原生请求由调用方自行校准）"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(weight)
+        value = fetch()
+        if observe and self.rate_limiter is not None:
+            self.rate_limiter.observe(self.exchange)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["weight"] += weight
+        return value
+
+    @staticmethod
+    def _fresh(snapshot: Optional[_Snapshot], ttl: float) -> bool:
+        return snapshot is not None and time.time() - snapshot.fetched_at <= ttl
+
+    def _cached(self, name: str, weight: int, fetch: Callable, observe: bool = True):
+        """周期内按name缓存的全账户数据"""
+        if not self._active:
+            return self._request(weight, fetch, observe)
+
+        with self._lock:
+            self.stats["baseline_weight"] += weight
+            snapshot = self._snapshots.get(name)
+            if self._fresh(snapshot, self.max_age_seconds):
+                self.stats["hits"] += 1
+                return snapshot.value
+
+            # 持锁拉取：同一周期内并发读取只触发一次请求
+            value = self._request(weight, fetch, observe)
+            self._snapshots[name] = _Snapshot(value, time.time())
+            return value
+
+    def _symbol_orders(
+        self,
+        kind: str,
+        symbol: str,
+        fetch_one: Callable,
+        fetch_all: Callable,
+        match: Callable[[Dict], bool],
+        observe: bool = True,
+    ) -> List[Dict]:
+        """
+        单币种挂单/条件单：先查单币种缓存；批量模式下从全币种快照分发
+        （该币种在快照后被invalidate时单独查询）；否则逐币种查询并缓存
+        """
+        weight = PER_SYMBOL_WEIGHTS[kind]
+        if not self._active:
+            return self._request(weight, fetch_one, observe)
+
+        key = (kind, symbol)
+        with self._lock:
+            self.stats["baseline_weight"] += weight
+            snapshot = self._symbol_snapshots.get(key)
+            if self._fresh(snapshot, self.max_age_seconds):
+                self.stats["hits"] += 1
+                return list(snapshot.value)
+
+            if self.uses_bulk(kind) and key not in self._stale:
+                bulk = self._snapshots.get(kind)
+                if self._fresh(bulk, self.max_age_seconds):
+                    self.stats["hits"] += 1
+                else:
+                    bulk = _Snapshot(
+                        self._request(REQUEST_WEIGHTS[f"{kind}_all"], fetch_all, observe), time.time()
+                    )
+                    self._snapshots[kind] = bulk
+                    self._stale = {k for k in self._stale if k[0] != kind}
+                return [o for o in bulk.value if match(o)]
+
+            value = self._request(weight, fetch_one, observe)
+            self._symbol_snapshots[key] = _Snapshot(value, time.time())
+            self._stale.discard(key)
+            return list(value)
+
+    def balance(self) -> Dict:
+        """exchange.fetch_balance()"""
+        return self._cached("balance", REQUEST_WEIGHTS["balance"], self.exchange.fetch_balance)
+
+    def positions(self, symbols: Optional[List[str]] = None) -> List[Dict]:
+        """exchange.fetch_positions()；symbols不为空时只返回这些币种"""
+        positions = self._cached(
+            "positions", REQUEST_WEIGHTS["positions"], self.exchange.fetch_positions
+        )
+        if symbols:
+            return [p for p in positions if p.get("symbol") in symbols]
+        return list(positions)
+
+    def _fetch_all_open_orders(self) -> List[Dict]:
+        options = getattr(self.exchange, "options", None)
+        if isinstance(options, dict):
+            # 批量拉取是有意为之（代替逐币种查询），关闭ccxt的无symbol警告
+            options["warnOnFetchOpenOrdersWithoutSymbol"] = False
+        return self.exchange.fetch_open_orders()
+
+    def open_orders(self, symbol: str) -> List[Dict]:
+        """exchange.fetch_open_orders(symbol)（周期内缓存，币种多时批量拉取）"""
+        return self._symbol_orders(
+            "open_orders",
+            symbol,
+            lambda: self.exchange.fetch_open_orders(symbol),
+            self._fetch_all_open_orders,
+            lambda o: o.get("symbol") == symbol,
+        )
+
+    def conditional_orders(self, symbol: str) -> List[Dict]:
+        """指定币种的papi条件单（止盈/止损策略单）"""
+        if self.conditional_orders_fetcher is None:
+            return []
+        target = binance_symbol(symbol)
+        return self._symbol_orders(
+            "conditional_orders",
+            symbol,
+            lambda: self.conditional_orders_fetcher(target),
+            lambda: self.conditional_orders_fetcher(None),
+            lambda o: o.get("symbol") == target,
+            observe=False,
+        )
+
+    def order_book(self, symbol: str, limit: int = 5) -> Dict:
+        """exchange.fetch_order_book(symbol, limit)，order_book_ttl秒内复用"""
+        weight = REQUEST_WEIGHTS["order_book"]
+        fetch = lambda: self.exchange.fetch_order_book(symbol, limit=limit)  # noqa: E731
+        if not self._active:
+            return self._request(weight, fetch)
+
+        key = (symbol, limit)
+        with self._lock:
+            self.stats["baseline_weight"] += weight
+            snapshot = self._order_books.get(key)
+            if self._fresh(snapshot, self.order_book_ttl):
+                self.stats["hits"] += 1
+                return snapshot.value
+            value = self._request(weight, fetch)
+            self._order_books[key] = _Snapshot(value, time.time())
+            return value
+
+    def get_stats(self) -> Dict:
+        """本周期统计：命中次数、实际请求次数/权重、净节省权重（可能为负）、失效次数"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["weight_saved"] = stats["baseline_weight"] - stats["weight"]
+        return stats
+
+
+if __name__ == "__main__":
+    """
+    自检：周期内复用、批量分发、下单后失效、周期外透传
+    """
+
+    class _FakeExchange:
+        def __init__(self):
+            self.options = {}
+            self.calls = []
+            self.orders = [
+                {"id": "1", "symbol": "BTC/USDT:USDT"},
+                {"id": "2", "symbol": "ETH/USDT:USDT"},
+                {"id": "3", "symbol": "BTC/USDT:USDT"},
+            ]
+
+        def fetch_balance(self):
+            self.calls.append("balance")
+            return {"USDT": {"total": 100.0, "free": 80.0}}
+
+        def fetch_positions(self):
+            self.calls.append("positions")
+            return [{"symbol": "BTC/USDT:USDT", "contracts": 1}, {"symbol": "ETH/USDT:USDT", "contracts": 2}]
+
+        def fetch_open_orders(self, symbol=None):
+            self.calls.append(("open_orders", symbol))
+            return [o for o in self.orders if symbol is None or o["symbol"] == symbol]
+
+        def fetch_order_book(self, symbol, limit=5):
+            self.calls.append(("order_book", symbol))
+            return {"bids": [[1.0, 1.0]], "asks": [[1.1, 1.0]]}
+
+    fake = _FakeExchange()
+    conditional_calls = []
+
+    def _conditional(symbol=None):
+        conditional_calls.append(symbol)
+        orders = [{"symbol": "BTCUSDT", "strategyId": 7}, {"symbol": "ETHUSDT", "strategyId": 8}]
+        return [o for o in orders if symbol is None or o["symbol"] == symbol]
+
+    cache = ExchangeStateCache(fake, conditional_orders_fetcher=_conditional)
+    symbols = ["BTC/USDT:USDT", "ETH/USDT:USDT"]
+
+    # 周期外：透传
+    cache.balance()
+    cache.balance()
+    assert fake.calls.count("balance") == 2
+
+    # 币种少：挂单/条件单逐币种查询并缓存（批量权重40不划算）
+    cache.begin_cycle(symbols)
+    assert not cache.uses_bulk("open_orders")
+    fake.calls.clear()
+    for _ in range(3):
+        cache.balance()
+        cache.positions()
+    assert fake.calls == ["balance", "positions"]
+    assert [p["symbol"] for p in cache.positions(["ETH/USDT:USDT"])] == ["ETH/USDT:USDT"]
+
+    for _ in range(2):
+        assert [o["id"] for o in cache.open_orders("BTC/USDT:USDT")] == ["1", "3"]
+        assert [o["id"] for o in cache.open_orders("ETH/USDT:USDT")] == ["2"]
+        assert cache.conditional_orders("ETH/USDT:USDT") == [{"symbol": "ETHUSDT", "strategyId": 8}]
+        assert cache.conditional_orders("BTC/USDT:USDT")[0]["strategyId"] == 7
+    assert ("open_orders", None) not in fake.calls
+    assert fake.calls.count(("open_orders", "BTC/USDT:USDT")) == 1
+    assert conditional_calls == ["ETHUSDT", "BTCUSDT"]
+
+    cache.order_book("BTC/USDT:USDT")
+    cache.order_book("BTC/USDT:USDT")
+    assert fake.calls.count(("order_book", "BTC/USDT:USDT")) == 1
+
+    # 本程序在BTC下单后：余额/持仓和BTC的挂单/盘口失效，ETH继续复用
+    cache.invalidate("BTC/USDT:USDT")
+    cache.balance()
+    cache.open_orders("BTC/USDT:USDT")
+    cache.open_orders("ETH/USDT:USDT")
+    cache.order_book("BTC/USDT:USDT")
+    assert fake.calls.count("balance") == 2
+    assert fake.calls.count(("open_orders", "BTC/USDT:USDT")) == 2
+    assert fake.calls.count(("open_orders", "ETH/USDT:USDT")) == 1
+    assert fake.calls.count(("order_book", "BTC/USDT:USDT")) == 2
+
+    small_stats = cache.get_stats()
+    assert small_stats["hits"] > 0 and small_stats["invalidations"] == 1
+    assert small_stats["weight_saved"] == small_stats["baseline_weight"] - small_stats["weight"] > 0
+
+    # 币种多：全币种批量拉取一次；下单后只单独重新查询该币种，批量快照保留
+    many = [f"C{i}/USDT:USDT" for i in range(60)]
+    fake.orders = [{"id": str(i), "symbol": s} for i, s in enumerate(many)]
+    cache.begin_cycle(many)
+    assert cache.uses_bulk("open_orders")
+    fake.calls.clear()
+    for s in many:
+        assert [o["symbol"] for o in cache.open_orders(s)] == [s]
+    assert fake.calls == [("open_orders", None)]
+    cache.invalidate(many[0])
+    cache.open_orders(many[0])
+    cache.open_orders(many[0])
+    cache.open_orders(many[1])
+    assert fake.calls == [("open_orders", None), ("open_orders", many[0])]
+    bulk_stats = cache.get_stats()
+    assert bulk_stats["weight"] == REQUEST_WEIGHTS["open_orders_all"] + PER_SYMBOL_WEIGHTS["open_orders"]
+    assert bulk_stats["weight_saved"] == len(many) + 3 - bulk_stats["weight"] > 0
+
+    cache.end_cycle()
+    fake.calls.clear()
+    cache.open_orders("BTC/USDT:USDT")
+    assert fake.calls == [("open_orders", "BTC/USDT:USDT")]
+    assert cache.conditional_orders("BTC/USDT:USDT") == [{"symbol": "BTCUSDT", "strategyId": 7}]
+    assert conditional_calls[-1] == "BTCUSDT"
+
+    print(f"✅ 交易所状态缓存自检通过: 少币种{small_stats} | 多币种{bulk_stats}")
@@ -4,11 +4,23 @@
 在服务器端导出真实历史数据到market_snapshots目录
 自动生成到最新UTC时间，支持覆盖旧数据
 【V7.8增强】支持计算signal_score，用于复盘分析
+【V8.9.17】回填引擎：每个币种整段只拉取一次（since分页 + 原始K线磁盘缓存），
+          连续序列上一次性算指标再按天切分；币种间并行拉取（共享限速），断点续传
+
+环境变量:
+    BACKFILL_WORKERS: 并行拉取的币种数（默认3）
+    BACKFILL_MIN_INTERVAL: 所有线程合计的最小请求间隔秒数（默认0.5，1500根/页约120页/分钟）
+    BACKFILL_CACHE_DIR: 原始K线缓存与断点文件目录（默认 trading_data/kline_cache）
 """
 
 import os
 import sys
 import csv
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import ccxt  # type: ignore[import-untyped]
 import pandas as pd  # type: ignore[import-untyped]
 import numpy as np
@@ -63,6 +75,20 @@ except ImportError:
         except (KeyError, TypeError, AttributeError):
             return 50, 0.30, 2
 
+# 【V8.9.15】K线侧车索引：回填改写CSV后同步重建，看板价格图继续走快速路径
+try:
+    from snapshot_ohlc_index import write_day_index
+    HAS_OHLC_INDEX = True
+except ImportError:
+    HAS_OHLC_INDEX = False
+
+# 【V8.9.9】列式分区：读取方优先读分区，回填改写CSV时必须同步重写，否则读到回填前的旧数据
+try:
+    from market_snapshot_store import has_snapshot_day, write_snapshot_day, writes_columnar, columnar_path
+    HAS_SNAPSHOT_STORE = True
+except ImportError:
+    HAS_SNAPSHOT_STORE = False
+
 # 加载环境变量
 _env_file = Path(__file__).parent / '.env.qwen'
 if _env_file.exists():
@@ -71,17 +97,19 @@ if _env_file.exists():
 # 初始化币安交易所（使用公开API，无需密钥）
 EXCHANGE_TYPE = os.getenv("EXCHANGE_TYPE", "binance")
 
-if EXCHANGE_TYPE == "binance":
-    exchange = ccxt.binance({
-        "options": {"defaultType": "future"},
-        "enableRateLimit": True,
-    })
-else:
-    exchange = ccxt.okx({
+def create_exchange():
+    if EXCHANGE_TYPE == "binance":
+        return ccxt.binance({
+            "options": {"defaultType": "future"},
+            "enableRateLimit": True,
+        })
+    return ccxt.okx({
         "options": {"defaultType": "swap"},
         "enableRateLimit": True,
     })
 
+exchange = create_exchange()
+
 # 币种列表
 SYMBOLS = [
     "BTC/USDT:USDT",
@@ -93,6 +121,19 @@ SYMBOLS = [
     "LTC/USDT:USDT",
 ]
 
+# 【V8.9.17】回填引擎配置
+TIMEFRAME = '15m'
+TIMEFRAME_MS = 15 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+WARMUP_DAYS = 7  # 指标预热天数（与fetch_data_for_date一致）
+PAGE_LIMIT = 1500  # 单次fetch_ohlcv的K线数上限（币安合约最大1500）
+FETCH_RETRIES = 3
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "3"))
+BACKFILL_MIN_INTERVAL = float(os.getenv("BACKFILL_MIN_INTERVAL", "0.5"))
+BACKFILL_CACHE_DIR = Path(os.getenv(
+    "BACKFILL_CACHE_DIR", str(Path(__file__).parent / "trading_data" / "kline_cache")
+))
+
 
 # ============================================================
 # 【V8.3.21】数据增强辅助函数（方案B）
@@ -381,31 +422,40 @@ def calculate_atr(high, low, close, period=14):
     return true_range.rolling(period).mean()
 
 def determine_trend(close, short=20, long=50):
-    """判断趋势"""
-    ema_short = close.ewm(span=short, adjust=False).mean()
-    ema_long = close.ewm(span=long, adjust=False).mean()
+    """判断趋势（【V8.9.17】np.select向量化，与逐行判断结果一致）"""
+    ema_short = close.ewm(span=short, adjust=False).mean().to_numpy()
+    ema_long = close.ewm(span=long, adjust=False).mean().to_numpy()
     
-    conditions = [
-        (ema_short > ema_long * 1.005, "多头"),
-        (ema_short < ema_long * 0.995, "空头"),
-        (ema_short >= ema_long, "多头转弱"),
-        (ema_short < ema_long, "空头转弱")
-    ]
+    trend = np.select(
+        [
+            ema_short > ema_long * 1.005,
+            ema_short < ema_long * 0.995,
+            ema_short >= ema_long,
+            ema_short < ema_long,
+        ],
+        ["多头", "空头", "多头转弱", "空头转弱"],
+        default="震荡",
+    ).astype(object)
+    trend[:long] = "震荡"
     
-    trend = ["震荡"] * len(close)
-    for i in range(len(close)):
-        if i >= long:
-            for condition, label in conditions:
-                if isinstance(condition, tuple):
-                    if condition[0].iloc[i]:
-                        trend[i] = condition[1]
-                        break
-                else:
-                    if condition.iloc[i]:
-                        trend[i] = label
-                        break
-    
-    return trend
+    return trend.tolist()
+
+def compute_indicators(df):
+    """在连续的15m序列上一次性计算全部指标（原地添加列并返回df）"""
+    df['rsi_14'] = calculate_rsi(df['close'], 14)
+    df['rsi_7'] = calculate_rsi(df['close'], 7)
+    df['macd_line'], df['macd_signal'], df['macd_histogram'] = calculate_macd(df['close'])
+    df['atr'] = calculate_atr(df['high'], df['low'], df['close'], 14)
+    df['support'] = df['low'].rolling(window=20).min()
+    df['resistance'] = df['high'].rolling(window=20).max()
+    df['trend_15m'] = determine_trend(df['close'], 20, 50)
+    df['trend_4h'] = determine_trend(df['close'], 50, 100)
+    df['trend_1h'] = determine_trend(df['close'], 30, 60)
+    df['ema20_1h'] = df['close'].ewm(span=20, adjust=False).mean()
+    df['ema50_1h'] = df['close'].ewm(span=50, adjust=False).mean()
+    df['macd_1h_line'], df['macd_1h_signal'], df['macd_1h_histogram'] = calculate_macd(df['close'], 48, 104, 36)
+    df['atr_1h'] = calculate_atr(df['high'], df['low'], df['close'], 56)
+    return df
 
 def fetch_data_for_date(symbol, date_str):
     """获取指定日期的数据"""
@@ -431,20 +481,7 @@ def fetch_data_for_date(symbol, date_str):
         
         df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         
-        # 计算指标
-        df['rsi_14'] = calculate_rsi(df['close'], 14)
-        df['rsi_7'] = calculate_rsi(df['close'], 7)
-        df['macd_line'], df['macd_signal'], df['macd_histogram'] = calculate_macd(df['close'])
-        df['atr'] = calculate_atr(df['high'], df['low'], df['close'], 14)
-        df['support'] = df['low'].rolling(window=20).min()
-        df['resistance'] = df['high'].rolling(window=20).max()
-        df['trend_15m'] = determine_trend(df['close'], 20, 50)
-        df['trend_4h'] = determine_trend(df['close'], 50, 100)
-        df['trend_1h'] = determine_trend(df['close'], 30, 60)
-        df['ema20_1h'] = df['close'].ewm(span=20, adjust=False).mean()
-        df['ema50_1h'] = df['close'].ewm(span=50, adjust=False).mean()
-        df['macd_1h_line'], df['macd_1h_signal'], df['macd_1h_histogram'] = calculate_macd(df['close'], 48, 104, 36)
-        df['atr_1h'] = calculate_atr(df['high'], df['low'], df['close'], 56)
+        compute_indicators(df)
         
         # 过滤目标日期（保留原始索引，用于后续访问历史数据）
         day_df = df[(df['timestamp'] >= start_ts) & (df['timestamp'] < end_ts)].copy()
@@ -462,575 +499,579 @@ def fetch_data_for_date(symbol, date_str):
         print(f"    ✗ 获取失败: {e}")
         return None
 
-def export_date(date_str, output_dirs):
-    """导出指定日期的CSV到多个目录"""
-    print(f"\n{'='*60}")
-    print(f"导出 {date_str} 的数据")
-    print(f"{'='*60}")
+class SymbolSeries:
+    """
+    【V8.9.17】单个币种的连续15m序列（指标已计算）
     
-    all_rows = []
+    逐行特征（成交量均值、前几根K线、最近100根K线上下文）直接切片这里预先取出的数组，
+    不再每行多次iloc；一段连续序列可以按天切出任意多天
+    """
     
-    for symbol in SYMBOLS:
-        coin_name = symbol.split('/')[0]
-        fetch_result = fetch_data_for_date(symbol, date_str)
+    def __init__(self, symbol, df):
+        self.symbol = symbol
+        self.coin = symbol.split('/')[0]
+        self.df = df.reset_index(drop=True)
+        self.timestamps = self.df['timestamp'].to_numpy()
+        self.opens = self.df['open'].to_numpy()
+        self.closes = self.df['close'].to_numpy()
+        self.volumes = self.df['volume'].to_numpy()
+        self.trend_15m = self.df['trend_15m'].tolist()
+        self.candles = self.df[['open', 'high', 'low', 'close', 'volume']].to_dict('records')
+    
+    def day_positions(self, date_str):
+        """某天（与fetch_data_for_date相同的日界）在序列中的行号范围"""
+        target_date = datetime.strptime(date_str, '%Y%m%d')
+        start_ts = int(target_date.timestamp() * 1000)
+        end_ts = int((target_date + timedelta(days=1)).timestamp() * 1000)
+        lo, hi = np.searchsorted(self.timestamps, [start_ts, end_ts], side='left')
+        return range(int(lo), int(hi))
+
+def build_rows(series, positions):
+    """把序列中positions范围内的K线转换为快照CSV行"""
+    coin_name = series.coin
+    rows = []
+    day_df = series.df.iloc[positions.start:positions.stop]
+    for actual_position, row in zip(positions, day_df.itertuples(index=False)):
+        time_str = datetime.fromtimestamp(row.timestamp / 1000).strftime('%H%M')
         
-        if fetch_result is None:
-            continue
+        # 【V8.2.3】增强market_data构造 - 基于历史数据判断各种形态
+        ema20 = row.ema20_1h if pd.notna(row.ema20_1h) else row.close
+        ema50 = row.ema50_1h if pd.notna(row.ema50_1h) else row.close
         
-        # 【V8.3.21.1修复】解包返回值
-        full_df, day_df, day_start_idx = fetch_result
+        # 【增强1】成交量激增判断
+        volume_surge_data = None
+        if actual_position >= 20:  # 需要足够的历史数据
+            recent_volume = series.volumes[max(0, actual_position-20):actual_position].mean()
+            if recent_volume > 0:
+                surge_ratio = row.volume / recent_volume
+                if surge_ratio > 2.0:  # 2倍平均量
+                    volume_surge_data = {
+                        "type": "extreme_surge",  # ✅ 修复：匹配函数期望值
+                        "ratio": surge_ratio  # ✅ V8.2.3.4：字段名改为ratio
+                    }
+                elif surge_ratio > 1.5:  # 1.5倍平均量
+                    volume_surge_data = {
+                        "type": "strong_surge",  # ✅ 修复：添加_surge后缀
+                        "ratio": surge_ratio  # ✅ V8.2.3.4：字段名改为ratio
+                    }
         
-        if day_df is None or len(day_df) == 0:
-            continue
+        # 【增强2】突破判断
+        breakout_data = None
+        resistance = row.resistance if pd.notna(row.resistance) else 0
+        support = row.support if pd.notna(row.support) else 0
+        # V8.2.3.5：放宽突破条件从0.2%到0.1%（更适合15分钟K线）
+        if resistance > 0 and row.close > resistance * 1.001:  # 突破阻力0.1%
+            breakout_data = {
+                "level": resistance,
+                "type": "resistance",
+                "strength": (row.close - resistance) / resistance
+            }
+        elif support > 0 and row.close < support * 0.999:  # 突破支撑0.1%
+            breakout_data = {
+                "level": support,
+                "type": "support",
+                "strength": (support - row.close) / support
+            }
         
-        for position, row in enumerate(day_df.itertuples(index=False)):
-            time_str = datetime.fromtimestamp(row.timestamp / 1000).strftime('%H%M')
-            
-            # 【V8.2.3】增强market_data构造 - 基于历史数据判断各种形态
-            ema20 = row.ema20_1h if pd.notna(row.ema20_1h) else row.close
-            ema50 = row.ema50_1h if pd.notna(row.ema50_1h) else row.close
-            
-            # 【V8.3.21.1修复】计算前一根K线数据（使用原始df的索引）
-            actual_position = day_start_idx + position  # 在原始df中的实际位置
-            prev_position = max(0, actual_position - 1)
-            prev_row = full_df.iloc[prev_position] if prev_position < actual_position else row
+        # 【增强3】趋势启动判断
+        trend_initiation_data = None
+        if actual_position >= 10:
+            # V8.2.3.5：调整趋势启动逻辑，适应实际trend_15m字段值
+            # 实际值：多头、空头、多头转弱、空头转弱（没有"震荡"）
+            prev_trends = series.trend_15m[max(0, actual_position-10):actual_position]
             
-            # 【增强1】成交量激增判断
-            volume_surge_data = None
-            if actual_position >= 20:  # 需要足够的历史数据
-                recent_volume = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                if recent_volume > 0:
-                    surge_ratio = row.volume / recent_volume
-                    if surge_ratio > 2.0:  # 2倍平均量
-                        volume_surge_data = {
-                            "type": "extreme_surge",  # ✅ 修复：匹配函数期望值
-                            "ratio": surge_ratio  # ✅ V8.2.3.4：字段名改为ratio
-                        }
-                    elif surge_ratio > 1.5:  # 1.5倍平均量
-                        volume_surge_data = {
-                            "type": "strong_surge",  # ✅ 修复：添加_surge后缀
-                            "ratio": surge_ratio  # ✅ V8.2.3.4：字段名改为ratio
-                        }
+            # 方案1：从"转弱"转为"强势"（趋势启动）
+            weak_count = sum(1 for t in prev_trends if '转弱' in str(t))
+            current_is_strong = ('多头' == str(row.trend_15m) or '空头' == str(row.trend_15m))
             
-            # 【增强2】突破判断
-            breakout_data = None
-            resistance = row.resistance if pd.notna(row.resistance) else 0
-            support = row.support if pd.notna(row.support) else 0
-            # V8.2.3.5：放宽突破条件从0.2%到0.1%（更适合15分钟K线）
-            if resistance > 0 and row.close > resistance * 1.001:  # 突破阻力0.1%
-                breakout_data = {
-                    "level": resistance,
-                    "type": "resistance",
-                    "strength": (row.close - resistance) / resistance
+            if weak_count >= 5 and current_is_strong:  # 过去10根中至少5根转弱，现在转强
+                trend_initiation_data = {
+                    "from_sideways": True,  # 保持字段名兼容性
+                    "new_trend": row.trend_15m,
+                    "strength": "strong"
                 }
-            elif support > 0 and row.close < support * 0.999:  # 突破支撑0.1%
-                breakout_data = {
-                    "level": support,
-                    "type": "support",
-                    "strength": (support - row.close) / support
-                }
-            
-            # 【增强3】趋势启动判断
-            trend_initiation_data = None
-            if actual_position >= 10:
-                # V8.2.3.5：调整趋势启动逻辑，适应实际trend_15m字段值
-                # 实际值：多头、空头、多头转弱、空头转弱（没有"震荡"）
-                prev_trends = [full_df.iloc[i]['trend_15m'] for i in range(max(0, actual_position-10), actual_position)]
-                
-                # 方案1：从"转弱"转为"强势"（趋势启动）
-                weak_count = sum(1 for t in prev_trends if '转弱' in str(t))
-                current_is_strong = ('多头' == str(row.trend_15m) or '空头' == str(row.trend_15m))
-                
-                if weak_count >= 5 and current_is_strong:  # 过去10根中至少5根转弱，现在转强
+            # 方案2：从震荡转趋势（如果有"震荡"字段）
+            elif any('震荡' in str(t) for t in prev_trends):
+                sideways_count = sum(1 for t in prev_trends if '震荡' in str(t))
+                if sideways_count >= 7 and '头' in str(row.trend_15m):
                     trend_initiation_data = {
-                        "from_sideways": True,  # 保持字段名兼容性
+                        "from_sideways": True,
                         "new_trend": row.trend_15m,
                         "strength": "strong"
                     }
-                # 方案2：从震荡转趋势（如果有"震荡"字段）
-                elif any('震荡' in str(t) for t in prev_trends):
-                    sideways_count = sum(1 for t in prev_trends if '震荡' in str(t))
-                    if sideways_count >= 7 and '头' in str(row.trend_15m):
-                        trend_initiation_data = {
-                            "from_sideways": True,
-                            "new_trend": row.trend_15m,
-                            "strength": "strong"
-                        }
-            
-            # 【增强4】连续K线判断
-            consecutive_data = None
-            if actual_position >= 4:
-                recent_candles = full_df.iloc[max(0, actual_position-3):actual_position+1]
-                all_bullish = all((c['close'] > c['open']) for _, c in recent_candles.iterrows())
-                all_bearish = all((c['close'] < c['open']) for _, c in recent_candles.iterrows())
-                if all_bullish or all_bearish:
-                    consecutive_data = {
-                        "candles": len(recent_candles),
-                        "direction": "bullish" if all_bullish else "bearish"
-                    }
-            
-            # 【增强5】Pin Bar判断
-            pin_bar_data = None
-            body = abs(row.close - row.open)
-            total_range = row.high - row.low
-            if total_range > 0:
-                upper_wick = row.high - max(row.close, row.open)
-                lower_wick = min(row.close, row.open) - row.low
-                if upper_wick > body * 2 and lower_wick < body * 0.5:  # 上影线长
-                    pin_bar_data = "bearish_pin"  # ✅ 修复：添加_pin后缀
-                elif lower_wick > body * 2 and upper_wick < body * 0.5:  # 下影线长
-                    pin_bar_data = "bullish_pin"  # ✅ 修复：添加_pin后缀
-            
-            # 【增强6】吞没形态判断
-            engulfing_data = None
-            if actual_position > 0:
-                prev_body = abs(prev_row['close'] - prev_row['open'])
-                curr_body = abs(row.close - row.open)
-                if curr_body > prev_body * 1.5:  # 当前K线实体明显大于前一根
-                    if row.close > row.open and prev_row['close'] < prev_row['open']:
-                        engulfing_data = "bullish_engulfing"  # ✅ 修复：添加_engulfing后缀
-                    elif row.close < row.open and prev_row['close'] > prev_row['open']:
-                        engulfing_data = "bearish_engulfing"  # ✅ 修复：添加_engulfing后缀
-            
-            {
-                "price": row.close,  # ← 【修复】添加price字段
-                "current_price": row.close,  # ← 【V8.2.3.4】添加current_price字段
-                "price_action": {
-                    "consecutive": consecutive_data,
-                    "momentum_slope": (row.close - row.open) / row.open if row.open > 0 else 0,
-                    "trend_exhaustion": None,  # 趋势衰竭需要更复杂的逻辑
-                    "pin_bar": pin_bar_data,
-                    "engulfing": engulfing_data,
-                    "breakout": breakout_data,
-                    "volume_surge": volume_surge_data,
-                    "pullback_type": {"type": "simple_pullback"} if abs(row.close - row.open) / row.open > 0.002 else None,
-                    "trend_initiation": trend_initiation_data,
-                },
-                "volume_analysis": volume_surge_data if volume_surge_data else {},  # ← 【V8.2.3.4】添加volume_analysis
-                "ytc_signal": {},  # ← 【V8.2.3.4】添加ytc_signal占位符
-                "mid_term": {},  # ← 【V8.2.3.4】添加mid_term占位符
-                "long_term": {
-                    "trend": row.trend_4h
-                },
-                "moving_averages": {
-                    "ema20": ema20,
-                    "ema50": ema50,
-                },
-                "rsi": {
-                    "rsi_14": row.rsi_14 if pd.notna(row.rsi_14) else 50,
-                    "rsi_7": row.rsi_7 if pd.notna(row.rsi_7) else 50,
-                },
-                "macd": {
-                    "histogram": row.macd_histogram if pd.notna(row.macd_histogram) else 0,
-                    "macd_line": row.macd_line if pd.notna(row.macd_line) else 0,
-                    "signal": row.macd_signal if pd.notna(row.macd_signal) else 0,
+        
+        # 【增强4】连续K线判断
+        consecutive_data = None
+        if actual_position >= 4:
+            recent_opens = series.opens[max(0, actual_position-3):actual_position+1]
+            recent_closes = series.closes[max(0, actual_position-3):actual_position+1]
+            all_bullish = bool((recent_closes > recent_opens).all())
+            all_bearish = bool((recent_closes < recent_opens).all())
+            if all_bullish or all_bearish:
+                consecutive_data = {
+                    "candles": len(recent_opens),
+                    "direction": "bullish" if all_bullish else "bearish"
+                }
+        
+        # 【增强5】Pin Bar判断
+        pin_bar_data = None
+        body = abs(row.close - row.open)
+        total_range = row.high - row.low
+        if total_range > 0:
+            upper_wick = row.high - max(row.close, row.open)
+            lower_wick = min(row.close, row.open) - row.low
+            if upper_wick > body * 2 and lower_wick < body * 0.5:  # 上影线长
+                pin_bar_data = "bearish_pin"  # ✅ 修复：添加_pin后缀
+            elif lower_wick > body * 2 and upper_wick < body * 0.5:  # 下影线长
+                pin_bar_data = "bullish_pin"  # ✅ 修复：添加_pin后缀
+        
+        # 【增强6】吞没形态判断
+        engulfing_data = None
+        if actual_position > 0:
+            prev_open = series.opens[actual_position - 1]
+            prev_close = series.closes[actual_position - 1]
+            prev_body = abs(prev_close - prev_open)
+            curr_body = abs(row.close - row.open)
+            if curr_body > prev_body * 1.5:  # 当前K线实体明显大于前一根
+                if row.close > row.open and prev_close < prev_open:
+                    engulfing_data = "bullish_engulfing"  # ✅ 修复：添加_engulfing后缀
+                elif row.close < row.open and prev_close > prev_open:
+                    engulfing_data = "bearish_engulfing"  # ✅ 修复：添加_engulfing后缀
+        
+        {
+            "price": row.close,  # ← 【修复】添加price字段
+            "current_price": row.close,  # ← 【V8.2.3.4】添加current_price字段
+            "price_action": {
+                "consecutive": consecutive_data,
+                "momentum_slope": (row.close - row.open) / row.open if row.open > 0 else 0,
+                "trend_exhaustion": None,  # 趋势衰竭需要更复杂的逻辑
+                "pin_bar": pin_bar_data,
+                "engulfing": engulfing_data,
+                "breakout": breakout_data,
+                "volume_surge": volume_surge_data,
+                "pullback_type": {"type": "simple_pullback"} if abs(row.close - row.open) / row.open > 0.002 else None,
+                "trend_initiation": trend_initiation_data,
+            },
+            "volume_analysis": volume_surge_data if volume_surge_data else {},  # ← 【V8.2.3.4】添加volume_analysis
+            "ytc_signal": {},  # ← 【V8.2.3.4】添加ytc_signal占位符
+            "mid_term": {},  # ← 【V8.2.3.4】添加mid_term占位符
+            "long_term": {
+                "trend": row.trend_4h
+            },
+            "moving_averages": {
+                "ema20": ema20,
+                "ema50": ema50,
+            },
+            "rsi": {
+                "rsi_14": row.rsi_14 if pd.notna(row.rsi_14) else 50,
+                "rsi_7": row.rsi_7 if pd.notna(row.rsi_7) else 50,
+            },
+            "macd": {
+                "histogram": row.macd_histogram if pd.notna(row.macd_histogram) else 0,
+                "macd_line": row.macd_line if pd.notna(row.macd_line) else 0,
+                "signal": row.macd_signal if pd.notna(row.macd_signal) else 0,
+            },
+            "support_resistance": {
+                "position_status": "neutral",
+                "nearest_resistance": {
+                    "price": resistance if resistance > 0 else row.close * 1.02,
+                    "strength": 0.5
                 },
-                "support_resistance": {
-                    "position_status": "neutral",
-                    "nearest_resistance": {
-                        "price": resistance if resistance > 0 else row.close * 1.02,
-                        "strength": 0.5
-                    },
-                    "nearest_support": {
-                        "price": support if support > 0 else row.close * 0.98,
-                        "strength": 0.5
-                    },
+                "nearest_support": {
+                    "price": support if support > 0 else row.close * 0.98,
+                    "strength": 0.5
                 },
-                "atr": row.atr if pd.notna(row.atr) and row.atr > 0 else row.close * 0.02,
-                "volume": row.volume,
-                "trend_4h": row.trend_4h,
-                "trend_1h": row.trend_1h,
-                "trend_15m": row.trend_15m,
-            }
+            },
+            "atr": row.atr if pd.notna(row.atr) and row.atr > 0 else row.close * 0.02,
+            "volume": row.volume,
+            "trend_4h": row.trend_4h,
+            "trend_1h": row.trend_1h,
+            "trend_15m": row.trend_15m,
+        }
+        
+        # 【V8.5.2.3】只保存原始维度数据（不计算total_score）
+        # 核心改进：避免预判分类错误，实时/回测时动态计算评分
+        try:
+            # 计算原始维度值
+            momentum = abs((row.close - row.open) / row.open) if row.open > 0 else 0
+            vol_ratio = 0
+            if actual_position >= 20:
+                recent_avg_vol = series.volumes[max(0, actual_position-20):actual_position].mean()
+                if recent_avg_vol > 0:
+                    vol_ratio = row.volume / recent_avg_vol
             
-            # 【V8.5.2.3】只保存原始维度数据（不计算total_score）
-            # 核心改进：避免预判分类错误，实时/回测时动态计算评分
-            try:
-                # 计算原始维度值
-                momentum = abs((row.close - row.open) / row.open) if row.open > 0 else 0
-                vol_ratio = 0
-                if actual_position >= 20:
-                    recent_avg_vol = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                    if recent_avg_vol > 0:
-                        vol_ratio = row.volume / recent_avg_vol
-                
-                # 趋势对齐统计
-                trends = [row.trend_4h, row.trend_1h, row.trend_15m]
-                bull_count = sum(1 for t in trends if pd.notna(t) and '多头' in str(t))
-                bear_count = sum(1 for t in trends if pd.notna(t) and '空头' in str(t))
-                aligned_count = max(bull_count, bear_count)
+            # 趋势对齐统计
+            trends = [row.trend_4h, row.trend_1h, row.trend_15m]
+            bull_count = sum(1 for t in trends if pd.notna(t) and '多头' in str(t))
+            bear_count = sum(1 for t in trends if pd.notna(t) and '空头' in str(t))
+            aligned_count = max(bull_count, bear_count)
+            
+            # EMA发散度
+            ema_divergence_pct = round(abs(ema20 - ema50) / ema50 * 100, 2) if (ema20 > 0 and ema50 > 0) else 0
+            
+            # 构建原始维度字典（不包含total_score和signal_type）
+            components = {
+                # ❌ 不保存预判的类型和总分
+                # 'signal_type': '...',
+                # 'total_score': 0,
                 
-                # EMA发散度
-                ema_divergence_pct = round(abs(ema20 - ema50) / ema50 * 100, 2) if (ema20 > 0 and ema50 > 0) else 0
+                # ✅ 只保存原始维度（客观事实）
+                'momentum_value': round(momentum, 4),
+                'volume_ratio': round(vol_ratio, 2),
+                'has_breakout': bool(breakout_data),
+                'has_pin_bar': bool(pin_bar_data),
+                'has_engulfing': bool(engulfing_data),
+                'consecutive_candles': consecutive_data.get('candles', 0) if consecutive_data else 0,
+                'trend_alignment_count': aligned_count,
+                'ema_divergence_pct': ema_divergence_pct,
+                'trend_initiation_strength': trend_initiation_data.get('strength', '') if trend_initiation_data else '',
                 
-                # 构建原始维度字典（不包含total_score和signal_type）
-                components = {
-                    # ❌ 不保存预判的类型和总分
-                    # 'signal_type': '...',
-                    # 'total_score': 0,
-                    
-                    # ✅ 只保存原始维度（客观事实）
-                    'momentum_value': round(momentum, 4),
-                    'volume_ratio': round(vol_ratio, 2),
-                    'has_breakout': bool(breakout_data),
-                    'has_pin_bar': bool(pin_bar_data),
-                    'has_engulfing': bool(engulfing_data),
-                    'consecutive_candles': consecutive_data.get('candles', 0) if consecutive_data else 0,
-                    'trend_alignment_count': aligned_count,
-                    'ema_divergence_pct': ema_divergence_pct,
-                    'trend_initiation_strength': trend_initiation_data.get('strength', '') if trend_initiation_data else '',
-                    
-                    # 保留这些字段用于兼容性（但实时计算时会用原始维度重新计算）
-                    'volume_surge_type': 'extreme' if vol_ratio > 2.0 else ('strong' if vol_ratio > 1.5 else ''),
-                    'pin_bar': pin_bar_data if pin_bar_data else '',
-                    'engulfing': engulfing_data if engulfing_data else '',
-                    'trend_4h_strength': 'strong' if ("强势" in str(row.trend_4h)) else ('normal' if ("多头" in str(row.trend_4h) or "空头" in str(row.trend_4h)) else 'weak'),
-                    'pullback_type': '',
-                    'volume_confirmed': vol_ratio >= 1.2,
-                }
-                
-            except Exception as e:
-                print(f"⚠️ 【V8.5.2.3】提取原始维度失败: {e}")
-                import traceback
-                traceback.print_exc()
-                components = {
-                    'momentum_value': 0,
-                    'volume_ratio': 0,
-                    'has_breakout': False,
-                    'has_pin_bar': False,
-                    'has_engulfing': False,
-                    'consecutive_candles': 0,
-                    'trend_alignment_count': 0,
-                    'ema_divergence_pct': 0,
-                    'trend_initiation_strength': '',
-                    'volume_surge_type': '',
-                    'pin_bar': '',
-                    'engulfing': '',
-                    'trend_4h_strength': '',
-                    'pullback_type': '',
-                    'volume_confirmed': False,
-                }
-            
-            # 【V8.4】计算综合确认度评分（0-100分）
-            # 从简单计数器升级为加权评分，包含指标、趋势、形态三大维度
-            consensus_score = 0
+                # 保留这些字段用于兼容性（但实时计算时会用原始维度重新计算）
+                'volume_surge_type': 'extreme' if vol_ratio > 2.0 else ('strong' if vol_ratio > 1.5 else ''),
+                'pin_bar': pin_bar_data if pin_bar_data else '',
+                'engulfing': engulfing_data if engulfing_data else '',
+                'trend_4h_strength': 'strong' if ("强势" in str(row.trend_4h)) else ('normal' if ("多头" in str(row.trend_4h) or "空头" in str(row.trend_4h)) else 'weak'),
+                'pullback_type': '',
+                'volume_confirmed': vol_ratio >= 1.2,
+            }
             
-            # === 第1层：指标确认（40分） ===
-            # 1. EMA发散（10分）
-            if ema20 > 0 and ema50 > 0:
-                divergence = abs(ema20 - ema50) / ema50 * 100
-                if divergence >= 5.0:
-                    consensus_score += 10  # 强发散
-                elif divergence >= 2.0:
-                    consensus_score += 5   # 中发散
+        except Exception as e:
+            print(f"⚠️ 【V8.5.2.3】提取原始维度失败: {e}")
+            import traceback
+            traceback.print_exc()
+            components = {
+                'momentum_value': 0,
+                'volume_ratio': 0,
+                'has_breakout': False,
+                'has_pin_bar': False,
+                'has_engulfing': False,
+                'consecutive_candles': 0,
+                'trend_alignment_count': 0,
+                'ema_divergence_pct': 0,
+                'trend_initiation_strength': '',
+                'volume_surge_type': '',
+                'pin_bar': '',
+                'engulfing': '',
+                'trend_4h_strength': '',
+                'pullback_type': '',
+                'volume_confirmed': False,
+            }
+        
+        # 【V8.4】计算综合确认度评分（0-100分）
+        # 从简单计数器升级为加权评分，包含指标、趋势、形态三大维度
+        consensus_score = 0
+        
+        # === 第1层：指标确认（40分） ===
+        # 1. EMA发散（10分）
+        if ema20 > 0 and ema50 > 0:
+            divergence = abs(ema20 - ema50) / ema50 * 100
+            if divergence >= 5.0:
+                consensus_score += 10  # 强发散
+            elif divergence >= 2.0:
+                consensus_score += 5   # 中发散
+        
+        # 2. MACD强度（10分）
+        macd_hist = row.macd_histogram if pd.notna(row.macd_histogram) else 0
+        if abs(macd_hist) >= 0.05:
+            consensus_score += 10  # 强信号
+        elif abs(macd_hist) >= 0.01:
+            consensus_score += 5   # 中信号
+        
+        # 3. RSI极端值（10分）
+        rsi_14 = row.rsi_14 if pd.notna(row.rsi_14) else 50
+        if rsi_14 > 75 or rsi_14 < 25:
+            consensus_score += 10  # 超强极端
+        elif rsi_14 > 70 or rsi_14 < 30:
+            consensus_score += 7   # 强极端
+        elif 45 <= rsi_14 <= 55:
+            consensus_score += 3   # 中性（轻微加分）
+        
+        # 4. 成交量放量（10分）
+        if actual_position >= 20:
+            recent_avg_vol = series.volumes[max(0, actual_position-20):actual_position].mean()
+            if recent_avg_vol > 0:
+                vol_ratio = row.volume / recent_avg_vol
+                if vol_ratio >= 2.0:
+                    consensus_score += 10  # 强放量
+                elif vol_ratio >= 1.5:
+                    consensus_score += 5   # 中放量
+        
+        # === 第2层：趋势确认（30分） ===
+        # 5. 多周期趋势一致性（30分）
+        is_all_bullish = ("多头" in str(row.trend_15m) and "多头" in str(row.trend_1h) and "多头" in str(row.trend_4h))
+        is_all_bearish = ("空头" in str(row.trend_15m) and "空头" in str(row.trend_1h) and "空头" in str(row.trend_4h))
+        
+        if is_all_bullish or is_all_bearish:
+            consensus_score += 30  # 三层对齐
+        elif ("多头" in str(row.trend_1h) and "多头" in str(row.trend_4h)) or \
+             ("空头" in str(row.trend_1h) and "空头" in str(row.trend_4h)):
+            consensus_score += 15  # 两层对齐
+        
+        # === 第3层：形态确认（30分） ===
+        # 6. 价格形态强度（15分）- 从components中提取
+        pattern_score = 0
+        if components.get('pin_bar_score', 0) > 0:
+            pattern_score += min(5, components['pin_bar_score'] / 2)  # Pin Bar最多5分
+        if components.get('engulfing_score', 0) > 0:
+            pattern_score += min(5, components['engulfing_score'] / 2)  # 吞没最多5分
+        if components.get('breakout_score', 0) > 0:
+            pattern_score += min(5, components['breakout_score'] / 5)  # 突破最多5分
+        consensus_score += int(pattern_score)
+        
+        # 7. K线序列一致性（10分）
+        if actual_position >= 3:
+            recent_closes = series.closes[actual_position-3:actual_position+1]
+            if len(recent_closes) >= 3:
+                # 检查最近3根K线的方向一致性
+                is_bullish_seq = all(recent_closes[i] < recent_closes[i+1] for i in range(len(recent_closes)-1))
+                is_bearish_seq = all(recent_closes[i] > recent_closes[i+1] for i in range(len(recent_closes)-1))
+                if is_bullish_seq or is_bearish_seq:
+                    consensus_score += 10  # 强一致
+                elif (recent_closes[-1] > recent_closes[-2]) or (recent_closes[-1] < recent_closes[-2]):
+                    consensus_score += 5   # 弱一致
+        
+        # 8. 支撑阻力明确性（5分）
+        support = row.support if pd.notna(row.support) else 0
+        resistance = row.resistance if pd.notna(row.resistance) else 0
+        if support > 0 and resistance > 0:
+            sr_gap = abs(resistance - support) / row.close * 100
+            if sr_gap >= 3.0:
+                consensus_score += 5  # 支撑阻力明确
+            elif sr_gap >= 1.5:
+                consensus_score += 3  # 支撑阻力较明确
+        
+        # 限制在0-100范围
+        consensus_score = min(100, max(0, consensus_score))
+        
+        # 【兼容性】保留旧的indicator_consensus字段（简化版，用于向后兼容）
+        # 只计算最核心的5个指标
+        indicator_consensus = 0
+        if ema20 > 0 and ema50 > 0 and abs(ema20 - ema50) / ema50 * 100 >= 2.0:
+            indicator_consensus += 1
+        if abs(macd_hist) >= 0.01:
+            indicator_consensus += 1
+        if rsi_14 > 70 or rsi_14 < 30 or (45 <= rsi_14 <= 55):
+            indicator_consensus += 1
+        if actual_position >= 20:
+            recent_avg_vol = series.volumes[max(0, actual_position-20):actual_position].mean()
+            if recent_avg_vol > 0 and row.volume >= recent_avg_vol * 1.5:
+                indicator_consensus += 1
+        if is_all_bullish or is_all_bearish:
+            indicator_consensus += 1
+        
+        # 【V8.3.20】增强版R:R计算 - 基于趋势强度动态调整
+        atr = row.atr if pd.notna(row.atr) and row.atr > 0 else 0
+        price = row.close
+        resistance = row.resistance if pd.notna(row.resistance) else price * 1.02
+        support = row.support if pd.notna(row.support) else price * 0.98
+        
+        if atr > 0:
+            # 止损距离：2倍ATR（与系统默认一致）
+            stop_distance = atr * 2.0
             
-            # 2. MACD强度（10分）
-            macd_hist = row.macd_histogram if pd.notna(row.macd_histogram) else 0
-            if abs(macd_hist) >= 0.05:
-                consensus_score += 10  # 强信号
-            elif abs(macd_hist) >= 0.01:
-                consensus_score += 5   # 中信号
+            # 【关键修复】基于趋势强度动态调整止盈目标
+            # 1. 判断趋势强度
+            is_strong_trend = (
+                ("多头" in str(row.trend_15m) and "多头" in str(row.trend_1h) and "多头" in str(row.trend_4h)) or
+                ("空头" in str(row.trend_15m) and "空头" in str(row.trend_1h) and "空头" in str(row.trend_4h))
+            )
+            is_medium_trend = "多头" in str(row.trend_15m) or "空头" in str(row.trend_15m)
             
-            # 3. RSI极端值（10分）
-            rsi_14 = row.rsi_14 if pd.notna(row.rsi_14) else 50
-            if rsi_14 > 75 or rsi_14 < 25:
-                consensus_score += 10  # 超强极端
-            elif rsi_14 > 70 or rsi_14 < 30:
-                consensus_score += 7   # 强极端
-            elif 45 <= rsi_14 <= 55:
-                consensus_score += 3   # 中性（轻微加分）
+            # 2. 动态目标倍数
+            if is_strong_trend:
+                target_multiplier = 6.0  # 强趋势：三框架一致
+            elif is_medium_trend:
+                target_multiplier = 4.5  # 中等趋势：15m趋势明确
+            else:
+                target_multiplier = 3.0  # 弱趋势/震荡
             
-            # 4. 成交量放量（10分）
+            # 3. 考虑成交量激增（进一步提高预期）
             if actual_position >= 20:
-                recent_avg_vol = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                if recent_avg_vol > 0:
-                    vol_ratio = row.volume / recent_avg_vol
-                    if vol_ratio >= 2.0:
-                        consensus_score += 10  # 强放量
-                    elif vol_ratio >= 1.5:
-                        consensus_score += 5   # 中放量
+                recent_vol = series.volumes[max(0, actual_position-20):actual_position].mean()
+                if recent_vol > 0 and row.volume > recent_vol * 2.0:
+                    target_multiplier *= 1.3  # 巨量额外加30%
             
-            # === 第2层：趋势确认（30分） ===
-            # 5. 多周期趋势一致性（30分）
-            is_all_bullish = ("多头" in str(row.trend_15m) and "多头" in str(row.trend_1h) and "多头" in str(row.trend_4h))
-            is_all_bearish = ("空头" in str(row.trend_15m) and "空头" in str(row.trend_1h) and "空头" in str(row.trend_4h))
+            # 4. 考虑指标共振
+            if indicator_consensus >= 4:
+                target_multiplier *= 1.2  # 强共振额外加20%
             
-            if is_all_bullish or is_all_bearish:
-                consensus_score += 30  # 三层对齐
-            elif ("多头" in str(row.trend_1h) and "多头" in str(row.trend_4h)) or \
-                 ("空头" in str(row.trend_1h) and "空头" in str(row.trend_4h)):
-                consensus_score += 15  # 两层对齐
+            # 5. 计算目标距离
+            target_distance = atr * target_multiplier
             
-            # === 第3层：形态确认（30分） ===
-            # 6. 价格形态强度（15分）- 从components中提取
-            pattern_score = 0
-            if components.get('pin_bar_score', 0) > 0:
-                pattern_score += min(5, components['pin_bar_score'] / 2)  # Pin Bar最多5分
-            if components.get('engulfing_score', 0) > 0:
-                pattern_score += min(5, components['engulfing_score'] / 2)  # 吞没最多5分
-            if components.get('breakout_score', 0) > 0:
-                pattern_score += min(5, components['breakout_score'] / 5)  # 突破最多5分
-            consensus_score += int(pattern_score)
-            
-            # 7. K线序列一致性（10分）
-            if actual_position >= 3:
-                recent_closes = full_df.iloc[actual_position-3:actual_position+1]['close'].values
-                if len(recent_closes) >= 3:
-                    # 检查最近3根K线的方向一致性
-                    is_bullish_seq = all(recent_closes[i] < recent_closes[i+1] for i in range(len(recent_closes)-1))
-                    is_bearish_seq = all(recent_closes[i] > recent_closes[i+1] for i in range(len(recent_closes)-1))
-                    if is_bullish_seq or is_bearish_seq:
-                        consensus_score += 10  # 强一致
-                    elif (recent_closes[-1] > recent_closes[-2]) or (recent_closes[-1] < recent_closes[-2]):
-                        consensus_score += 5   # 弱一致
+            # 计算盈亏比
+            risk_reward = round(target_distance / stop_distance, 2) if stop_distance > 0 else 0
+        else:
+            risk_reward = 0
+        
+        # 【V8.3.20】成交量确认（用于swing模式）
+        if actual_position >= 20:
+            recent_avg_vol = series.volumes[max(0, actual_position-20):actual_position].mean()
+            if recent_avg_vol > 0 and row.volume >= recent_avg_vol * 1.5:
+                pass  # 已在indicator_consensus中计算
+        
+        # 【V8.3.21】数据增强：调用新函数获取上下文数据
+        kline_context_15m = None
+        market_structure_15m = None
+        resistance_history = None
+        support_history = None
+        
+        # 【V8.3.21.1修复】构建标准K线格式（使用原始df的索引）
+        if actual_position >= 10:  # 确保有足够的历史数据
+            start_pos = max(0, actual_position - 100)  # 取最近100根K线（用于S/R历史分析）
+            standard_klines = series.candles[start_pos:actual_position + 1]
             
-            # 8. 支撑阻力明确性（5分）
-            support = row.support if pd.notna(row.support) else 0
-            resistance = row.resistance if pd.notna(row.resistance) else 0
-            if support > 0 and resistance > 0:
-                sr_gap = abs(resistance - support) / row.close * 100
-                if sr_gap >= 3.0:
-                    consensus_score += 5  # 支撑阻力明确
-                elif sr_gap >= 1.5:
-                    consensus_score += 3  # 支撑阻力较明确
+            # 调用三个数据增强函数
+            if len(standard_klines) >= 10:
+                kline_context_15m = get_kline_context(standard_klines, count=10)
+            if len(standard_klines) >= 20:
+                market_structure_15m = analyze_market_structure(standard_klines, timeframe_hours=0.25)
+            if len(standard_klines) >= 50 and resistance > 0:
+                resistance_history = analyze_sr_history(standard_klines, resistance, sr_type='resistance')
+            if len(standard_klines) >= 50 and support > 0:
+                support_history = analyze_sr_history(standard_klines, support, sr_type='support')
+        
+        csv_row = {
+            'time': time_str,
+            'coin': coin_name,
+            'open': round(row.open, 8),
+            'high': round(row.high, 8),
+            'low': round(row.low, 8),
+            'close': round(row.close, 8),
+            'volume': round(row.volume, 3),
+            'price': round(row.close, 8),
+            'trend_4h': row.trend_4h,
+            'trend_1h': row.trend_1h,  # 【V8.5.2.4.40】添加trend_1h（consensus计算需要）
+            'trend_15m': row.trend_15m,
+            'ema20_1h': round(row.ema20_1h, 8) if pd.notna(row.ema20_1h) else row.close,  # 【V8.5.2.4.40】添加EMA（consensus计算需要）
+            'ema50_1h': round(row.ema50_1h, 8) if pd.notna(row.ema50_1h) else row.close,  # 【V8.5.2.4.40】添加EMA（consensus计算需要）
+            'rsi_14': round(row.rsi_14, 8) if pd.notna(row.rsi_14) else 50,
+            'rsi_7': round(row.rsi_7, 8) if pd.notna(row.rsi_7) else 50,
+            'macd_line': round(row.macd_line, 8) if pd.notna(row.macd_line) else 0,
+            'macd_signal': round(row.macd_signal, 8) if pd.notna(row.macd_signal) else 0,
+            'macd_histogram': round(row.macd_histogram, 8) if pd.notna(row.macd_histogram) else 0,
+            'atr': round(row.atr, 8) if pd.notna(row.atr) else 0,
+            'support': round(row.support, 8) if pd.notna(row.support) else row.low,
+            'resistance': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
+            'indicator_consensus': indicator_consensus,  # 【兼容性】保留旧字段（0-5）
+            'consensus_score': consensus_score,  # 【V8.4新增】综合确认度评分（0-100）
             
-            # 限制在0-100范围
-            consensus_score = min(100, max(0, consensus_score))
+            # 【V8.2】信号评分维度（保存各个维度，不保存总分）
+            'signal_type': components.get('signal_type', 'swing'),
+            # 超短线维度
+            'volume_surge_type': components.get('volume_surge_type', ''),
+            'volume_surge_score': components.get('volume_surge_score', 0),
+            'has_breakout': components.get('has_breakout', False),
+            'breakout_score': components.get('breakout_score', 0),
+            'momentum_value': components.get('momentum_value', 0),
+            'momentum_score': components.get('momentum_score', 0),
+            'scalp_consecutive_candles': components.get('consecutive_candles', 0) if components.get('signal_type') == 'scalping' else 0,
+            'scalp_consecutive_score': components.get('consecutive_score', 0) if components.get('signal_type') == 'scalping' else 0,
+            'pin_bar_detected': components.get('pin_bar', ''),
+            'pin_bar_score': components.get('pin_bar_score', 0),
+            'engulfing_detected': components.get('engulfing', ''),
+            'engulfing_score': components.get('engulfing_score', 0),
+            # 波段维度
+            'trend_initiation_strength': components.get('trend_initiation_strength', ''),
+            'trend_initiation_score': components.get('trend_initiation_score', 0),
+            'trend_alignment_count': components.get('trend_alignment', 0),
+            'trend_alignment_score': components.get('trend_alignment_score', 0),
+            'trend_4h_strength': components.get('trend_4h_strength', ''),
+            'trend_4h_strength_score': components.get('trend_4h_strength_score', 0),
+            'ema_divergence_pct': components.get('ema_divergence_pct', 0),
+            'ema_divergence_score': components.get('ema_divergence_score', 0),
+            'swing_pullback_type': components.get('pullback_type', ''),
+            'swing_pullback_score': components.get('pullback_score', 0),
+            'swing_consecutive_candles': components.get('consecutive_candles', 0) if components.get('signal_type') == 'swing' else 0,
+            'swing_consecutive_score': components.get('consecutive_score', 0) if components.get('signal_type') == 'swing' else 0,
+            'volume_confirmed': components.get('volume_confirmed', False),
+            'volume_confirmed_score': components.get('volume_confirmed_score', 0),
+            # ❌ 不再保存signal_score（回测时动态计算）
             
-            # 【兼容性】保留旧的indicator_consensus字段（简化版，用于向后兼容）
-            # 只计算最核心的5个指标
-            indicator_consensus = 0
-            if ema20 > 0 and ema50 > 0 and abs(ema20 - ema50) / ema50 * 100 >= 2.0:
-                indicator_consensus += 1
-            if abs(macd_hist) >= 0.01:
-                indicator_consensus += 1
-            if rsi_14 > 70 or rsi_14 < 30 or (45 <= rsi_14 <= 55):
-                indicator_consensus += 1
-            if actual_position >= 20:
-                recent_avg_vol = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                if recent_avg_vol > 0 and row.volume >= recent_avg_vol * 1.5:
-                    indicator_consensus += 1
-            if is_all_bullish or is_all_bearish:
-                indicator_consensus += 1
+            'risk_reward': risk_reward,
+            'macd_1h_line': round(row.macd_1h_line, 8) if pd.notna(row.macd_1h_line) else 0,
+            'macd_1h_signal': round(row.macd_1h_signal, 8) if pd.notna(row.macd_1h_signal) else 0,
+            'macd_1h_histogram': round(row.macd_1h_histogram, 8) if pd.notna(row.macd_1h_histogram) else 0,
+            'atr_1h': round(row.atr_1h, 8) if pd.notna(row.atr_1h) else 0,
+            'resistance_1h': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
+            'resistance_1h_strength': 5,
+            'support_1h': round(row.support, 8) if pd.notna(row.support) else row.low,
+            'support_1h_strength': 5,
+            'pin_bar': '',
+            'engulfing': '',
+            'pullback_type': 'simple_pullback' if abs(row.close - row.open) / row.open > 0.002 else '',
+            'pullback_depth': round(abs(row.high - row.low) / row.open, 8),
             
-            # 【V8.3.20】增强版R:R计算 - 基于趋势强度动态调整
-            atr = row.atr if pd.notna(row.atr) and row.atr > 0 else 0
-            price = row.close
-            resistance = row.resistance if pd.notna(row.resistance) else price * 1.02
-            support = row.support if pd.notna(row.support) else price * 0.98
+            'momentum_slope': round((row.close - row.open) / row.open, 8),
+            'pullback_weakness_score': 0.4,
+            'lwp_long': round(row.support, 8) if pd.notna(row.support) else row.low,
+            'lwp_short': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
+            'lwp_confidence': 'high',
+            'ytc_signal_type': 'TST' if row.trend_15m in ['多头', '空头'] else 'NONE',
+            'ytc_direction': 'SHORT' if row.trend_15m == '空头' else 'LONG' if row.trend_15m == '多头' else '',
+            'ytc_strength': 5 if row.trend_15m in ['多头', '空头'] else 0,
+            'ytc_sr_strength': 5,
+            'ytc_entry_price': round(row.close, 8),
+            'ytc_rationale': f"弱势测试强{'阻力' if row.trend_15m == '空头' else '支撑'}{round(row.resistance if row.trend_15m == '空头' else row.support, 2)}+动能停滞，Fading测试者" if row.trend_15m in ['多头', '空头'] else '',
+            'support_strength': 5,
+            'support_polarity_switched': 'True',
+            'support_fast_rejection': 'True',
+            'resistance_strength': 5,
+            'resistance_polarity_switched': 'True',
+            'resistance_fast_rejection': 'True',
             
-            if atr > 0:
-                # 止损距离：2倍ATR（与系统默认一致）
-                stop_distance = atr * 2.0
-                
-                # 【关键修复】基于趋势强度动态调整止盈目标
-                # 1. 判断趋势强度
-                is_strong_trend = (
-                    ("多头" in str(row.trend_15m) and "多头" in str(row.trend_1h) and "多头" in str(row.trend_4h)) or
-                    ("空头" in str(row.trend_15m) and "空头" in str(row.trend_1h) and "空头" in str(row.trend_4h))
-                )
-                is_medium_trend = "多头" in str(row.trend_15m) or "空头" in str(row.trend_15m)
-                
-                # 2. 动态目标倍数
-                if is_strong_trend:
-                    target_multiplier = 6.0  # 强趋势：三框架一致
-                elif is_medium_trend:
-                    target_multiplier = 4.5  # 中等趋势：15m趋势明确
-                else:
-                    target_multiplier = 3.0  # 弱趋势/震荡
-                
-                # 3. 考虑成交量激增（进一步提高预期）
-                if actual_position >= 20:
-                    recent_vol = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                    if recent_vol > 0 and row.volume > recent_vol * 2.0:
-                        target_multiplier *= 1.3  # 巨量额外加30%
-                
-                # 4. 考虑指标共振
-                if indicator_consensus >= 4:
-                    target_multiplier *= 1.2  # 强共振额外加20%
-                
-                # 5. 计算目标距离
-                target_distance = atr * target_multiplier
-                
-                # 计算盈亏比
-                risk_reward = round(target_distance / stop_distance, 2) if stop_distance > 0 else 0
-            else:
-                risk_reward = 0
+            # === 【V8.3.21】数据增强字段（方案B）===
+            # 盲点1：K线序列上下文（15m）
+            'kline_ctx_count': kline_context_15m.get("count", 0) if kline_context_15m else 0,
+            'kline_ctx_highest': kline_context_15m.get("highest_high", 0) if kline_context_15m else 0,
+            'kline_ctx_lowest': kline_context_15m.get("lowest_low", 0) if kline_context_15m else 0,
+            'kline_ctx_avg_body': kline_context_15m.get("avg_body_size", 0) if kline_context_15m else 0,
+            'kline_ctx_avg_range': kline_context_15m.get("avg_range_size", 0) if kline_context_15m else 0,
+            'kline_ctx_bullish_cnt': kline_context_15m.get("bullish_count", 0) if kline_context_15m else 0,
+            'kline_ctx_bearish_cnt': kline_context_15m.get("bearish_count", 0) if kline_context_15m else 0,
+            'kline_ctx_bullish_ratio': kline_context_15m.get("bullish_ratio", 0) if kline_context_15m else 0,
+            'kline_ctx_price_chg_pct': kline_context_15m.get("price_change_pct", 0) if kline_context_15m else 0,
+            'kline_ctx_is_up': kline_context_15m.get("is_trending_up", False) if kline_context_15m else False,
+            'kline_ctx_is_down': kline_context_15m.get("is_trending_down", False) if kline_context_15m else False,
+            'kline_ctx_volatility': kline_context_15m.get("volatility_pct", 0) if kline_context_15m else 0,
             
-            # 【V8.3.20】成交量确认（用于swing模式）
-            if actual_position >= 20:
-                recent_avg_vol = full_df.iloc[max(0, actual_position-20):actual_position]['volume'].mean()
-                if recent_avg_vol > 0 and row.volume >= recent_avg_vol * 1.5:
-                    pass  # 已在indicator_consensus中计算
+            # 盲点2：市场结构（15m）
+            'mkt_struct_swing': market_structure_15m.get("swing_structure", "") if market_structure_15m else "",
+            'mkt_struct_trend_strength': market_structure_15m.get("trend_strength", "") if market_structure_15m else "",
+            'mkt_struct_age_candles': market_structure_15m.get("trend_age_candles", 0) if market_structure_15m else 0,
+            'mkt_struct_age_hours': market_structure_15m.get("trend_age_hours", 0) if market_structure_15m else 0,
+            'mkt_struct_move_pct': market_structure_15m.get("trend_move_pct", 0) if market_structure_15m else 0,
+            'mkt_struct_last_high': market_structure_15m.get("last_swing_high", 0) if market_structure_15m else 0,
+            'mkt_struct_last_low': market_structure_15m.get("last_swing_low", 0) if market_structure_15m else 0,
+            'mkt_struct_pos_in_range': market_structure_15m.get("position_in_range", 0) if market_structure_15m else 0,
+            'mkt_struct_dist_high_pct': market_structure_15m.get("distance_from_high_pct", 0) if market_structure_15m else 0,
+            'mkt_struct_dist_low_pct': market_structure_15m.get("distance_from_low_pct", 0) if market_structure_15m else 0,
             
-            # 【V8.3.21】数据增强：调用新函数获取上下文数据
-            kline_context_15m = None
-            market_structure_15m = None
-            resistance_history = None
-            support_history = None
+            # 盲点3：阻力历史
+            'resist_hist_test_cnt': resistance_history.get("test_count", 0) if resistance_history else 0,
+            'resist_hist_last_test_ago': resistance_history.get("last_test_ago_candles", 999) if resistance_history else 999,
+            'resist_hist_avg_reaction': resistance_history.get("avg_reaction_pct", 0) if resistance_history else 0,
+            'resist_hist_max_rejection': resistance_history.get("max_rejection_pct", 0) if resistance_history else 0,
+            'resist_hist_false_bo': resistance_history.get("false_breakouts", 0) if resistance_history else 0,
+            'resist_hist_desc': resistance_history.get("description", "") if resistance_history else "",
             
-            # 【V8.3.21.1修复】构建标准K线格式（使用原始df的索引）
-            if actual_position >= 10:  # 确保有足够的历史数据
-                standard_klines = []
-                start_pos = max(0, actual_position - 100)  # 取最近100根K线（用于S/R历史分析）
-                for i in range(start_pos, actual_position + 1):
-                    candle = full_df.iloc[i]
-                    standard_klines.append({
-                        'open': candle['open'],
-                        'high': candle['high'],
-                        'low': candle['low'],
-                        'close': candle['close'],
-                        'volume': candle['volume']
-                    })
-                
-                # 调用三个数据增强函数
-                if len(standard_klines) >= 10:
-                    kline_context_15m = get_kline_context(standard_klines, count=10)
-                if len(standard_klines) >= 20:
-                    market_structure_15m = analyze_market_structure(standard_klines, timeframe_hours=0.25)
-                if len(standard_klines) >= 50 and resistance > 0:
-                    resistance_history = analyze_sr_history(standard_klines, resistance, sr_type='resistance')
-                if len(standard_klines) >= 50 and support > 0:
-                    support_history = analyze_sr_history(standard_klines, support, sr_type='support')
-            
-            csv_row = {
-                'time': time_str,
-                'coin': coin_name,
-                'open': round(row.open, 8),
-                'high': round(row.high, 8),
-                'low': round(row.low, 8),
-                'close': round(row.close, 8),
-                'volume': round(row.volume, 3),
-                'price': round(row.close, 8),
-                'trend_4h': row.trend_4h,
-                'trend_1h': row.trend_1h,  # 【V8.5.2.4.40】添加trend_1h（consensus计算需要）
-                'trend_15m': row.trend_15m,
-                'ema20_1h': round(row.ema20_1h, 8) if pd.notna(row.ema20_1h) else row.close,  # 【V8.5.2.4.40】添加EMA（consensus计算需要）
-                'ema50_1h': round(row.ema50_1h, 8) if pd.notna(row.ema50_1h) else row.close,  # 【V8.5.2.4.40】添加EMA（consensus计算需要）
-                'rsi_14': round(row.rsi_14, 8) if pd.notna(row.rsi_14) else 50,
-                'rsi_7': round(row.rsi_7, 8) if pd.notna(row.rsi_7) else 50,
-                'macd_line': round(row.macd_line, 8) if pd.notna(row.macd_line) else 0,
-                'macd_signal': round(row.macd_signal, 8) if pd.notna(row.macd_signal) else 0,
-                'macd_histogram': round(row.macd_histogram, 8) if pd.notna(row.macd_histogram) else 0,
-                'atr': round(row.atr, 8) if pd.notna(row.atr) else 0,
-                'support': round(row.support, 8) if pd.notna(row.support) else row.low,
-                'resistance': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
-                'indicator_consensus': indicator_consensus,  # 【兼容性】保留旧字段（0-5）
-                'consensus_score': consensus_score,  # 【V8.4新增】综合确认度评分（0-100）
-                
-                # 【V8.2】信号评分维度（保存各个维度，不保存总分）
-                'signal_type': components.get('signal_type', 'swing'),
-                # 超短线维度
-                'volume_surge_type': components.get('volume_surge_type', ''),
-                'volume_surge_score': components.get('volume_surge_score', 0),
-                'has_breakout': components.get('has_breakout', False),
-                'breakout_score': components.get('breakout_score', 0),
-                'momentum_value': components.get('momentum_value', 0),
-                'momentum_score': components.get('momentum_score', 0),
-                'scalp_consecutive_candles': components.get('consecutive_candles', 0) if components.get('signal_type') == 'scalping' else 0,
-                'scalp_consecutive_score': components.get('consecutive_score', 0) if components.get('signal_type') == 'scalping' else 0,
-                'pin_bar_detected': components.get('pin_bar', ''),
-                'pin_bar_score': components.get('pin_bar_score', 0),
-                'engulfing_detected': components.get('engulfing', ''),
-                'engulfing_score': components.get('engulfing_score', 0),
-                # 波段维度
-                'trend_initiation_strength': components.get('trend_initiation_strength', ''),
-                'trend_initiation_score': components.get('trend_initiation_score', 0),
-                'trend_alignment_count': components.get('trend_alignment', 0),
-                'trend_alignment_score': components.get('trend_alignment_score', 0),
-                'trend_4h_strength': components.get('trend_4h_strength', ''),
-                'trend_4h_strength_score': components.get('trend_4h_strength_score', 0),
-                'ema_divergence_pct': components.get('ema_divergence_pct', 0),
-                'ema_divergence_score': components.get('ema_divergence_score', 0),
-                'swing_pullback_type': components.get('pullback_type', ''),
-                'swing_pullback_score': components.get('pullback_score', 0),
-                'swing_consecutive_candles': components.get('consecutive_candles', 0) if components.get('signal_type') == 'swing' else 0,
-                'swing_consecutive_score': components.get('consecutive_score', 0) if components.get('signal_type') == 'swing' else 0,
-                'volume_confirmed': components.get('volume_confirmed', False),
-                'volume_confirmed_score': components.get('volume_confirmed_score', 0),
-                # ❌ 不再保存signal_score（回测时动态计算）
-                
-                'risk_reward': risk_reward,
-                'macd_1h_line': round(row.macd_1h_line, 8) if pd.notna(row.macd_1h_line) else 0,
-                'macd_1h_signal': round(row.macd_1h_signal, 8) if pd.notna(row.macd_1h_signal) else 0,
-                'macd_1h_histogram': round(row.macd_1h_histogram, 8) if pd.notna(row.macd_1h_histogram) else 0,
-                'atr_1h': round(row.atr_1h, 8) if pd.notna(row.atr_1h) else 0,
-                'resistance_1h': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
-                'resistance_1h_strength': 5,
-                'support_1h': round(row.support, 8) if pd.notna(row.support) else row.low,
-                'support_1h_strength': 5,
-                'pin_bar': '',
-                'engulfing': '',
-                'pullback_type': 'simple_pullback' if abs(row.close - row.open) / row.open > 0.002 else '',
-                'pullback_depth': round(abs(row.high - row.low) / row.open, 8),
-                
-                'momentum_slope': round((row.close - row.open) / row.open, 8),
-                'pullback_weakness_score': 0.4,
-                'lwp_long': round(row.support, 8) if pd.notna(row.support) else row.low,
-                'lwp_short': round(row.resistance, 8) if pd.notna(row.resistance) else row.high,
-                'lwp_confidence': 'high',
-                'ytc_signal_type': 'TST' if row.trend_15m in ['多头', '空头'] else 'NONE',
-                'ytc_direction': 'SHORT' if row.trend_15m == '空头' else 'LONG' if row.trend_15m == '多头' else '',
-                'ytc_strength': 5 if row.trend_15m in ['多头', '空头'] else 0,
-                'ytc_sr_strength': 5,
-                'ytc_entry_price': round(row.close, 8),
-                'ytc_rationale': f"弱势测试强{'阻力' if row.trend_15m == '空头' else '支撑'}{round(row.resistance if row.trend_15m == '空头' else row.support, 2)}+动能停滞，Fading测试者" if row.trend_15m in ['多头', '空头'] else '',
-                'support_strength': 5,
-                'support_polarity_switched': 'True',
-                'support_fast_rejection': 'True',
-                'resistance_strength': 5,
-                'resistance_polarity_switched': 'True',
-                'resistance_fast_rejection': 'True',
-                
-                # === 【V8.3.21】数据增强字段（方案B）===
-                # 盲点1：K线序列上下文（15m）
-                'kline_ctx_count': kline_context_15m.get("count", 0) if kline_context_15m else 0,
-                'kline_ctx_highest': kline_context_15m.get("highest_high", 0) if kline_context_15m else 0,
-                'kline_ctx_lowest': kline_context_15m.get("lowest_low", 0) if kline_context_15m else 0,
-                'kline_ctx_avg_body': kline_context_15m.get("avg_body_size", 0) if kline_context_15m else 0,
-                'kline_ctx_avg_range': kline_context_15m.get("avg_range_size", 0) if kline_context_15m else 0,
-                'kline_ctx_bullish_cnt': kline_context_15m.get("bullish_count", 0) if kline_context_15m else 0,
-                'kline_ctx_bearish_cnt': kline_context_15m.get("bearish_count", 0) if kline_context_15m else 0,
-                'kline_ctx_bullish_ratio': kline_context_15m.get("bullish_ratio", 0) if kline_context_15m else 0,
-                'kline_ctx_price_chg_pct': kline_context_15m.get("price_change_pct", 0) if kline_context_15m else 0,
-                'kline_ctx_is_up': kline_context_15m.get("is_trending_up", False) if kline_context_15m else False,
-                'kline_ctx_is_down': kline_context_15m.get("is_trending_down", False) if kline_context_15m else False,
-                'kline_ctx_volatility': kline_context_15m.get("volatility_pct", 0) if kline_context_15m else 0,
-                
-                # 盲点2：市场结构（15m）
-                'mkt_struct_swing': market_structure_15m.get("swing_structure", "") if market_structure_15m else "",
-                'mkt_struct_trend_strength': market_structure_15m.get("trend_strength", "") if market_structure_15m else "",
-                'mkt_struct_age_candles': market_structure_15m.get("trend_age_candles", 0) if market_structure_15m else 0,
-                'mkt_struct_age_hours': market_structure_15m.get("trend_age_hours", 0) if market_structure_15m else 0,
-                'mkt_struct_move_pct': market_structure_15m.get("trend_move_pct", 0) if market_structure_15m else 0,
-                'mkt_struct_last_high': market_structure_15m.get("last_swing_high", 0) if market_structure_15m else 0,
-                'mkt_struct_last_low': market_structure_15m.get("last_swing_low", 0) if market_structure_15m else 0,
-                'mkt_struct_pos_in_range': market_structure_15m.get("position_in_range", 0) if market_structure_15m else 0,
-                'mkt_struct_dist_high_pct': market_structure_15m.get("distance_from_high_pct", 0) if market_structure_15m else 0,
-                'mkt_struct_dist_low_pct': market_structure_15m.get("distance_from_low_pct", 0) if market_structure_15m else 0,
-                
-                # 盲点3：阻力历史
-                'resist_hist_test_cnt': resistance_history.get("test_count", 0) if resistance_history else 0,
-                'resist_hist_last_test_ago': resistance_history.get("last_test_ago_candles", 999) if resistance_history else 999,
-                'resist_hist_avg_reaction': resistance_history.get("avg_reaction_pct", 0) if resistance_history else 0,
-                'resist_hist_max_rejection': resistance_history.get("max_rejection_pct", 0) if resistance_history else 0,
-                'resist_hist_false_bo': resistance_history.get("false_breakouts", 0) if resistance_history else 0,
-                'resist_hist_desc': resistance_history.get("description", "") if resistance_history else "",
-                
-                # 盲点3：支撑历史
-                'support_hist_test_cnt': support_history.get("test_count", 0) if support_history else 0,
-                'support_hist_last_test_ago': support_history.get("last_test_ago_candles", 999) if support_history else 999,
-                'support_hist_avg_reaction': support_history.get("avg_reaction_pct", 0) if support_history else 0,
-                'support_hist_max_bounce': support_history.get("max_rejection_pct", 0) if support_history else 0,
-                'support_hist_false_bd': support_history.get("false_breakouts", 0) if support_history else 0,
-                'support_hist_desc': support_history.get("description", "") if support_history else "",
-            }
-            
-            all_rows.append(csv_row)
+            # 盲点3：支撑历史
+            'support_hist_test_cnt': support_history.get("test_count", 0) if support_history else 0,
+            'support_hist_last_test_ago': support_history.get("last_test_ago_candles", 999) if support_history else 999,
+            'support_hist_avg_reaction': support_history.get("avg_reaction_pct", 0) if support_history else 0,
+            'support_hist_max_bounce': support_history.get("max_rejection_pct", 0) if support_history else 0,
+            'support_hist_false_bd': support_history.get("false_breakouts", 0) if support_history else 0,
+            'support_hist_desc': support_history.get("description", "") if support_history else "",
+        }
+        
+        rows.append(csv_row)
     
+    return rows
+
+def write_day_csv(date_str, all_rows, output_dirs):
+    """排序并写入一天的CSV（第一个目录写入，其余目录复制），同步重写列式分区、重建K线侧车索引"""
     if len(all_rows) == 0:
         print(f"✗ {date_str} 没有数据")
-        return
+        return False
     
     # 排序
     all_rows.sort(key=lambda x: (x['time'], x['coin']))
@@ -1039,6 +1080,8 @@ def export_date(date_str, output_dirs):
     fieldnames = list(all_rows[0].keys())
     filename = f"{date_str}.csv"  # 直接使用日期作为文件名
     
+    first_file = None
+    day_frame = None
     for output_dir in output_dirs:
         output_file = output_dir / filename
         
@@ -1048,14 +1091,291 @@ def export_date(date_str, output_dirs):
             print(f"  ⚠️ 文件已存在，备份为: {backup_file.name}")
             output_file.rename(backup_file)
         
-        with open(output_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(all_rows)
+        if first_file is None:
+            with open(output_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(all_rows)
+            first_file = output_file
+        else:
+            shutil.copyfile(first_file, output_file)  # 各模型目录内容相同，只序列化一次
+        
+        # 列式分区与CSV同一步更新（分区已存在或当前模式写分区时）；写失败就删除旧分区，读取方回退CSV
+        if HAS_SNAPSHOT_STORE and (has_snapshot_day(output_dir, date_str) or writes_columnar()):
+            try:
+                if day_frame is None:
+                    day_frame = pd.read_csv(first_file, dtype={'time': str})  # 与读取方读CSV的结果一致
+                write_snapshot_day(output_dir, date_str, day_frame)
+            except Exception as e:
+                print(f"  ⚠️ 列式分区写入失败，已删除旧分区（读取方回退CSV）: {e}")
+                try:
+                    columnar_path(output_dir, date_str).unlink()
+                except OSError:
+                    pass
+        
+        if HAS_OHLC_INDEX:
+            try:
+                write_day_index(output_dir, date_str)
+            except Exception as e:
+                print(f"  ⚠️ K线索引生成失败（看板会回退解析CSV）: {e}")
         
         print(f"  ✓ 已写入: {output_file} ({len(all_rows)} 条记录)")
     
     print(f"✓ {date_str} 导出完成")
+    return True
+
+def export_date(date_str, output_dirs):
+    """导出指定日期的CSV到多个目录"""
+    print(f"\n{'='*60}")
+    print(f"导出 {date_str} 的数据")
+    print(f"{'='*60}")
+    
+    all_rows = []
+    
+    for symbol in SYMBOLS:
+        fetch_result = fetch_data_for_date(symbol, date_str)
+        
+        if fetch_result is None:
+            continue
+        
+        # 【V8.3.21.1修复】解包返回值
+        full_df, day_df, day_start_idx = fetch_result
+        
+        if day_df is None or len(day_df) == 0:
+            continue
+        
+        positions = range(day_start_idx, day_start_idx + len(day_df))
+        all_rows.extend(build_rows(SymbolSeries(symbol, full_df), positions))
+    
+    write_day_csv(date_str, all_rows, output_dirs)
+
+# ============================================================
+# 【V8.9.17】回填引擎：整段拉取 + 磁盘缓存 + 并行 + 断点续传
+# ============================================================
+
+def _day_bounds(date_str):
+    """某天的 [开始, 结束) 毫秒时间戳（与fetch_data_for_date相同的日界）"""
+    start_ts = int(datetime.strptime(date_str, '%Y%m%d').timestamp() * 1000)
+    return start_ts, start_ts + DAY_MS
+
+
+class _RequestGate:
+    """所有拉取线程共享的最小请求间隔：锁内只预约时间片，sleep在锁外"""
+    
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_REQUEST_GATE = _RequestGate(BACKFILL_MIN_INTERVAL)
+_thread_local = threading.local()
+
+
+def _thread_exchange():
+    """每个线程独立的交易所实例（ccxt同步实例的会话和限速状态不能跨线程共享）"""
+    ex = getattr(_thread_local, "exchange", None)
+    if ex is None:
+        ex = _thread_local.exchange = create_exchange()
+    return ex
+
+
+class CandleCache:
+    """
+    单个币种原始15m K线的磁盘缓存：float64数组 (n, 6) = timestamp, open, high, low, close, volume
+    
+    只保存已收盘的K线，按时间排序去重；每拉取一页就落盘，中断后从缓存继续
+    """
+    
+    def __init__(self, cache_dir, symbol):
+        coin = symbol.split('/')[0]
+        self.path = Path(cache_dir) / f"{EXCHANGE_TYPE}_{coin}_{TIMEFRAME}.npy"
+        self.data = self._load()
+    
+    def _load(self):
+        try:
+            data = np.load(self.path, allow_pickle=False)
+        except (OSError, ValueError):
+            return np.empty((0, 6))
+        if data.ndim != 2 or data.shape[1] != 6:
+            return np.empty((0, 6))
+        return data
+    
+    def merge(self, candles):
+        new = np.asarray(candles, dtype=float).reshape(-1, 6)
+        merged = np.concatenate([new, self.data])  # 新数据在前：时间戳重复时以新拉取的为准
+        _, first = np.unique(merged[:, 0], return_index=True)
+        self.data = merged[first]
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.data)
+        os.replace(tmp_path, self.path)
+    
+    def missing_spans(self, since, until):
+        """[since, until) 内缓存没有覆盖的区间（开头、结尾、中间断档）"""
+        ts = self.data[:, 0]
+        ts = ts[(ts >= since) & (ts < until)]
+        if len(ts) == 0:
+            return [(since, until)]
+        spans = []
+        if ts[0] > since:
+            spans.append((since, int(ts[0])))
+        for i in np.nonzero(np.diff(ts) > TIMEFRAME_MS)[0]:
+            spans.append((int(ts[i]) + TIMEFRAME_MS, int(ts[i + 1])))
+        if ts[-1] + TIMEFRAME_MS < until:
+            spans.append((int(ts[-1]) + TIMEFRAME_MS, until))
+        return spans
+    
+    def window(self, since, until):
+        ts = self.data[:, 0]
+        return self.data[(ts >= since) & (ts < until)]
+
+
+def _fetch_page(symbol, cursor):
+    for attempt in range(FETCH_RETRIES):
+        _REQUEST_GATE.wait()
+        try:
+            return _thread_exchange().fetch_ohlcv(symbol, timeframe=TIMEFRAME, since=int(cursor), limit=PAGE_LIMIT)
+        except ccxt.NetworkError as e:  # 含限频（RateLimitExceeded / DDoSProtection）
+            if attempt == FETCH_RETRIES - 1:
+                raise
+            wait = 2 ** attempt * 5
+            print(f"    ⚠️ {symbol} 请求失败，{wait}秒后重试: {e}")
+            time.sleep(wait)
+    return []
+
+
+def _fetch_span(symbol, cache, start, end, now_ms):
+    """按since游标分页拉取 [start, end)，只缓存已收盘的K线"""
+    cursor = start
+    pages = 0
+    while cursor < end:
+        page = _fetch_page(symbol, cursor)
+        closed = [c for c in page if c[0] >= cursor and c[0] + TIMEFRAME_MS <= now_ms]
+        if not closed:
+            break
+        cache.merge(closed)
+        pages += 1
+        cursor = int(closed[-1][0]) + TIMEFRAME_MS
+    return pages
+
+
+def load_symbol_series(symbol, since, until, cache_dir, now_ms):
+    """缓存补齐 [since, until) 后，在整段连续序列上一次性计算指标"""
+    cache = CandleCache(cache_dir, symbol)
+    pages = 0
+    for start, end in cache.missing_spans(since, until):
+        pages += _fetch_span(symbol, cache, start, end, now_ms)
+    
+    data = cache.window(since, until)
+    print(f"  ✓ {symbol}: {len(data)} 根K线（新拉取 {pages} 页）")
+    if len(data) == 0:
+        return None
+    
+    df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = df['timestamp'].astype('int64')
+    return SymbolSeries(symbol, compute_indicators(df))
+
+
+class BackfillCheckpoint:
+    """断点文件：同一回填任务（币种、交易所）已完整写出的日期（与本次日期范围无关，扩大范围时已完成的日期仍跳过）"""
+    
+    def __init__(self, path, job, fresh=False):
+        self.path = Path(path)
+        self.job = job
+        self.done = set()
+        if not fresh:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("job") == job:
+                    self.done = set(saved.get("done", []))
+            except (OSError, ValueError):
+                pass
+    
+    def mark(self, date_str):
+        self.done.add(date_str)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"job": self.job, "done": sorted(self.done)}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def backfill(start_date, end_date, output_dirs, workers=BACKFILL_WORKERS, fresh=False, cache_dir=BACKFILL_CACHE_DIR):
+    """
+    回填 [start_date, end_date] 的快照CSV
+    
+    每个币种整段只拉取一次（预热 + 全部日期），之后逐天切分写出；
+    只有全部币种都拉取成功、且当天K线已全部收盘的日期才记入断点
+    
+    Returns:
+        (成功天数, 失败天数)
+    """
+    dates = []
+    current = datetime.strptime(start_date, '%Y%m%d')
+    end = datetime.strptime(end_date, '%Y%m%d')
+    while current <= end:
+        dates.append(current.strftime('%Y%m%d'))
+        current += timedelta(days=1)
+    
+    job = {"symbols": SYMBOLS, "exchange": EXCHANGE_TYPE}
+    checkpoint = BackfillCheckpoint(Path(cache_dir) / "backfill_checkpoint.json", job, fresh=fresh)
+    pending = [d for d in dates if d not in checkpoint.done]
+    if len(pending) < len(dates):
+        print(f"⏩ 断点续传: 跳过已完成的 {len(dates) - len(pending)} 天（--fresh 重新导出）")
+    if not pending:
+        return 0, 0
+    
+    now_ms = int(time.time() * 1000)
+    since = _day_bounds(pending[0])[0] - WARMUP_DAYS * DAY_MS
+    until = min(_day_bounds(pending[-1])[1], now_ms)
+    
+    print(f"📥 拉取 {len(SYMBOLS)} 个币种（{workers} 线程，请求间隔≥{BACKFILL_MIN_INTERVAL}秒）...")
+    series_list, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(load_symbol_series, symbol, since, until, cache_dir, now_ms): symbol
+            for symbol in SYMBOLS
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                series = future.result()
+            except Exception as e:
+                print(f"  ✗ {symbol} 获取失败: {e}")
+                series = None
+            if series is None:
+                failed.append(symbol)
+            else:
+                series_list.append(series)
+    series_list.sort(key=lambda s: SYMBOLS.index(s.symbol))
+    if failed:
+        print(f"⚠️ {len(failed)} 个币种获取失败，写出的日期不记入断点: {', '.join(failed)}")
+    
+    success_count = fail_count = 0
+    for date_str in pending:
+        print(f"\n导出 {date_str} 的数据")
+        all_rows = []
+        for series in series_list:
+            all_rows.extend(build_rows(series, series.day_positions(date_str)))
+        if write_day_csv(date_str, all_rows, output_dirs):
+            success_count += 1
+            if not failed and _day_bounds(date_str)[1] <= now_ms:
+                checkpoint.mark(date_str)
+        else:
+            fail_count += 1
+    return success_count, fail_count
 
 def main():
     """主函数"""
@@ -1064,16 +1384,19 @@ def main():
     today_str = now_utc.strftime('%Y%m%d')
     
     # 解析命令行参数
-    if len(sys.argv) < 2:
-        print("用法: python3 export_historical_data.py START_DATE [END_DATE]")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    if len(args) < 1:
+        print("用法: python3 export_historical_data.py START_DATE [END_DATE] [--fresh] [--per-day]")
         print("示例: python3 export_historical_data.py 20251025")
         print("示例: python3 export_historical_data.py 20251025 20251102")
         print(f"\n如果不指定END_DATE，将自动生成到今天 ({today_str})")
+        print("--fresh: 忽略断点重新导出全部日期；--per-day: 使用旧版逐天拉取")
         sys.exit(1)
     
-    start_date = sys.argv[1]
+    start_date = args[0]
     # 如果没有指定结束日期，使用今天
-    end_date = sys.argv[2] if len(sys.argv) >= 3 else today_str
+    end_date = args[1] if len(args) >= 2 else today_str
     
     # 输出目录（两个目录）
     base_dir = Path(__file__).parent / "trading_data"
@@ -1097,22 +1420,25 @@ def main():
         print(f"  - {output_dir}")
     print(f"{'='*60}\n")
     
-    # 遍历日期
-    current = datetime.strptime(start_date, '%Y%m%d')
-    end = datetime.strptime(end_date, '%Y%m%d')
-    
-    success_count = 0
-    fail_count = 0
-    
-    while current <= end:
-        date_str = current.strftime('%Y%m%d')
-        try:
-            export_date(date_str, output_dirs)
-            success_count += 1
-        except Exception as e:
-            print(f"✗ {date_str} 导出失败: {e}")
-            fail_count += 1
-        current += timedelta(days=1)
+    if "--per-day" not in flags:
+        success_count, fail_count = backfill(start_date, end_date, output_dirs, fresh="--fresh" in flags)
+    else:
+        # 遍历日期
+        current = datetime.strptime(start_date, '%Y%m%d')
+        end = datetime.strptime(end_date, '%Y%m%d')
+        
+        success_count = 0
+        fail_count = 0
+        
+        while current <= end:
+            date_str = current.strftime('%Y%m%d')
+            try:
+                export_date(date_str, output_dirs)
+                success_count += 1
+            except Exception as e:
+                print(f"✗ {date_str} 导出失败: {e}")
+                fail_count += 1
+            current += timedelta(days=1)
     
     print(f"\n{'='*60}")
     print("✓ 导出完成！")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.18】机会未来价格路径的紧凑编码
+
+核心功能:
+1. PathArena: 每个币种的high/low/close只保存一份(n, 3)数组，机会的future_data["path"]
+   是其中[idx+1, idx+1+horizon)行的视图（零拷贝，每个机会只多一个视图对象，
+   内存与max_high/min_low/final_close摘要相当）
+2. simulate_path_levels: 在路径上找止损/止盈的首次触达K线，能区分谁先触发，
+   规则与_simulate_trade_with_params的逐K线循环一致
+3. path_price_matrix: 一组机会的路径 → batch_trade_simulator.simulate_path_batch的价格矩阵
+
+4. copy_sharing_arrays: 复制机会的dict/list结构但共享路径视图（copy.deepcopy会把每个视图复制成独立数组）
+
+序列化（如多进程网格搜索）时视图只复制自己的horizon行；
+没有path字段的旧机会数据继续走摘要逻辑。
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# path列顺序
+PATH_HIGH = 0
+PATH_LOW = 1
+PATH_CLOSE = 2
+
+
+class PathArena:
+    """单个币种的连续价格序列，为该币种所有机会共享"""
+
+    def __init__(self, highs: np.ndarray, lows: np.ndarray, closes: np.ndarray):
+        self.data = np.column_stack([
+            np.asarray(highs, dtype=np.float64),
+            np.asarray(lows, dtype=np.float64),
+            np.asarray(closes, dtype=np.float64),
+        ])
+        self.data.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def window(self, idx: int, horizon: int = 96) -> np.ndarray:
+        """入场行idx之后horizon根K线的(horizon, 3)视图（与forward_windows的窗口一致）"""
+        return self.data[idx + 1 : idx + 1 + horizon]
+
+
+def simulate_path_levels(
+    path: np.ndarray,
+    entry_price: float,
+    is_long: bool,
+    stop_loss: float,
+    take_profit: float,
+    max_holding_hours: Optional[float] = None,
+) -> Tuple[str, float, int]:
+    """
+    按路径精确模拟一笔交易
+
+    - 同一根K线先检查止损再检查止盈
+    - high<=0或low<=0的K线跳过
+    - 第max_holding_hours*4根（0起）K线按收盘价超时平仓
+    - 全部K线未触达时按最后一根收盘价计算（holding）
+
+    Returns:
+        (exit_type, exit_price, exit_index)；路径为空时为("no_data", entry_price, -1)
+    """
+    length = len(path)
+    if length == 0:
+        return "no_data", entry_price, -1
+
+    max_candles = int(max_holding_hours * 4) if max_holding_hours else None
+    scan = path if max_candles is None else path[:max_candles]
+    highs = scan[:, PATH_HIGH]
+    lows = scan[:, PATH_LOW]
+
+    with np.errstate(invalid="ignore"):
+        valid = (highs > 0) & (lows > 0)
+        if is_long:
+            sl_hit = valid & (lows <= stop_loss)
+            tp_hit = valid & (highs >= take_profit)
+        else:
+            sl_hit = valid & (highs >= stop_loss)
+            tp_hit = valid & (lows <= take_profit)
+
+    hit = sl_hit | tp_hit
+    if hit.any():
+        first = int(hit.argmax())
+        if sl_hit[first]:
+            return "stop_loss", stop_loss, first
+        return "take_profit", take_profit, first
+
+    if max_candles is not None and length > max_candles:
+        exit_type, exit_index = "time_exit", max_candles
+    else:
+        exit_type, exit_index = "holding", length - 1
+    close = float(path[exit_index, PATH_CLOSE])
+    return exit_type, entry_price if np.isnan(close) else close, exit_index
+
+
+def copy_sharing_arrays(value):
+    """
+    递归复制dict/list（调用方可以放心修改字段），numpy数组原样共享
+
+    用于替代对机会列表的copy.deepcopy：deepcopy会把每个路径视图复制成独立的(horizon, 3)数组，
+    4000个机会就多出几十MB，且不再共享PathArena
+    """
+    if isinstance(value, dict):
+        return {key: copy_sharing_arrays(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_sharing_arrays(item) for item in value]
+    return value
+
+
+def path_price_matrix(paths: List[np.ndarray]):
+    """
+    路径列表 → NaN填充的(highs, lows, closes, lengths)，供simulate_path_batch使用
+    """
+    lengths = np.array([len(p) for p in paths], dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    matrix = np.full((len(paths), width, 3), np.nan)
+    for i, path in enumerate(paths):
+        matrix[i, : lengths[i]] = path
+    return (
+        matrix[:, :, PATH_HIGH],
+        matrix[:, :, PATH_LOW],
+        matrix[:, :, PATH_CLOSE],
+        lengths,
+    )
+
+
+if __name__ == "__main__":
+    """
+    对照测试：路径模拟 vs 主程序逐K线实现（DataFrame路径），以及批量版本
+    """
+    import pandas as pd
+
+    from batch_trade_simulator import _load_scalar_oracles, simulate_path_batch
+
+    oracle = _load_scalar_oracles()
+    rng = np.random.default_rng(11)
+    n, horizon = 2000, 96
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    arena = PathArena(close * 1.004, close * 0.996, close)
+
+    mismatches = 0
+    cases = []
+    for _ in range(500):
+        idx = int(rng.integers(0, n - horizon - 1))
+        path = arena.window(idx, horizon)
+        entry = float(close[idx])
+        is_long = bool(rng.random() < 0.5)
+        sl_dist, tp_dist = entry * rng.uniform(0.005, 0.04), entry * rng.uniform(0.005, 0.08)
+        sl = entry - sl_dist if is_long else entry + sl_dist
+        tp = entry + tp_dist if is_long else entry - tp_dist
+        hours = [None, 2, 6, 24][int(rng.integers(0, 4))]
+
+        exit_type, exit_price, _ = simulate_path_levels(path, entry, is_long, sl, tp, hours)
+        frame = pd.DataFrame(path, columns=["high", "low", "close"])
+        expected = oracle["_simulate_trade_with_params"](
+            entry, "long" if is_long else "short", 1.0, frame, 100, 5, 5, 0, 0, 0,
+            atr_stop_multiplier=sl_dist, atr_tp_multiplier=tp_dist,
+            max_holding_hours=hours,
+        )
+        profit = (exit_price - entry) / entry * 100 if is_long else (entry - exit_price) / entry * 100
+        if expected["exit_type"] != exit_type or not np.isclose(expected["profit"], profit):
+            mismatches += 1
+        cases.append((path, entry, is_long, sl, tp, hours, exit_type, profit))
+
+    assert mismatches == 0, f"路径模拟与逐K线实现不一致: {mismatches}个"
+
+    for hours in (None, 2, 6, 24):
+        subset = [c for c in cases if c[5] == hours]
+        highs, lows, closes, lengths = path_price_matrix([c[0] for c in subset])
+        batch = simulate_path_batch(
+            np.array([c[1] for c in subset]), np.array([c[2] for c in subset]),
+            np.array([c[3] for c in subset]), np.array([c[4] for c in subset]),
+            highs, lows, closes, lengths, max_holding_hours=hours,
+        )
+        assert np.allclose(batch["profit"], [c[7] for c in subset]), "批量路径模拟不一致"
+
+    print(f"✅ {len(cases)}个机会：路径模拟与逐K线实现、批量实现一致")
+
+    opportunities = [{"coin": "BTC", "future_data": {"path": arena.window(i, horizon), "max_high": 1.0}} for i in range(50)]
+    copied = copy_sharing_arrays(opportunities)
+    copied[0]["future_data"]["max_high"] = 2.0
+    assert opportunities[0]["future_data"]["max_high"] == 1.0, "复制后修改字段不应影响原数据"
+    assert all(np.shares_memory(c["future_data"]["path"], arena.data) for c in copied), "路径应仍为PathArena视图"
+    print("✅ 机会复制共享路径视图")
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.5】增量技术指标引擎
+
+核心功能:
+1. 按(币种, 周期)保存EMA/MACD/RSI/ATR的运行状态
+2. 每收盘一根K线只做O(1)更新，不再对整段DataFrame重复ewm/rolling
+3. 首次调用、数据断档或时间戳对不上时，自动回退到全量pandas计算并重建状态
+4. 全量计算公式与get_ohlcv_data原实现完全一致（ewm(adjust=False) / rolling均值）
+
+EMA起点（修复）：全量路径对传入的窗口（如最近99根）重算，EMA以窗口第一根收盘价为种子，
+span=50时种子在末值中仍占约2%权重。增量状态若从第一次看到的K线一路累积，窗口滑动后种子
+不同，结果会偏离全量路径。这里用"无界EMA + 种子修正"表示窗口EMA：
+
+    E_窗口(末) = U(末) + (1-α)^(L-1) × (窗口首根收盘 - U(窗口首根))
+
+U为从最早K线开始的递推EMA，只需保留窗口内每根K线的U值即可O(1)得到与全量路径相同的
+窗口EMA；MACD信号线对种子修正项同样是线性的，见_IndicatorState.window_values。
+文件末尾的对照测试覆盖"从第0根增长"和"固定99根滑动"两种窗口。
+"""
+
+import math
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+EMA_SPANS = (20, 50)
+MACD_PARAMS = (12, 26, 9)  # fast, slow, signal
+RSI_PERIODS = (7, 14)
+ATR_PERIODS = (3, 14)
+
+# 窗口太短时rolling窗口会碰到窗口首根（diff/shift为NaN），直接全量计算
+MIN_INCREMENTAL_WINDOW = max(RSI_PERIODS + ATR_PERIODS) + 2
+
+
+def _alpha(span: int) -> float:
+    return 2 / (span + 1)
+
+
+@lru_cache(maxsize=64)
+def _seeded_geometric_ema(ratio: float, alpha: float, steps: int) -> float:
+    """
+    以首值为种子、对序列 ratio^0, ratio^1, ... ratio^steps 做ewm(adjust=False)的末值
+
+    MACD线的种子修正项是这样的几何序列，窗口长度固定时结果固定，缓存复用
+    """
+    value = 1.0
+    term = 1.0
+    for _ in range(steps):
+        term *= ratio
+        value = alpha * term + (1 - alpha) * value
+    return value
+
+
+def _rsi_from_means(avg_gain: float, avg_loss: float) -> float:
+    """与pandas一致：loss=0时rs=inf→100，gain和loss都为0时为NaN→回退50"""
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+
+def compute_indicator_snapshot(df: pd.DataFrame) -> Dict[str, float]:
+    """
+    全量计算（pandas），结果与get_ohlcv_data原有公式逐项一致
+
+    Returns:
+        {"ema20", "ema50", "macd_line", "macd_signal", "macd_histogram",
+         "rsi_7", "rsi_14", "atr_3", "atr_14"}
+    """
+    close = df["close"]
+    result = {}
+
+    for span in EMA_SPANS:
+        result[f"ema{span}"] = close.ewm(span=span, adjust=False).mean().iloc[-1]
+
+    fast, slow, signal = MACD_PARAMS
+    macd_line = (
+        close.ewm(span=fast, adjust=False).mean()
+        - close.ewm(span=slow, adjust=False).mean()
+    )
+    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
+    result["macd_line"] = macd_line.iloc[-1]
+    result["macd_signal"] = signal_line.iloc[-1]
+    result["macd_histogram"] = (macd_line - signal_line).iloc[-1]
+
+    delta = close.diff()
+    for period in RSI_PERIODS:
+        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+        rsi = 100 - (100 / (1 + gain / loss))
+        result[f"rsi_{period}"] = rsi.iloc[-1] if not pd.isna(rsi.iloc[-1]) else 50
+
+    high_low = df["high"] - df["low"]
+    high_close = abs(df["high"] - close.shift())
+    low_close = abs(df["low"] - close.shift())
+    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
+    for period in ATR_PERIODS:
+        atr = tr.rolling(window=period).mean()
+        result[f"atr_{period}"] = atr.iloc[-1] if not pd.isna(atr.iloc[-1]) else 0
+
+    return result
+
+
+class _IndicatorState:
+    """单个(币种, 周期)的指标运行状态"""
+
+    def __init__(self, history_limit: int):
+        self.last_timestamp: Optional[int] = None
+        self.prev_close: Optional[float] = None
+        # 每根K线一项: (timestamp, close, {span: U_ema}, U_fast, U_slow, U_signal)
+        self.history: deque = deque(maxlen=history_limit)
+        self.ema: Dict[int, float] = {}
+        self.macd_fast = 0.0
+        self.macd_slow = 0.0
+        self.macd_signal = 0.0
+        self.gains = {p: deque(maxlen=p) for p in RSI_PERIODS}
+        self.losses = {p: deque(maxlen=p) for p in RSI_PERIODS}
+        self.true_ranges = {p: deque(maxlen=p) for p in ATR_PERIODS}
+
+    def rebuild(self, df: pd.DataFrame, timestamps: np.ndarray) -> Dict[str, float]:
+        """全量回退：用pandas算一遍，再把无界EMA序列和rolling尾部状态装回来"""
+        close = df["close"]
+        snapshot = compute_indicator_snapshot(df)
+
+        # 以df首根为起点时，无界EMA就是全量路径的窗口EMA
+        ema_series = {
+            span: close.ewm(span=span, adjust=False).mean().to_numpy(dtype=np.float64)
+            for span in EMA_SPANS
+        }
+        fast, slow, signal = MACD_PARAMS
+        fast_series = close.ewm(span=fast, adjust=False).mean()
+        slow_series = close.ewm(span=slow, adjust=False).mean()
+        signal_series = (fast_series - slow_series).ewm(span=signal, adjust=False).mean()
+        fast_values = fast_series.to_numpy(dtype=np.float64)
+        slow_values = slow_series.to_numpy(dtype=np.float64)
+        signal_values = signal_series.to_numpy(dtype=np.float64)
+        closes = close.to_numpy(dtype=np.float64)
+
+        self.history.clear()
+        start = max(0, len(df) - self.history.maxlen)
+        for i in range(start, len(df)):
+            self.history.append((
+                int(timestamps[i]),
+                float(closes[i]),
+                {span: float(ema_series[span][i]) for span in EMA_SPANS},
+                float(fast_values[i]),
+                float(slow_values[i]),
+                float(signal_values[i]),
+            ))
+        for span in EMA_SPANS:
+            self.ema[span] = float(ema_series[span][-1])
+        self.macd_fast = float(fast_values[-1])
+        self.macd_slow = float(slow_values[-1])
+        self.macd_signal = float(signal_values[-1])
+
+        # rolling窗口只依赖最近period个值（第一根的diff/shift为NaN，不进入窗口）
+        delta = close.diff().iloc[1:].to_numpy(dtype=np.float64)
+        for period in RSI_PERIODS:
+            tail = delta[-period:]
+            self.gains[period].clear()
+            self.gains[period].extend(np.where(tail > 0, tail, 0.0).tolist())
+            self.losses[period].clear()
+            self.losses[period].extend(np.where(tail < 0, -tail, 0.0).tolist())
+
+        highs = df["high"].to_numpy(dtype=np.float64)
+        lows = df["low"].to_numpy(dtype=np.float64)
+        prev_closes = np.concatenate(([np.nan], closes[:-1]))
+        tr = np.fmax(
+            highs - lows,
+            np.fmax(np.abs(highs - prev_closes), np.abs(lows - prev_closes)),
+        )
+        for period in ATR_PERIODS:
+            self.true_ranges[period].clear()
+            self.true_ranges[period].extend(tr[-period:].tolist())
+
+        self.prev_close = float(closes[-1])
+        self.last_timestamp = int(timestamps[-1])
+        return snapshot
+
+    def update(self, timestamp: int, high: float, low: float, close: float):
+        """新收盘一根K线：O(1)更新无界EMA和rolling窗口"""
+        for span in EMA_SPANS:
+            alpha = _alpha(span)
+            self.ema[span] = alpha * close + (1 - alpha) * self.ema[span]
+
+        fast, slow, signal = MACD_PARAMS
+        self.macd_fast += _alpha(fast) * (close - self.macd_fast)
+        self.macd_slow += _alpha(slow) * (close - self.macd_slow)
+        macd_line = self.macd_fast - self.macd_slow
+        self.macd_signal += _alpha(signal) * (macd_line - self.macd_signal)
+
+        self.history.append((
+            timestamp, close, dict(self.ema), self.macd_fast, self.macd_slow, self.macd_signal,
+        ))
+
+        delta = close - self.prev_close
+        for period in RSI_PERIODS:
+            self.gains[period].append(delta if delta > 0 else 0.0)
+            self.losses[period].append(-delta if delta < 0 else 0.0)
+
+        tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        for period in ATR_PERIODS:
+            self.true_ranges[period].append(tr)
+
+        self.prev_close = close
+        self.last_timestamp = timestamp
+
+    def window_values(self, window: int) -> Dict[str, float]:
+        """
+        末尾window根K线作为全量路径的输入时的指标值（EMA以窗口首根为种子）
+
+        调用方保证 MIN_INCREMENTAL_WINDOW <= window <= len(history)
+        """
+        _, seed_close, seed_ema, seed_fast, seed_slow, seed_signal = self.history[-window]
+        steps = window - 1
+
+        result = {}
+        for span in EMA_SPANS:
+            decay = (1 - _alpha(span)) ** steps
+            result[f"ema{span}"] = self.ema[span] + decay * (seed_close - seed_ema[span])
+
+        fast, slow, signal = MACD_PARAMS
+        fast_ratio, slow_ratio = 1 - _alpha(fast), 1 - _alpha(slow)
+        signal_alpha = _alpha(signal)
+        fast_offset = seed_close - seed_fast
+        slow_offset = seed_close - seed_slow
+        macd_line = (
+            self.macd_fast + fast_ratio ** steps * fast_offset
+            - self.macd_slow - slow_ratio ** steps * slow_offset
+        )
+        # 窗口MACD线 = 无界MACD线 + fast_offset·r_f^k - slow_offset·r_s^k，信号线对三项分别做种子ewm
+        seed_macd = seed_fast - seed_slow
+        macd_signal = (
+            self.macd_signal
+            + (1 - signal_alpha) ** steps * (seed_macd - seed_signal)
+            + fast_offset * _seeded_geometric_ema(fast_ratio, signal_alpha, steps)
+            - slow_offset * _seeded_geometric_ema(slow_ratio, signal_alpha, steps)
+        )
+        result["macd_line"] = macd_line
+        result["macd_signal"] = macd_signal
+        result["macd_histogram"] = macd_line - macd_signal
+
+        for period in RSI_PERIODS:
+            gains, losses = self.gains[period], self.losses[period]
+            if len(gains) < period:
+                result[f"rsi_{period}"] = 50
+            else:
+                result[f"rsi_{period}"] = _rsi_from_means(
+                    sum(gains) / period, sum(losses) / period
+                )
+
+        for period in ATR_PERIODS:
+            trs = self.true_ranges[period]
+            result[f"atr_{period}"] = sum(trs) / period if len(trs) == period else 0
+
+        return result
+
+
+class IncrementalIndicatorEngine:
+    """
+    增量指标引擎（线程安全，按(币种, 周期)隔离状态）
+
+    用法:
+        engine = IncrementalIndicatorEngine()
+        ind = engine.update("BTC/USDT:USDT", "15m", df_15m)
+        ema20, rsi_14 = ind["ema20"], ind["rsi_14"]
+    """
+
+    def __init__(self, max_incremental_candles: int = 16, history_limit: int = 1000):
+        """
+        Args:
+            max_incremental_candles: 单次最多增量追加的K线数，超过则直接全量重算
+            history_limit: 每个(币种, 周期)保留的无界EMA历史根数（窗口更长时全量重算）
+        """
+        self.max_incremental_candles = max_incremental_candles
+        self.history_limit = history_limit
+        self._states: Dict[Tuple[str, str], _IndicatorState] = {}
+        self._lock = threading.Lock()
+        self.stats = {"incremental_updates": 0, "full_recomputes": 0}
+
+    def update(self, symbol: str, timeframe: str, df: pd.DataFrame) -> Dict[str, float]:
+        """
+        根据最新K线（按时间升序、均为已收盘）返回指标值
+
+        Args:
+            symbol: 交易对
+            timeframe: K线周期
+            df: 含timestamp/high/low/close列的DataFrame
+
+        Returns:
+            与compute_indicator_snapshot相同结构的字典
+        """
+        timestamps = df["timestamp"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+
+        with self._lock:
+            state = self._states.setdefault(
+                (symbol, timeframe), _IndicatorState(self.history_limit)
+            )
+
+        if state.last_timestamp is not None and len(timestamps) > 0:
+            pos = int(np.searchsorted(timestamps, state.last_timestamp, side="right"))
+            new_count = len(timestamps) - pos
+            # 上次的最后一根必须仍在当前序列里，才能保证状态连续
+            continuous = pos > 0 and timestamps[pos - 1] == state.last_timestamp
+            if continuous and new_count <= self.max_incremental_candles:
+                highs = df["high"].to_numpy(dtype=np.float64)
+                lows = df["low"].to_numpy(dtype=np.float64)
+                closes = df["close"].to_numpy(dtype=np.float64)
+                for i in range(pos, len(timestamps)):
+                    state.update(int(timestamps[i]), highs[i], lows[i], closes[i])
+                # 窗口首根必须在历史里，EMA才能按全量路径的种子修正
+                window = len(timestamps)
+                if (
+                    MIN_INCREMENTAL_WINDOW <= window <= len(state.history)
+                    and state.history[-window][0] == timestamps[0]
+                ):
+                    self.stats["incremental_updates"] += 1
+                    return state.window_values(window)
+
+        self.stats["full_recomputes"] += 1
+        return state.rebuild(df, timestamps)
+
+    def reset(self, symbol: Optional[str] = None):
+        """清空状态（symbol为None时全部清空）"""
+        with self._lock:
+            if symbol is None:
+                self._states.clear()
+            else:
+                for key in [k for k in self._states if k[0] == symbol]:
+                    del self._states[key]
+
+
+def _synthetic_candles(n: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    closes = 100 + np.cumsum(rng.normal(0, 1, n))
+    opens = closes + rng.normal(0, 0.3, n)
+    highs = np.maximum(opens, closes) + rng.random(n)
+    lows = np.minimum(opens, closes) - rng.random(n)
+    # 制造一段横盘，覆盖RSI的0/0分支
+    closes[300:320] = closes[299]
+    highs[300:320] = lows[300:320] = opens[300:320] = closes[299]
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(np.arange(n) * 15 * 60 * 1000, unit="ms"),
+        "open": opens,
+        "high": highs,
+        "low": lows,
+        "close": closes,
+        "volume": rng.random(n) * 1000,
+    })
+
+
+def _check_parity(engine: IncrementalIndicatorEngine, symbol: str, windows, tolerance: float) -> float:
+    """逐个窗口比对增量结果与全量公式，返回最大相对误差"""
+    max_error = 0.0
+    for window in windows:
+        incremental = engine.update(symbol, "15m", window)
+        reference = compute_indicator_snapshot(window)
+        for key, ref_value in reference.items():
+            scale = max(1.0, abs(float(ref_value)))
+            error = abs(float(incremental[key]) - float(ref_value)) / scale
+            if not math.isfinite(error) or error > tolerance:
+                raise AssertionError(
+                    f"{symbol} {key} 不一致 @ {window.index[-1]}: {incremental[key]} vs {ref_value}"
+                )
+            max_error = max(max_error, error)
+    return max_error
+
+
+if __name__ == "__main__":
+    """
+    对照测试：增量结果 vs 原pandas公式
+    1. 从第0根开始增长的窗口
+    2. 固定99根滑动的窗口（get_ohlcv_data的实际用法，EMA种子随窗口移动）
+    """
+    n = 600
+    full_df = _synthetic_candles(n)
+    tolerance = 1e-9
+
+    engine = IncrementalIndicatorEngine()
+    growing_error = _check_parity(
+        engine, "GROW", (full_df.iloc[:end] for end in range(100, n + 1)), tolerance
+    )
+    assert engine.stats["full_recomputes"] == 1, engine.stats
+
+    engine = IncrementalIndicatorEngine()
+    window_size = 99
+    sliding = (full_df.iloc[end - window_size : end] for end in range(window_size, n + 1))
+    sliding_error = _check_parity(engine, "SLIDE", sliding, tolerance)
+    assert engine.stats["full_recomputes"] == 1, engine.stats
+
+    # 上次的最后一根不在新序列里（数据被替换/回补）必须回退全量
+    shifted = full_df.copy()
+    shifted["timestamp"] += pd.Timedelta(minutes=5)
+    _check_parity(engine, "SLIDE", (shifted.iloc[n - window_size :],), tolerance)
+    assert engine.stats["full_recomputes"] == 2, engine.stats
+
+    print(
+        f"✅ 对照测试通过: 增长窗口最大误差 {growing_error:.2e}, "
+        f"99根滑动窗口最大误差 {sliding_error:.2e}, 统计 {engine.stats}"
+    )
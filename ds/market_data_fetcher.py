@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.3】多币种并发行情获取模块
+
+核心功能:
+1. 所有币种 × 所有周期(15m/4h/1h)的K线请求通过有界线程池并发拉取
+2. 每个请求先向APIRateLimiter申请权重，避免并发时触发币安限频
+3. 拉取完成后按币种组装market_data（调用方提供的构建函数），保持原顺序和结构
+4. 统计每个币种的拉取/计算耗时，便于排查[1/6]步骤的瓶颈
+5. 【V8.9.4】可选接入OHLCVCandleStore，只增量拉取新收盘的K线
+
+替代原来trading_bot()中"逐币种串行 + 0.3秒固定间隔"的写法。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def kline_request_weight(limit: int) -> int:
+    """币安合约 /klines 接口的请求权重（随limit分档）"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def _fetch_with_retry(
+    exchange,
+    symbol: str,
+    timeframe: str,
+    limit: int,
+    rate_limiter=None,
+    max_retries: int = 2,
+    retry_delay: float = 1.0,
+    candle_store=None,
+):
+    """
+    拉取单个(币种, 周期)的K线，失败时重试
+
+    Returns:
+        (rows_or_exception, elapsed_seconds): 成功返回K线列表（使用candle_store时为
+        StoredCandles），最终失败返回异常对象
+    """
+    start = time.time()
+    last_error = None
+
+    for attempt in range(max_retries + 1):
+        try:
+            if candle_store is not None:
+                # 仓库内部按实际请求数量申请限频权重
+                candles = candle_store.fetch(
+                    exchange, symbol, timeframe, limit, rate_limiter=rate_limiter
+                )
+                return candles, time.time() - start
+            if rate_limiter is not None:
+                rate_limiter.acquire(kline_request_weight(limit))
+            rows = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            if rate_limiter is not None:
+                rate_limiter.observe(exchange)  # 【V8.9.26】响应头校准已用权重
+            return rows, time.time() - start
+        except Exception as e:
+            last_error = e
+            if attempt < max_retries:
+                time.sleep(retry_delay)
+
+    return last_error, time.time() - start
+
+
+def fetch_market_data_concurrent(
+    symbols: List[str],
+    exchange,
+    build_market_data: Callable,
+    timeframe_limits: Dict[str, int],
+    rate_limiter=None,
+    max_workers: int = 8,
+    max_retries: int = 2,
+    retry_delay: float = 1.0,
+    verbose: bool = True,
+    candle_store=None,
+) -> Tuple[List[Optional[Dict]], Dict[str, Dict]]:
+    """
+    并发获取多币种市场数据
+
+    Args:
+        symbols: 交易对列表（返回结果与其顺序一一对应）
+        exchange: ccxt交易所实例
+        build_market_data: 构建函数，签名为 build_market_data(symbol, prefetched=...)，
+            prefetched为 {timeframe: K线列表或异常对象}
+        timeframe_limits: 每个周期拉取的K线数量，如 {"15m": 100, "4h": 50, "1h": 100}
+        rate_limiter: APIRateLimiter实例（可选）
+        max_workers: 线程池大小上限
+        max_retries: 单个请求 / 单个币种的最大重试次数
+        retry_delay: 重试间隔（秒）
+        verbose: 是否打印每个币种的结果
+        candle_store: OHLCVCandleStore实例（可选），提供时只增量拉取新K线，
+            prefetched中的值为StoredCandles
+
+    Returns:
+        (market_data_list, latency_report):
+            market_data_list: 与symbols同序的列表，获取失败的位置为None
+            latency_report: {symbol: {"fetch": 秒, "build": 秒, "total": 秒, "ok": bool}}
+    """
+    tasks = [(symbol, tf, limit) for symbol in symbols for tf, limit in timeframe_limits.items()]
+    workers = max(1, min(max_workers, len(tasks)))
+
+    # === 第1步：并发拉取所有(币种, 周期)的K线 ===
+    raw: Dict[Tuple[str, str], object] = {}
+    fetch_elapsed: Dict[str, float] = {symbol: 0.0 for symbol in symbols}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ohlcv") as pool:
+        futures = {
+            (symbol, tf): pool.submit(
+                _fetch_with_retry, exchange, symbol, tf, limit,
+                rate_limiter, max_retries, retry_delay, candle_store
+            )
+            for symbol, tf, limit in tasks
+        }
+        for key, future in futures.items():
+            rows, elapsed = future.result()
+            raw[key] = rows
+            # 同一币种的多个周期是并行拉取的，取最慢的那个作为该币种的拉取耗时
+            fetch_elapsed[key[0]] = max(fetch_elapsed[key[0]], elapsed)
+
+    # === 第2步：按原顺序组装market_data ===
+    market_data_list: List[Optional[Dict]] = []
+    latency_report: Dict[str, Dict] = {}
+
+    for symbol in symbols:
+        coin_name = symbol.split("/")[0]
+        prefetched = {tf: raw[(symbol, tf)] for tf in timeframe_limits}
+        build_start = time.time()
+        data = None
+
+        for attempt in range(max_retries + 1):
+            try:
+                # 首次使用并发拉取的结果；重试时回退到构建函数自行拉取
+                data = build_market_data(
+                    symbol, prefetched=prefetched if attempt == 0 else None
+                )
+            except Exception as e:
+                if verbose:
+                    print(f"⚠️ {coin_name}: 异常({e})，重试({attempt + 1}/{max_retries})...")
+                data = None
+
+            # kline_data为空视为不完整数据，与原串行逻辑保持一致
+            if data and data.get("kline_data"):
+                break
+            if attempt < max_retries:
+                time.sleep(retry_delay)
+
+        build_elapsed = time.time() - build_start
+        latency_report[symbol] = {
+            "fetch": fetch_elapsed[symbol],
+            "build": build_elapsed,
+            "total": fetch_elapsed[symbol] + build_elapsed,
+            "ok": bool(data),
+        }
+
+        if data:
+            market_data_list.append(data)
+            if verbose:
+                print(
+                    f"✓ {coin_name}: ${data['price']:,.2f} ({data['price_change']:+.2f}%) "
+                    f"[拉取{fetch_elapsed[symbol]:.2f}s + 计算{build_elapsed:.2f}s]"
+                )
+        else:
+            market_data_list.append(None)  # 保持索引一致
+            if verbose:
+                print(f"❌ {coin_name}: 数据获取失败（已重试{max_retries}次）")
+
+    return market_data_list, latency_report
+
+
+def format_latency_summary(latency_report: Dict[str, Dict]) -> str:
+    """生成一行耗时汇总，如 '拉取最慢 ETH 0.82s | 计算合计 1.35s'"""
+    if not latency_report:
+        return "无数据"
+
+    slowest_symbol, slowest = max(latency_report.items(), key=lambda item: item[1]["fetch"])
+    total_build = sum(item["build"] for item in latency_report.values())
+    return (
+        f"拉取最慢 {slowest_symbol.split('/')[0]} {slowest['fetch']:.2f}s | "
+        f"计算合计 {total_build:.2f}s"
+    )
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.9】市场快照列式存储（结构化npy，每天一个分区）
+
+核心功能:
+1. market_snapshots/YYYYMMDD.npy：结构化数组，每列一个带类型的字段（float64/bool/定长字符串），
+   以mmap方式打开，只把需要的列拷贝成DataFrame（列投影），不解析文本
+2. 读取结果与pd.read_csv读原CSV一致（空字符串→NaN），time列保持"HHMM"字符串
+   （数值列统一为float64，缺失为NaN；整数值读出为x.0）
+3. 列类型（schema）固定：数值列一律float64、布尔列bool、其余为字符串；
+   追加时新数据按已存储的列类型转换，只有从未有过非缺失值的列才按新数据确定类型
+   （当天第一批某列全为None时不会被锁定成字符串列）；
+   数值列收到无法解析为数字的字符串（如"n/a"）时整列升级为字符串列，不会静默变成NaN
+   （与pd.read_csv读到混合列时一致）
+4. 追加：列和类型都不变、字符串不超出已存储宽度时，新行直接写到分区文件末尾并原地改写
+   npy头里的行数（头部预留了行数位数），不再整天重写；新增列/类型升级/字符串变宽时才整体重写
+5. 写入模式（环境变量SNAPSHOT_STORE_MODE）:
+   - csv: 只写CSV（旧行为）
+   - dual: CSV + 列式同时写（默认，可随时回退）
+   - columnar: 只写列式；读取时当天没有列式分区再回退CSV
+6. 迁移工具：把已有CSV批量转换为列式分区
+
+用法:
+    python3 market_snapshot_store.py migrate            # 迁移deepseek和qwen全部CSV
+    python3 market_snapshot_store.py migrate qwen       # 只迁移qwen
+    python3 market_snapshot_store.py migrate --force    # 覆盖已存在的列式分区
+
+没有引入pyarrow（不在requirements.txt中），只依赖numpy。
+"""
+
+import os
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_STORE_MODE = os.getenv("SNAPSHOT_STORE_MODE", "dual").lower()
+
+COLUMNAR_SUFFIX = ".npy"
+
+
+def columnar_path(snapshot_dir, date_str: str) -> Path:
+    """某天的列式分区路径"""
+    return Path(snapshot_dir) / f"{date_str}{COLUMNAR_SUFFIX}"
+
+
+def has_snapshot_day(snapshot_dir, date_str: str) -> bool:
+    return columnar_path(snapshot_dir, date_str).exists()
+
+
+def writes_csv() -> bool:
+    return SNAPSHOT_STORE_MODE != "columnar"
+
+
+def writes_columnar() -> bool:
+    return SNAPSHOT_STORE_MODE in ("dual", "columnar")
+
+
+# 列类型
+KIND_FLOAT = "float"
+KIND_BOOL = "bool"
+KIND_STR = "str"
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, (float, np.floating)) and np.isnan(value))
+
+
+def _is_bool(value) -> bool:
+    return isinstance(value, (bool, np.bool_))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not _is_bool(value)
+
+
+def _values_kind(values) -> Optional[str]:
+    """一列新数据的类型（只看非缺失值）；全部缺失时返回None，由后续数据决定"""
+    if isinstance(values, pd.Series):
+        if pd.api.types.is_bool_dtype(values):
+            return KIND_BOOL if len(values) else None
+        if pd.api.types.is_numeric_dtype(values):
+            return KIND_FLOAT if values.notna().any() else None
+    present = [v for v in values if not _is_missing(v)]
+    if not present:
+        return None
+    if all(_is_bool(v) for v in present):
+        return KIND_BOOL
+    if all(_is_number(v) for v in present):
+        return KIND_FLOAT
+    return KIND_STR
+
+
+def _stored_kind(column: np.ndarray) -> Optional[str]:
+    """已存储列的类型；从未有过非缺失值时返回None（旧版本可能把全None列存成了空字符串列）"""
+    if column.dtype.kind == "b":
+        return KIND_BOOL if len(column) else None
+    if column.dtype.kind in "fiu":
+        column = column.astype(np.float64, copy=False)
+        return KIND_FLOAT if (~np.isnan(column)).any() else None
+    return KIND_STR if (column != "").any() else None
+
+
+def _parses_as_float(values) -> bool:
+    """非缺失、非空字符串的值是否都能解析为数字（不能时数值列要升级为字符串列）"""
+    if isinstance(values, pd.Series) and pd.api.types.is_numeric_dtype(values):
+        return True
+    present = [v for v in values if not _is_missing(v) and v != ""]
+    return bool(pd.to_numeric(pd.Series(present, dtype=object), errors="coerce").notna().all())
+
+
+def _column_kind(column: np.ndarray) -> str:
+    """已存储数组的物理类型"""
+    if column.dtype.kind == "b":
+        return KIND_BOOL
+    if column.dtype.kind in "fiu":
+        return KIND_FLOAT
+    return KIND_STR
+
+
+def _cast(values, kind: str) -> np.ndarray:
+    """按列类型转换（缺失值: float→NaN, bool→False, str→空字符串）"""
+    if kind == KIND_FLOAT:
+        if isinstance(values, np.ndarray) and values.dtype.kind in "fiub":
+            return values.astype(np.float64)
+        return pd.to_numeric(
+            pd.Series([np.nan if _is_missing(v) else v for v in values], dtype=object),
+            errors="coerce",
+        ).to_numpy(dtype=np.float64)
+    if kind == KIND_BOOL:
+        if isinstance(values, np.ndarray) and values.dtype.kind == "b":
+            return values
+        return np.array(
+            [False if _is_missing(v) or v == "" else v in (True, "True", "true", 1) for v in values],
+            dtype=bool,
+        )
+    strings = ["" if _is_missing(v) else str(v) for v in values]
+    return np.array(strings, dtype=str) if strings else np.array([], dtype="<U1")
+
+
+def _missing_column(kind: str, length: int) -> np.ndarray:
+    if kind == KIND_FLOAT:
+        return np.full(length, np.nan)
+    if kind == KIND_BOOL:
+        return np.zeros(length, dtype=bool)
+    return np.full(length, "", dtype="<U1")
+
+
+def _to_column(series: pd.Series, kind: Optional[str] = None) -> np.ndarray:
+    """DataFrame列 → 带类型的数组（类型未定的全缺失列按float64存NaN）"""
+    kind = kind or _values_kind(series) or KIND_FLOAT
+    values = series.to_numpy() if kind != KIND_STR else series.tolist()
+    return _cast(values, kind)
+
+
+def open_snapshot_day(snapshot_dir, date_str: str) -> Optional[np.ndarray]:
+    """以只读mmap方式打开某天的分区（结构化数组），没有分区时返回None"""
+    path = columnar_path(snapshot_dir, date_str)
+    if not path.exists():
+        return None
+    return np.load(path, mmap_mode="r", allow_pickle=False)
+
+
+def _raw_frame(path: Path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """读取分区原始内容（字符串列保留空字符串）"""
+    table = np.load(path, mmap_mode="r", allow_pickle=False)
+    names = table.dtype.names
+    if columns is not None:
+        wanted = set(columns)
+        names = [c for c in names if c in wanted]
+    return pd.DataFrame({name: np.array(table[name]) for name in names})
+
+
+# npy头按64字节对齐，行数预留21位数字（与numpy的GROWTH_AXIS_MAX_DIGITS一致），追加时原地改写
+_HEADER_ALIGN = 64
+_SHAPE_DIGITS = 21
+
+
+def _npy_header(dtype, length: int, size: Optional[int] = None) -> Optional[bytes]:
+    """
+    一维结构化数组的npy头
+
+    Args:
+        size: 头部总字节数（追加时传已有文件的数据偏移，保证数据不挪动）；None时按对齐自动计算
+
+    Returns:
+        头部字节；指定的size放不下时返回None
+    """
+    text = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        length,
+    )
+    text += " " * max(_SHAPE_DIGITS - len(str(length)), 0)
+    for version, prefix, length_format in (((1, 0), 10, "<H"), ((2, 0), 12, "<I")):
+        total = size or -(-(prefix + len(text) + 1) // _HEADER_ALIGN) * _HEADER_ALIGN
+        body = total - prefix
+        if body < len(text) + 1:
+            return None
+        if length_format == "<H" and body > 0xFFFF:
+            continue
+        return (
+            np.lib.format.magic(*version)
+            + struct.pack(length_format, body)
+            + (text.ljust(body - 1) + "\n").encode("latin1")
+        )
+    return None
+
+
+def _build_table(arrays: List) -> np.ndarray:
+    length = len(arrays[0][1]) if arrays else 0
+    table = np.empty(length, dtype=[(name, arr.dtype) for name, arr in arrays])
+    for name, arr in arrays:
+        table[name] = arr
+    return table
+
+
+def _write_table(path: Path, arrays: List):
+    """[(列名, 数组)] → 结构化数组，原子替换写入"""
+    table = _build_table(arrays)
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_npy_header(table.dtype, len(table)))
+            f.write(table.tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_snapshot_day(snapshot_dir, date_str: str, df: pd.DataFrame):
+    """整天写入（原子替换，写一半崩溃不会损坏旧分区）"""
+    path = columnar_path(snapshot_dir, date_str)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_table(path, [(str(name), _to_column(df[name])) for name in df.columns])
+
+
+def _append_in_place(path: Path, stored_dtype, stored_length: int, new_arrays: List) -> bool:
+    """
+    新行写到分区文件末尾，再原地改写npy头中的行数（先写数据后改头：中途崩溃时读到的仍是旧行数）
+
+    Returns:
+        False: 类型或字符串宽度不兼容、头部放不下新行数，调用方整体重写
+    """
+    for name, arr in new_arrays:
+        target = stored_dtype[name]
+        if target.kind == "U":
+            if arr.dtype.kind != "U" or arr.dtype.itemsize > target.itemsize:
+                return False
+        elif arr.dtype != target:
+            return False
+
+    table = np.empty(len(new_arrays[0][1]), dtype=stored_dtype)
+    for name, arr in new_arrays:
+        table[name] = arr
+
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            np.lib.format.read_array_header_1_0(f)
+        else:
+            np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        header = _npy_header(stored_dtype, stored_length + len(table), size=offset)
+        if header is None:
+            return False
+        f.seek(offset + stored_length * stored_dtype.itemsize)
+        f.write(table.tobytes())
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(header)
+    return True
+
+
+def append_snapshot_rows(snapshot_dir, date_str: str, rows: List[Dict]):
+    """
+    追加一批快照行（列和类型不变时只写新行，见模块说明第4条）
+
+    新数据按已存储的列类型转换；已存储列从未有过数据时按新数据确定类型并重新转换旧值；
+    数值列收到非数字字符串时升级为字符串列
+    """
+    new_df = pd.DataFrame(rows)
+    path = columnar_path(snapshot_dir, date_str)
+    if not path.exists():
+        write_snapshot_day(snapshot_dir, date_str, new_df)
+        return
+
+    stored = np.load(path, mmap_mode="r", allow_pickle=False)
+    stored_names = list(stored.dtype.names)
+    stored_length = len(stored)
+    names = stored_names + [str(c) for c in new_df.columns if c not in stored.dtype.names]
+    kinds = {}
+    for name in names:
+        old = stored[name] if name in stored_names else None
+        new = new_df[name] if name in new_df.columns else None
+        kind = (
+            (_stored_kind(old) if old is not None else None)
+            or (_values_kind(new) if new is not None else None)
+            or KIND_FLOAT
+        )
+        if kind == KIND_FLOAT and new is not None and not _parses_as_float(new):
+            kind = KIND_STR
+        kinds[name] = kind
+
+    new_arrays = [
+        (
+            name,
+            _cast(new_df[name].tolist(), kinds[name])
+            if name in new_df.columns
+            else _missing_column(kinds[name], len(new_df)),
+        )
+        for name in names
+    ]
+    if len(names) == len(stored_names) and all(
+        _column_kind(stored[name]) == kinds[name] for name in stored_names
+    ):
+        stored_dtype = stored.dtype
+        del stored
+        if _append_in_place(path, stored_dtype, stored_length, new_arrays):
+            return
+        stored = np.load(path, mmap_mode="r", allow_pickle=False)
+
+    arrays = []
+    for name, new in new_arrays:
+        old = (
+            _cast(np.array(stored[name]), kinds[name])
+            if name in stored_names
+            else _missing_column(kinds[name], stored_length)
+        )
+        arrays.append((name, np.concatenate([old, new])))
+    del stored
+    _write_table(path, arrays)
+
+
+def load_snapshot_day(
+    snapshot_dir, date_str: str, columns: Optional[Iterable[str]] = None
+) -> Optional[pd.DataFrame]:
+    """
+    读取某天的快照（与pd.read_csv结果兼容）
+
+    Args:
+        snapshot_dir: market_snapshots目录
+        date_str: YYYYMMDD
+        columns: 只读取这些列（不存在的列忽略），None为全部
+
+    Returns:
+        DataFrame；没有列式分区时返回None（调用方回退CSV）
+    """
+    path = columnar_path(snapshot_dir, date_str)
+    if not path.exists():
+        return None
+
+    df = _raw_frame(path, columns)
+    for name in df.columns:
+        if df[name].dtype == object or pd.api.types.is_string_dtype(df[name]):
+            values = df[name].to_numpy(dtype=object)
+            values[values == ""] = np.nan  # 与read_csv一致：空字段为NaN
+            df[name] = values
+    return df
+
+
+def snapshot_times(snapshot_dir, date_str: str) -> Optional[Set[str]]:
+    """某天已保存的时间点（去重用），没有列式分区时返回None"""
+    path = columnar_path(snapshot_dir, date_str)
+    if not path.exists():
+        return None
+    return set(_raw_frame(path, ["time"])["time"].tolist())
+
+
+def migrate_csv_day(csv_file: Path, force: bool = False) -> int:
+    """把一天的CSV转换为列式分区，返回行数（已存在且不强制覆盖时返回-1）"""
+    csv_file = Path(csv_file)
+    date_str = csv_file.stem
+    if has_snapshot_day(csv_file.parent, date_str) and not force:
+        return -1
+
+    df = pd.read_csv(
+        csv_file, on_bad_lines="skip", encoding="utf-8-sig", dtype={"time": str}
+    )
+    write_snapshot_day(csv_file.parent, date_str, df)
+    return len(df)
+
+
+def migrate_model(snapshot_dir, force: bool = False) -> Dict[str, int]:
+    """迁移一个模型目录下所有YYYYMMDD.csv"""
+    results = {}
+    for csv_file in sorted(Path(snapshot_dir).glob("*.csv")):
+        if not (csv_file.stem.isdigit() and len(csv_file.stem) == 8):
+            continue
+        try:
+            results[csv_file.stem] = migrate_csv_day(csv_file, force=force)
+        except Exception as e:
+            print(f"  ❌ {csv_file.name}: {e}")
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != "migrate":
+        print(__doc__)
+        sys.exit(1)
+
+    force = "--force" in args
+    models = [a for a in args[1:] if not a.startswith("--")] or ["deepseek", "qwen"]
+    base_dir = Path(__file__).parent / "trading_data"
+
+    for model in models:
+        snapshot_dir = base_dir / model / "market_snapshots"
+        if not snapshot_dir.exists():
+            print(f"⚠️  {model}: 未找到 {snapshot_dir}")
+            continue
+
+        print(f"\n📦 迁移 {model} ...")
+        results = migrate_model(snapshot_dir, force=force)
+        migrated = {d: n for d, n in results.items() if n >= 0}
+        skipped = len(results) - len(migrated)
+        for date_str, count in migrated.items():
+            print(f"  ✓ {date_str}: {count}行")
+        print(f"  完成: 迁移{len(migrated)}天, 跳过{skipped}天（已存在，--force覆盖）")
+
+
+if __name__ == "__main__":
+    main()
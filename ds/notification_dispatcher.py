@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.16】异步通知分发（Bark推送 / 邮件）
+
+核心功能:
+1. 调用方只把通知放进队列立即返回，由后台线程发送；推送服务器慢或超时不再卡住交易循环
+2. 每个通道（bark / email）独立的有界队列和工作线程，邮件慢不影响Bark；
+   队列满时丢弃新通知并计数（不阻塞调用方）
+3. 按通道重试 + 指数退避（退避只占用该通道的工作线程）
+4. 相同通知合并：同一内容还在队列中、或在NOTIFY_COALESCE_SECONDS内刚发送过时不重复发送
+5. 邮件复用SMTP会话（空闲超时或连接断开时自动重连登录），不再每封邮件都SSL握手+登录
+6. 进程退出前（atexit）最多等待NOTIFY_FLUSH_TIMEOUT秒把队列发完，手动回测等短进程不丢通知
+
+环境变量:
+    NOTIFY_ASYNC: 1=后台发送（默认），0=同步发送（旧行为，排查问题用）
+    NOTIFY_QUEUE_SIZE: 每个通道的队列上限（默认100）
+    NOTIFY_COALESCE_SECONDS: 相同通知的合并窗口（默认60秒）
+    NOTIFY_FLUSH_TIMEOUT: 退出时等待发送的最长时间（默认30秒）
+"""
+
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional
+
+NOTIFY_CONFIG = {
+    "async": os.getenv("NOTIFY_ASYNC", "1") != "0",
+    "queue_size": int(os.getenv("NOTIFY_QUEUE_SIZE", "100")),
+    "coalesce_seconds": float(os.getenv("NOTIFY_COALESCE_SECONDS", "60")),
+    "flush_timeout": float(os.getenv("NOTIFY_FLUSH_TIMEOUT", "30")),
+    "smtp_idle_seconds": 240,  # QQ邮箱约5分钟断开空闲连接，提前重连
+}
+
+# 各通道：工作线程数、失败重试次数、退避基数/上限（秒）
+CHANNEL_CONFIG = {
+    "bark": {"workers": 2, "max_retries": 2, "backoff": 2.0, "backoff_cap": 30.0},
+    "email": {"workers": 1, "max_retries": 3, "backoff": 5.0, "backoff_cap": 60.0},
+}
+
+
+class PermanentFailure(Exception):
+    """重试也不会成功的失败（如Bark Key无效、URL过长），不再重试"""
+
+
+@dataclass
+class _Job:
+    send: Callable[[], bool]
+    label: str
+    key: Optional[Hashable] = None
+    merged: int = 0  # 在队列中等待期间合并掉的相同通知数
+
+
+class _Channel:
+    """单个通道：有界队列 + 工作线程 + 合并/重试"""
+
+    def __init__(self, name: str, workers: int, max_retries: int, backoff: float, backoff_cap: float):
+        self.name = name
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.queue: "queue.Queue[_Job]" = queue.Queue(maxsize=NOTIFY_CONFIG["queue_size"])
+        self.stats = {"sent": 0, "failed": 0, "dropped": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, _Job] = {}
+        self._recent: Dict[Hashable, float] = {}
+        self._pid: Optional[int] = None
+
+    def submit(self, job: _Job) -> bool:
+        now = time.time()
+        with self._lock:
+            if job.key is not None:
+                if job.key in self._pending:
+                    self._pending[job.key].merged += 1
+                    self.stats["coalesced"] += 1
+                    return True
+                if now - self._recent.get(job.key, 0) < NOTIFY_CONFIG["coalesce_seconds"]:
+                    self.stats["coalesced"] += 1
+                    print(f"[通知] {job.label}: {NOTIFY_CONFIG['coalesce_seconds']:.0f}秒内已发送过相同内容，合并")
+                    return True
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                print(f"[通知] ⚠️ {self.name}队列已满({self.queue.maxsize})，丢弃: {job.label}")
+                return False
+            if job.key is not None:
+                self._pending[job.key] = job
+            self._ensure_workers()
+        return True
+
+    def _ensure_workers(self):
+        # fork出的子进程没有父进程的线程，按pid判断是否需要重新启动
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"notify-{self.name}-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                ok = self.deliver(job)
+                with self._lock:
+                    self.stats["sent" if ok else "failed"] += 1
+                    if job.key is not None:
+                        self._pending.pop(job.key, None)
+                        self._recent[job.key] = time.time()
+                        self._prune_recent()
+                if job.merged:
+                    print(f"[通知] {job.label}: 等待期间合并了{job.merged}条相同通知")
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, job: _Job) -> bool:
+        """发送一条通知，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if job.send():
+                    return True
+            except PermanentFailure as e:
+                print(f"[通知] {job.label}: ❌ {e}，不再重试")
+                return False
+            except Exception as e:
+                print(f"[通知] {job.label}: ❌ 发送异常: {str(e)[:100]}")
+            if attempt < self.max_retries:
+                delay = min(self.backoff_cap, self.backoff * (2 ** attempt))
+                print(f"[通知] {job.label}: {delay:.0f}秒后重试（{attempt + 1}/{self.max_retries}）")
+                time.sleep(delay)
+        print(f"[通知] {job.label}: ❌ 重试{self.max_retries}次后仍失败，放弃")
+        return False
+
+    def _prune_recent(self):
+        if len(self._recent) > 256:
+            cutoff = time.time() - NOTIFY_CONFIG["coalesce_seconds"]
+            self._recent = {k: t for k, t in self._recent.items() if t >= cutoff}
+
+    def wait(self, deadline: float) -> bool:
+        while self.queue.unfinished_tasks:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+_CHANNELS: Dict[str, _Channel] = {}
+_CHANNELS_LOCK = threading.Lock()
+
+
+def _channel(name: str) -> _Channel:
+    with _CHANNELS_LOCK:
+        if name not in _CHANNELS:
+            _CHANNELS[name] = _Channel(name, **CHANNEL_CONFIG[name])
+        return _CHANNELS[name]
+
+
+def dispatch(channel: str, send: Callable[[], bool], label: str, key: Optional[Hashable] = None) -> bool:
+    """
+    提交一条通知
+
+    Args:
+        channel: 通道名（CHANNEL_CONFIG中的key）
+        send: 实际发送函数，成功返回True（失败返回False或抛异常时按通道配置重试）
+        label: 日志中显示的名称
+        key: 合并用的内容标识（None为不合并）
+
+    Returns:
+        是否已接受（同步模式下为是否发送成功）
+    """
+    job = _Job(send=send, label=label, key=key)
+    if not NOTIFY_CONFIG["async"]:
+        return _channel(channel).deliver(job)
+    return _channel(channel).submit(job)
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """等待所有通道的队列发送完毕（默认最多NOTIFY_FLUSH_TIMEOUT秒），返回是否全部发完"""
+    deadline = time.time() + (NOTIFY_CONFIG["flush_timeout"] if timeout is None else timeout)
+    with _CHANNELS_LOCK:
+        channels = list(_CHANNELS.values())
+    return all([ch.wait(deadline) for ch in channels])
+
+
+def notification_stats() -> Dict[str, Dict[str, int]]:
+    with _CHANNELS_LOCK:
+        return {name: dict(ch.stats, queued=ch.queue.qsize()) for name, ch in _CHANNELS.items()}
+
+
+@atexit.register
+def _flush_on_exit():
+    with _CHANNELS_LOCK:
+        pending = sum(ch.queue.unfinished_tasks for ch in _CHANNELS.values())
+    if pending:
+        print(f"[通知] 进程退出前等待{pending}条通知发送...")
+        if not flush():
+            print("[通知] ⚠️ 等待超时，部分通知未发送")
+
+
+# ==================== Bark ====================
+
+
+def bark_sender(url: str, label: str) -> Callable[[], bool]:
+    """Bark GET请求（10秒超时），状态码200为成功"""
+    import requests
+
+    def send() -> bool:
+        response = requests.get(url, timeout=10)
+        if response.status_code == 200:
+            print(f"[Bark推送] {label}: ✅ 推送成功")
+            return True
+        print(f"[Bark推送] {label}: ❌ 推送失败 - 状态码 {response.status_code}, 响应: {response.text[:200]}")
+        # 4xx（如Key无效、URL过长）重试也不会成功
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise PermanentFailure(f"状态码 {response.status_code}")
+        return False
+
+    return send
+
+
+# ==================== 邮件 ====================
+
+
+class SmtpSession:
+    """复用的SMTP连接：空闲超时或连接断开时重新连接并登录"""
+
+    def __init__(self, server: str, port: int, username: str, password: str, use_ssl: bool = True, timeout: int = 30):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def send_message(self, msg):
+        with self._lock:
+            conn = self._connection()
+            try:
+                conn.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # 服务器已断开（复用的连接过期）：重连后再发一次
+                self._close()
+                self._connection().send_message(msg)
+            except Exception:
+                self._close()
+                raise
+            self._last_used = time.time()
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._conn is not None:
+            if time.time() - self._last_used < NOTIFY_CONFIG["smtp_idle_seconds"]:
+                return self._conn
+            self._close()
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        conn.login(self.username, self.password)
+        self._conn = conn
+        self._last_used = time.time()
+        return conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+
+_SMTP_SESSIONS: Dict[tuple, SmtpSession] = {}
+
+
+def smtp_session(config: Dict) -> SmtpSession:
+    """按(服务器, 端口, 账号)复用SmtpSession"""
+    key = (config["smtp_server"], int(config["smtp_port"]), config["username"])
+    with _CHANNELS_LOCK:
+        if key not in _SMTP_SESSIONS:
+            _SMTP_SESSIONS[key] = SmtpSession(
+                str(config["smtp_server"]), int(config["smtp_port"]),
+                str(config["username"]), str(config["password"]),
+                use_ssl=bool(config.get("use_ssl", True)),
+            )
+        return _SMTP_SESSIONS[key]
+
+
+def email_sender(msg, config: Dict) -> Callable[[], bool]:
+    session = smtp_session(config)
+    subject = msg["Subject"]
+
+    def send() -> bool:
+        session.send_message(msg)
+        print(f"[邮件通知] ✅ 邮件发送成功: {subject}")
+        return True
+
+    return send
+
+
+if __name__ == "__main__":
+    """
+    自检：提交立即返回、慢通道不阻塞、重试、合并、队列上限、退出前flush
+    """
+    CHANNEL_CONFIG["bark"].update(backoff=0.05, backoff_cap=0.05)
+    NOTIFY_CONFIG["coalesce_seconds"] = 0.5
+    calls = []
+
+    def slow_send(tag, fail_times=0):
+        state = {"fails": fail_times}
+
+        def send():
+            time.sleep(0.2)
+            if state["fails"]:
+                state["fails"] -= 1
+                return False
+            calls.append(tag)
+            return True
+
+        return send
+
+    t0 = time.time()
+    for i in range(4):
+        dispatch("bark", slow_send(f"n{i}", fail_times=1 if i == 0 else 0), f"设备{i}", key=f"n{i}")
+    for _ in range(5):
+        dispatch("bark", slow_send("dup"), "重复", key="dup")
+    assert time.time() - t0 < 0.05, "提交应立即返回"
+
+    assert flush(10)
+    assert sorted(calls) == ["dup", "n0", "n1", "n2", "n3"], calls
+    stats = notification_stats()["bark"]
+    assert stats["coalesced"] == 4 and stats["sent"] == 5, stats
+
+    dispatch("bark", slow_send("dup"), "重复", key="dup")  # 合并窗口内
+    assert flush(5) and calls.count("dup") == 1
+    time.sleep(0.6)
+    dispatch("bark", slow_send("dup"), "重复", key="dup")
+    assert flush(5) and calls.count("dup") == 2
+    print(f"✅ 通知分发自检通过: {notification_stats()}")
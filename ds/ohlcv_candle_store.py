@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.4】增量K线仓库（环形缓冲区）
+
+核心功能:
+1. 按(币种, 周期)在内存中保存已完成K线，底层为定长NumPy数组（int64时间戳 + float64 OHLCV）
+2. 每轮只拉取上次最后一根K线之后的数据（since游标），不再每15分钟重下100/50/100根
+3. "移除未完成K线"只在仓库层判断一次：仓库里只存放已经收盘的K线
+4. 直接交给get_ohlcv_data现成的DataFrame和原始K线列表（kline_data兼容格式）
+
+缓存断档（进程刚启动、网络中断过久、数据不连续）时自动回退到全量拉取。
+"""
+
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from market_data_fetcher import kline_request_weight
+
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+_TIMEFRAME_UNIT_MS = {
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+}
+
+
+def timeframe_to_ms(timeframe: str) -> int:
+    """'15m' / '1h' / '4h' / '1d' -> 毫秒"""
+    unit = timeframe[-1]
+    if unit not in _TIMEFRAME_UNIT_MS:
+        raise ValueError(f"不支持的K线周期: {timeframe}")
+    return int(timeframe[:-1]) * _TIMEFRAME_UNIT_MS[unit]
+
+
+class StoredCandles(NamedTuple):
+    """仓库输出：原始K线列表（ccxt格式）+ 已转换时间戳的DataFrame"""
+
+    rows: List[list]
+    frame: pd.DataFrame
+
+
+class _CandleRingBuffer:
+    """单个(币种, 周期)的定长环形缓冲区，只保存已收盘K线"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 5), dtype=np.float64)
+        self.head = 0  # 下一个写入位置
+        self.size = 0
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        if self.size == 0:
+            return None
+        return int(self.timestamps[(self.head - 1) % self.capacity])
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def append(self, timestamp: int, ohlcv):
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = ohlcv
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def replace_last(self, ohlcv):
+        self.values[(self.head - 1) % self.capacity] = ohlcv
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间升序返回(timestamps, values)副本"""
+        idx = (self.head - self.size + np.arange(self.size)) % self.capacity
+        return self.timestamps[idx], self.values[idx]
+
+
+class OHLCVCandleStore:
+    """
+    增量K线仓库
+
+    用法:
+        store = OHLCVCandleStore()
+        candles = store.fetch(exchange, "BTC/USDT:USDT", "15m", limit=100)
+        df_15m, rows = candles.frame, candles.rows
+    """
+
+    def __init__(self):
+        self._buffers: Dict[Tuple[str, str], _CandleRingBuffer] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "full_fetches": 0,
+            "incremental_fetches": 0,
+            "candles_downloaded": 0,
+            "request_weight": 0,
+        }
+
+    def _get_buffer(self, symbol: str, timeframe: str, capacity: int) -> _CandleRingBuffer:
+        key = (symbol, timeframe)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer.capacity != capacity:
+                buffer = _CandleRingBuffer(capacity)
+                self._buffers[key] = buffer
+            return buffer
+
+    def _record(self, rows: List[list], weight: int, incremental: bool):
+        with self._lock:
+            self.stats["incremental_fetches" if incremental else "full_fetches"] += 1
+            self.stats["candles_downloaded"] += len(rows)
+            self.stats["request_weight"] += weight
+
+    def fetch(
+        self,
+        exchange,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        rate_limiter=None,
+        now_ms: Optional[int] = None,
+    ) -> StoredCandles:
+        """
+        同步并返回某币种某周期的已收盘K线
+
+        Args:
+            exchange: ccxt交易所实例
+            symbol: 交易对
+            timeframe: K线周期
+            limit: 全量拉取时的数量（与原get_ohlcv_data一致，包含1根可能未完成的K线），
+                仓库容量为limit-1根已收盘K线
+            rate_limiter: APIRateLimiter实例（可选）
+            now_ms: 当前时间戳（毫秒），默认取系统时间
+
+        Returns:
+            StoredCandles(rows, frame)
+        """
+        tf_ms = timeframe_to_ms(timeframe)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        capacity = max(1, limit - 1)
+        buffer = self._get_buffer(symbol, timeframe, capacity)
+        last_ts = buffer.last_timestamp
+
+        # 距离上次最后一根K线缺了多少根（含当前未完成的那根）
+        missing = (now_ms - last_ts) // tf_ms + 1 if last_ts is not None else None
+        incremental = missing is not None and missing < capacity
+
+        if incremental:
+            fetch_limit = int(missing) + 1
+            weight = kline_request_weight(fetch_limit)
+            if rate_limiter is not None:
+                rate_limiter.acquire(weight)
+            rows = exchange.fetch_ohlcv(symbol, timeframe, since=last_ts, limit=fetch_limit)
+            if rate_limiter is not None:
+                rate_limiter.observe(exchange)  # 【V8.9.26】响应头校准已用权重
+            # 数据不连续（交易所返回的第一根晚于预期）时回退全量
+            if rows and rows[0][0] > last_ts + tf_ms:
+                incremental = False
+
+        if not incremental:
+            weight = kline_request_weight(limit)
+            if rate_limiter is not None:
+                rate_limiter.acquire(weight)
+            rows = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            if rate_limiter is not None:
+                rate_limiter.observe(exchange)
+            buffer.clear()
+
+        self._record(rows, weight, incremental)
+
+        for row in rows:
+            ts = int(row[0])
+            # 只保留已收盘K线：开盘时间 + 周期 <= 当前时间
+            if ts + tf_ms > now_ms:
+                continue
+            current_last = buffer.last_timestamp
+            if current_last is not None and ts < current_last:
+                continue
+            if current_last is not None and ts == current_last:
+                buffer.replace_last(row[1:6])
+            else:
+                buffer.append(ts, row[1:6])
+
+        return self.snapshot(symbol, timeframe)
+
+    def snapshot(self, symbol: str, timeframe: str) -> StoredCandles:
+        """导出当前缓存内容（不访问交易所）"""
+        buffer = self._buffers.get((symbol, timeframe))
+        if buffer is None or buffer.size == 0:
+            return StoredCandles([], pd.DataFrame(columns=OHLCV_COLUMNS))
+
+        timestamps, values = buffer.ordered()
+        rows = [
+            [int(ts), *vals]
+            for ts, vals in zip(timestamps.tolist(), values.tolist())
+        ]
+        frame = pd.DataFrame(values, columns=OHLCV_COLUMNS[1:])
+        frame.insert(0, "timestamp", pd.to_datetime(timestamps, unit="ms"))
+        return StoredCandles(rows, frame)
+
+    def get_stats(self) -> Dict:
+        """累计统计：全量/增量次数、下载K线数、消耗权重"""
+        with self._lock:
+            return dict(self.stats, buffers=len(self._buffers))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.6】Phase 1机会扫描向量化模块
+
+核心功能:
+1. 用滑动窗口视图（零拷贝）一次性得到每个入场点之后N根K线的最高价/最低价/末根收盘价
+2. 批量计算两个方向的最大潜在利润、方向选择、到达最高利润的K线位置
+3. 预筛选候选入场点，逐行的字段解析只对少量候选执行
+4. 【V8.9.18】返回该币种共享的PathArena，机会用其视图记录完整的未来价格路径
+
+替代analyze_separated_opportunities中"每行iloc + 每行切片96根 + iterrows跟踪"的写法，
+结果与原逐行逻辑逐位一致（同样的浮点运算顺序），见文件末尾的对照基准。
+"""
+
+import warnings
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from future_path_arena import PathArena
+
+
+def forward_windows(values: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    返回形状为(n - horizon, horizon)的只读视图，第i行为values[i+1 : i+1+horizon]
+
+    不复制数据；n <= horizon时返回空数组。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = len(values) - horizon
+    if count <= 0:
+        return np.empty((0, horizon), dtype=np.float64)
+    return sliding_window_view(values[1:], horizon)[:count]
+
+
+def _numeric_column(df: pd.DataFrame, column: str, default: float) -> np.ndarray:
+    """列缺失时用默认值填充（与row.get(column, default)一致），无法解析的值为NaN"""
+    if column not in df.columns:
+        return np.full(len(df), default, dtype=np.float64)
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def entry_prices_from_snapshots(df: pd.DataFrame) -> np.ndarray:
+    """入场价：优先close，close<=0时回退price（与原逐行逻辑一致）"""
+    close = _numeric_column(df, "close", 0.0)
+    price = _numeric_column(df, "price", 0.0)
+    return np.where(close <= 0, price, close)
+
+
+def scan_forward_extremes(
+    coin_data: pd.DataFrame,
+    horizon: int = 96,
+    min_profit: float = 8.0,
+) -> Dict[str, np.ndarray]:
+    """
+    对单个币种（已按时间排序、reset_index）批量扫描所有入场点
+
+    Returns:
+        {
+            "candidates": 满足最低利润门槛（且成交量/RSI未明确不合格）的行号,
+            "entry_price", "max_high", "min_low", "final_close",
+            "is_long", "max_profit", "bars_to_max": 均为按行号索引的数组（长度n-horizon），
+                其中bars_to_max只对candidates有效，其余为-1,
+            "path_arena": 该币种high/low/close的PathArena（window(idx, horizon)即第idx行的未来路径）
+        }
+    """
+    highs = _numeric_column(coin_data, "high", np.nan)
+    lows = _numeric_column(coin_data, "low", np.nan)
+    closes = _numeric_column(coin_data, "close", np.nan)
+    count = max(len(coin_data) - horizon, 0)
+
+    entry = entry_prices_from_snapshots(coin_data)[:count]
+    high_windows = forward_windows(highs, horizon)
+    low_windows = forward_windows(lows, horizon)
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # 全NaN窗口
+        max_high = np.nanmax(high_windows, axis=1) if count else np.empty(0)
+        min_low = np.nanmin(low_windows, axis=1) if count else np.empty(0)
+        long_profit = (max_high - entry) / entry * 100
+        short_profit = (entry - min_low) / entry * 100
+
+    is_long = long_profit > short_profit
+    max_profit = np.where(is_long, long_profit, short_profit)
+
+    # 预筛选：利润门槛是确定性的；成交量/RSI只排除"能解析且明确不合格"的行，
+    # 无法解析的交给逐行逻辑判断，保证候选集是原逻辑的超集
+    with np.errstate(invalid="ignore"):
+        mask = max_profit >= min_profit
+        volume_ratio = _numeric_column(coin_data, "volume_ratio", 0.0)[:count]
+        rsi = _numeric_column(coin_data, "rsi_15m", 50.0)[:count]
+        mask &= ~(volume_ratio < 1.2)
+        mask &= ~(np.abs(rsi - 50) < 15)
+    candidates = np.flatnonzero(mask)
+
+    # 最高利润首次出现的位置：按逐根利润（与原跟踪循环相同的公式）取首个最大值
+    bars_to_max = np.full(count, -1, dtype=np.int64)
+    if len(candidates):
+        cand_entry = entry[candidates][:, None]
+        with np.errstate(invalid="ignore"):
+            long_path = (high_windows[candidates] - cand_entry) / cand_entry * 100
+            short_path = (cand_entry - low_windows[candidates]) / cand_entry * 100
+        path = np.where(is_long[candidates][:, None], long_path, short_path)
+        path = np.where(np.isnan(path), -np.inf, path)
+        bars_to_max[candidates] = path.argmax(axis=1)
+
+    return {
+        "candidates": candidates,
+        "entry_price": entry,
+        "max_high": max_high,
+        "min_low": min_low,
+        "final_close": closes[horizon : horizon + count],
+        "is_long": is_long,
+        "max_profit": max_profit,
+        "bars_to_max": bars_to_max,
+        "path_arena": PathArena(highs, lows, closes),
+    }
+
+
+if __name__ == "__main__":
+    """
+    基准测试：14天 × N个币种，对比原逐行逻辑与向量化扫描（结果须一致）
+    """
+    import time
+
+    horizon, threshold = 96, 8.0
+    n_coins, n_rows = 8, 14 * 96
+    rng = np.random.default_rng(7)
+
+    frames = []
+    for c in range(n_coins):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_rows)))
+        frames.append(pd.DataFrame({
+            "coin": f"C{c}",
+            "close": close,
+            "high": close * (1 + rng.random(n_rows) * 0.01),
+            "low": close * (1 - rng.random(n_rows) * 0.01),
+            "volume_ratio": rng.random(n_rows) * 3,
+            "rsi_15m": rng.random(n_rows) * 100,
+        }))
+
+    def legacy_scan(coin_data):
+        results = []
+        for idx in range(len(coin_data) - horizon):
+            current = coin_data.iloc[idx]
+            entry_price = float(current.get("close", 0))
+            if float(current.get("volume_ratio", 0)) < 1.2 or abs(float(current.get("rsi_15m", 50)) - 50) < 15:
+                continue
+            later = coin_data.iloc[idx + 1 : idx + 1 + horizon]
+            max_high, min_low = float(later["high"].max()), float(later["low"].min())
+            long_p = (max_high - entry_price) / entry_price * 100
+            short_p = (entry_price - min_low) / entry_price * 100
+            direction = "long" if long_p > short_p else "short"
+            if max(long_p, short_p) < threshold:
+                continue
+            best, best_bar, started = 0, 0, False
+            for bar_idx, (_, row) in enumerate(later.iterrows()):
+                p = ((float(row["high"]) - entry_price) if direction == "long" else (entry_price - float(row["low"]))) / entry_price * 100
+                if not started and p >= threshold:
+                    started, best, best_bar = True, p, bar_idx
+                if started and p > best:
+                    best, best_bar = p, bar_idx
+            results.append((idx, direction, best, best_bar))
+        return results
+
+    t0 = time.time()
+    legacy = [legacy_scan(df) for df in frames]
+    t_legacy = time.time() - t0
+
+    t0 = time.time()
+    vectorized = []
+    for df in frames:
+        scan = scan_forward_extremes(df, horizon, threshold)
+        vectorized.append([
+            (int(i), "long" if scan["is_long"][i] else "short", float(scan["max_profit"][i]), int(scan["bars_to_max"][i]))
+            for i in scan["candidates"]
+        ])
+    t_vec = time.time() - t0
+
+    assert legacy == vectorized, "向量化扫描结果与逐行逻辑不一致"
+    total = sum(len(r) for r in legacy)
+    print(f"✅ {n_coins}币种 × 14天: {total}个机会，结果一致")
+    print(f"   逐行: {t_legacy:.2f}s | 向量化: {t_vec:.3f}s | 加速 {t_legacy / max(t_vec, 1e-9):.0f}x")
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.20】机会列式表（Phase 1–4共享的交换格式）
+
+核心功能:
+1. OpportunityTable.from_dicts: 机会dict列表 → 列数组
+   - 数值列为float64/int64/bool，字符串列为分类编码（int32 codes + 类别表）
+   - 嵌套的snapshot/future_data展开为"snapshot.xxx" / "future_data.xxx"列，
+     future_data.path（未来价格路径视图）保留为对象列
+   - 部分机会缺少的字段额外记录present掩码，column(name, default)与dict.get语义一致
+2. select / by_signal_type / by_coin / by_date: 筛选只生成行号索引，列数据不复制
+3. row / to_dicts / 迭代: 按需还原为原来的dict结构，供仍按dict读取的调用方使用
+   （fields限定只还原部分字段，如利润计算只需要价格/ATR几列；"snapshot.xxx"只还原快照中的单个字段）
+4. assign: 把数值写回某一列（如Phase 3重算的signal_score），同一张表的其他筛选结果都能看到
+
+一个带snapshot（约150个字段）的机会dict占十几KB，列式存储每个字段约8字节，
+同样的机会集合内存降到原来的几分之一。
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+NESTED_FIELDS = ("snapshot", "future_data")
+_SEP = "."
+_MISSING = object()
+_NAN_KEY = object()  # 分类列中NaN的统一键（NaN != NaN，不能直接做dict键）
+
+
+class _Column:
+    """单列数据：kind为num/bool/cat/obj，present为None表示所有行都有该字段"""
+
+    __slots__ = ("kind", "data", "categories", "present")
+
+    def __init__(self, kind, data, categories=None, present=None):
+        self.kind = kind
+        self.data = data
+        self.categories = categories
+        self.present = present
+
+    @property
+    def nbytes(self) -> int:
+        total = self.data.nbytes
+        if self.present is not None:
+            total += self.present.nbytes
+        return total
+
+
+def _is_nan(value) -> bool:
+    return isinstance(value, (float, np.floating)) and value != value
+
+
+def _build_column(values: List) -> _Column:
+    present = np.fromiter((v is not _MISSING for v in values), dtype=bool, count=len(values))
+    mask = None if present.all() else present
+    known = [v for v in values if v is not _MISSING]
+
+    if not known:
+        return _Column("num", np.full(len(values), np.nan), present=mask)
+
+    if all(isinstance(v, (bool, np.bool_)) for v in known):
+        data = np.array([bool(v) if v is not _MISSING else False for v in values], dtype=bool)
+        return _Column("bool", data, present=mask)
+
+    if all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_)) for v in known):
+        if all(isinstance(v, (int, np.integer)) for v in known):
+            data = np.array([v if v is not _MISSING else 0 for v in values], dtype=np.int64)
+        else:
+            data = np.array([v if v is not _MISSING else np.nan for v in values], dtype=np.float64)
+        return _Column("num", data, present=mask)
+
+    if all(isinstance(v, str) or v is None or _is_nan(v) for v in known):
+        lookup: Dict = {}
+        categories: List = []
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            if v is _MISSING:
+                codes[i] = -1
+                continue
+            key = _NAN_KEY if _is_nan(v) else v
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(categories)
+                categories.append(v)
+            codes[i] = code
+        return _Column("cat", codes, categories=categories, present=mask)
+
+    data = np.empty(len(values), dtype=object)
+    data[:] = [None if v is _MISSING else v for v in values]
+    return _Column("obj", data, present=mask)
+
+
+def _flatten_nested(name: str, values: List) -> Dict[str, _Column]:
+    """嵌套dict字段 → 标记列（该行是否有这个dict）+ 每个子字段一列"""
+    keys: Dict[str, None] = {}
+    for value in values:
+        if value is not _MISSING:
+            keys.update(dict.fromkeys(value))
+    columns = {
+        name: _Column("bool", np.fromiter((v is not _MISSING for v in values), dtype=bool, count=len(values)))
+    }
+    for key in keys:
+        columns[f"{name}{_SEP}{key}"] = _build_column(
+            [v.get(key, _MISSING) if v is not _MISSING else _MISSING for v in values]
+        )
+    return columns
+
+
+class OpportunityTable:
+    """
+    机会列式表
+
+    同一张表的筛选结果共享列数据，只持有各自的行号索引（_rows为None表示全部行）
+    """
+
+    def __init__(self, columns: Dict[str, _Column], size: int, rows: Optional[np.ndarray] = None):
+        self._columns = columns
+        self._size = size
+        self._rows = rows
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_dicts(cls, opportunities: Sequence[Dict], fields: Optional[Iterable[str]] = None) -> "OpportunityTable":
+        """
+        机会dict列表 → 列式表
+
+        Args:
+            opportunities: Phase 1输出的机会列表
+            fields: 只构建这些顶层字段（如("signal_type", "signal_score")）；
+                包含"snapshot"/"future_data"时展开对应的嵌套字段；None为全部字段
+        """
+        wanted = set(fields) if fields is not None else None
+        top_keys: Dict[str, None] = {}
+        for opp in opportunities:
+            top_keys.update(dict.fromkeys(opp))
+
+        columns: Dict[str, _Column] = {}
+        for key in top_keys:
+            if wanted is not None and key not in wanted:
+                continue
+            values = [opp.get(key, _MISSING) for opp in opportunities]
+            if key in NESTED_FIELDS and all(v is _MISSING or isinstance(v, dict) for v in values):
+                columns.update(_flatten_nested(key, values))
+            else:
+                # 非dict的嵌套字段（如DataFrame形式的future_data）整体作为对象列
+                columns[key] = _build_column(values)
+        return cls(columns, len(opportunities))
+
+    # ------------------------------------------------------------------
+    # 基本信息
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self._size if self._rows is None else len(self._rows)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        """列数据占用的字节数（共享列只算一次，不含分类类别表和对象列引用的对象）"""
+        total = sum(col.nbytes for col in self._columns.values())
+        return total + (self._rows.nbytes if self._rows is not None else 0)
+
+    # ------------------------------------------------------------------
+    # 列访问
+    # ------------------------------------------------------------------
+
+    def _take(self, array: np.ndarray) -> np.ndarray:
+        return array if self._rows is None else array[self._rows]
+
+    def column(self, name: str, default=np.nan) -> np.ndarray:
+        """
+        按当前筛选取一列（与逐个opp.get(name, default)一致）
+
+        数值/布尔列返回对应dtype的数组，分类列和对象列返回object数组
+        """
+        col = self._columns.get(name)
+        if col is None:
+            return np.full(len(self), default, dtype=np.float64 if isinstance(default, (int, float)) else object)
+
+        if col.kind == "cat":
+            lookup = np.empty(len(col.categories) + 1, dtype=object)
+            lookup[:-1] = col.categories
+            lookup[-1] = default
+            values = lookup[self._take(col.data)]  # 缺失的code为-1，取到默认值
+        else:
+            values = self._take(col.data)
+
+        if col.present is not None:
+            present = self._take(col.present)
+            if col.kind in ("num", "bool") and not isinstance(default, (bool, np.bool_)):
+                values = np.where(present, values, default)
+            elif col.kind in ("num", "bool"):
+                values = np.where(present, values, bool(default))
+            elif col.kind == "obj":
+                values = values.copy()
+                values[~present] = default
+        return values
+
+    def has(self, name: str) -> np.ndarray:
+        """该字段存在的行掩码（与逐个name in opp一致）"""
+        col = self._columns.get(name)
+        if col is None:
+            return np.zeros(len(self), dtype=bool)
+        if col.present is None:
+            return np.ones(len(self), dtype=bool)
+        return self._take(col.present).copy()
+
+    def codes(self, name: str) -> np.ndarray:
+        """分类列的int32编码（缺失为-1）"""
+        return self._take(self._columns[name].data)
+
+    def categories(self, name: str) -> List:
+        return list(self._columns[name].categories)
+
+    def equals(self, name: str, value) -> np.ndarray:
+        """该列等于value的行掩码（分类列按编码比较，不解码字符串）"""
+        col = self._columns.get(name)
+        if col is None:
+            return np.zeros(len(self), dtype=bool)
+        if col.kind == "cat":
+            try:
+                code = col.categories.index(value)
+            except ValueError:
+                return np.zeros(len(self), dtype=bool)
+            return self._take(col.data) == code
+        if isinstance(value, str):
+            return np.zeros(len(self), dtype=bool)
+        mask = self._take(col.data) == value
+        if col.present is not None:
+            mask &= self._take(col.present)
+        return mask
+
+    # ------------------------------------------------------------------
+    # 写回
+    # ------------------------------------------------------------------
+
+    def assign(self, name: str, values, positions: Optional[Sequence[int]] = None) -> None:
+        """
+        把数值写入name列（与逐行opp[name] = value一致）
+
+        Args:
+            values: 写入的数值，与positions一一对应
+            positions: 相对当前筛选结果的行号；None为当前筛选的全部行
+
+        列数据与同一张表的其他筛选结果共享，写入对它们同样可见；整数列写入小数时升为float64
+        """
+        col = self._columns.get(name)
+        if col is not None and col.kind != "num":
+            raise TypeError(f"{name}不是数值列，不能写回数值")
+        values = np.asarray(values)
+        rows = np.arange(self._size) if self._rows is None else self._rows
+        if positions is not None:
+            rows = rows[np.asarray(positions, dtype=np.int64)]
+
+        if col is None:
+            col = self._columns[name] = _Column(
+                "num", np.full(self._size, np.nan), present=np.zeros(self._size, dtype=bool)
+            )
+        dtype = np.result_type(col.data, values)
+        if dtype != col.data.dtype:
+            col.data = col.data.astype(dtype)
+        col.data[rows] = values
+        if col.present is not None:
+            col.present[rows] = True
+            if col.present.all():
+                col.present = None
+
+    # ------------------------------------------------------------------
+    # 筛选（只生成行号，不复制列）
+    # ------------------------------------------------------------------
+
+    def select(self, selector: Union[np.ndarray, Sequence[int]]) -> "OpportunityTable":
+        """按布尔掩码或行号（相对当前筛选结果）筛选"""
+        selector = np.asarray(selector)
+        if selector.dtype == bool:
+            selector = np.flatnonzero(selector)
+        base = np.arange(self._size) if self._rows is None else self._rows
+        return OpportunityTable(self._columns, self._size, base[selector.astype(np.int64)])
+
+    def by_signal_type(self, signal_type: str) -> "OpportunityTable":
+        return self.select(self.equals("signal_type", signal_type))
+
+    def by_coin(self, coin: str) -> "OpportunityTable":
+        return self.select(self.equals("coin", coin))
+
+    def by_date(self, date: str) -> "OpportunityTable":
+        return self.select(self.equals("date", date))
+
+    # ------------------------------------------------------------------
+    # dict适配（旧调用方）
+    # ------------------------------------------------------------------
+
+    def _value(self, col: _Column, i: int):
+        if col.present is not None and not col.present[i]:
+            return _MISSING
+        if col.kind == "cat":
+            return col.categories[col.data[i]]
+        if col.kind == "obj":
+            return col.data[i]
+        return col.data[i].item()
+
+    def _selected(self, fields: Optional[Iterable[str]]) -> List:
+        """fields → 需要还原的(列名, 列)：顶层名包含其全部嵌套列，"snapshot.xxx"只取该列（及嵌套标记列）"""
+        if fields is None:
+            return list(self._columns.items())
+        wanted = frozenset(fields)
+        parents = {name.partition(_SEP)[0] for name in wanted if _SEP in name}
+        return [
+            (name, col) for name, col in self._columns.items()
+            if name in wanted or name in parents or name.partition(_SEP)[0] in wanted
+        ]
+
+    def _row_at(self, i: int, columns: Optional[List] = None) -> Dict:
+        row: Dict = {}
+        nested: Dict[str, Dict] = {}
+        for name, col in (self._columns.items() if columns is None else columns):
+            if name in NESTED_FIELDS:
+                if col.data[i]:
+                    nested[name] = row[name] = {}
+                continue
+            value = self._value(col, i)
+            if value is _MISSING:
+                continue
+            prefix, sep, key = name.partition(_SEP)
+            if sep and prefix in NESTED_FIELDS:
+                if prefix in nested:
+                    nested[prefix][key] = value
+            else:
+                row[name] = value
+        return row
+
+    def row(self, position: int, fields: Optional[Iterable[str]] = None) -> Dict:
+        """第position行（相对当前筛选结果）还原为机会dict；fields限定还原的字段"""
+        i = int(position if self._rows is None else self._rows[position])
+        return self._row_at(i, self._selected(fields) if fields is not None else None)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(len(self)):
+            yield self.row(position)
+
+    def to_dicts(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        if fields is None:
+            return list(self)
+        columns = self._selected(fields)
+        rows = range(self._size) if self._rows is None else self._rows
+        return [self._row_at(int(i), columns) for i in rows]
+
+
+def as_opportunity_table(
+    opportunities: Union[OpportunityTable, Sequence[Dict]],
+    fields: Optional[Iterable[str]] = None,
+) -> OpportunityTable:
+    """已经是OpportunityTable时原样返回，dict列表按fields构建"""
+    if isinstance(opportunities, OpportunityTable):
+        return opportunities
+    return OpportunityTable.from_dicts(opportunities, fields)
+
+
+def take_opportunities(
+    opportunities: Union[OpportunityTable, Sequence[Dict]],
+    positions: Sequence[int],
+) -> Union[OpportunityTable, List[Dict]]:
+    """按行号取子集，保持输入类型（dict列表返回原dict对象，调用方的就地修改依然生效）"""
+    if isinstance(opportunities, OpportunityTable):
+        return opportunities.select(np.asarray(positions, dtype=np.int64))
+    return [opportunities[int(i)] for i in positions]
+
+
+if __name__ == "__main__":
+    """
+    往返与内存对照：dict列表 → 列式表 → dict列表
+    """
+    import pickle
+
+    rng = np.random.default_rng(2)
+    coins = ["BTC", "ETH", "SOL", "BNB", "XRP", "DOGE", "LTC"]
+    opportunities = []
+    for i in range(3000):
+        snapshot = {f"f{k}": float(rng.random()) for k in range(120)}
+        snapshot.update(trend_4h=["多头", "空头", "多头转弱"][i % 3], has_breakout=bool(i % 2), side="long")
+        if i % 5 == 0:
+            snapshot["volume_ratio"] = float("nan")
+        opp = {
+            "coin": coins[i % len(coins)],
+            "date": f"202511{10 + i % 14:02d}",
+            "entry_price": float(rng.uniform(1, 100000)),
+            "direction": "long" if i % 3 else "short",
+            "signal_type": "scalping" if i % 4 else "swing",
+            "signal_score": int(rng.integers(40, 100)),
+            "consensus": int(rng.integers(0, 5)),
+            "snapshot": snapshot,
+            "future_data": {"max_high": 1.0, "min_low": 0.5, "final_close": 0.8, "data_points": 96},
+        }
+        if i % 7 == 0:
+            opp["actual_profit_pct"] = float(rng.normal())
+        opportunities.append(opp)
+
+    def same(a, b):
+        if isinstance(a, dict):
+            return isinstance(b, dict) and a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+        return a == b or (_is_nan(a) and _is_nan(b))
+
+    table = OpportunityTable.from_dicts(opportunities)
+    restored = table.to_dicts()
+    assert all(same(a, b) for a, b in zip(restored, opportunities)), "往返结果不一致"
+
+    swing_btc = table.by_signal_type("swing").by_coin("BTC")
+    expected = [o for o in opportunities if o["signal_type"] == "swing" and o["coin"] == "BTC"]
+    assert len(swing_btc) == len(expected) and all(same(a, b) for a, b in zip(swing_btc, expected))
+    slim = swing_btc.to_dicts(("entry_price", "snapshot"))
+    assert all(same(a, {"entry_price": b["entry_price"], "snapshot": b["snapshot"]}) for a, b in zip(slim, expected))
+    lean = swing_btc.row(0, ("coin", "snapshot.trend_4h", "snapshot.missing"))
+    assert lean == {"coin": "BTC", "snapshot": {"trend_4h": expected[0]["snapshot"]["trend_4h"]}}
+    scores = table.column("actual_profit_pct", 0)
+    assert scores.tolist() == [o.get("actual_profit_pct", 0) for o in opportunities]
+    assert table.has("actual_profit_pct").tolist() == ["actual_profit_pct" in o for o in opportunities]
+
+    # 写回：在筛选结果上写入，原表和其他筛选结果都能看到
+    rescored = [float(o["signal_score"]) + 0.5 for o in expected]
+    swing_btc.assign("signal_score", rescored)
+    swing_btc.select([0]).assign("actual_profit_pct", [1.25])
+    for o, score in zip(expected, rescored):
+        o["signal_score"] = score
+    expected[0]["actual_profit_pct"] = 1.25
+    assert all(same(a, b) for a, b in zip(table.to_dicts(), opportunities)), "写回后与逐行赋值不一致"
+
+    dict_bytes = len(pickle.dumps(opportunities))
+    print(f"✅ {len(opportunities)}个机会往返一致 | pickle(dict) {dict_bytes / 1e6:.1f}MB vs 列数据 {table.nbytes / 1e6:.1f}MB")
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.8】参数网格搜索的多进程评估后端
+
+核心功能:
+1. 把参数组合分发到进程池并行评估，结果按输入顺序返回
+2. 共享数据以数值列的形式写入一个共享内存文件（/dev/shm），worker用np.memmap只读映射，
+   各进程共用同一份物理页，不再每个worker反序列化一份完整副本；
+   共享数据需实现 to_shared_arrays() / from_shared_arrays(arrays, meta)
+   （V8321FilterIndex、ActualProfitColumns），其他对象直接串行评估
+3. 进程池使用forkserver（不可用时spawn），不从多线程的主进程fork；
+   启动worker期间隐藏主程序模块，子进程不会重新执行主程序脚本（连接交易所等）
+4. 内存保护：worker数受GRID_SEARCH_WORKERS和GRID_SEARCH_MEMORY_CAP_MB共同约束；
+   运行中可用内存低于GRID_SEARCH_MIN_AVAILABLE_MB时停止并行，剩余组合在主进程串行；
+   串行评估与worker中每10组检查一次RSS，超过300MB时GC（原逐组循环的内存检查）
+5. 参数采样（random）仍在主进程完成，评估函数为纯函数，并行结果与串行逐项一致
+
+环境变量:
+    GRID_SEARCH_WORKERS: worker数量，0=自动（CPU核数），1=强制串行
+    GRID_SEARCH_MEMORY_CAP_MB: 共享数据 + 所有worker合计的内存上限（MB）
+    GRID_SEARCH_MIN_AVAILABLE_MB: 系统可用内存下限（MB），低于时剩余组合改为串行
+"""
+
+import gc
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+import types
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import psutil
+
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+GRID_SEARCH_CONFIG = {
+    "max_workers": int(os.getenv("GRID_SEARCH_WORKERS", "0")),
+    "memory_cap_mb": int(os.getenv("GRID_SEARCH_MEMORY_CAP_MB", "768")),
+    "min_available_mb": int(os.getenv("GRID_SEARCH_MIN_AVAILABLE_MB", "200")),
+    "min_tasks_for_parallel": 8,  # 任务太少时进程启动开销不划算
+    "worker_base_mb": 60,  # 单个worker的基础开销（解释器 + numpy + 评估时的临时对象）
+    "memory_check_every": 10,  # 每评估N组检查一次内存
+    "gc_rss_mb": 300,  # 单进程RSS超过此值时GC
+}
+
+_ARRAY_ALIGNMENT = 64
+
+# worker进程内的共享数据（initializer中映射一次）
+_WORKER_SHARED = None
+_WORKER_TASKS_DONE = 0
+
+
+def _shared_dir() -> str:
+    """优先使用/dev/shm（内存文件系统），否则用系统临时目录"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def write_shared_arrays(f, arrays: Dict[str, np.ndarray]) -> Dict[str, Tuple[int, str, tuple]]:
+    """
+    把一组数值数组顺序写入文件（按64字节对齐）
+
+    Returns:
+        layout: {名称: (偏移, dtype, shape)}，供map_shared_arrays映射
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise TypeError(f"共享数组不支持object类型: {name}")
+        padding = -offset % _ARRAY_ALIGNMENT
+        if padding:
+            f.write(b"\0" * padding)
+            offset += padding
+        layout[name] = (offset, array.dtype.str, array.shape)
+        if array.nbytes:
+            f.write(memoryview(array).cast("B"))
+        offset += array.nbytes
+    return layout
+
+
+def map_shared_arrays(path: str, layout: Dict[str, Tuple[int, str, tuple]]) -> Dict[str, np.ndarray]:
+    """按layout只读映射共享文件中的数组（不复制）"""
+    arrays = {}
+    for name, (offset, dtype, shape) in layout.items():
+        if math.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+    return arrays
+
+
+def _check_memory(progress: str = ""):
+    """RSS超过gc_rss_mb时主动GC"""
+    if not HAS_PSUTIL:
+        return
+    mem_usage = psutil.Process().memory_info().rss / (1024**2)
+    if mem_usage > GRID_SEARCH_CONFIG["gc_rss_mb"]:
+        gc.collect()
+        if progress:
+            print(f"      [{progress}] 内存: {mem_usage:.0f}MB → GC")
+
+
+def _memory_low() -> bool:
+    """系统可用内存是否低于min_available_mb"""
+    if not HAS_PSUTIL:
+        return False
+    available_mb = psutil.virtual_memory().available / (1024**2)
+    return available_mb < GRID_SEARCH_CONFIG["min_available_mb"]
+
+
+def _init_worker(path: str, layout: Dict, shared_type: type, meta: Dict):
+    global _WORKER_SHARED
+    _WORKER_SHARED = shared_type.from_shared_arrays(map_shared_arrays(path, layout), meta)
+
+
+def _run_task(evaluate: Callable, task):
+    global _WORKER_TASKS_DONE
+    _WORKER_TASKS_DONE += 1
+    if _WORKER_TASKS_DONE % GRID_SEARCH_CONFIG["memory_check_every"] == 0:
+        _check_memory()
+    return evaluate(_WORKER_SHARED, task)
+
+
+def _evaluate_serial(shared, tasks: List, evaluate: Callable, offset: int = 0, total: Optional[int] = None) -> List:
+    total = len(tasks) + offset if total is None else total
+    results = []
+    every = GRID_SEARCH_CONFIG["memory_check_every"]
+    for i, task in enumerate(tasks, offset):
+        if i % every == 0:
+            _check_memory(f"{i}/{total}")
+        results.append(evaluate(shared, task))
+    return results
+
+
+def _pool_context():
+    """forkserver优先（worker从单线程的服务进程fork），否则spawn"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["numpy", "parallel_grid_search"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+@contextmanager
+def _main_module_hidden():
+    """
+    启动worker期间用空模块替换__main__
+
+    spawn/forkserver的子进程会按__main__的路径重新执行主程序脚本；主程序模块级代码会
+    创建交易所/AI客户端，worker只需要评估函数所在的模块，因此启动时不传主程序路径
+    """
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+def plan_worker_count(
+    task_count: int,
+    payload_bytes: int,
+    max_workers: Optional[int] = None,
+    memory_cap_mb: Optional[int] = None,
+) -> int:
+    """
+    按CPU、任务数、内存上限计算worker数量（返回1表示串行）
+
+    Args:
+        task_count: 参数组合数
+        payload_bytes: 共享数组的字节数（所有worker共用一份，只计一次）
+        max_workers: worker数量（None用GRID_SEARCH_CONFIG，0为按CPU核数自动）
+        memory_cap_mb: 内存上限（None用GRID_SEARCH_CONFIG）
+    """
+    config = GRID_SEARCH_CONFIG
+    max_workers = config["max_workers"] if max_workers is None else max_workers
+    memory_cap_mb = config["memory_cap_mb"] if memory_cap_mb is None else memory_cap_mb
+
+    if task_count < config["min_tasks_for_parallel"]:
+        return 1
+
+    # 显式指定时以配置为准，否则按CPU核数
+    workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+    workers = min(workers, task_count)
+
+    if HAS_PSUTIL:
+        available_mb = psutil.virtual_memory().available / (1024**2)
+        memory_cap_mb = min(memory_cap_mb, (available_mb - config["min_available_mb"]) * 0.8)
+
+    budget_mb = memory_cap_mb - payload_bytes / (1024**2)
+    workers = min(workers, int(budget_mb // config["worker_base_mb"]))
+    return max(1, workers)
+
+
+def evaluate_param_grid(
+    shared,
+    tasks: List,
+    evaluate: Callable,
+    max_workers: Optional[int] = None,
+    memory_cap_mb: Optional[int] = None,
+    verbose: bool = True,
+) -> List:
+    """
+    并行评估参数组合
+
+    Args:
+        shared: 所有任务共用的只读数据；实现to_shared_arrays()/from_shared_arrays()时
+            以共享内存映射给worker，否则串行评估
+        tasks: 参数组合列表（每个元素单独发送给worker）
+        evaluate: 模块级评估函数 evaluate(shared, task) -> result（须可pickle，且不修改shared）
+        max_workers / memory_cap_mb: 覆盖GRID_SEARCH_CONFIG
+
+    Returns:
+        与tasks同序的结果列表（与串行逐个调用evaluate完全一致）
+    """
+    if not hasattr(shared, "to_shared_arrays") or len(tasks) < 2:
+        return _evaluate_serial(shared, tasks, evaluate)
+
+    arrays, meta = shared.to_shared_arrays()
+    payload_bytes = sum(array.nbytes for array in arrays.values())
+    workers = plan_worker_count(len(tasks), payload_bytes, max_workers, memory_cap_mb)
+    if workers <= 1:
+        return _evaluate_serial(shared, tasks, evaluate)
+
+    fd, path = tempfile.mkstemp(prefix="grid_search_", suffix=".arrays", dir=_shared_dir())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            layout = write_shared_arrays(f, arrays)
+        del arrays
+
+        if verbose:
+            print(
+                f"      ⚙️  并行评估: {len(tasks)}组参数 × {workers}进程"
+                f"（共享数组{payload_bytes / (1024**2):.1f}MB）"
+            )
+
+        context = _pool_context()
+        with _main_module_hidden():
+            pool = context.Pool(
+                workers, initializer=_init_worker, initargs=(path, layout, type(shared), meta)
+            )
+
+        results = []
+        stopped = False
+        try:
+            chunksize = max(1, math.ceil(len(tasks) / (workers * 4)))
+            every = GRID_SEARCH_CONFIG["memory_check_every"]
+            for result in pool.imap(partial(_run_task, evaluate), tasks, chunksize=chunksize):
+                results.append(result)
+                if len(results) % every == 0 and len(results) < len(tasks) and _memory_low():
+                    stopped = True
+                    break
+        finally:
+            if stopped:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+        if stopped:
+            print(
+                f"      ⚠️  可用内存低于{GRID_SEARCH_CONFIG['min_available_mb']}MB，停止并行，"
+                f"剩余{len(tasks) - len(results)}组串行评估"
+            )
+            gc.collect()
+            results.extend(
+                _evaluate_serial(shared, tasks[len(results):], evaluate, offset=len(results), total=len(tasks))
+            )
+        return results
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# volume_surge_type的取值编码（calculate_single_actual_profit只区分这几种情况）
+_SURGE_TYPES = ("", "extreme_surge", "strong_surge", "other")
+
+
+def _arena_of(path: np.ndarray):
+    """路径视图 → (所属arena数组, 起始行)；不是(n, 3)连续数组的行切片时路径自身作为arena"""
+    base = path.base if isinstance(path.base, np.ndarray) else None
+    if (
+        base is not None
+        and base.ndim == 2
+        and base.shape[1] == 3
+        and base.dtype == np.float64
+        and base.flags.c_contiguous
+        and path.flags.c_contiguous
+        and path.dtype == np.float64
+        and path.ndim == 2
+    ):
+        start_bytes = path.__array_interface__["data"][0] - base.__array_interface__["data"][0]
+        row_bytes = base.strides[0]
+        if start_bytes % row_bytes == 0 and 0 <= start_bytes // row_bytes <= len(base) - len(path):
+            return base, start_bytes // row_bytes
+    return np.ascontiguousarray(path, dtype=np.float64).reshape(-1, 3), 0
+
+
+class ActualProfitColumns:
+    """
+    actual_profit_task的共享数据：calculate_single_actual_profit用到的字段按列存放，
+    各币种的未来路径arena（V8.9.18）拼接成一个(n, 3)数组
+
+    worker按下标临时组装精简的机会dict（路径是arena切片视图），不持有整份机会列表；
+    字段缺失与原dict一致（按presence列省略该键），结果与直接传入机会dict逐项一致
+    """
+
+    NUMERIC_FIELDS = ("entry_price", "atr", "signal_score", "recent_high", "recent_low")
+    SUMMARY_FIELDS = ("max_high", "min_low", "final_close", "data_points")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.size = meta["size"]
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_opportunities(cls, opportunities: List[Dict]) -> Optional["ActualProfitColumns"]:
+        """机会列表 → 列式数据；有无法用数值列表示的字段（如future_data是DataFrame）时返回None"""
+        size = len(opportunities)
+        arrays = {}
+        try:
+            for field in cls.NUMERIC_FIELDS:
+                present = np.fromiter((field in o for o in opportunities), dtype=bool, count=size)
+                arrays[f"{field}_present"] = present
+                arrays[field] = np.array(
+                    [float(o[field]) if field in o else 0.0 for o in opportunities], dtype=np.float64
+                )
+
+            future = [o.get("future_data", {}) if "future_data" in o else None for o in opportunities]
+            if not all(fd is None or isinstance(fd, dict) for fd in future):
+                return None
+            arrays["future_present"] = np.array([fd is not None for fd in future], dtype=bool)
+            for field in cls.SUMMARY_FIELDS:
+                arrays[f"{field}_present"] = np.array(
+                    [fd is not None and field in fd for fd in future], dtype=bool
+                )
+                arrays[field] = np.array(
+                    [float(fd[field]) if fd is not None and field in fd else 0.0 for fd in future],
+                    dtype=np.float64,
+                )
+        except (TypeError, ValueError):
+            return None
+
+        arrays["is_long"] = np.array(
+            [o.get("direction", "long") == "long" for o in opportunities], dtype=bool
+        )
+        arrays["volume_surge"] = np.array(
+            [bool(o.get("volume_surge", False)) for o in opportunities], dtype=bool
+        )
+        arrays["volume_surge_type"] = np.array(
+            [
+                _SURGE_TYPES.index(t) if t in _SURGE_TYPES[:3] else (3 if t else 0)
+                for t in (o.get("volume_surge_type", "") for o in opportunities)
+            ],
+            dtype=np.int8,
+        )
+
+        # 路径：按所属arena去重后拼接，每个机会记录(起始行, 长度)，无路径为-1
+        path_start = np.full(size, -1, dtype=np.int64)
+        path_length = np.zeros(size, dtype=np.int64)
+        arenas, arena_offsets = [], {}
+        total_rows = 0
+        for i, fd in enumerate(future):
+            path = fd.get("path") if fd is not None else None
+            if path is None:
+                continue
+            if not isinstance(path, np.ndarray):
+                return None
+            base, row = _arena_of(path)
+            key = id(base)
+            if key not in arena_offsets:
+                arena_offsets[key] = total_rows
+                arenas.append(base)
+                total_rows += len(base)
+            path_start[i] = arena_offsets[key] + row
+            path_length[i] = len(path)
+        arrays["path_start"] = path_start
+        arrays["path_length"] = path_length
+        arrays["path_arena"] = (
+            np.concatenate(arenas).astype(np.float64, copy=False) if arenas else np.empty((0, 3))
+        )
+        return cls(arrays, {"size": size})
+
+    def opportunity(self, i: int) -> Dict:
+        """第i个机会的精简dict（calculate_single_actual_profit的输入）"""
+        a = self.arrays
+        opp = {
+            "direction": "long" if a["is_long"][i] else "short",
+            "volume_surge": bool(a["volume_surge"][i]),
+            "volume_surge_type": _SURGE_TYPES[a["volume_surge_type"][i]],
+        }
+        for field in self.NUMERIC_FIELDS:
+            if a[f"{field}_present"][i]:
+                opp[field] = float(a[field][i])
+        if a["future_present"][i]:
+            future_data = {
+                field: float(a[field][i])
+                for field in self.SUMMARY_FIELDS
+                if a[f"{field}_present"][i]
+            }
+            start = int(a["path_start"][i])
+            if start >= 0:
+                future_data["path"] = a["path_arena"][start : start + int(a["path_length"][i])]
+            opp["future_data"] = future_data
+        return opp
+
+    def to_shared_arrays(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        return self.arrays, self.meta
+
+    @classmethod
+    def from_shared_arrays(cls, arrays: Dict[str, np.ndarray], meta: Dict) -> "ActualProfitColumns":
+        return cls(arrays, meta)
+
+
+def actual_profit_task(opportunities, task) -> List[float]:
+    """
+    评估函数：对指定下标的机会计算实际利润（quick_global_search_v8316参数测试用）
+
+    Args:
+        opportunities: ActualProfitColumns（并行时为共享映射）或机会列表
+        task: (机会下标列表, strategy_params)
+    """
+    from calculate_actual_profit import calculate_single_actual_profit
+
+    indices, strategy_params = task
+    get = (
+        opportunities.opportunity
+        if isinstance(opportunities, ActualProfitColumns)
+        else opportunities.__getitem__
+    )
+    return [
+        calculate_single_actual_profit(
+            get(i), strategy_params=strategy_params, use_dynamic_atr=False
+        )
+        for i in indices
+    ]
+
+
+class _DemoValues:
+    """自检用共享数据"""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def to_shared_arrays(self):
+        return {"values": self.values}, {}
+
+    @classmethod
+    def from_shared_arrays(cls, arrays, meta):
+        return cls(arrays["values"])
+
+
+def _demo_task(shared: _DemoValues, task) -> float:
+    offset, scale = task
+    return float(((shared.values + offset) * scale).sum())
+
+
+if __name__ == "__main__":
+    """
+    自检：并行结果与串行一致；ActualProfitColumns与原机会dict的实际利润一致
+    """
+    import random
+    import time
+
+    # 以模块名导入，worker才能按名称找到评估函数和共享数据类型
+    import parallel_grid_search as pgs
+    from future_path_arena import PathArena
+
+    random.seed(7)
+    shared = pgs._DemoValues(np.array([random.random() for _ in range(200_000)]))
+    tasks = [(random.random(), random.random()) for _ in range(64)]
+
+    t0 = time.time()
+    serial = [pgs._demo_task(shared, task) for task in tasks]
+    t_serial = time.time() - t0
+
+    t0 = time.time()
+    parallel = pgs.evaluate_param_grid(shared, tasks, pgs._demo_task, max_workers=2, memory_cap_mb=4096)
+    t_parallel = time.time() - t0
+
+    assert parallel == serial, "并行结果与串行不一致"
+    print(f"✅ 并行结果与串行一致（{len(tasks)}组）")
+    print(f"   串行: {t_serial:.2f}s | 并行: {t_parallel:.2f}s | CPU核数: {os.cpu_count()}")
+
+    rng = np.random.default_rng(5)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 3000)))
+    arena = PathArena(closes * 1.003, closes * 0.997, closes)
+    opportunities = []
+    for _ in range(300):
+        idx = int(rng.integers(0, 2800))
+        opp = {
+            "entry_price": float(closes[idx]),
+            "direction": "long" if rng.random() < 0.5 else "short",
+            "atr": float(closes[idx] * 0.01),
+            "signal_score": int(rng.integers(60, 95)),
+            "volume_surge_type": random.choice(["", "extreme_surge", "strong_surge", "weak"]),
+            "future_data": {
+                "max_high": float(closes[idx + 1 : idx + 97].max()),
+                "min_low": float(closes[idx + 1 : idx + 97].min()),
+                "final_close": float(closes[idx + 96]),
+            },
+        }
+        if rng.random() < 0.7:
+            opp["future_data"]["path"] = arena.window(idx, 96)
+        if rng.random() < 0.3:
+            opp["recent_high"], opp["recent_low"] = opp["entry_price"] * 1.02, opp["entry_price"] * 0.98
+        opportunities.append(opp)
+
+    columns = pgs.ActualProfitColumns.from_opportunities(opportunities)
+    assert len(columns.arrays["path_arena"]) == len(arena), "路径应共享同一个arena"
+    profit_tasks = [
+        (list(range(0, 300, step)), {"atr_stop_multiplier": sl, "atr_tp_multiplier": tp, "max_holding_hours": h})
+        for step, sl, tp, h in [(1, 1.5, 3.0, 24), (2, 1.0, 2.0, 6), (3, 2.0, 5.0, 12)] * 4
+    ]
+    expected = [pgs.actual_profit_task(opportunities, task) for task in profit_tasks]
+    got = pgs.evaluate_param_grid(columns, profit_tasks, pgs.actual_profit_task, max_workers=2, memory_cap_mb=4096)
+    assert got == expected, "列式共享数据的实际利润与原机会dict不一致"
+    print(f"✅ ActualProfitColumns与原机会dict一致（{len(profit_tasks)}组 × 最多300个机会）")
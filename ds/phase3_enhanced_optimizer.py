@@ -11,15 +11,92 @@
 5. AI协助分析和推荐最优参数
 6. 【V8.5.2.4.42新增】分离优化超短线和波段参数
 7. 【V8.5.2.4.42新增】测试移动止盈止损效果
+8. 【V8.9.20】采样按OpportunityTable列向量化，支持dict列表或列式表输入
+9. 【V8.9.23】精简机会表示（只保留Phase 3用到的快照字段、字符串驻留、价格路径共享arena），
+   默认使用全量机会不再采样；可选报告采样带来的结果波动
+   主流程传入OpportunityTable时精简副本只还原需要的列，完整行只在重算signal_score时还原
+10.【V8.9.23】Phase3FilterIndex: 组合筛选按列向量化（每个组合几次数组比较），
+   实际利润按止盈/止损/持仓时间对全部机会只计算一次，各组合按掩码求和
+11.【V8.9.23】重算的signal_score同时写回输入（列式表的signal_score列或原机会dict），
+   Phase 4用同一份机会验证时与Phase 3调出的min_signal_score口径一致
+
+环境变量:
+    PHASE3_MAX_OPPORTUNITIES: >0时按旧逻辑分层采样到该数量（默认0=全量）
+    PHASE3_SAMPLING_VARIANCE_RUNS: >0时用N次采样重新评估最优参数，报告采样引入的波动
 """
 
 import json
+import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Union
 import sys
 
+import numpy as np
+
+from opportunity_table import OpportunityTable, as_opportunity_table, take_opportunities
+
+PHASE3_CONFIG = {
+    "max_opportunities": int(os.getenv("PHASE3_MAX_OPPORTUNITIES", "0")),
+    "sampling_variance_runs": int(os.getenv("PHASE3_SAMPLING_VARIANCE_RUNS", "0")),
+    "variance_sample_size": 600,  # 与旧版采样上限一致
+}
+
+# Phase 3筛选读取的快照字段（其余快照字段只在重新计算signal_score时使用）
+PHASE3_SNAPSHOT_FIELDS = ("has_pin_bar", "has_engulfing", "has_breakout", "trend_4h_strength", "current_price")
+
+
+def _compact_value(value):
+    """字符串驻留（币种/方向/类型等大量重复），numpy标量转为Python标量"""
+    if type(value) is str:
+        return sys.intern(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def compact_opportunity(opp: Dict) -> Dict:
+    """
+    【V8.9.23】机会的精简副本（Phase 3专用）
+    
+    - 顶层字段浅拷贝（future_data及其价格路径视图与Phase 1共享，不复制）
+    - snapshot只保留PHASE3_SNAPSHOT_FIELDS和最近支撑/阻力价格
+    - Phase 3写入的字段（_matrix_actual_profit、exit_reason等）落在副本上，不污染Phase 1机会
+    """
+    lean = {key: _compact_value(value) for key, value in opp.items() if key != 'snapshot'}
+    
+    snapshot = opp.get('snapshot')
+    if isinstance(snapshot, dict):
+        slim = {key: _compact_value(snapshot[key]) for key in PHASE3_SNAPSHOT_FIELDS if key in snapshot}
+        sr = snapshot.get('support_resistance')
+        if isinstance(sr, dict):
+            slim['support_resistance'] = {
+                key: {'price': level.get('price', 0)} if isinstance(level, dict) else level
+                for key, level in ((k, sr.get(k)) for k in ('nearest_support', 'nearest_resistance'))
+                if level is not None
+            }
+        lean['snapshot'] = slim
+    
+    return lean
+
+
+def phase3_lean_fields(table: OpportunityTable) -> List[str]:
+    """列式表中精简副本需要还原的字段：snapshot以外的顶层字段 + PHASE3_SNAPSHOT_FIELDS + 支撑阻力"""
+    top_level = {name.partition('.')[0] for name in table.fields} - {'snapshot'}
+    snapshot_fields = [f"snapshot.{key}" for key in PHASE3_SNAPSHOT_FIELDS + ('support_resistance',)]
+    return sorted(top_level) + snapshot_fields
+
+
+def compact_opportunities_for_phase3(opportunities: Union[List[Dict], OpportunityTable]) -> List[Dict]:
+    """机会列表或列式表 → 精简副本列表（顺序不变；列式表不还原完整快照）"""
+    if isinstance(opportunities, OpportunityTable):
+        lean_fields = phase3_lean_fields(opportunities)
+        return [compact_opportunity(opportunities.row(i, lean_fields)) for i in range(len(opportunities))]
+    return [compact_opportunity(opp) for opp in opportunities]
+
 
-def sample_opportunities_for_phase3(opportunities: List[Dict], max_size: int = 800) -> List[Dict]:
+def sample_opportunities_for_phase3(
+    opportunities: Union[List[Dict], OpportunityTable], max_size: int = 800, verbose: bool = True
+) -> Union[List[Dict], OpportunityTable]:
     """
     【V8.5.2.4.89.4】为Phase 3采样机会（保留代表性，控制内存）
     
@@ -31,20 +108,26 @@ def sample_opportunities_for_phase3(opportunities: List[Dict], max_size: int = 8
     Args:
         opportunities: 所有机会列表
         max_size: 最大保留数量（默认800，约占用170MB）
+        verbose: 是否打印采样统计（采样波动评估时关闭）
     
     Returns:
-        采样后的机会列表
+        采样后的机会（与输入类型一致）
     """
     
+    log = print if verbose else (lambda *args, **kwargs: None)
+    
     # 【V8.5.2.4.89.4】先按类型分类（关键修复）
-    scalping_opps = [o for o in opportunities if o.get('signal_type') == 'scalping']
-    swing_opps = [o for o in opportunities if o.get('signal_type') == 'swing']
+    # 【V8.9.20】只为类型和信号分建列，分类/分层都在行号上进行
+    table = as_opportunity_table(opportunities, ("signal_type", "signal_score"))
+    scores = table.column('signal_score', 0)
+    scalping_opps = np.flatnonzero(table.equals('signal_type', 'scalping'))
+    swing_opps = np.flatnonzero(table.equals('signal_type', 'swing'))
     
-    print(f"  📊 机会分布: 超短线{len(scalping_opps)}个 | 波段{len(swing_opps)}个")
+    log(f"  📊 机会分布: 超短线{len(scalping_opps)}个 | 波段{len(swing_opps)}个")
     
     # 如果总数<=max_size，不需要采样
     if len(opportunities) <= max_size:
-        print(f"  ✓ 机会数({len(opportunities)})未超限，无需采样")
+        log(f"  ✓ 机会数({len(opportunities)})未超限，无需采样")
         return opportunities
     
     # 【V8.5.2.4.89.64】优先均分配额（避免不平衡）
@@ -53,17 +136,17 @@ def sample_opportunities_for_phase3(opportunities: List[Dict], max_size: int = 8
         # 均分策略
         scalping_quota = max_size // 2
         swing_quota = max_size - scalping_quota
-        print(f"  📊 采样策略: 均分配额（超短线{scalping_quota}, 波段{swing_quota}）")
+        log(f"  📊 采样策略: 均分配额（超短线{scalping_quota}, 波段{swing_quota}）")
     elif len(scalping_opps) > 0:
         # 只有超短线
         scalping_quota = min(max_size, len(scalping_opps))
         swing_quota = 0
-        print(f"  📊 采样策略: 仅超短线（{scalping_quota}）")
+        log(f"  📊 采样策略: 仅超短线（{scalping_quota}）")
     elif len(swing_opps) > 0:
         # 只有波段
         scalping_quota = 0
         swing_quota = min(max_size, len(swing_opps))
-        print(f"  📊 采样策略: 仅波段（{swing_quota}）")
+        log(f"  📊 采样策略: 仅波段（{swing_quota}）")
     else:
         scalping_quota = 0
         swing_quota = 0
@@ -71,33 +154,35 @@ def sample_opportunities_for_phase3(opportunities: List[Dict], max_size: int = 8
     sampled = []
     
     # 采样超短线
-    if scalping_opps:
-        sampled_scalping = _sample_by_quality(scalping_opps, scalping_quota)
+    if len(scalping_opps):
+        sampled_scalping = _sample_by_quality(scalping_opps, scores[scalping_opps], scalping_quota)
         sampled.extend(sampled_scalping)
-        print(f"  ⚡ 超短线采样: {len(sampled_scalping)}/{len(scalping_opps)}个")
+        log(f"  ⚡ 超短线采样: {len(sampled_scalping)}/{len(scalping_opps)}个")
     
     # 采样波段
-    if swing_opps:
-        sampled_swing = _sample_by_quality(swing_opps, swing_quota)
+    if len(swing_opps):
+        sampled_swing = _sample_by_quality(swing_opps, scores[swing_opps], swing_quota)
         sampled.extend(sampled_swing)
-        print(f"  🌊 波段采样: {len(sampled_swing)}/{len(swing_opps)}个")
+        log(f"  🌊 波段采样: {len(sampled_swing)}/{len(swing_opps)}个")
     
-    print(f"  ✂️  采样后: {len(sampled)}个机会（节省{len(opportunities)-len(sampled)}个，约{(1-len(sampled)/len(opportunities))*100:.0f}%内存）")
-    return sampled
+    log(f"  ✂️  采样后: {len(sampled)}个机会（节省{len(opportunities)-len(sampled)}个，约{(1-len(sampled)/len(opportunities))*100:.0f}%内存）")
+    return take_opportunities(opportunities, sampled)
 
 
-def _sample_by_quality(opportunities: List[Dict], quota: int) -> List[Dict]:
+def _sample_by_quality(positions: np.ndarray, scores: np.ndarray, quota: int) -> List[int]:
     """
     【V8.5.2.4.89.63】按质量分层采样（动态阈值，避免超短线/波段采样失衡）
+    
+    【V8.9.20】输入为机会行号及其signal_score，返回采样后的行号
     """
     import random
     
-    if len(opportunities) <= quota:
-        return opportunities
+    positions = positions.tolist()
+    if len(positions) <= quota:
+        return positions
     
     # 【修复】动态计算质量阈值（基于当前数据分布，而非固定90/80）
-    scores = [o.get('signal_score', 0) for o in opportunities]
-    scores_sorted = sorted(scores, reverse=True)
+    scores_sorted = np.sort(scores)[::-1]
     
     # 使用分位数动态设置阈值
     p75_idx = int(len(scores_sorted) * 0.25)  # Top 25%
@@ -107,9 +192,11 @@ def _sample_by_quality(opportunities: List[Dict], quota: int) -> List[Dict]:
     medium_threshold = scores_sorted[p50_idx] if p50_idx < len(scores_sorted) else 60
     
     # 按质量分层
-    high_quality = [o for o in opportunities if o.get('signal_score', 0) >= high_threshold]
-    medium_quality = [o for o in opportunities if medium_threshold <= o.get('signal_score', 0) < high_threshold]
-    low_quality = [o for o in opportunities if o.get('signal_score', 0) < medium_threshold]
+    high_mask = scores >= high_threshold
+    low_mask = scores < medium_threshold
+    high_quality = [p for p, keep in zip(positions, high_mask) if keep]
+    medium_quality = [p for p, keep in zip(positions, (scores >= medium_threshold) & ~high_mask) if keep]
+    low_quality = [p for p, keep in zip(positions, low_mask) if keep]
     
     # 保留所有高质量
     sampled = high_quality.copy()
@@ -134,8 +221,75 @@ def _sample_by_quality(opportunities: List[Dict], quota: int) -> List[Dict]:
     return sampled
 
 
+def rescore_opportunities_for_phase3(
+    source_opportunities: Union[List[Dict], OpportunityTable],
+    best_scalping_weights: Dict,
+    best_swing_weights: Dict,
+    recalculate
+) -> tuple:
+    """
+    用Phase 2的最优权重重算signal_score，返回(精简副本列表, 重算数量)
+    
+    重新计算需要完整快照：从原机会计算，结果写入精简副本
+    【V8.9.20】列式表的精简副本只还原需要的列，完整行只在需要重算时还原
+    【V8.9.23】新分数同时写回输入（列式表写回signal_score列，dict列表写回原机会），
+    Phase 4用同一份机会验证时看到的是同样的分数
+    
+    Args:
+        recalculate: recalculate_signal_score_from_snapshot(opp, signal_type, learning_config)
+    """
+    recalc_count = 0
+    all_opportunities = []
+    recalc_positions, recalc_scores = [], []
+    is_table = isinstance(source_opportunities, OpportunityTable)
+    lean_fields = phase3_lean_fields(source_opportunities) if is_table else None
+    for position in range(len(source_opportunities)):
+        if is_table:
+            source_opp = None
+            opp = compact_opportunity(source_opportunities.row(position, lean_fields))
+        else:
+            source_opp = source_opportunities[position]
+            opp = compact_opportunity(source_opp)
+        all_opportunities.append(opp)
+        signal_type = opp.get('signal_type', 'swing')
+        
+        # 选择对应的权重配置
+        if signal_type == 'scalping' and best_scalping_weights:
+            weight_config = best_scalping_weights.get('weights', {})
+        elif signal_type == 'swing' and best_swing_weights:
+            weight_config = best_swing_weights.get('weights', {})
+        else:
+            weight_config = None
+        
+        # 重新计算signal_score
+        if weight_config:
+            # 构建learning_config格式
+            learning_config = {
+                'scalping_weights': best_scalping_weights.get('weights', {}) if signal_type == 'scalping' else {},
+                'swing_weights': best_swing_weights.get('weights', {}) if signal_type == 'swing' else {}
+            }
+            
+            if source_opp is None:
+                source_opp = source_opportunities.row(position)
+            new_signal_score = recalculate(source_opp, signal_type, learning_config)
+            
+            # 保存旧值（调试用）
+            opp['_old_signal_score'] = opp.get('signal_score', 0)
+            opp['signal_score'] = new_signal_score
+            if is_table:
+                recalc_positions.append(position)
+                recalc_scores.append(new_signal_score)
+            else:
+                source_opp['signal_score'] = new_signal_score
+            recalc_count += 1
+    
+    if recalc_positions:
+        source_opportunities.assign('signal_score', recalc_scores, recalc_positions)
+    return all_opportunities, recalc_count
+
+
 def phase3_enhanced_optimization(
-    all_opportunities: List[Dict],
+    all_opportunities: Union[List[Dict], OpportunityTable],
     phase1_baseline: Dict,
     phase2_baseline: Dict,
     kline_snapshots,
@@ -145,7 +299,7 @@ def phase3_enhanced_optimization(
     【V8.5.2.4.88】Phase 3增强优化（内存优化版）
     
     Args:
-        all_opportunities: 所有识别的机会
+        all_opportunities: 所有识别的机会（dict列表或主流程构建的OpportunityTable）
         phase1_baseline: Phase 1的统计基线
         phase2_baseline: Phase 2的优化结果（包含learned_features）
         kline_snapshots: 市场快照数据
@@ -159,15 +313,18 @@ def phase3_enhanced_optimization(
     print(f"{'='*70}")
     print("  策略：叠加Phase 2成果 + 多起点搜索 + AI辅助决策")
     print("  特色：使用优化权重 + consensus筛选 + 信号分矩阵")
-    print("  【V8.5.2.4.88】内存优化：智能采样 + 分批测试")
+    print("  【V8.9.23】内存优化：精简机会表示 + 全量机会（不再采样）")
     print(f"{'='*70}")
     
-    # 【V8.5.2.4.89.64】内存优化：采样机会（降低max_size避免内存问题）
-    print("\n  💾 【内存优化】机会采样")
+    # 【V8.9.23】精简机会表示代替采样：快照只保留Phase 3用到的字段，
+    # 全量机会的内存与旧版600个完整机会相当；设置PHASE3_MAX_OPPORTUNITIES时仍按旧逻辑采样
+    print("\n  💾 【内存优化】精简机会表示")
     print(f"     原始机会数: {len(all_opportunities)}")
-    # 【修复】降低max_size从800到600，确保采样更激进，避免内存压力
-    all_opportunities = sample_opportunities_for_phase3(all_opportunities, max_size=600)
-    print(f"     采样后机会数: {len(all_opportunities)}")
+    source_opportunities = all_opportunities
+    max_size = PHASE3_CONFIG["max_opportunities"]
+    if max_size > 0:
+        source_opportunities = sample_opportunities_for_phase3(source_opportunities, max_size=max_size)
+        print(f"     采样后机会数: {len(source_opportunities)}（PHASE3_MAX_OPPORTUNITIES={max_size}）")
     
     # 【步骤1】提取Phase 2学到的特征
     learned_features = phase2_baseline.get('learned_features', {})
@@ -188,36 +345,13 @@ def phase3_enhanced_optimization(
     sys.path.insert(0, str(Path(__file__).parent))
     from deepseek_多币种智能版 import recalculate_signal_score_from_snapshot
     
-    recalc_count = 0
-    for opp in all_opportunities:
-        signal_type = opp.get('signal_type', 'swing')
-        
-        # 选择对应的权重配置
-        if signal_type == 'scalping' and best_scalping_weights:
-            weight_config = best_scalping_weights.get('weights', {})
-        elif signal_type == 'swing' and best_swing_weights:
-            weight_config = best_swing_weights.get('weights', {})
-        else:
-            weight_config = None
-        
-        # 重新计算signal_score
-        if weight_config:
-            # 构建learning_config格式
-            learning_config = {
-                'scalping_weights': best_scalping_weights.get('weights', {}) if signal_type == 'scalping' else {},
-                'swing_weights': best_swing_weights.get('weights', {}) if signal_type == 'swing' else {}
-            }
-            
-            new_signal_score = recalculate_signal_score_from_snapshot(
-                opp, signal_type, learning_config
-            )
-            
-            # 保存旧值（调试用）
-            opp['_old_signal_score'] = opp.get('signal_score', 0)
-            opp['signal_score'] = new_signal_score
-            recalc_count += 1
-    
+    all_opportunities, recalc_count = rescore_opportunities_for_phase3(
+        source_opportunities, best_scalping_weights, best_swing_weights,
+        recalculate_signal_score_from_snapshot
+    )
     print(f"     ✓ 重新计算: {recalc_count}/{len(all_opportunities)}个机会")
+    print(f"     精简后机会数: {len(all_opportunities)}（快照保留{len(PHASE3_SNAPSHOT_FIELDS) + 1}个字段）")
+    del source_opportunities
     
     # 【步骤3】两阶段多起点搜索（方案C）
     print("\n  🎯 【两阶段多起点搜索】")
@@ -371,22 +505,21 @@ def phase3_enhanced_optimization(
     
     matrix_results = []
     
-    for combo in filter_combinations:
-        # 过滤机会
-        # 【V8.5.2.4.47修复】字段名统一为consensus（Phase 1设置的字段名）
-        filtered_opps = [
-            opp for opp in all_opportunities
-            if (opp.get('consensus', 0) >= combo['min_consensus'] and
-                opp.get('signal_score', 0) >= combo['min_signal_score'])
-        ]
-        
-        if not filtered_opps:
-            continue
-        
-        # 计算actual_profit（使用best_search_result的参数，如果有）
-        params = best_search_result.get('params', phase2_baseline.get('params', {})) if best_search_result else phase2_baseline.get('params', {})
-        
-        for opp in filtered_opps:
+    # 【V8.9.23】筛选按列生成掩码；利润与组合无关，每个机会只计算一次
+    matrix_index = Phase3FilterIndex(all_opportunities)
+    # 【V8.5.2.4.47修复】字段名统一为consensus（Phase 1设置的字段名）
+    matrix_masks = [
+        matrix_index.threshold('consensus', combo['min_consensus']) &
+        matrix_index.threshold('signal_score', combo['min_signal_score'])
+        for combo in filter_combinations
+    ]
+    
+    # 计算actual_profit（使用best_search_result的参数，如果有）
+    params = best_search_result.get('params', phase2_baseline.get('params', {})) if best_search_result else phase2_baseline.get('params', {})
+    
+    if matrix_masks:
+        for position in np.flatnonzero(np.logical_or.reduce(matrix_masks)):
+            opp = all_opportunities[position]
             signal_type = opp.get('signal_type', 'swing')
             
             # 【V8.5.2.4.60】从learned_features提取最优TP/SL
@@ -417,6 +550,12 @@ def phase3_enhanced_optimization(
                 use_dynamic_atr=False
             )
             opp['_matrix_actual_profit'] = actual_profit
+    
+    for combo, mask in zip(filter_combinations, matrix_masks):
+        filtered_opps = [all_opportunities[position] for position in np.flatnonzero(mask)]
+        
+        if not filtered_opps:
+            continue
         
         # 统计结果
         capture_rate = len(filtered_opps) / len(all_opportunities) if all_opportunities else 0
@@ -505,6 +644,16 @@ def phase3_enhanced_optimization(
         kline_snapshots=kline_snapshots
     )
     
+    # 【V8.9.23】可选：评估采样给最优参数结果带来的波动
+    sampling_variance = None
+    if PHASE3_CONFIG["sampling_variance_runs"] > 0:
+        sampling_variance = estimate_sampling_variance(
+            all_opportunities,
+            {'scalping': scalping_result.get('best_params'), 'swing': swing_result.get('best_params')},
+            runs=PHASE3_CONFIG["sampling_variance_runs"],
+            sample_size=PHASE3_CONFIG["variance_sample_size"],
+        )
+    
     print("\n  ✅ Phase 3优化完成")
     print(f"     超短线: 捕获率{scalping_result['capture_rate']*100:.1f}%, 平均利润{scalping_result['avg_profit']:.2f}%")
     print(f"     波段: 捕获率{swing_result['capture_rate']*100:.1f}%, 平均利润{swing_result['avg_profit']:.2f}%")
@@ -538,7 +687,8 @@ def phase3_enhanced_optimization(
             'best_combo': best_matrix_combo
         },
         'ai_recommendation': ai_recommendation,
-        'recalculated_opportunities': len(all_opportunities)
+        'recalculated_opportunities': len(all_opportunities),
+        'sampling_variance': sampling_variance
     }
 
 
@@ -780,6 +930,151 @@ def parse_ai_recommendation(ai_response: str) -> Dict:
         return {}
 
 
+def _passes_phase3_filters(opp: Dict, params: Dict) -> bool:
+    """
+    【V8.5.2.4.73】全维度智能筛选：基础条件 + K线形态 + 趋势强度 + 支撑阻力
+    
+    【V8.9.23】从optimize_for_signal_type中提取，采样波动评估复用同一套筛选
+    """
+    # 基础条件
+    if opp.get('consensus', 0) < params['min_indicator_consensus']:
+        return False
+    if opp.get('signal_score', 0) < params['min_signal_score']:
+        return False
+    if opp.get('risk_reward', 0) < params.get('min_risk_reward', 0):
+        return False
+    if opp.get('profit_density', 0) < params.get('min_profit_density', 0):
+        return False
+    
+    # 【V8.5.2.4.73】K线形态筛选
+    if params.get('require_strong_pattern', False):
+        snapshot = opp.get('snapshot', {})
+        has_pin_bar = snapshot.get('has_pin_bar', False)
+        has_engulfing = snapshot.get('has_engulfing', False)
+        has_breakout = snapshot.get('has_breakout', False)
+        if not (has_pin_bar or has_engulfing or has_breakout):
+            return False  # 必须有强K线形态
+    
+    # 【V8.5.2.4.73】趋势强度筛选
+    min_strength = params.get('min_trend_strength', 'any')
+    if min_strength != 'any':
+        snapshot = opp.get('snapshot', {})
+        trend_4h_strength = snapshot.get('trend_4h_strength', 'weak')
+        if min_strength == 'strong' and trend_4h_strength != 'strong':
+            return False  # 必须是强势趋势
+        elif min_strength == 'normal' and trend_4h_strength == 'weak':
+            return False  # 至少有正常趋势
+    
+    # 【V8.5.2.4.73】支撑/阻力位筛选
+    if params.get('require_near_sr', False):
+        snapshot = opp.get('snapshot', {})
+        # 检查价格是否在S/R的±3%范围内
+        current_price = snapshot.get('current_price', 0)
+        if current_price > 0:
+            sr = snapshot.get('support_resistance', {})
+            nearest_support = sr.get('nearest_support') or {}
+            nearest_resistance = sr.get('nearest_resistance') or {}
+            support_price = nearest_support.get('price', 0)
+            resistance_price = nearest_resistance.get('price', 0)
+            
+            near_support = support_price > 0 and abs(current_price - support_price) / current_price < 0.03
+            near_resistance = resistance_price > 0 and abs(current_price - resistance_price) / current_price < 0.03
+            
+            if not (near_support or near_resistance):
+                return False  # 必须靠近S/R
+    
+    # 通过所有筛选条件
+    return True
+
+
+class Phase3FilterIndex:
+    """
+    【V8.9.23】_passes_phase3_filters的列式版本
+    
+    筛选列只构建一次（OpportunityTable），每个参数组合的通过集是几次数组比较；
+    阈值掩码按(字段, 阈值)缓存，形态/趋势/支撑阻力掩码与参数无关，首次用到时计算。
+    比较写成not(x < 阈值)，与逐行版本对NaN的处理一致（NaN视为通过）
+    """
+    
+    FIELDS = ('consensus', 'signal_score', 'risk_reward', 'profit_density', 'snapshot')
+    
+    def __init__(self, opportunities: Union[List[Dict], OpportunityTable]):
+        self.table = as_opportunity_table(opportunities, self.FIELDS)
+        self._masks: Dict = {}
+    
+    def __len__(self) -> int:
+        return len(self.table)
+    
+    def _cached(self, key, build) -> np.ndarray:
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._masks[key] = build()
+        return mask
+    
+    def threshold(self, field: str, minimum) -> np.ndarray:
+        """opp.get(field, 0) >= minimum 的行掩码"""
+        return self._cached(
+            (field, minimum),
+            lambda: ~(self.table.column(field, 0).astype(np.float64) < minimum)
+        )
+    
+    def _strong_pattern(self) -> np.ndarray:
+        mask = np.zeros(len(self.table), dtype=bool)
+        for key in ('has_pin_bar', 'has_engulfing', 'has_breakout'):
+            mask |= self.table.column(f'snapshot.{key}', False).astype(bool)
+        return mask
+    
+    def _trend_strength(self, min_strength: str) -> np.ndarray:
+        trend = self.table.column('snapshot.trend_4h_strength', 'weak')
+        if min_strength == 'strong':
+            return trend == 'strong'
+        if min_strength == 'normal':
+            return trend != 'weak'
+        return np.ones(len(self.table), dtype=bool)
+    
+    def _near_sr(self) -> np.ndarray:
+        """价格在最近支撑/阻力±3%内（current_price无效时不筛选）"""
+        current_price = self.table.column('snapshot.current_price', 0).astype(np.float64)
+        levels = self.table.column('snapshot.support_resistance', None)
+        support = np.zeros(len(levels))
+        resistance = np.zeros(len(levels))
+        for i, sr in enumerate(levels):
+            if isinstance(sr, dict):
+                support[i] = (sr.get('nearest_support') or {}).get('price', 0) or 0
+                resistance[i] = (sr.get('nearest_resistance') or {}).get('price', 0) or 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            near_support = (support > 0) & (np.abs(current_price - support) / current_price < 0.03)
+            near_resistance = (resistance > 0) & (np.abs(current_price - resistance) / current_price < 0.03)
+        return ~(current_price > 0) | near_support | near_resistance
+    
+    def mask(self, params: Dict) -> np.ndarray:
+        """与逐行调用_passes_phase3_filters(opp, params)结果一致的布尔掩码"""
+        mask = (
+            self.threshold('consensus', params['min_indicator_consensus'])
+            & self.threshold('signal_score', params['min_signal_score'])
+            & self.threshold('risk_reward', params.get('min_risk_reward', 0))
+            & self.threshold('profit_density', params.get('min_profit_density', 0))
+        )
+        if params.get('require_strong_pattern', False):
+            mask = mask & self._cached('strong_pattern', self._strong_pattern)
+        min_strength = params.get('min_trend_strength', 'any')
+        if min_strength != 'any':
+            mask = mask & self._cached(('trend', min_strength), lambda: self._trend_strength(min_strength))
+        if params.get('require_near_sr', False):
+            mask = mask & self._cached('near_sr', self._near_sr)
+        return mask
+
+
+def _actual_profits(opportunities: List[Dict], params: Dict) -> np.ndarray:
+    """calculate_actual_profit_batch的结果 → actual_profit_pct数组（与opportunities顺序一致）"""
+    from calculate_actual_profit import calculate_actual_profit_batch
+    
+    results = calculate_actual_profit_batch(
+        opportunities, params, batch_size=1000, use_dynamic_atr=True, include_trading_costs=True
+    )
+    return np.array([r.get('actual_profit_pct', 0) for r in results], dtype=np.float64)
+
+
 def optimize_for_signal_type(
     opportunities: List[Dict],
     signal_type: str,
@@ -808,19 +1103,20 @@ def optimize_for_signal_type(
             'captured_count': int
         }
     """
-    # 【V8.5.2.4.69】使用calculate_actual_profit_batch而不是batch_calculate_profits
+    # 【V8.5.2.4.69】使用calculate_actual_profit_batch而不是batch_calculate_profits（见_actual_profits）
     # 原因: batch_calculate_profits会走到模拟逻辑_calculate_with_max_profit
     #       而没有使用V8.5.2.4.65的波动幅度修复
-    from calculate_actual_profit import calculate_actual_profit_batch
     import gc
     
     print(f"\n  🎯 【{signal_type.upper()}参数优化】")
     print(f"     机会数量: {len(opportunities)}个")
     
     # 【V8.5.2.4.47】内存优化：对大量机会进行采样
-    if len(opportunities) > 1000:
+    # 【V8.9.23】精简表示下默认全量，仅在设置PHASE3_MAX_OPPORTUNITIES时采样
+    max_size = PHASE3_CONFIG["max_opportunities"]
+    if max_size > 0 and len(opportunities) > max_size:
         import random
-        sample_size = 1000
+        sample_size = max_size
         sampled_opportunities = random.sample(opportunities, sample_size)
         print(f"     💾 内存优化：采样{sample_size}个机会（保留{sample_size/len(opportunities)*100:.1f}%）")
         opportunities = sampled_opportunities
@@ -963,6 +1259,11 @@ def optimize_for_signal_type(
     # 多起点搜索
     all_results = []
     
+    # 【V8.9.23】筛选列只构建一次，每个组合按列生成掩码；
+    # calculate_actual_profit只读取TP/SL/持仓时间，同一组取值对全部机会计算一次，各组合按掩码求和
+    filter_index = Phase3FilterIndex(opportunities)
+    profit_cache: Dict = {}
+    
     for sp_idx, starting_point in enumerate(starting_points, 1):
         print(f"     [{sp_idx}/{len(starting_points)}] 从'{starting_point['name']}'出发...")
         
@@ -1008,76 +1309,23 @@ def optimize_for_signal_type(
         best_for_this_start = None
         for params in test_combinations:
             # 【V8.5.2.4.73】全维度智能筛选：基础条件 + K线形态 + 趋势强度 + 支撑阻力
-            filtered_opps = []
-            for opp in opportunities:
-                # 基础条件
-                if opp.get('consensus', 0) < params['min_indicator_consensus']:
-                    continue
-                if opp.get('signal_score', 0) < params['min_signal_score']:
-                    continue
-                if opp.get('risk_reward', 0) < params.get('min_risk_reward', 0):
-                    continue
-                if opp.get('profit_density', 0) < params.get('min_profit_density', 0):
-                    continue
-                
-                # 【V8.5.2.4.73】K线形态筛选
-                if params.get('require_strong_pattern', False):
-                    snapshot = opp.get('snapshot', {})
-                    has_pin_bar = snapshot.get('has_pin_bar', False)
-                    has_engulfing = snapshot.get('has_engulfing', False)
-                    has_breakout = snapshot.get('has_breakout', False)
-                    if not (has_pin_bar or has_engulfing or has_breakout):
-                        continue  # 必须有强K线形态
-                
-                # 【V8.5.2.4.73】趋势强度筛选
-                min_strength = params.get('min_trend_strength', 'any')
-                if min_strength != 'any':
-                    snapshot = opp.get('snapshot', {})
-                    trend_4h_strength = snapshot.get('trend_4h_strength', 'weak')
-                    if min_strength == 'strong' and trend_4h_strength != 'strong':
-                        continue  # 必须是强势趋势
-                    elif min_strength == 'normal' and trend_4h_strength == 'weak':
-                        continue  # 至少有正常趋势
-                
-                # 【V8.5.2.4.73】支撑/阻力位筛选
-                if params.get('require_near_sr', False):
-                    snapshot = opp.get('snapshot', {})
-                    # 检查价格是否在S/R的±3%范围内
-                    current_price = snapshot.get('current_price', 0)
-                    if current_price > 0:
-                        sr = snapshot.get('support_resistance', {})
-                        nearest_support = sr.get('nearest_support') or {}
-                        nearest_resistance = sr.get('nearest_resistance') or {}
-                        support_price = nearest_support.get('price', 0)
-                        resistance_price = nearest_resistance.get('price', 0)
-                        
-                        near_support = support_price > 0 and abs(current_price - support_price) / current_price < 0.03
-                        near_resistance = resistance_price > 0 and abs(current_price - resistance_price) / current_price < 0.03
-                        
-                        if not (near_support or near_resistance):
-                            continue  # 必须靠近S/R
-                
-                # 通过所有筛选条件
-                filtered_opps.append(opp)
+            mask = filter_index.mask(params)
+            captured_count = int(mask.sum())
             
-            if not filtered_opps:
+            if not captured_count:
                 continue
             
             # 【V8.5.2.4.69】使用calculate_actual_profit_batch计算利润
             # 它会使用future_data和V8.5.2.4.65的波动幅度修复
-            profit_results = calculate_actual_profit_batch(
-                filtered_opps, 
-                params, 
-                batch_size=1000, 
-                use_dynamic_atr=True, 
-                include_trading_costs=True
-            )
+            profit_key = (params['atr_tp_multiplier'], params['atr_stop_multiplier'], params['max_holding_hours'])
+            profits = profit_cache.get(profit_key)
+            if profits is None:
+                profits = profit_cache[profit_key] = _actual_profits(opportunities, params)
             
             # 统计
-            captured_count = len(profit_results)
             capture_rate = captured_count / len(opportunities) if opportunities else 0
             # 【V8.5.2.4.69】修复：字段名应为actual_profit_pct（calculate_actual_profit_batch返回的字段名）
-            total_profit = sum(r.get('actual_profit_pct', 0) for r in profit_results)
+            total_profit = float(profits[mask].sum())
             avg_profit = total_profit / captured_count if captured_count > 0 else 0
             
             # 【V8.5.2.4.47】只保存当前起点的最佳结果
@@ -1127,3 +1375,66 @@ def optimize_for_signal_type(
         'starting_point': best_result['starting_point']
     }
 
+
+
+def estimate_sampling_variance(
+    opportunities: List[Dict],
+    params_by_type: Dict[str, Dict],
+    runs: int = 5,
+    sample_size: int = 600
+) -> Dict:
+    """
+    【V8.9.23】评估采样给Phase 3结果带来的波动
+    
+    用旧版采样（sample_opportunities_for_phase3）重复抽取runs次，
+    在每个样本上按最优参数重新筛选和计算利润，与全量结果对比
+    
+    Args:
+        opportunities: 全量（精简后的）机会
+        params_by_type: {'scalping': best_params, 'swing': best_params}
+        runs: 采样次数
+        sample_size: 每次采样数量（默认与旧版上限600一致）
+    
+    Returns:
+        {signal_type: {'full_avg_profit', 'sample_avg_profit_mean', 'sample_avg_profit_std',
+                       'full_capture_rate', 'sample_capture_rate_mean', 'sample_capture_rate_std', 'runs'}}
+    """
+    def evaluate(opps: List[Dict], signal_type: str, params: Dict):
+        typed = [o for o in opps if o.get('signal_type') == signal_type]
+        if not typed:
+            return 0.0, 0.0
+        mask = Phase3FilterIndex(typed).mask(params)
+        filtered = [o for o, keep in zip(typed, mask) if keep]
+        if not filtered:
+            return 0.0, 0.0
+        total_profit = float(_actual_profits(filtered, params).sum())
+        return len(filtered) / len(typed), total_profit / len(filtered)
+    
+    print(f"\n  🎲 【采样波动评估】{runs}次 × {sample_size}个机会 vs 全量{len(opportunities)}个")
+    
+    samples = [sample_opportunities_for_phase3(opportunities, max_size=sample_size, verbose=False) for _ in range(runs)]
+    
+    report = {}
+    for signal_type, params in params_by_type.items():
+        if not params:
+            continue
+        
+        full_capture, full_profit = evaluate(opportunities, signal_type, params)
+        sample_stats = np.array([evaluate(sample, signal_type, params) for sample in samples])
+        
+        report[signal_type] = {
+            'full_avg_profit': full_profit,
+            'sample_avg_profit_mean': float(sample_stats[:, 1].mean()),
+            'sample_avg_profit_std': float(sample_stats[:, 1].std()),
+            'full_capture_rate': full_capture,
+            'sample_capture_rate_mean': float(sample_stats[:, 0].mean()),
+            'sample_capture_rate_std': float(sample_stats[:, 0].std()),
+            'runs': runs
+        }
+        
+        stats = report[signal_type]
+        print(f"     {signal_type}: 全量平均利润{full_profit:.2f}% | "
+              f"采样{stats['sample_avg_profit_mean']:.2f}%±{stats['sample_avg_profit_std']:.2f}% | "
+              f"捕获率{full_capture*100:.1f}% vs {stats['sample_capture_rate_mean']*100:.1f}%±{stats['sample_capture_rate_std']*100:.1f}%")
+    
+    return report
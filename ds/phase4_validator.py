@@ -10,15 +10,40 @@
 4. 稳定性评分（0-100分）
 5. 使用移动止盈止损计算利润
 6. 分别验证超短线和波段参数
+7. 【V8.9.20】机会可以是dict列表或OpportunityTable，筛选/排序按列向量化；
+   主流程传入的列式表只在利润计算前按_PROFIT_FIELDS还原为dict
+8. 【V8.9.19】机会带future_data["path"]（Phase 1的PathArena视图）时，利润按真实未来收盘价
+   走移动止损批量引擎（多空分别处理），没有路径的旧数据才按max_potential_profit模拟
 """
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from opportunity_table import OpportunityTable, as_opportunity_table, take_opportunities
 from trailing_stop_calculator import batch_calculate_profits
 
+Opportunities = Union[List[Dict], OpportunityTable]
+
+# Phase 4筛选和分段用到的字段（dict列表输入时只为这些字段建列）
+_PHASE4_FIELDS = ("signal_type", "indicator_consensus", "signal_score", "timestamp")
+
+# batch_calculate_profits读取的字段（有未来路径时按路径模拟，否则按max_potential_profit模拟）
+_PROFIT_FIELDS = (
+    "coin", "timestamp", "entry_price", "atr", "max_potential_profit", "direction", "future_data.path",
+)
+
+
+def _as_dicts(opportunities: Opportunities) -> List[Dict]:
+    """batch_calculate_profits仍按dict读取机会（列式表只还原利润计算用到的字段）"""
+    if isinstance(opportunities, OpportunityTable):
+        return opportunities.to_dicts(_PROFIT_FIELDS)
+    return opportunities
+
 
 def phase4_validation_and_overfitting_detection(
     phase3_result: Dict,
-    all_opportunities: List[Dict],
+    all_opportunities: Opportunities,
     phase1_baseline: Optional[Dict] = None
 ) -> Dict:
     """
@@ -50,8 +75,9 @@ def phase4_validation_and_overfitting_detection(
     swing_params = phase3_result.get('swing', {}).get('params', {})
     
     # 分离数据
-    scalping_opps = [o for o in all_opportunities if o.get('signal_type') == 'scalping']
-    swing_opps = [o for o in all_opportunities if o.get('signal_type') == 'swing']
+    table = as_opportunity_table(all_opportunities, _PHASE4_FIELDS)
+    scalping_opps = take_opportunities(all_opportunities, np.flatnonzero(table.equals('signal_type', 'scalping')))
+    swing_opps = take_opportunities(all_opportunities, np.flatnonzero(table.equals('signal_type', 'swing')))
     
     print("\n  📊 数据分布:")
     print(f"     总机会数: {len(all_opportunities)}个")
@@ -92,7 +118,7 @@ def phase4_validation_and_overfitting_detection(
 
 
 def validate_signal_type(
-    opportunities: List[Dict],
+    opportunities: Opportunities,
     params: Dict,
     signal_type: str,
     phase1_stats: Optional[Dict] = None
@@ -112,9 +138,9 @@ def validate_signal_type(
     """
     print(f"\n  📊 【{signal_type.upper()}参数验证】")
     
-    if not opportunities or not params:
+    if not len(opportunities) or not params:
         # 【V8.5.2.4.89.3】更友好的提示，明确区分两种跳过情况
-        if not opportunities:
+        if not len(opportunities):
             print(f"     ⚠️  无{signal_type}机会数据，跳过验证")
             print(f"     💡 可能原因: 当前数据量较小或市场条件不符合{signal_type}特征")
         elif not params:
@@ -159,7 +185,7 @@ def validate_signal_type(
 
 
 def test_params_on_data(
-    opportunities: List[Dict],
+    opportunities: Opportunities,
     params: Dict,
     label: str
 ) -> Dict:
@@ -176,13 +202,14 @@ def test_params_on_data(
         }
     """
     # 筛选机会
-    filtered_opps = [
-        opp for opp in opportunities
-        if (opp.get('indicator_consensus', 0) >= params.get('min_indicator_consensus', 2) and
-            opp.get('signal_score', 0) >= params.get('min_signal_score', 85))
-    ]
+    table = as_opportunity_table(opportunities, _PHASE4_FIELDS)
+    mask = (
+        (table.column('indicator_consensus', 0) >= params.get('min_indicator_consensus', 2)) &
+        (table.column('signal_score', 0) >= params.get('min_signal_score', 85))
+    )
+    filtered_opps = take_opportunities(opportunities, np.flatnonzero(mask))
     
-    if not filtered_opps:
+    if not len(filtered_opps):
         return {
             'captured_count': 0,
             'capture_rate': 0.0,
@@ -193,11 +220,11 @@ def test_params_on_data(
         }
     
     # 使用移动止损计算利润
-    profit_results = batch_calculate_profits(filtered_opps, params)
+    profit_results = batch_calculate_profits(_as_dicts(filtered_opps), params)
     
     # 统计
     captured_count = len(filtered_opps)
-    capture_rate = captured_count / len(opportunities) if opportunities else 0
+    capture_rate = captured_count / len(opportunities) if len(opportunities) else 0
     total_profit = sum(r['profit'] for r in profit_results)
     avg_profit = total_profit / captured_count if captured_count > 0 else 0
     
@@ -222,7 +249,7 @@ def test_params_on_data(
 
 
 def split_and_test(
-    opportunities: List[Dict],
+    opportunities: Opportunities,
     params: Dict
 ) -> Tuple[Dict, Dict]:
     """
@@ -231,14 +258,15 @@ def split_and_test(
     Returns:
         (early_result, late_result)
     """
-    # 按timestamp排序
-    sorted_opps = sorted(opportunities, key=lambda x: x.get('timestamp', ''))
+    # 按timestamp排序（稳定排序，与sorted一致）
+    table = as_opportunity_table(opportunities, _PHASE4_FIELDS)
+    order = np.argsort(table.column('timestamp', ''), kind='stable')
     
     # 分割点（50%）
-    split_point = len(sorted_opps) // 2
+    split_point = len(order) // 2
     
-    early_opps = sorted_opps[:split_point]
-    late_opps = sorted_opps[split_point:]
+    early_opps = take_opportunities(opportunities, order[:split_point])
+    late_opps = take_opportunities(opportunities, order[split_point:])
     
     print("\n  2️⃣ 分段测试:")
     print(f"     前期样本: {len(early_opps)}个")
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.14】盈亏历史时间索引（pnl_history.csv + pnl_history.csv.idx）
+
+核心功能:
+1. 写入只追加一行CSV + 一条索引（16字节：UTC秒级时间戳 + 该行起始字节偏移），
+   不再每个周期读入并重写整个CSV；索引文件头记录它覆盖的CSV大小和修改时间
+2. 行数超过 保留条数 × PNL_HISTORY_COMPACT_FACTOR 时压缩一次（只保留最近的保留条数）
+3. 按时间范围查询时二分查找索引，只读取命中的字节区间，不再逐行strptime；
+   CSV大小/修改时间与索引文件头一致时直接使用；CSV只是变长（旧版程序追加）时校验原末行后补齐新行；
+   其他情况（被改写、截短、旧格式索引）在内存中重建，结果不变
+4. LTTB降采样：折线图最多返回N个点，保留曲线的峰谷形状（月/全部范围不随文件增长变慢）
+
+环境变量:
+    PNL_HISTORY_RETENTION: 保留的快照条数（默认1000，与旧版一致；0为不限制）
+    PNL_HISTORY_COMPACT_FACTOR: 超过保留条数的多少倍时压缩（默认1.2）
+    PNL_CHART_MAX_POINTS: 折线图最多返回的点数（默认1500，0为不降采样）
+
+只依赖标准库（看板进程没有numpy也可使用）。
+"""
+
+import bisect
+import csv
+import io
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PNL_HISTORY_RETENTION = int(os.getenv("PNL_HISTORY_RETENTION", "1000"))
+PNL_HISTORY_COMPACT_FACTOR = float(os.getenv("PNL_HISTORY_COMPACT_FACTOR", "1.2"))
+PNL_CHART_MAX_POINTS = int(os.getenv("PNL_CHART_MAX_POINTS", "1500"))
+
+INDEX_SUFFIX = ".idx"
+TIME_FIELDS = ("时间", "timestamp")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_ENTRY = struct.Struct("<qq")
+# 索引文件头：魔数 + 覆盖的CSV大小 + CSV修改时间(ns)
+_HEADER = struct.Struct("<8sqq")
+INDEX_MAGIC = b"PNLIDX2\0"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_epoch(text) -> Optional[int]:
+    """'YYYY-MM-DD HH:MM:SS'（UTC）→ 秒级时间戳，无法解析时返回None"""
+    try:
+        moment = datetime.strptime(str(text).split(".")[0].strip(), TIME_FORMAT)
+    except ValueError:
+        return None
+    return int((moment - _EPOCH).total_seconds())
+
+
+def to_epoch(moment: datetime) -> int:
+    return int((moment - _EPOCH).total_seconds())
+
+
+def _atomic_write(path: Path, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _signature(path: Path):
+    try:
+        stat = path.stat()
+        return (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+
+def _csv_line(values) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+
+class _Index:
+    """内存中的索引：epochs/offsets一一对应（只包含时间可解析的行），end为已扫描到的字节位置"""
+
+    def __init__(self, header: List[str], header_end: int):
+        self.header = header
+        self.header_end = header_end
+        self.time_col = next((header.index(f) for f in TIME_FIELDS if f in header), None)
+        self.epochs = array("q")
+        self.offsets = array("q")
+        self.end = header_end
+        self.persisted = 0  # 与索引文件一致的条目数
+        self.verified_end = 0  # 索引文件头记录的CSV大小（等于end时文件头无需更新）
+        self._sorted: Optional[bool] = None
+
+    def scan(self, data: bytes, base: int):
+        """解析data（从文件位置base开始）中的完整行，追加到索引"""
+        pos = 0
+        while True:
+            newline = data.find(b"\n", pos)
+            if newline < 0:
+                break
+            line = data[pos:newline]
+            if line.strip() and self.time_col is not None:
+                fields = next(csv.reader([line.decode("utf-8", "replace")]), [])
+                ts = parse_epoch(fields[self.time_col]) if self.time_col < len(fields) else None
+                if ts is not None:
+                    self.epochs.append(ts)
+                    self.offsets.append(base + pos)
+            pos = newline + 1
+        self.end = base + pos
+        self._sorted = None
+
+    def is_sorted(self) -> bool:
+        if self._sorted is None:
+            epochs = self.epochs
+            self._sorted = all(epochs[i] <= epochs[i + 1] for i in range(len(epochs) - 1))
+        return self._sorted
+
+
+class PnlHistory:
+    """
+    单个pnl_history.csv的追加写入与时间范围查询
+
+    用法:
+        history = PnlHistory(PNL_HISTORY_FILE)
+        history.append(snapshot)
+        epochs, rows = history.query(start_ts, end_ts)
+    """
+
+    def __init__(self, csv_path, retention: Optional[int] = None):
+        self.path = Path(csv_path)
+        self.index_path = Path(f"{csv_path}{INDEX_SUFFIX}")
+        self.retention = PNL_HISTORY_RETENTION if retention is None else retention
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[tuple, _Index]] = None
+
+    # ---------- 写入 ----------
+
+    def append(self, snapshot: Dict):
+        """追加一条快照（列与已有表头不一致时整表重写），超限时压缩"""
+        with self._lock:
+            index = self._load()
+            if index is None or not index.header:
+                header = list(snapshot)
+                data = _csv_line(header) + _csv_line([snapshot[c] for c in header])
+                _atomic_write(self.path, data)
+                self._write_index(self._build_index())
+                return
+
+            if not set(snapshot) <= set(index.header):
+                self._rewrite_with(index, snapshot)
+                return
+
+            if index.persisted != len(index.offsets) or index.verified_end != index.end:
+                self._write_index(index)
+            line = _csv_line([snapshot.get(c, "") for c in index.header])
+            with open(self.path, "r+b") as f:
+                f.truncate(index.end)  # 丢弃写到一半的末行
+                f.seek(index.end)
+                f.write(line)
+            ts = parse_epoch(snapshot.get(self._time_field(index), ""))
+            with open(self.index_path, "r+b") as f:
+                if ts is not None:
+                    f.seek(0, os.SEEK_END)
+                    f.write(_ENTRY.pack(ts, index.end))
+                    index.epochs.append(ts)
+                    index.offsets.append(index.end)
+                    index.persisted += 1
+                index.end += len(line)
+                f.seek(0)
+                f.write(self._index_header())
+                index.verified_end = index.end
+
+            if self.retention > 0 and len(index.offsets) > self.retention * PNL_HISTORY_COMPACT_FACTOR:
+                self._compact(index)
+            self._cached = None
+
+    def _time_field(self, index: _Index) -> str:
+        return index.header[index.time_col] if index.time_col is not None else TIME_FIELDS[0]
+
+    def _compact(self, index: _Index):
+        keep = index.offsets[-self.retention]
+        with open(self.path, "rb") as f:
+            header_bytes = f.read(index.header_end)
+            f.seek(keep)
+            body = f.read(index.end - keep)
+        shift = keep - index.header_end
+        # 先替换CSV再替换索引；读取方会校验索引，两者短暂不一致时在内存中重建
+        _atomic_write(self.path, header_bytes + body)
+        compacted = _Index(index.header, index.header_end)
+        compacted.epochs = index.epochs[-self.retention:]
+        compacted.offsets = array("q", (o - shift for o in index.offsets[-self.retention:]))
+        compacted.end = index.end - shift
+        self._write_index(compacted)
+
+    def _rewrite_with(self, index: _Index, snapshot: Dict):
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        header = index.header + [c for c in snapshot if c not in index.header]
+        rows.append(snapshot)
+        if self.retention > 0:
+            rows = rows[-self.retention:]
+        data = _csv_line(header) + b"".join(_csv_line([row.get(c, "") for c in header]) for row in rows)
+        _atomic_write(self.path, data)
+        self._write_index(self._build_index())
+
+    def _index_header(self) -> bytes:
+        size, mtime_ns = _signature(self.path) or (0, 0)
+        return _HEADER.pack(INDEX_MAGIC, size, mtime_ns)
+
+    def _write_index(self, index: _Index):
+        data = bytearray(self._index_header())
+        for ts, offset in zip(index.epochs, index.offsets):
+            data += _ENTRY.pack(ts, offset)
+        _atomic_write(self.index_path, bytes(data))
+        index.persisted = len(index.offsets)
+        index.verified_end = index.end
+
+    # ---------- 读取 ----------
+
+    def query(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[List[int], List[Dict]]:
+        """
+        时间范围 [start, end) 内的快照（UTC秒级时间戳，None为不限）
+
+        Returns:
+            (时间戳列表, 行字典列表)，按文件顺序
+        """
+        with self._lock:
+            index = self._load()
+        if index is None or not index.offsets:
+            return [], []
+
+        count = len(index.epochs)
+        if index.is_sorted():
+            lo = 0 if start is None else bisect.bisect_left(index.epochs, start)
+            hi = count if end is None else bisect.bisect_left(index.epochs, end)
+            selected = range(lo, hi)
+        else:
+            # 时间不单调（如服务器时钟回拨）：逐条比较时间戳，仍不解析文本
+            selected = [
+                i for i, ts in enumerate(index.epochs)
+                if (start is None or ts >= start) and (end is None or ts < end)
+            ]
+        if not selected:
+            return [], []
+
+        # 只读到最后一条命中行的下一条索引处（末条命中时读到已扫描位置）
+        base = index.offsets[selected[0]]
+        last = selected[-1]
+        stop = index.offsets[last + 1] if last + 1 < count else index.end
+        with open(self.path, "rb") as f:
+            f.seek(base)
+            span = f.read(stop - base)
+
+        lines = []
+        for i in selected:
+            pos = index.offsets[i] - base
+            lines.append(span[pos:span.index(b"\n", pos) + 1].decode("utf-8"))
+        rows = list(csv.DictReader(lines, fieldnames=index.header))
+        return [index.epochs[i] for i in selected], rows
+
+    def _load(self) -> Optional[_Index]:
+        """读取并校验索引；CSV有新追加的行时补齐，对不上时重建"""
+        signature = (_signature(self.path), _signature(self.index_path))
+        if signature[0] is None:
+            self._cached = None
+            return None
+        if self._cached and self._cached[0] == signature:
+            return self._cached[1]
+
+        index = self._read_index()
+        if index is None:
+            index = self._build_index()
+        self._cached = (signature, index)
+        return index
+
+    def _read_header(self) -> Optional[_Index]:
+        with open(self.path, "rb") as f:
+            first = f.readline()
+        if not first.endswith(b"\n"):
+            return None
+        header = [name.strip() for name in next(csv.reader([first.decode("utf-8-sig")]), [])]
+        return _Index(header, len(first))
+
+    def _build_index(self) -> Optional[_Index]:
+        index = self._read_header()
+        if index is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(index.header_end)
+            index.scan(f.read(), index.header_end)
+        return index
+
+    def _read_index(self) -> Optional[_Index]:
+        index = self._read_header()
+        if index is None:
+            return None
+        try:
+            raw = self.index_path.read_bytes()
+        except OSError:
+            return None
+        if len(raw) < _HEADER.size or (len(raw) - _HEADER.size) % _ENTRY.size:
+            return None
+        magic, covered_size, covered_mtime = _HEADER.unpack_from(raw)
+        if magic != INDEX_MAGIC:
+            return None  # 旧格式索引（没有文件头）
+        for ts, offset in _ENTRY.iter_unpack(raw[_HEADER.size:]):
+            index.epochs.append(ts)
+            index.offsets.append(offset)
+        index.persisted = len(index.offsets)
+
+        offsets = index.offsets
+        if (offsets and offsets[0] < index.header_end) or any(
+            offsets[i] >= offsets[i + 1] for i in range(len(offsets) - 1)
+        ) or (offsets and offsets[-1] >= covered_size):
+            return None
+
+        csv_size, csv_mtime = _signature(self.path)
+        if (csv_size, csv_mtime) == (covered_size, covered_mtime):
+            index.end = index.verified_end = covered_size
+            return index
+        if csv_size <= covered_size or not offsets:
+            return None  # 被改写或截短
+
+        # CSV变长：原末行应原样保留且恰好结束在索引覆盖的位置，之后的行是新追加的
+        with open(self.path, "rb") as f:
+            f.seek(offsets[-1] - 1)
+            last = f.read(covered_size - offsets[-1] + 1)
+            appended = f.read()
+        if last[:1] != b"\n" or last.find(b"\n", 1) != len(last) - 1:
+            return None
+        fields = next(csv.reader([last[1:-1].decode("utf-8", "replace")]), [])
+        if index.time_col is None or index.time_col >= len(fields):
+            return None
+        if parse_epoch(fields[index.time_col]) != index.epochs[-1]:
+            return None
+
+        index.end = index.verified_end = covered_size
+        index.scan(appended, covered_size)
+        return index
+
+
+_HISTORIES: Dict[str, PnlHistory] = {}
+
+
+def get_pnl_history(csv_path) -> PnlHistory:
+    """按路径复用PnlHistory实例（同一进程内共享锁和索引缓存）"""
+    key = str(Path(csv_path).resolve())
+    if key not in _HISTORIES:
+        _HISTORIES[key] = PnlHistory(csv_path)
+    return _HISTORIES[key]
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    LTTB（Largest-Triangle-Three-Buckets）降采样，返回保留点的下标
+
+    首尾两点固定保留，中间每个桶选与前一个保留点、后一个桶均值围成三角形面积最大的点
+    """
+    n = len(xs)
+    if threshold >= n or threshold <= 0:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:threshold]
+
+    every = (n - 2) / (threshold - 2)
+    sampled = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(ys[avg_start:avg_end]) / (avg_end - avg_start)
+
+        best, best_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(best)
+        a = best
+    sampled.append(n - 1)
+    return sampled
+
+
+def downsample_rows(epochs: List[int], rows: List[Dict], max_points: int, value_field: str = "总资产"):
+    """按value_field做LTTB降采样，点数不超过max_points时原样返回"""
+    if max_points <= 0 or len(rows) <= max_points:
+        return epochs, rows
+    values = []
+    for row in rows:
+        try:
+            values.append(float(row.get(value_field) or row.get("total_assets") or 0))
+        except ValueError:
+            values.append(0.0)
+    keep = lttb_indices(epochs, values, max_points)
+    return [epochs[i] for i in keep], [rows[i] for i in keep]
+
+
+if __name__ == "__main__":
+    """
+    自检：追加/压缩/范围查询与逐行过滤一致、旧版写入的行补齐、索引损坏重建、LTTB
+    """
+    import random
+    import shutil
+    import time
+    from datetime import timedelta
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="pnl_index_"))
+    try:
+        csv_path = tmp_dir / "pnl_history.csv"
+        start = datetime(2025, 11, 1)
+        history = PnlHistory(csv_path, retention=500)
+        assets = 100.0
+        for i in range(1300):
+            assets += random.uniform(-0.5, 0.5)
+            history.append({
+                "时间": (start + timedelta(minutes=15 * i)).strftime(TIME_FORMAT),
+                "余额": round(assets - 1, 4), "总仓位价值": 10.0, "未实现盈亏": 1.0, "总资产": assets,
+            })
+
+        def slow_query(lo, hi):
+            with open(csv_path, encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            return [r for r in rows if lo <= parse_epoch(r["时间"]) < hi]
+
+        with open(csv_path, encoding="utf-8") as f:
+            total_rows = sum(1 for _ in f) - 1
+        assert 500 <= total_rows <= 500 * PNL_HISTORY_COMPACT_FACTOR, total_rows
+
+        lo = to_epoch(start + timedelta(days=10))
+        hi = to_epoch(start + timedelta(days=12))
+        reader = PnlHistory(csv_path)
+        epochs, rows = reader.query(lo, hi)
+        assert rows == slow_query(lo, hi) and len(rows) == 192
+
+        # 外部改写（末行偏移不变，中间行长度变化）：文件头签名不符 → 重建
+        with open(csv_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        lines[50] = lines[50].replace(",10.0,", ",10.00,", 1)
+        lines[300] = lines[300].replace(",10.0,", ",10.,", 1)
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        lo_mid = parse_epoch(lines[100].split(",")[0])
+        hi_mid = parse_epoch(lines[200].split(",")[0])
+        assert PnlHistory(csv_path).query(lo_mid, hi_mid)[1] == slow_query(lo_mid, hi_mid)
+
+        # 旧版程序（pandas重写）追加的行：索引落后于CSV，读取方在内存中补齐
+        with open(csv_path, "a", encoding="utf-8") as f:
+            f.write("2025-11-14 00:00:00,1,2,3,104.5\n")
+        epochs, rows = reader.query(to_epoch(datetime(2025, 11, 13, 23)), None)
+        assert rows[-1]["总资产"] == "104.5"
+
+        # 索引损坏：重建后结果不变
+        PnlHistory(csv_path).index_path.write_bytes(_ENTRY.pack(1, 10 ** 9))
+        assert PnlHistory(csv_path).query(lo, hi)[1] == slow_query(lo, hi)
+
+        xs = list(range(10_000))
+        ys = [random.gauss(0, 1) for _ in xs]
+        keep = lttb_indices(xs, ys, 300)
+        assert len(keep) == 300 and keep[0] == 0 and keep[-1] == 9999 and keep == sorted(keep)
+
+        t0 = time.time()
+        for _ in range(200):
+            reader.query(to_epoch(start + timedelta(days=12)), None)
+        print(f"✅ 盈亏时间索引自检通过: {total_rows}行, 单日范围查询 {(time.time() - t0) / 200 * 1e6:.0f}µs")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
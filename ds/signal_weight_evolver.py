@@ -6,16 +6,23 @@
 2. 通过进化算法自动发现最适合当前市场状态的权重组合
 3. 突破人工定义权重的局限性
 
+【V8.9.21】适应度向量化：各维度原始强度与权重无关，只在首次评估时提取一次，
+得到(机会数 × 基因数)的分量矩阵；整个种群的得分是一次矩阵乘法，
+适应度的三个指标也按列批量计算（可选线程并行）
+
 @author: 交易员建议 + AI实现
 @date: 2025-11-23
 """
 
 import copy
 import random
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import numpy as np
 
+from opportunity_table import OpportunityTable
+
 
 class SignalWeightEvolver:
     """信号权重遗传算法进化器"""
@@ -24,12 +31,15 @@ class SignalWeightEvolver:
         """初始化进化器
 
         Args:
-            opportunities: Phase 1识别出的客观机会列表 (必须包含snapshot数据)
+            opportunities: Phase 1识别出的客观机会列表或OpportunityTable (必须包含snapshot数据)
             signal_type: 'scalping' 或 'swing'
 
         """
         self.opportunities = opportunities
         self.signal_type = signal_type
+        # 分量矩阵和利润向量（首次评估时构建）
+        self._components = None
+        self._profits = None
 
         # 定义基因组（需要优化的维度）- V8.7.3新维度
         if signal_type == "scalping":
@@ -197,34 +207,91 @@ class SignalWeightEvolver:
 
         return comps
 
-    def _calculate_score_batch(self, weights: dict[str, float]) -> tuple:
-        """使用给定的权重，批量计算所有机会的得分
-
-        Returns:
-            (scores, profits): 得分列表和利润列表
+    def _component_matrix(self) -> tuple[np.ndarray, np.ndarray]:
+        """提取所有机会的分量矩阵 (机会数 × 基因数) 和利润向量（只提取一次）
 
+        没有snapshot的机会跳过；缺失的维度按0计
         """
-        scores = []
-        profits = []
+        if self._components is None:
+            rows = []
+            profits = []
+            opportunities = self.opportunities
+            if isinstance(opportunities, OpportunityTable):
+                opportunities = iter(opportunities)
+
+            for opp in opportunities:
+                snapshot = opp.get("snapshot", {})
+                if not snapshot:
+                    continue
+
+                raw_components = self._extract_raw_components(snapshot)
+                rows.append([raw_components.get(gene, 0) for gene in self.genes])
+                profits.append(opp.get("objective_profit", 0))
+
+            self._components = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.genes))
+            self._profits = np.array(profits, dtype=np.float64)
+
+        return self._components, self._profits
+
+    def _weight_matrix(self, population: list[dict[str, float]]) -> np.ndarray:
+        """种群 → (基因数 × 种群大小) 权重矩阵"""
+        return np.array(
+            [[genome.get(gene, 0) for genome in population] for gene in self.genes],
+            dtype=np.float64,
+        ).reshape(len(self.genes), len(population))
+
+    def _population_fitness(self, population: list[dict[str, float]]) -> np.ndarray:
+        """一组权重的适应度（每列一个个体，指标按列批量计算）"""
+        components, profits = self._component_matrix()
+        n = len(profits)
+        if n < 5:
+            return np.zeros(len(population))
+
+        scores = 50 + components @ self._weight_matrix(population)  # (机会数 × 种群大小)
 
-        for opp in self.opportunities:
-            snapshot = opp.get("snapshot", {})
-            if not snapshot:
-                continue
+        # 1. 相关性得分 (Pearson Correlation)
+        # 我们希望分数和利润正相关
+        score_std = scores.std(axis=0)
+        profit_std = profits.std()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = ((scores - scores.mean(axis=0)) * (profits - profits.mean())[:, None]).mean(axis=0)
+            correlation = covariance / (score_std * profit_std)
+        correlation = np.where((score_std > 0) & np.isfinite(correlation), correlation, 0.0)
 
-            raw_components = self._extract_raw_components(snapshot)
+        # 2. 头部效应 (Top Tier Profit)
+        # 找出分数最高的20%的机会，看它们的平均利润（同分保持原顺序，与稳定排序一致）
+        top_20_count = max(1, int(n * 0.2))
+        top_rows = np.argsort(-scores, axis=0, kind="stable")[:top_20_count]
+        top_20_profit = profits[top_rows].mean(axis=0)
 
-            # 计算总分
-            score = 50  # 基础分
-            for gene in self.genes:
-                strength = raw_components.get(gene, 0)
-                weight = weights.get(gene, 0)
-                score += strength * weight
+        # 3. 区分度 (Standard Deviation)
+        # 我们不希望所有机会都是80分，要有区分度
 
-            scores.append(score)
-            profits.append(opp.get("objective_profit", 0))
+        # 综合评分公式
+        # 权重：头部利润(60%) + 相关性(30%) + 区分度(10%)
+        return (top_20_profit * 2.0) + (correlation * 20) + (score_std * 0.5)
+
+    def fitness_population(
+        self, population: list[dict[str, float]], n_jobs: int = 1
+    ) -> np.ndarray:
+        """批量评估整个种群的适应度
+
+        Args:
+            population: 权重组合列表
+            n_jobs: >1时把种群分块交给线程池（矩阵运算释放GIL）
+
+        Returns:
+            与population顺序一致的适应度数组
+
+        """
+        self._component_matrix()
+        if n_jobs <= 1 or len(population) < 2 * n_jobs:
+            return self._population_fitness(population)
 
-        return scores, profits
+        chunk = -(-len(population) // n_jobs)
+        parts = [population[i : i + chunk] for i in range(0, len(population), chunk)]
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            return np.concatenate(list(pool.map(self._population_fitness, parts)))
 
     def fitness_function(self, weights: dict[str, float]) -> float:
         """适应度函数：评估这组权重的质量
@@ -236,48 +303,17 @@ class SignalWeightEvolver:
         2. 相关性 (30%)：分数与利润的皮尔逊相关系数
         3. 区分度 (10%)：分数的标准差（避免所有机会都80分）
         """
-        scores, profits = self._calculate_score_batch(weights)
-
-        if not scores or len(scores) < 5:
-            return 0
-
-        # 1. 相关性得分 (Pearson Correlation)
-        # 我们希望分数和利润正相关
-        try:
-            if np.std(scores) > 0:
-                correlation = np.corrcoef(scores, profits)[0, 1]
-            else:
-                correlation = 0
-            if np.isnan(correlation):
-                correlation = 0
-        except Exception:
-            correlation = 0
-
-        # 2. 头部效应 (Top Tier Profit)
-        # 找出分数最高的20%的机会，看它们的平均利润
-        paired = list(zip(scores, profits))
-        paired.sort(key=lambda x: x[0], reverse=True)
-        top_20_count = max(1, int(len(paired) * 0.2))
-        top_20_profit = np.mean([p for s, p in paired[:top_20_count]])
-
-        # 3. 区分度 (Standard Deviation)
-        # 我们不希望所有机会都是80分，要有区分度
-        score_std = np.std(scores)
-
-        # 综合评分公式
-        # 权重：头部利润(60%) + 相关性(30%) + 区分度(10%)
-        fitness = (top_20_profit * 2.0) + (correlation * 20) + (score_std * 0.5)
-
-        return fitness
+        return float(self._population_fitness([weights])[0])
 
     def evolve(
-        self, generations: int = 10, population_size: int = 20
+        self, generations: int = 10, population_size: int = 20, n_jobs: int = 1
     ) -> dict[str, Any]:
         """运行进化算法
 
         Args:
             generations: 进化代数
             population_size: 种群大小
+            n_jobs: 种群评估的并行线程数（1为单线程）
 
         Returns:
             最优权重组合
@@ -296,11 +332,9 @@ class SignalWeightEvolver:
         print(f"\n🧬 启动信号权重进化 ({generations}代, 种群{population_size})...")
 
         for gen in range(generations):
-            # 评估
-            ranked_population = []
-            for genome in population:
-                fit = self.fitness_function(genome)
-                ranked_population.append((fit, genome))
+            # 评估（整个种群一次矩阵运算）
+            fitness = self.fitness_population(population, n_jobs=n_jobs)
+            ranked_population = list(zip(fitness.tolist(), population))
 
             # 排序
             ranked_population.sort(key=lambda x: x[0], reverse=True)
@@ -413,3 +447,53 @@ def integrate_evolver_to_phase2(
             print(f"\n  ⚠️ 波段样本不足({len(train_opps)}<20)，跳过进化")
 
     return scalping_weight_candidates, swing_weight_candidates
+
+
+if __name__ == "__main__":
+    """
+    对照测试：矩阵版适应度 vs 逐机会循环 + np.corrcoef的原实现
+    """
+    rng = np.random.default_rng(5)
+    trends = ["多头", "空头", "震荡", "多头转弱"]
+    opps = []
+    for i in range(600):
+        snapshot = {
+            "close": float(rng.uniform(90, 110)),
+            "open": float(rng.uniform(90, 110)),
+            "volume_ratio": float(rng.uniform(0.5, 3)),
+            "trend_4h": trends[i % 4],
+            "trend_1h": trends[(i // 4) % 4],
+            "trend_15m": trends[(i // 16) % 4],
+            "side": "long" if i % 3 else "short",
+            "breakout": ["强势突破", "突破", "震荡", ""][i % 4],
+            "pattern": ["持续", "反转", ""][i % 3],
+            "ema_divergence": float(rng.normal(0, 3)),
+            "trend_4h_strength": float(rng.uniform(0, 100)),
+            "atr_14": float(rng.uniform(0.5, 2)),
+            "nearest_resistance": float(rng.uniform(100, 120)),
+            "nearest_support": float(rng.uniform(80, 100)),
+            "position_status": ["at_support", "at_resistance", "mid"][i % 3],
+            "mkt_struct_age_candles": int(rng.integers(0, 80)),
+        }
+        opps.append({"snapshot": snapshot if i % 50 else {}, "objective_profit": float(rng.normal(1, 3))})
+
+    def legacy_fitness(evolver, weights):
+        scores, profits = [], []
+        for opp in evolver.opportunities:
+            if not opp["snapshot"]:
+                continue
+            comps = evolver._extract_raw_components(opp["snapshot"])
+            scores.append(50 + sum(comps.get(g, 0) * weights.get(g, 0) for g in evolver.genes))
+            profits.append(opp["objective_profit"])
+        correlation = np.corrcoef(scores, profits)[0, 1] if np.std(scores) > 0 else 0
+        paired = sorted(zip(scores, profits), key=lambda x: x[0], reverse=True)
+        top = np.mean([p for _, p in paired[: max(1, int(len(paired) * 0.2))]])
+        return top * 2.0 + correlation * 20 + np.std(scores) * 0.5
+
+    evolver = SignalWeightEvolver(opps, signal_type="swing")
+    population = [{g: random.randint(0, 50) for g in evolver.genes} for _ in range(64)]
+    expected = [legacy_fitness(evolver, w) for w in population]
+    assert np.allclose(evolver.fitness_population(population), expected)
+    assert np.allclose(evolver.fitness_population(population, n_jobs=4), expected)
+    assert np.isclose(evolver.fitness_function(population[0]), expected[0])
+    print(f"✅ {len(population)}个个体：矩阵版适应度与逐机会实现一致")
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.15】市场快照K线侧车索引（按币种、按天的OHLC）
+
+核心功能:
+1. market_snapshots/YYYYMMDD.ohlc：保存快照时同步写入，只含K线需要的 时间/开/高/低/收，
+   按币种分段存储（JSON表头记录每个币种的起始位置和条数），读取一个币种只读它自己的字节
+2. 表头记录当天源文件（CSV/列式分区）的指纹；源文件被其他程序改写（如历史数据回填）后
+   指纹对不上，读取方改为解析源文件；列式分区比CSV旧时以CSV为准
+3. 进程内缓存按（目录, 币种）整条序列保存解码后的各天K线块，每块附带文件指纹，文件更新后自动失效；
+   按序列整体LRU淘汰（总条数超过上限时淘汰最久未用的序列，正在查询的序列不淘汰），
+   一年的价格图不会因为天数×币种×模型超过块数上限而自我淘汰
+4. 批量生成工具：为已有的快照补建索引
+
+用法:
+    python3 snapshot_ohlc_index.py build            # 为deepseek和qwen补建全部索引
+    python3 snapshot_ohlc_index.py build qwen       # 只处理qwen
+    python3 snapshot_ohlc_index.py build --force    # 重建已存在的索引
+
+环境变量:
+    KLINE_CACHE_MAX_RECORDS: 缓存的K线总条数上限（默认200000，约40MB；单个序列超过时仍完整缓存）
+
+只依赖标准库（读取只有列式分区的日期时才需要numpy）。
+"""
+
+import csv
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+KLINE_CACHE_MAX_RECORDS = int(os.getenv("KLINE_CACHE_MAX_RECORDS", "200000"))
+
+INDEX_SUFFIX = ".ohlc"
+INDEX_VERSION = 1
+_RECORD = struct.Struct("<idddd")  # 当天秒数（UTC）, open, high, low, close
+
+
+def index_path(snapshot_dir, date_str: str) -> Path:
+    return Path(snapshot_dir) / f"{date_str}{INDEX_SUFFIX}"
+
+
+def _signature(path: Path):
+    try:
+        stat = path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def source_signature(snapshot_dir, date_str: str) -> list:
+    """当天源文件指纹：[CSV, 列式分区]"""
+    snapshot_dir = Path(snapshot_dir)
+    return [
+        _signature(snapshot_dir / f"{date_str}.csv"),
+        _signature(snapshot_dir / f"{date_str}.npy"),
+    ]
+
+
+def _seconds_of_day(time_str) -> Optional[int]:
+    """'HHMM' / 'HH:MM' / 'HH:MM:SS'（UTC）→ 当天秒数，无法解析时返回None"""
+    text = str(time_str).strip()
+    if len(text) == 4 and text.isdigit():
+        parts = [text[:2], text[2:], "0"]
+    else:
+        parts = text.split(":")
+        if len(parts) == 2:
+            parts.append("0")
+    if len(parts) != 3 or not all(p.isdigit() for p in parts):
+        return None
+    hour, minute, second = (int(p) for p in parts)
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return hour * 3600 + minute * 60 + second
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _read_source(snapshot_dir, date_str: str) -> Optional[Dict[str, List[tuple]]]:
+    """
+    解析当天源文件，按币种（大写）分组为 [(当天秒数, open, high, low, close)]，保持文件顺序
+
+    列式分区优先（与看板原读取顺序一致），没有numpy、没有列式分区或分区比CSV旧时读CSV；都没有时返回None
+    """
+    snapshot_dir = Path(snapshot_dir)
+    npy_path = snapshot_dir / f"{date_str}.npy"
+    csv_path = snapshot_dir / f"{date_str}.csv"
+    rows: Optional[Iterable] = None
+
+    # 列式分区比CSV旧（CSV被其他程序改写而分区未同步）时不用分区
+    npy_signature, csv_signature = _signature(npy_path), _signature(csv_path)
+    npy_current = npy_signature is not None and (csv_signature is None or npy_signature[1] >= csv_signature[1])
+    if npy_current:
+        try:
+            import numpy as np
+
+            table = np.load(npy_path, mmap_mode="r", allow_pickle=False)
+            columns = [np.array(table[name]).tolist() for name in ("coin", "time", "open", "high", "low", "close")]
+            rows = zip(*columns)
+        except (ImportError, ValueError, OSError):
+            rows = None
+    if rows is None:
+        if not csv_path.exists():
+            return None
+        with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = [
+                (r.get("coin") or "", r.get("time") or "", r.get("open"), r.get("high"), r.get("low"), r.get("close"))
+                for r in csv.DictReader(f)
+            ]
+
+    by_coin: Dict[str, List[tuple]] = {}
+    for coin, time_str, open_, high, low, close in rows:
+        seconds = _seconds_of_day(time_str)
+        if seconds is None:
+            continue
+        by_coin.setdefault(str(coin).upper(), []).append(
+            (seconds, _to_float(open_), _to_float(high), _to_float(low), _to_float(close))
+        )
+    return by_coin
+
+
+def write_day_index(snapshot_dir, date_str: str) -> bool:
+    """
+    按当天源文件重建侧车索引（保存快照后调用；当天最多约700行，整天重写）
+
+    Returns:
+        是否写入（当天没有源文件时为False）
+    """
+    signature = source_signature(snapshot_dir, date_str)
+    by_coin = _read_source(snapshot_dir, date_str)
+    if by_coin is None:
+        return False
+
+    coins, body, position = {}, bytearray(), 0
+    for coin, records in by_coin.items():
+        coins[coin] = [position, len(records)]
+        for record in records:
+            body += _RECORD.pack(*record)
+        position += len(records)
+    header = json.dumps({"version": INDEX_VERSION, "source": signature, "coins": coins}, ensure_ascii=False)
+
+    path = index_path(snapshot_dir, date_str)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.encode("utf-8") + b"\n")
+            f.write(body)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def _read_index_coin(path: Path, signature: list, coin: str) -> Optional[List[tuple]]:
+    """从侧车索引读取一个币种；索引不存在或与源文件对不上时返回None"""
+    try:
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != INDEX_VERSION or header.get("source") != signature:
+                return None
+            start, count = header["coins"].get(coin, (0, 0))
+            if not count:
+                return []
+            f.seek(start * _RECORD.size, os.SEEK_CUR)
+            data = f.read(count * _RECORD.size)
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(data) != count * _RECORD.size:
+        return None
+    return list(_RECORD.iter_unpack(data))
+
+
+def _to_block(date_str: str, records: List[tuple]) -> tuple:
+    """(秒数, OHLC)记录 → (北京时间字符串, open, high, low, close)，过滤非正价格（与看板原逻辑一致）"""
+    day_start = datetime.strptime(date_str, "%Y%m%d") + timedelta(hours=8)
+    block = []
+    for seconds, open_, high, low, close in records:
+        if open_ > 0 and high > 0 and low > 0 and close > 0:
+            timestamp = (day_start + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+            block.append((timestamp, open_, high, low, close))
+    return tuple(block)
+
+
+class KlineBlockCache:
+    """（目录, 币种）→ {日期: 解码后的K线块}，按序列整体LRU淘汰"""
+
+    def __init__(self, max_records: int = KLINE_CACHE_MAX_RECORDS):
+        self.max_records = max_records
+        self._series: "OrderedDict[tuple, Dict[str, tuple]]" = OrderedDict()
+        self._records = 0
+        self._lock = threading.Lock()
+
+    def coin_day(self, snapshot_dir, date_str: str, coin: str) -> Tuple[tuple, bool]:
+        """某天某币种的K线块（按文件顺序）及其是否按时间有序，当天没有数据时为空"""
+        coin = coin.upper()
+        signature = source_signature(snapshot_dir, date_str)
+        if signature == [None, None]:
+            return (), True
+        key = (str(snapshot_dir), coin)
+        with self._lock:
+            cached = self._series.get(key, {}).get(date_str)
+            if cached is not None and cached[0] == signature:
+                self._series.move_to_end(key)
+                return cached[1], cached[2]
+
+        records = _read_index_coin(index_path(snapshot_dir, date_str), signature, coin)
+        if records is not None:
+            blocks = {coin: _to_block(date_str, records)}
+        else:
+            # 没有索引或索引过期：解析源文件，顺带更新已缓存的其他币种序列
+            by_coin = _read_source(snapshot_dir, date_str) or {}
+            blocks = {c: _to_block(date_str, r) for c, r in by_coin.items()}
+            blocks.setdefault(coin, ())
+
+        with self._lock:
+            for block_coin, block in blocks.items():
+                block_key = (str(snapshot_dir), block_coin)
+                if block_coin == coin or block_key in self._series:
+                    self._store(block_key, date_str, (signature, block, _is_ordered(block)))
+            self._series.move_to_end(key)
+            # 正在查询的序列在末尾，不会被淘汰
+            while self._records > self.max_records and len(self._series) > 1:
+                _, series = self._series.popitem(last=False)
+                self._records -= sum(len(entry[1]) for entry in series.values())
+            entry = self._series[key][date_str]
+        return entry[1], entry[2]
+
+    def _store(self, key: tuple, date_str: str, entry: tuple):
+        series = self._series.setdefault(key, {})
+        previous = series.get(date_str)
+        if previous is not None:
+            self._records -= len(previous[1])
+        series[date_str] = entry
+        self._records += len(entry[1])
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._records = 0
+
+
+_CACHE = KlineBlockCache()
+
+
+def query_klines(snapshot_dir, dates: Iterable[str], coin: str, start: str, end: str) -> List[Dict]:
+    """
+    多天的K线（看板价格图）
+
+    Args:
+        dates: YYYYMMDD（UTC日期），按顺序
+        start / end: 北京时间 'YYYY-MM-DD HH:MM:SS'，闭区间
+
+    Returns:
+        [{'timestamp': 北京时间, 'open', 'high', 'low', 'close'}]
+    """
+    kline_data = []
+    for date_str in dates:
+        block, ordered = _CACHE.coin_day(snapshot_dir, date_str, coin)
+        if not block:
+            continue
+        if ordered and start <= block[0][0] and block[-1][0] <= end:
+            rows = block
+        else:
+            rows = [row for row in block if start <= row[0] <= end]
+        kline_data.extend(
+            {"timestamp": ts, "open": o, "high": h, "low": lo, "close": c} for ts, o, h, lo, c in rows
+        )
+    return kline_data
+
+
+def _is_ordered(block: tuple) -> bool:
+    return all(block[i][0] <= block[i + 1][0] for i in range(len(block) - 1))
+
+
+def build_model(snapshot_dir, force: bool = False) -> Tuple[int, int]:
+    """为一个模型目录下所有快照日期补建索引，返回(写入天数, 跳过天数)"""
+    snapshot_dir = Path(snapshot_dir)
+    dates = sorted({
+        p.stem for p in snapshot_dir.iterdir()
+        if p.suffix in (".csv", ".npy") and p.stem.isdigit() and len(p.stem) == 8
+    })
+    written = skipped = 0
+    for date_str in dates:
+        path = index_path(snapshot_dir, date_str)
+        if not force and _read_index_coin(path, source_signature(snapshot_dir, date_str), "") is not None:
+            skipped += 1
+            continue
+        try:
+            written += write_day_index(snapshot_dir, date_str)
+        except Exception as e:
+            print(f"  ❌ {date_str}: {e}")
+    return written, skipped
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        _self_check()
+        return
+    if args[0] != "build":
+        print(__doc__)
+        sys.exit(1)
+
+    force = "--force" in args
+    models = [a for a in args[1:] if not a.startswith("--")] or ["deepseek", "qwen"]
+    base_dir = Path(__file__).parent / "trading_data"
+    for model in models:
+        snapshot_dir = base_dir / model / "market_snapshots"
+        if not snapshot_dir.exists():
+            print(f"⚠️  {model}: 未找到 {snapshot_dir}")
+            continue
+        written, skipped = build_model(snapshot_dir, force=force)
+        print(f"📦 {model}: 生成{written}天, 跳过{skipped}天（已是最新，--force重建）")
+
+
+def _self_check():
+    """自检：索引读取与逐行解析CSV结果一致、源文件改写后不返回过期数据、跨天范围过滤"""
+    import random
+    import shutil
+    import time
+
+    def slow_query(snapshot_dir, dates, coin, start, end):
+        result = []
+        for date_str in dates:
+            csv_path = Path(snapshot_dir) / f"{date_str}.csv"
+            with open(csv_path, encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    if row["coin"].upper() != coin.upper():
+                        continue
+                    t = row["time"]
+                    utc = datetime.strptime(f"{date_str} {t[:2]}:{t[2:]}:00", "%Y%m%d %H:%M:%S")
+                    ts = (utc + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
+                    prices = [float(row[k] or 0) for k in ("open", "high", "low", "close")]
+                    if start <= ts <= end and all(p > 0 for p in prices):
+                        result.append(dict(zip(("timestamp", "open", "high", "low", "close"), [ts] + prices)))
+        return result
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="ohlc_index_"))
+    try:
+        random.seed(3)
+        coins = ["BTC", "ETH", "SOL", "BNB", "XRP", "DOGE", "LTC"]
+        dates = [(datetime(2025, 1, 1) + timedelta(days=i)).strftime("%Y%m%d") for i in range(365)]
+        for date_str in dates:
+            with open(tmp_dir / f"{date_str}.csv", "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["time", "coin", "price", "open", "high", "low", "close", "volume"])
+                for slot in range(96):
+                    for coin in coins:
+                        p = random.uniform(1, 100)
+                        close = "" if random.random() < 0.01 else p
+                        writer.writerow([f"{slot // 4:02d}{slot % 4 * 15:02d}", coin, p, p, p * 1.01, p * 0.99, close, 1])
+        for date_str in dates[:-1]:
+            write_day_index(tmp_dir, date_str)  # 最后一天不建索引：走源文件回退
+
+        start, end = "2025-01-01 08:00:00", "2025-12-31 12:00:00"
+        t0 = time.time()
+        cold = query_klines(tmp_dir, dates, "btc", start, end)
+        t_cold = time.time() - t0
+        t0 = time.time()
+        warm = query_klines(tmp_dir, dates, "BTC", start, end)
+        t_warm = time.time() - t0
+        assert cold == warm == slow_query(tmp_dir, dates, "BTC", start, end)
+
+        # 一年的序列（超过旧版512块上限）完整缓存：切换币种后再查BTC仍全部命中
+        for coin in coins[1:3]:
+            query_klines(tmp_dir, dates, coin, start, end)
+        reads = []
+        original_read = _read_index_coin
+        globals()["_read_index_coin"] = lambda *a: reads.append(a) or original_read(*a)
+        try:
+            assert query_klines(tmp_dir, dates, "BTC", start, end) == warm
+        finally:
+            globals()["_read_index_coin"] = original_read
+        assert not reads, f"缓存应全部命中，实际读取索引{len(reads)}次"
+
+        # 超过条数上限：淘汰最久未用的序列，正在查询的序列完整保留
+        small = KlineBlockCache(max_records=1000)
+        for date_str in dates[:30]:
+            small.coin_day(tmp_dir, date_str, "ETH")
+        for date_str in dates[:30]:
+            small.coin_day(tmp_dir, date_str, "BTC")
+        assert list(small._series) == [(str(tmp_dir), "BTC")] and len(small._series[(str(tmp_dir), "BTC")]) == 30
+
+        # 源文件被改写：索引过期，读取方改为解析源文件
+        with open(tmp_dir / f"{dates[10]}.csv", "a", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(["2359", "BTC", 5, 5, 5, 5, 5, 1])
+        assert query_klines(tmp_dir, dates[10:11], "BTC", start, end)[-1]["close"] == 5.0
+
+        # 只改写CSV、列式分区未同步（比CSV旧）：以CSV为准
+        try:
+            import numpy as np
+
+            stale = np.array([("BTC", "0000", 1.0, 1.0, 1.0, 1.0)], dtype=[
+                ("coin", "<U8"), ("time", "<U4"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8")])
+            npy_path = tmp_dir / f"{dates[20]}.npy"
+            np.save(npy_path, stale)
+            os.utime(npy_path, ns=(0, 0))
+            assert query_klines(tmp_dir, dates[20:21], "BTC", start, end) == slow_query(
+                tmp_dir, dates[20:21], "BTC", start, end)
+        except ImportError:
+            pass
+
+        print(f"✅ K线索引自检通过: 一年{len(warm)}条, 首次 {t_cold * 1000:.0f}ms, 缓存命中 {t_warm * 1000:.0f}ms")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.10】多日市场快照的内存映射窗口（按(币种, 时间戳)索引）
+
+核心功能:
+1. 把最近N天中已收盘的快照合并成一个磁盘上的结构化数组（market_snapshots/_window/*.npy），
+   按(币种, 时间)排序，以mmap只读方式打开，不再为每天各建一个DataFrame再concat
+2. 预先计算每个币种的[start, end)行号区间，取某个币种只是切片（零拷贝视图），
+   不再反复history_df[history_df["coin"] == coin]扫描整表
+3. 构建时逐天读取、逐天写入（两遍扫描），峰值内存≈一天的数据，与回看天数无关
+4. 源文件（CSV/列式分区）大小和修改时间不变时直接复用已构建的窗口文件
+5. 当天的快照每15分钟追加一次，不进入窗口文件（否则每次运行都要重建），
+   打开时单独读取，各查询方法对它透明
+6. 字符串列存为int32类别编码（类别表在窗口元数据里），不按最长字符串定宽存储
+7. 不同日期范围的窗口各自缓存（7天/14天窗口互不覆盖），超过保留期未使用的才清理
+
+附加的内部列:
+    _date: 快照日期（int32，YYYYMMDD）
+    _ts:   时间戳（datetime64[m]，由日期+time列得到，无法解析时为NaT）
+    _row:  该行在当天文件中的行号（与pd.read_csv的默认index一致）
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from market_snapshot_store import columnar_path, load_snapshot_day
+
+WINDOW_DIR_NAME = "_window"
+INTERNAL_COLUMNS = ("_date", "_ts", "_row")
+# 窗口文件超过这么多天未被使用才删除
+WINDOW_RETENTION_DAYS = int(os.getenv("SNAPSHOT_WINDOW_RETENTION_DAYS", "3"))
+MISSING_CODE = -1
+
+
+def recent_dates(days: int, end_date: Optional[datetime] = None) -> List[str]:
+    """最近days天的日期（从今天往前，YYYYMMDD）"""
+    end_date = end_date or datetime.now()
+    return [(end_date - timedelta(days=i)).strftime("%Y%m%d") for i in range(days)]
+
+
+def _read_day(snapshot_dir: Path, date_str: str) -> Optional[pd.DataFrame]:
+    """读取一天的快照（优先列式分区，其次CSV），都没有时返回None"""
+    df = load_snapshot_day(snapshot_dir, date_str)
+    if df is not None:
+        return df
+    csv_file = snapshot_dir / f"{date_str}.csv"
+    if not csv_file.exists():
+        return None
+    return pd.read_csv(
+        csv_file, on_bad_lines="skip", encoding="utf-8-sig", dtype={"time": str}
+    )
+
+
+def _source_signature(snapshot_dir: Path, dates: Iterable[str]) -> List:
+    """源文件指纹（大小 + 修改时间），用于判断窗口文件是否过期"""
+    signature = []
+    for date_str in dates:
+        for path in (columnar_path(snapshot_dir, date_str), snapshot_dir / f"{date_str}.csv"):
+            if path.exists():
+                stat = path.stat()
+                signature.append([date_str, path.name, stat.st_size, int(stat.st_mtime_ns)])
+                break
+    return signature
+
+
+def _time_minutes(times: pd.Series) -> np.ndarray:
+    """time列（"HHMM" / "HH:MM" / 整数）→ 当天的分钟数，无法解析为-1"""
+    text = times.astype(str).str.strip().str.replace(":", "", regex=False)
+    value = pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64)
+    minutes = np.where(np.isnan(value), -1, (value // 100) * 60 + value % 100)
+    return minutes.astype(np.int64)
+
+
+def _day_timestamps(df: pd.DataFrame, date_str: str) -> np.ndarray:
+    """某天每行的时间戳（datetime64[m]，time无法解析为NaT）"""
+    minutes = _time_minutes(df["time"]) if "time" in df.columns else np.full(len(df), -1)
+    return np.where(
+        minutes >= 0,
+        np.datetime64(datetime.strptime(date_str, "%Y%m%d"), "m") + minutes.astype("timedelta64[m]"),
+        np.datetime64("NaT", "m"),
+    )
+
+
+def _column_kind(series: pd.Series) -> str:
+    """列类型归类："b"/"i"/"f"，其余按字符串（类别编码）"U" """
+    if pd.api.types.is_bool_dtype(series):
+        return "b"
+    if pd.api.types.is_integer_dtype(series):
+        return "i"
+    if pd.api.types.is_float_dtype(series):
+        return "f"
+    return "U"
+
+
+def _merge_kinds(kinds: List[str], present_everywhere: bool) -> np.dtype:
+    """多天同名列的类型合并（与pd.concat相近：数值混合→float64，出现字符串→类别编码）"""
+    letters = set(kinds)
+    if "U" in letters:
+        return np.dtype(np.int32)
+    if letters == {"b"} and present_everywhere:
+        return np.dtype(bool)
+    if letters == {"i"} and present_everywhere:
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)  # 某天缺列时需要NaN
+
+
+def _text_values(values: pd.Series) -> pd.Series:
+    """字符串列的取值（缺失为""，与旧版定宽字符串列一致）"""
+    return values.where(values.notna(), "").astype(str)
+
+
+def _fill_column(values: pd.Series, dtype: np.dtype, categories: Optional[Dict[str, int]] = None) -> np.ndarray:
+    if categories is not None:
+        codes = _text_values(values).map(categories)
+        return codes.fillna(MISSING_CODE).to_numpy(dtype=dtype)
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=dtype)
+
+
+def _missing_value(dtype: np.dtype, categorical: bool):
+    return MISSING_CODE if categorical else np.nan
+
+
+def _decode(codes: np.ndarray, categories: List[str]) -> np.ndarray:
+    """类别编码 → object数组（缺失编码-1恰好取到末尾的NaN）"""
+    lookup = np.empty(len(categories) + 1, dtype=object)
+    lookup[:-1] = categories
+    lookup[-1] = np.nan
+    return lookup[codes]
+
+
+class SnapshotWindow:
+    """
+    多日快照窗口（只读，行按(币种, 时间戳)排序）
+
+    用法:
+        window = SnapshotWindow.open(snapshot_dir, recent_dates(14))
+        for coin in window.day_coins("20251120"):
+            df = window.coin_frame(coin, "20251120")  # 某币种某天的DataFrame
+        view = window.coin_view("BTC")               # 已收盘日期的零拷贝结构化数组
+    """
+
+    def __init__(
+        self,
+        table: np.ndarray,
+        dates: List[str],
+        categories: Dict[str, List[str]],
+        live: Optional[Dict[str, pd.DataFrame]] = None,
+    ):
+        self.table = table
+        self.categories = categories
+        self.live = live or {}
+        self.dates = sorted(set(dates) | set(self.live))
+        coin_names = categories.get("coin", [])
+        codes = np.asarray(table["coin"]) if len(table) else np.array([], dtype=np.int32)
+        # 编码按币种名称排序，窗口内各币种的行连续排列
+        present, starts = np.unique(codes, return_index=True)
+        bounds = list(starts) + [len(table)]
+        self.offsets: Dict[str, Tuple[int, int]] = {
+            coin_names[code]: (int(bounds[k]), int(bounds[k + 1]))
+            for k, code in enumerate(present)
+        }
+        self.columns = [c for c in table.dtype.names if c not in INTERNAL_COLUMNS]
+        for df in self.live.values():
+            self.columns += [str(c) for c in df.columns if str(c) not in self.columns]
+
+    def __len__(self) -> int:
+        return len(self.table) + sum(len(df) for df in self.live.values())
+
+    @property
+    def coins(self) -> List[str]:
+        live_coins = {str(c) for df in self.live.values() for c in df["coin"].dropna().unique()}
+        return sorted(set(self.offsets) | live_coins)
+
+    @classmethod
+    def open(
+        cls,
+        snapshot_dir,
+        dates: List[str],
+        rebuild: bool = False,
+        live_from: Optional[str] = None,
+    ) -> Optional["SnapshotWindow"]:
+        """
+        打开（必要时构建）窗口文件
+
+        Args:
+            snapshot_dir: market_snapshots目录
+            dates: 日期列表（YYYYMMDD，顺序无关）
+            rebuild: 忽略已有窗口文件强制重建
+            live_from: 不小于该日期的快照仍在追加，不进入窗口文件（默认今天）
+
+        Returns:
+            SnapshotWindow；所有日期都没有数据时返回None
+        """
+        snapshot_dir = Path(snapshot_dir)
+        live_from = live_from or datetime.now().strftime("%Y%m%d")
+        sealed = [d for d in sorted(dates) if d < live_from]
+
+        live = {}
+        for date_str in sorted(d for d in dates if d >= live_from):
+            df = _read_day(snapshot_dir, date_str)
+            if df is not None and "coin" in df.columns and len(df):
+                df["coin"] = df["coin"].astype(str)
+                live[date_str] = df
+
+        signature = _source_signature(snapshot_dir, sealed)
+        if not signature:
+            if not live:
+                return None
+            empty = np.empty(0, dtype=[("coin", np.int32), ("_date", np.int32),
+                                       ("_ts", "datetime64[m]"), ("_row", np.int64)])
+            return cls(empty, [], {"coin": []}, live)
+
+        loaded = [entry[0] for entry in signature]
+        window_dir = snapshot_dir / WINDOW_DIR_NAME
+        # 按日期范围命名，不同回看天数的窗口互不覆盖
+        name = f"{loaded[0]}_{loaded[-1]}_{len(loaded)}d"
+        data_path = window_dir / f"{name}.npy"
+        meta_path = window_dir / f"{name}.json"
+
+        if not rebuild and data_path.exists() and meta_path.exists():
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("sources") == signature and "categories" in meta:
+                    table = np.load(data_path, mmap_mode="r", allow_pickle=False)
+                    os.utime(meta_path)  # 记录最近使用时间，供清理判断
+                    return cls(table, loaded, meta["categories"], live)
+            except (OSError, ValueError):
+                pass  # 元数据损坏时重建
+
+        categories = build_window(snapshot_dir, loaded, data_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"sources": signature, "categories": categories}, f, ensure_ascii=False)
+        prune_windows(window_dir, keep=(data_path.name, meta_path.name))
+        table = np.load(data_path, mmap_mode="r", allow_pickle=False)
+        return cls(table, loaded, categories, live)
+
+    def coin_view(self, coin: str, start=None, end=None) -> np.ndarray:
+        """
+        某币种的行（结构化数组视图，不复制；只含窗口文件中的已收盘日期）
+
+        Args:
+            start / end: 可选时间范围[start, end)，datetime64或可被np.datetime64解析的值
+                （time无法解析的行排在当天末尾，按时间范围取时不保证包含它们）
+        """
+        lo, hi = self.offsets.get(coin, (0, 0))
+        if lo == hi or (start is None and end is None):
+            return self.table[lo:hi]
+        ts = self.table["_ts"][lo:hi]
+        if start is not None:
+            lo += int(np.searchsorted(ts, np.datetime64(start, "m"), side="left"))
+        if end is not None:
+            hi = self.offsets[coin][0] + int(np.searchsorted(ts, np.datetime64(end, "m"), side="left"))
+        return self.table[lo:max(lo, hi)]
+
+    def day_view(self, coin: str, date_str: str) -> np.ndarray:
+        """某币种某一天的行（视图；time无法解析的行也在其中；当天的数据不在窗口中）"""
+        lo, hi = self.offsets.get(coin, (0, 0))
+        dates = self.table["_date"][lo:hi]
+        first = int(np.searchsorted(dates, int(date_str), side="left"))
+        last = int(np.searchsorted(dates, int(date_str), side="right"))
+        return self.table[lo + first:lo + last]
+
+    def day_rows(self, date_str: str) -> int:
+        """某天的总行数"""
+        if date_str in self.live:
+            return len(self.live[date_str])
+        return int(np.count_nonzero(self.table["_date"] == int(date_str)))
+
+    def day_coins(self, date_str: str) -> List[str]:
+        """某天出现的币种，按在当天文件中首次出现的顺序（与df["coin"].unique()一致）"""
+        if date_str in self.live:
+            return list(self.live[date_str]["coin"].unique())
+        first_rows = []
+        for coin in self.offsets:
+            rows = self.day_view(coin, date_str)["_row"]
+            if len(rows):
+                first_rows.append((int(rows.min()), coin))
+        return [coin for _, coin in sorted(first_rows)]
+
+    def coin_frame(
+        self,
+        coin: str,
+        date_str: Optional[str] = None,
+        columns: Optional[Iterable[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        某币种（可选限定某天）的DataFrame，index为当天文件中的行号
+
+        只复制这一小段数据；空字符串还原为NaN（与pd.read_csv一致）
+        """
+        columns = self.columns if columns is None else list(columns)
+        if date_str in self.live:
+            return _live_coin_frame(self.live[date_str], coin, date_str, columns)
+        view = self.day_view(coin, date_str) if date_str else self.coin_view(coin)
+        frame = _view_to_frame(view, columns, self.categories)
+        if date_str is None and self.live:
+            parts = [frame] + [
+                _live_coin_frame(df, coin, d, columns) for d, df in sorted(self.live.items())
+            ]
+            frame = pd.concat(parts)
+        return frame
+
+    def to_frame(self, columns: Optional[Iterable[str]] = None, newest_first: bool = True) -> pd.DataFrame:
+        """
+        整个窗口转为一个DataFrame（行顺序与"逐天read_csv后concat"一致）
+
+        附加snapshot_date列（YYYYMMDD）；index为0..n-1
+        逐列按行序取出，不整表复制结构化数组
+        """
+        columns = self.columns if columns is None else list(columns)
+        dates = np.asarray(self.table["_date"])
+        rows = np.asarray(self.table["_row"])
+        day_key = -dates.astype(np.int64) if newest_first else dates.astype(np.int64)
+        order = np.lexsort((rows, day_key))
+
+        data = {}
+        for name in columns:
+            if name not in self.table.dtype.names:
+                continue
+            values = np.asarray(self.table[name])[order]
+            if name in self.categories:
+                values = _decode(values, self.categories[name])
+            data[name] = values
+        sealed = pd.DataFrame(data)
+        sealed["snapshot_date"] = dates[order].astype(str)
+        del data, order
+
+        live = []
+        for date_str, df in sorted(self.live.items(), reverse=newest_first):
+            part = df[[c for c in columns if c in df.columns]].copy()
+            part["snapshot_date"] = date_str
+            live.append(part)
+        if not live:
+            return sealed
+        parts = live + [sealed] if newest_first else [sealed] + live
+        return pd.concat(parts, ignore_index=True)
+
+
+def _view_to_frame(view: np.ndarray, columns: Iterable[str], categories: Dict[str, List[str]]) -> pd.DataFrame:
+    wanted = set(columns)
+    data = {}
+    for name in view.dtype.names:
+        if name not in wanted:
+            continue
+        if name in categories:
+            data[name] = _decode(np.asarray(view[name]), categories[name])
+        else:
+            data[name] = np.array(view[name])
+    return pd.DataFrame(data, index=pd.Index(np.array(view["_row"]), dtype=np.int64))
+
+
+def _live_coin_frame(df: pd.DataFrame, coin: str, date_str: str, columns: List[str]) -> pd.DataFrame:
+    """当天数据中某币种的行，按(时间, 行号)排序（与窗口内的排序一致）"""
+    rows = df[df["coin"] == coin]
+    order = np.lexsort((np.arange(len(rows)), _day_timestamps(rows, date_str)))
+    return rows.iloc[order][[c for c in columns if c in rows.columns]]
+
+
+def prune_windows(window_dir: Path, keep: Iterable[str] = ()) -> int:
+    """删除超过保留期未使用的窗口文件（当前正在使用的窗口不受影响）"""
+    keep = set(keep)
+    cutoff = time.time() - WINDOW_RETENTION_DAYS * 86400
+    removed = 0
+    for old in window_dir.glob("*"):
+        if old.name in keep:
+            continue
+        try:
+            if old.stat().st_mtime < cutoff or old.suffix == ".tmp":
+                old.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def build_window(snapshot_dir: Path, dates: List[str], data_path: Path) -> Dict[str, List[str]]:
+    """
+    构建窗口文件（两遍扫描，每次只持有一天的数据）
+
+    第一遍: 统计列类型、字符串列的类别、每天每币种行数
+    第二遍: 每天按(币种, 时间)排序后写入各币种的区间
+
+    Returns:
+        字符串列的类别表 {列名: [类别...]}（编码即下标）
+    """
+    dates = sorted(dates)
+    kinds: Dict[str, List[str]] = {}
+    values_seen: Dict[str, set] = {}
+    coin_counts: Dict[str, Dict[str, int]] = {}
+    present_days: Dict[str, int] = {}
+    loaded_days = 0
+
+    for date_str in dates:
+        df = _read_day(snapshot_dir, date_str)
+        if df is None or "coin" not in df.columns:
+            continue
+        loaded_days += 1
+        df["coin"] = df["coin"].astype(str)
+        for name in df.columns:
+            kind = _column_kind(df[name])
+            kinds.setdefault(str(name), []).append(kind)
+            present_days[str(name)] = present_days.get(str(name), 0) + 1
+            if kind == "U":
+                values_seen.setdefault(str(name), set()).update(_text_values(df[name]).unique())
+        coin_counts[date_str] = df["coin"].value_counts().to_dict()
+        del df
+
+    # coin列始终按类别编码存储（offsets依赖它）；出现字符串的列的数值也按文本计入类别
+    kinds["coin"] = ["U"]
+    fields = [(name, _merge_kinds(k, present_days[name] == loaded_days)) for name, k in kinds.items()]
+    categories: Dict[str, List[str]] = {}
+    for name, k in kinds.items():
+        if "U" not in k:
+            continue
+        seen = values_seen.get(name, set())
+        if len(set(k)) > 1:
+            continue  # 第二遍补齐数值天的取值
+        categories[name] = sorted(v for v in seen if v != "")
+    mixed = [name for name, k in kinds.items() if "U" in k and len(set(k)) > 1]
+
+    if mixed:
+        # 同一列某些天是数值、某些天是字符串：数值天的取值也需要进入类别
+        for date_str in dates:
+            if date_str not in coin_counts:
+                continue
+            df = _read_day(snapshot_dir, date_str)
+            for name in mixed:
+                if name in df.columns:
+                    values_seen[name].update(_text_values(df[name]).unique())
+            del df
+        for name in mixed:
+            categories[name] = sorted(v for v in values_seen[name] if v != "")
+
+    data_fields = list(fields)
+    fields += [("_date", np.dtype(np.int32)), ("_ts", np.dtype("datetime64[m]")), ("_row", np.dtype(np.int64))]
+    dtype = np.dtype(fields)
+    lookups = {name: {v: i for i, v in enumerate(cats)} for name, cats in categories.items()}
+
+    # 每个币种的起始位置（币种按名称排序，区间内按日期升序）
+    coins = categories["coin"]
+    cursor, position = {}, 0
+    for code, coin in enumerate(coins):
+        cursor[code] = position
+        position += sum(counts.get(coin, 0) for counts in coin_counts.values())
+    total = position
+
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=data_path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        table = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(total,))
+        for date_str in dates:
+            if date_str not in coin_counts:
+                continue
+            df = _read_day(snapshot_dir, date_str)
+            df["coin"] = df["coin"].astype(str)
+            ts = _day_timestamps(df, date_str)
+
+            chunk = np.empty(len(df), dtype=dtype)
+            for name, field_dtype in data_fields:
+                lookup = lookups.get(name)
+                if name in df.columns:
+                    chunk[name] = _fill_column(df[name], field_dtype, lookup)
+                else:
+                    chunk[name] = _missing_value(field_dtype, lookup is not None)
+            chunk["_date"] = int(date_str)
+            chunk["_ts"] = ts
+            chunk["_row"] = np.arange(len(df))
+            chunk = chunk[np.lexsort((chunk["_row"], ts, chunk["coin"]))]
+
+            coin_codes = chunk["coin"]
+            for code in np.unique(coin_codes):
+                rows = chunk[coin_codes == code]
+                start = cursor[int(code)]
+                table[start:start + len(rows)] = rows
+                cursor[int(code)] = start + len(rows)
+            del df, chunk
+        table.flush()
+        del table
+        os.replace(tmp_path, data_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return categories
+
+
+if __name__ == "__main__":
+    """
+    自检：窗口切片与"逐天read_csv + concat + 按币种过滤"结果一致
+    """
+    import resource
+    import shutil
+    import time
+
+    rng = np.random.default_rng(3)
+    tmp_dir = Path(tempfile.mkdtemp(prefix="snapshot_window_"))
+    coins = ["BTC", "ETH", "SOL", "BNB", "XRP", "DOGE"]
+    dates = recent_dates(30)
+    try:
+        for n, date_str in enumerate(dates):
+            rows = []
+            for minute in range(0, 24 * 60, 15):
+                for coin in rng.permutation(coins):
+                    price = 100 + rng.normal()
+                    rows.append({
+                        "time": f"{minute // 60:02d}{minute % 60:02d}",
+                        "coin": coin,
+                        "price": price,
+                        "high": price + rng.random(),
+                        "low": price - rng.random(),
+                        "indicator_consensus": int(rng.integers(0, 5)),
+                        "trend_4h": rng.choice(["多头", "空头", ""]),
+                    })
+            day = pd.DataFrame(rows)
+            if n % 7 == 3:
+                day = day.drop(columns=["indicator_consensus"])  # 某天缺列
+            day.to_csv(tmp_dir / f"{date_str}.csv", index=False)
+
+        for days in (7, 14, 30):
+            t0 = time.time()
+            window = SnapshotWindow.open(tmp_dir, dates[:days])
+            t_build = time.time() - t0
+            for date_str in dates[:days]:
+                reference = pd.read_csv(tmp_dir / f"{date_str}.csv", dtype={"time": str})
+                assert window.day_coins(date_str) == list(reference["coin"].unique())
+                for coin in window.day_coins(date_str):
+                    expected = reference[reference["coin"] == coin].sort_values("time", kind="stable")
+                    actual = window.coin_frame(coin, date_str, expected.columns)
+                    pd.testing.assert_frame_equal(
+                        actual[expected.columns], expected,
+                        check_dtype=False, check_index_type=False,
+                    )
+            view = window.coin_view("BTC")
+            assert np.shares_memory(view, window.table), "coin_view应为零拷贝视图"
+            assert dates[0] in window.live, "当天数据不应进入窗口文件"
+
+            reference = []
+            for date_str in dates[:days]:
+                day = pd.read_csv(tmp_dir / f"{date_str}.csv", dtype={"time": str})
+                day["snapshot_date"] = date_str
+                reference.append(day)
+            reference = pd.concat(reference, ignore_index=True)
+            pd.testing.assert_frame_equal(
+                window.to_frame()[reference.columns], reference, check_dtype=False,
+            )
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"✅ {days}天: {len(window)}行, 构建 {t_build:.2f}s, 峰值RSS {rss_mb:.0f}MB")
+
+        window_files = sorted(p.name for p in (tmp_dir / WINDOW_DIR_NAME).glob("*.npy"))
+        assert len(window_files) == 3, f"不同范围的窗口应各自保留: {window_files}"
+
+        # 当天文件追加后不重建窗口（只重新读当天）
+        today_file = tmp_dir / f"{dates[0]}.csv"
+        extra = pd.read_csv(today_file, dtype={"time": str}).tail(6).assign(time="2359")
+        extra.to_csv(today_file, mode="a", header=False, index=False)
+        built = {p.name: p.stat().st_mtime_ns for p in (tmp_dir / WINDOW_DIR_NAME).glob("*.npy")}
+        t0 = time.time()
+        window = SnapshotWindow.open(tmp_dir, dates[:30])
+        after = {p.name: p.stat().st_mtime_ns for p in (tmp_dir / WINDOW_DIR_NAME).glob("*.npy")}
+        assert after == built, "当天数据变化不应触发窗口重建"
+        assert window.coin_frame("BTC", dates[0])["time"].iloc[-1] == "2359"
+        print(f"✅ 复用已构建窗口（当天数据已追加）: {time.time() - t0:.3f}s")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.27】AI投资组合决策的流式调用
+
+核心功能:
+1. IncrementalActionParser: 模型输出边到达边扫描，"actions"数组里每个对象一闭合就解析出来，
+   不必等完整响应再找首尾大括号
+2. StreamingDecisionCall: 后台线程消费stream=True的响应，主线程从队列中逐个取出已完成的action
+   （平仓等需要在主线程执行的操作可以在模型仍在输出时开始）
+3. 记录延迟：首token、首个正文字符、首个action、完成时间
+
+完整响应仍由调用方按原逻辑整体解析（含截断修复、V8.8解析器），流式解析出的action只用于提前执行。
+"""
+
+import json
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f]")
+
+
+def _strip_line_comments(text: str) -> str:
+    """去掉字符串外的//注释（提示词示例中带注释，模型偶尔照抄）"""
+    if "//" not in text:
+        return text
+    out = []
+    in_string = escape = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            if newline == -1:
+                break
+            i = newline
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def parse_action_text(text: str) -> Optional[Dict]:
+    """单个action对象文本 → dict；无法解析时返回None（交给完整响应解析）"""
+    try:
+        action = json.loads(_strip_line_comments(_CONTROL_CHARS.sub("", text)))
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return action if isinstance(action, dict) else None
+
+
+class IncrementalActionParser:
+    """
+    增量扫描JSON文本，提取顶层对象中key数组（默认"actions"）的每个元素
+
+    逐字符维护字符串/转义/嵌套深度状态，每个字符只扫描一次；
+    JSON之前的说明文字或```json标记会被跳过（从第一个"{"开始）
+    """
+
+    def __init__(self, key: str = "actions"):
+        self.key = key
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None  # 目标数组内部的深度
+        self._element_start = -1
+        self._done = False
+        self.parsed: List[Dict] = []
+        self.failed = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """追加一段文本，返回本次新解析完成的action列表"""
+        if not chunk or self._done:
+            return []
+        self._text += chunk
+        text = self._text
+        new_actions = []
+
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1 : i]
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (
+                    ch == "["
+                    and self._depth == 1
+                    and self._array_depth is None
+                    and self._last_key == self.key
+                ):
+                    self._array_depth = 2
+                elif ch == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if (
+                    ch == "}"
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth
+                    and self._element_start >= 0
+                ):
+                    action = parse_action_text(text[self._element_start : i + 1])
+                    self._element_start = -1
+                    if action is None:
+                        self.failed += 1
+                    else:
+                        self.parsed.append(action)
+                        new_actions.append(action)
+                elif ch == "]" and self._array_depth is not None and self._depth == 1:
+                    self._done = True  # actions数组结束，后面的字段不再关心
+                    break
+                if self._depth == 0:
+                    self._done = True
+                    break
+            i += 1
+
+        # 已扫描且不再需要的前缀丢弃（进行中的字符串/元素从起点保留）
+        keep_from = i
+        if self._in_string:
+            keep_from = min(keep_from, self._string_start)
+        if self._element_start >= 0:
+            keep_from = min(keep_from, self._element_start)
+        if keep_from > 0:
+            self._text = text[keep_from:]
+            self._string_start -= keep_from
+            if self._element_start >= 0:
+                self._element_start -= keep_from
+        self._pos = i - keep_from
+        return new_actions
+
+
+class StreamingDecisionCall:
+    """
+    后台线程流式调用chat.completions，主线程通过actions()逐个取得已闭合的action
+
+    用法:
+        call = StreamingDecisionCall(client, {"model": ..., "messages": ..., "max_tokens": ...})
+        call.start()
+        for action in call.actions():
+            ...  # 模型仍在输出时即可处理
+        text, finish_reason = call.result()
+    """
+
+    def __init__(
+        self,
+        client,
+        request: Dict,
+        on_content_start: Optional[Callable[[], None]] = None,
+    ):
+        self.client = client
+        self.request = dict(request, stream=True)
+        self.on_content_start = on_content_start
+
+        self.parser = IncrementalActionParser()
+        self._queue: "queue.Queue[Tuple[str, object]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._parts: List[str] = []
+        self._finish_reason: Optional[str] = None
+        self._error: Optional[BaseException] = None
+
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None  # 含思考模式的reasoning_content
+        self.first_content_at: Optional[float] = None
+        self.first_action_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="ai-decision-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            stream = self.client.chat.completions.create(**self.request)
+            for chunk in stream:
+                if not getattr(chunk, "choices", None):
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                if self.first_token_at is None and (
+                    getattr(delta, "reasoning_content", None) or getattr(delta, "content", None)
+                ):
+                    self.first_token_at = time.time()
+
+                content = getattr(delta, "content", None)
+                if content:
+                    if self.first_content_at is None:
+                        self.first_content_at = time.time()
+                        if self.on_content_start is not None:
+                            try:
+                                self.on_content_start()
+                            except Exception as e:
+                                print(f"⚠️ [流式决策] 正文开始回调失败: {e}")
+                    self._parts.append(content)
+                    for action in self.parser.feed(content):
+                        if self.first_action_at is None:
+                            self.first_action_at = time.time()
+                        self._queue.put(("action", action))
+
+                if choice.finish_reason:
+                    self._finish_reason = choice.finish_reason
+        except BaseException as e:  # 交给主线程在result()中重新抛出
+            self._error = e
+        finally:
+            self.finished_at = time.time()
+            self._queue.put(("done", None))
+
+    def actions(self) -> Iterator[Dict]:
+        """按到达顺序产出已解析的action，流结束后返回"""
+        while True:
+            kind, payload = self._queue.get()
+            if kind == "done":
+                return
+            yield payload
+
+    def result(self) -> Tuple[str, Optional[str]]:
+        """等待流结束，返回(完整正文, finish_reason)；流式调用出错时抛出原异常"""
+        if self._thread is not None:
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return "".join(self._parts), self._finish_reason
+
+    @property
+    def emitted_actions(self) -> int:
+        return len(self.parser.parsed)
+
+    def latency(self) -> Dict[str, Optional[float]]:
+        """相对调用开始的秒数（未发生的为None）"""
+
+        def since(ts):
+            return None if ts is None or self.started_at is None else ts - self.started_at
+
+        return {
+            "first_token": since(self.first_token_at),
+            "first_content": since(self.first_content_at),
+            "first_action": since(self.first_action_at),
+            "total": since(self.finished_at),
+        }
+
+    def format_latency(self) -> str:
+        def fmt(value):
+            return "-" if value is None else f"{value:.1f}s"
+
+        lat = self.latency()
+        return (
+            f"⏱️ [流式决策] 首token {fmt(lat['first_token'])} / 首个正文 {fmt(lat['first_content'])} / "
+            f"首个动作 {fmt(lat['first_action'])} / 完成 {fmt(lat['total'])} "
+            f"（流式解析{self.emitted_actions}个动作"
+            + (f"，{self.parser.failed}个留待整体解析" if self.parser.failed else "")
+            + "）"
+        )
+
+
+if __name__ == "__main__":
+    """
+    自检：任意切块喂入时增量解析结果与整体解析一致；模拟流式响应的线程/队列/延迟记录
+    """
+    import random
+    from types import SimpleNamespace
+
+    decision = {
+        "思考过程": "BTC {多头} 结构, \"引号\" 与 [括号] 不影响解析",
+        "analysis": "actions: [不是数组]",
+        "actions": [
+            {"symbol": "BTC/USDT:USDT", "action": "CLOSE", "reason": "跌破{支撑}"},
+            {"symbol": "ETH/USDT:USDT", "action": "OPEN_LONG", "exit_plan": {"a": [1, 2, {"b": "}"}]}},
+            {"symbol": "SOL/USDT:USDT", "action": "HOLD", "reason": "观望\\n"},
+        ],
+        "risk_assessment": "低",
+    }
+    body = json.dumps(decision, ensure_ascii=False, indent=2)
+    body = body.replace('"HOLD",', '"HOLD",  // 示例注释', 1)
+    text = "好的，以下是决策：\n```json\n" + body + "\n```"
+    expected = decision["actions"]
+
+    rng = random.Random(3)
+    for _ in range(200):
+        parser = IncrementalActionParser()
+        got = []
+        pos = 0
+        while pos < len(text):
+            step = rng.randint(1, 12)
+            got.extend(parser.feed(text[pos : pos + step]))
+            pos += step
+        assert got == expected, got
+
+    class _FakeCompletions:
+        def create(self, **kwargs):
+            assert kwargs["stream"] is True
+            chunks = [SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(reasoning_content="思考...", content=None), finish_reason=None)])]
+            for i in range(0, len(text), 7):
+                chunks.append(SimpleNamespace(choices=[SimpleNamespace(
+                    delta=SimpleNamespace(content=text[i : i + 7]), finish_reason=None)]))
+            chunks.append(SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=None), finish_reason="stop")]))
+            chunks.append(SimpleNamespace(choices=[]))
+            for chunk in chunks:
+                time.sleep(0.001)
+                yield chunk
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions()))
+    started = []
+    call = StreamingDecisionCall(client, {"model": "x", "messages": []}, on_content_start=lambda: started.append(1))
+    call.start()
+    streamed = list(call.actions())
+    full_text, finish_reason = call.result()
+    assert streamed == expected
+    assert full_text == text and finish_reason == "stop" and started == [1]
+    lat = call.latency()
+    assert lat["first_token"] <= lat["first_content"] <= lat["first_action"] <= lat["total"]
+    print(call.format_latency())
+    print("✅ 流式决策解析自检通过")
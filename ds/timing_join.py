@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.24】开平仓时机分析的时间索引连接层
+
+核心功能:
+1. TimeIndex: 交易/市场快照/K线按币种分组、按时间排序一次，
+   时间窗口匹配（±5分钟开仓、平仓后4小时K线）= 二分查找，O(log n + k)
+2. DecisionTimeIndex: AI决策时间戳只解析一次，最近决策为as-of最近邻查找，
+   同时给出决策记录的最早/最晚时间
+
+替代entry_exit_timing_analyzer_v2中"每个机会重新扫描交易表、每个错过的机会重新解析全部AI决策时间"
+的嵌套循环，匹配结果（含同距离时取列表中靠前的决策）与原逐条比较一致。
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _to_ns(values) -> Tuple[np.ndarray, np.ndarray]:
+    """时间序列 → (int64纳秒数组, 有效掩码)"""
+    index = pd.DatetimeIndex(values)
+    if hasattr(index, "as_unit"):
+        index = index.as_unit("ns")
+    return index.asi8, ~np.asarray(index.isna())
+
+
+def _ns(value) -> int:
+    return pd.Timestamp(value).value
+
+
+class TimeIndex:
+    """
+    DataFrame按key列分组、按时间列排序的窗口索引
+
+    rows/positions返回的行保持原DataFrame顺序（与布尔筛选df[mask]一致），
+    时间无法解析（NaT）或key为空的行不参与匹配
+    """
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        time_column: str,
+        key_column: str,
+        parse: Callable = pd.to_datetime,
+    ):
+        self.frame = frame
+        times, valid = _to_ns(parse(frame[time_column]))
+        keys = frame[key_column].to_numpy()
+
+        positions = np.flatnonzero(valid)
+        order = positions[np.argsort(times[positions], kind="stable")]
+        self._groups: Dict = {}
+        for key, idx in pd.Series(keys[order]).groupby(keys[order], sort=False).indices.items():
+            rows = order[idx]
+            self._groups[key] = (times[rows], rows)
+
+    def positions(
+        self,
+        key,
+        start,
+        end,
+        include_start: bool = True,
+        include_end: bool = True,
+    ) -> np.ndarray:
+        """key在[start, end]（端点可选开闭）内的行号（iloc位置，升序）"""
+        group = self._groups.get(key)
+        if group is None:
+            return np.empty(0, dtype=np.int64)
+        times, rows = group
+        lo = np.searchsorted(times, _ns(start), side="left" if include_start else "right")
+        hi = np.searchsorted(times, _ns(end), side="right" if include_end else "left")
+        return np.sort(rows[lo:hi])
+
+    def rows(self, key, start, end, include_start: bool = True, include_end: bool = True) -> pd.DataFrame:
+        return self.frame.iloc[self.positions(key, start, end, include_start, include_end)]
+
+
+class DecisionTimeIndex:
+    """AI决策记录的时间索引（timestamp字段只解析一次）"""
+
+    def __init__(self, decisions: List[Dict]):
+        self.decisions = decisions
+        parsed = []  # (时间, 列表下标)
+        all_parsed = True
+        for i, decision in enumerate(decisions):
+            timestamp = decision.get("timestamp", "")
+            if not timestamp:
+                continue
+            try:
+                parsed.append((pd.to_datetime(timestamp), i))
+            except (ValueError, TypeError):
+                all_parsed = False
+
+        # 与原逻辑一致：任何一条解析失败时不判断AI运行时间范围
+        stamps = [ts for ts, _ in parsed]
+        self.earliest = min(stamps) if all_parsed and stamps else None
+        self.latest = max(stamps) if all_parsed and stamps else None
+
+        valid = [(ts.value, i) for ts, i in parsed if not pd.isna(ts)]
+        valid.sort()
+        self._times = np.array([t for t, _ in valid], dtype=np.int64)
+        self._order = [i for _, i in valid]
+
+    def closest(self, when, max_seconds: float) -> Tuple[Optional[Dict], float]:
+        """
+        时间差严格小于max_seconds的最近决策
+
+        Returns:
+            (decision, 时间差秒数)；没有时为(None, inf)。同距离时取列表中靠前的决策
+        """
+        times = self._times
+        if len(times) == 0:
+            return None, float("inf")
+
+        target = _ns(when)
+        pos = int(np.searchsorted(times, target))
+        nearest = min(
+            abs(int(times[p]) - target) for p in (pos - 1, pos) if 0 <= p < len(times)
+        )
+        if nearest / 1e9 >= max_seconds:
+            return None, float("inf")
+
+        candidates = []
+        for value in {target - nearest, target + nearest}:
+            first = int(np.searchsorted(times, value, side="left"))
+            if first < len(times) and times[first] == value:
+                candidates.append(self._order[first])
+        return self.decisions[min(candidates)], nearest / 1e9
+
+
+if __name__ == "__main__":
+    """
+    对照测试：时间索引匹配 vs 原逐条布尔筛选/逐条比较
+    """
+    from datetime import timedelta
+
+    rng = np.random.default_rng(4)
+    coins = ["BTC", "ETH", "SOL", "BNB"]
+    base = pd.Timestamp("2025-11-11")
+
+    trades = pd.DataFrame({
+        "币种": rng.choice(coins, 300),
+        "开仓时间": [str(base + pd.Timedelta(minutes=int(m))) for m in rng.integers(0, 1440, 300)],
+    })
+    trade_index = TimeIndex(trades, "开仓时间", "币种")
+
+    decisions = [
+        {"timestamp": str(base + pd.Timedelta(minutes=int(m)))} for m in rng.integers(0, 1440, 200)
+    ]
+    decisions.insert(50, {"timestamp": ""})
+    decision_index = DecisionTimeIndex(decisions)
+
+    for _ in range(500):
+        coin = coins[int(rng.integers(0, len(coins)))]
+        when = base + pd.Timedelta(minutes=float(rng.uniform(-60, 1500)))
+
+        expected = trades[
+            (trades["币种"] == coin)
+            & (pd.to_datetime(trades["开仓时间"]) >= when - timedelta(minutes=5))
+            & (pd.to_datetime(trades["开仓时间"]) <= when + timedelta(minutes=5))
+        ]
+        got = trade_index.rows(coin, when - timedelta(minutes=5), when + timedelta(minutes=5))
+        assert list(got.index) == list(expected.index)
+
+        closest, min_diff = None, float("inf")
+        for decision in decisions:
+            if decision["timestamp"]:
+                diff = abs((pd.to_datetime(decision["timestamp"]) - when).total_seconds())
+                if diff < 7200 and diff < min_diff:
+                    closest, min_diff = decision, diff
+        got_decision, got_diff = decision_index.closest(when, 7200)
+        assert got_decision is closest and (closest is None or np.isclose(got_diff, min_diff))
+
+    print("✅ 时间索引匹配与逐条筛选一致")
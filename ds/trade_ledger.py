@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+【V8.9.12】交易账本（SQLite WAL）
+
+核心功能:
+1. trades_history.db：每笔交易一行，开仓=INSERT、平仓=UPDATE，单个事务完成，
+   不再"加锁 → 复制备份 → pandas读全表 → concat → 写临时文件 → rename"
+2. (币种, 方向)上对未平仓记录建部分索引，查持仓对应的开仓信息为一次索引查询，
+   get_all_positions不再为每个持仓重读一遍CSV
+3. trades_history.csv保留为导出视图（其他函数、Flask看板、修复脚本仍读CSV）：
+   - deferred（默认）：开仓直接追加一行；平仓/修改只标记待导出，
+     TRADE_LEDGER_CSV_FLUSH_SECONDS秒内的多次改动合并为一次重写，交易循环结束和进程退出时也会导出
+   - sync：每次写入后整表重写
+   - off：关闭自动导出、需要时手动导出
+   写入期间持有trades_history.csv.lock的fcntl排他锁（与修复脚本等外部写入方互斥）
+4. 首次使用时从已有CSV导入；CSV被外部脚本改写（大小/修改时间与上次导出不同）时自动重新导入，
+   修复脚本的改动以CSV为准；此时账本还有未导出的改动（deferred）则合并：以CSV为准，
+   未导出的行按(开仓时间, 币种, 方向)的第n次出现覆盖回CSV中对应的行，找不到的追加
+5. 进程内直接读CSV的地方用read_trades_csv：读之前先导出本进程账本待导出的改动
+
+用法:
+    python3 trade_ledger.py export [deepseek|qwen]   # 手动导出CSV视图
+    python3 trade_ledger.py import [deepseek|qwen]   # 强制从CSV重新导入
+    python3 trade_ledger.py                          # 自检
+"""
+
+import atexit
+import csv
+import math
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内线程锁
+    fcntl = None
+
+TRADE_LEDGER_CSV_EXPORT = os.getenv("TRADE_LEDGER_CSV_EXPORT", "deferred").lower()
+TRADE_LEDGER_CSV_FLUSH_SECONDS = float(os.getenv("TRADE_LEDGER_CSV_FLUSH_SECONDS", "5"))
+
+# 标准列顺序（与save_open_position的STANDARD_COLUMNS一致）
+TRADE_COLUMNS = [
+    "开仓时间",
+    "平仓时间",
+    "币种",
+    "方向",
+    "数量",
+    "开仓价格",
+    "平仓价格",
+    "仓位(U)",
+    "杠杆率",
+    "止损",
+    "止盈",
+    "盈亏比",
+    "盈亏(U)",
+    "开仓理由",
+    "平仓理由",
+    "信号分数",
+    "共振指标数",
+]
+
+_COLUMN_SQL = ", ".join(f'"{c}"' for c in TRADE_COLUMNS)
+_PLACEHOLDERS = ", ".join("?" for _ in TRADE_COLUMNS)
+
+
+def _clean(value):
+    """pandas/numpy值 → SQLite可存的Python值（NaN/NA → NULL）"""
+    if value is None:
+        return None
+    if hasattr(value, "item"):  # numpy标量
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    try:
+        import pandas as pd
+
+        if value is pd.NA or value is pd.NaT:
+            return None
+    except ImportError:
+        pass
+    return value
+
+
+def _csv_signature(path: Path) -> str:
+    try:
+        stat = path.stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return ""
+
+
+class TradeLedger:
+    """
+    交易账本（一个模型一个实例，线程安全）
+
+    用法:
+        ledger = get_ledger(TRADES_FILE)
+        ledger.record_open(trade_info)
+        ledger.record_close("BTC", "多", close_time, close_price, pnl, reason)
+        row = ledger.open_trade("BTC", "多")
+    """
+
+    def __init__(self, csv_path, db_path=None):
+        self.csv_path = Path(csv_path)
+        self.db_path = Path(db_path) if db_path else self.csv_path.with_suffix(".db")
+        self.lock_path = self.csv_path.parent / f"{self.csv_path.name}.lock"
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_handle = None
+        self._csv_dirty = False
+        self._dirty_ids = set()  # 未导出的改动涉及的记录id（外部改写CSV时合并用）
+        self._flush_timer: Optional[threading.Timer] = None
+        self._conn = sqlite3.connect(
+            str(self.db_path), timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f'"{c}"' for c in TRADE_COLUMNS)
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS trades (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, {columns}
+            );
+            CREATE INDEX IF NOT EXISTS idx_trades_open
+                ON trades ("币种", "方向") WHERE "平仓时间" IS NULL;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self.sync_from_csv()
+
+    @contextmanager
+    def _file_lock(self):
+        """线程锁 + CSV的fcntl排他锁（同一线程可重入）"""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+                self._lock_handle = open(self.lock_path, "w")
+                fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_handle is not None:
+                    fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_UN)
+                    self._lock_handle.close()
+                    self._lock_handle = None
+
+    # ---------- 元数据 ----------
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    # ---------- CSV同步 ----------
+    def sync_from_csv(self, force: bool = False) -> bool:
+        """
+        CSV与上次导出不一致（首次使用或被外部改写）时，以CSV为准重新导入
+
+        账本还有未导出的改动时不丢弃：合并后仍标记待导出（见模块说明第4条）；force=True直接以CSV为准
+        """
+        with self._file_lock():
+            signature = _csv_signature(self.csv_path)
+            if not force and (not signature or signature == self._meta("csv_signature")):
+                return False
+            if not self.csv_path.exists():
+                return False
+
+            import pandas as pd
+
+            df = pd.read_csv(self.csv_path, encoding="utf-8")
+            df.columns = df.columns.str.strip().str.replace("\ufeff", "")
+            df = df.reindex(columns=TRADE_COLUMNS).dropna(how="all")
+            rows = [tuple(_clean(v) for v in row) for row in df.itertuples(index=False)]
+            merge = self._csv_dirty and not force
+            pending = self._merge_pending(rows) if merge else set()
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM trades")
+                dirty_ids = set()
+                for position, values in enumerate(rows):
+                    cursor = self._conn.execute(
+                        f"INSERT INTO trades ({_COLUMN_SQL}) VALUES ({_PLACEHOLDERS})", values
+                    )
+                    if position in pending:
+                        dirty_ids.add(cursor.lastrowid)
+                self._set_meta("csv_signature", signature)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._dirty_ids = dirty_ids
+            self._csv_dirty = bool(dirty_ids)
+            if merge:
+                print(
+                    f"  📒 CSV已被外部改写，与账本未导出的{len(pending)}条改动合并: "
+                    f"{len(rows)}条 → {self.db_path.name}"
+                )
+            else:
+                print(f"  📒 交易账本已从CSV导入: {len(rows)}条 → {self.db_path.name}")
+            return True
+
+    def _merge_pending(self, rows: List[tuple]) -> set:
+        """
+        把账本未导出的记录合并进外部CSV的行（原地修改rows），返回来自账本的行位置
+
+        记录按(开仓时间, 币种, 方向)的第n次出现对应（分批平仓的剩余仓位与原记录键相同，按出现顺序区分）
+        """
+        open_time, coin, side = (TRADE_COLUMNS.index(c) for c in ("开仓时间", "币种", "方向"))
+        positions = {}
+        seen: Dict[tuple, int] = {}
+        for position, values in enumerate(rows):
+            key = (values[open_time], values[coin], values[side])
+            positions[(key, seen.get(key, 0))] = position
+            seen[key] = seen.get(key, 0) + 1
+
+        pending = set()
+        seen = {}
+        for row in self._conn.execute(f"SELECT id, {_COLUMN_SQL} FROM trades ORDER BY id"):
+            values = tuple(row[c] for c in TRADE_COLUMNS)
+            key = (values[open_time], values[coin], values[side])
+            occurrence = seen.get(key, 0)
+            seen[key] = occurrence + 1
+            if row["id"] not in self._dirty_ids:
+                continue
+            position = positions.get((key, occurrence))
+            if position is None:
+                position = len(rows)
+                rows.append(values)
+            else:
+                rows[position] = values
+            pending.add(position)
+        return pending
+
+    def export_csv(self, path=None) -> int:
+        """导出CSV视图（原子替换），返回行数"""
+        with self._file_lock():
+            target = Path(path) if path else self.csv_path
+            temp_file = target.parent / f"{target.name}.tmp"
+            rows = self._conn.execute(f"SELECT {_COLUMN_SQL} FROM trades ORDER BY id").fetchall()
+            with open(temp_file, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(TRADE_COLUMNS)
+                for row in rows:
+                    writer.writerow(["" if v is None else v for v in row])
+            temp_file.replace(target)
+            if target == self.csv_path:
+                self._set_meta("csv_signature", _csv_signature(target))
+                self._csv_dirty = False
+                self._dirty_ids.clear()
+            return len(rows)
+
+    def flush_csv(self) -> bool:
+        """有待导出的改动时重写CSV视图（CSV在此期间被外部改写过则先合并，不覆盖修复脚本的改动）"""
+        with self._file_lock():
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._csv_dirty:
+                return False
+            self.sync_from_csv()
+            self.export_csv()
+            return True
+
+    def _append_csv(self, values) -> bool:
+        """开仓记录直接追加到CSV末尾（CSV与上次导出一致时），否则返回False"""
+        signature = _csv_signature(self.csv_path)
+        if self._csv_dirty or not signature or signature != self._meta("csv_signature"):
+            return False
+        with open(self.csv_path, "a", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(["" if v is None else v for v in values])
+        self._set_meta("csv_signature", _csv_signature(self.csv_path))
+        return True
+
+    def _after_write(self, row_ids, appended_values=None):
+        if TRADE_LEDGER_CSV_EXPORT == "sync":
+            self.export_csv()
+        elif TRADE_LEDGER_CSV_EXPORT == "deferred":
+            if appended_values is not None and self._append_csv(appended_values):
+                return
+            self._csv_dirty = True
+            self._dirty_ids.update(row_ids)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(TRADE_LEDGER_CSV_FLUSH_SECONDS, self.flush_csv)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    # ---------- 写入 ----------
+    def record_open(self, trade_info: Dict) -> int:
+        """记录开仓（只保留标准列），返回记录id"""
+        values = tuple(_clean(trade_info.get(c)) for c in TRADE_COLUMNS)
+        with self._file_lock():
+            self.sync_from_csv()
+            cursor = self._conn.execute(
+                f"INSERT INTO trades ({_COLUMN_SQL}) VALUES ({_PLACEHOLDERS})", values
+            )
+            self._after_write([cursor.lastrowid], appended_values=values)
+            return cursor.lastrowid
+
+    def record_close(
+        self, coin, side, close_time, close_price, pnl, close_reason, close_pct=100
+    ) -> Optional[Dict]:
+        """
+        平仓：更新该币种该方向最后一条未平仓记录
+
+        分批平仓（close_pct < 100）时，当前记录代表平掉的部分，另插入一条未平仓记录代表剩余仓位。
+
+        Returns:
+            被平仓的原记录；没有未平仓记录时返回None
+        """
+        with self._file_lock():
+            self.sync_from_csv()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._last_open_row(coin, side)
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+
+                self._conn.execute(
+                    'UPDATE trades SET "平仓时间" = ?, "平仓价格" = ?, "盈亏(U)" = ?, "平仓理由" = ? '
+                    "WHERE id = ?",
+                    (_clean(close_time), _clean(close_price), _clean(pnl), _clean(close_reason), row["id"]),
+                )
+                row_ids = [row["id"]]
+                if close_pct < 100:
+                    remaining = {c: row[c] for c in TRADE_COLUMNS}
+                    for column in ("平仓时间", "平仓价格", "盈亏(U)", "平仓理由"):
+                        remaining[column] = None
+                    remaining["开仓理由"] = f"{row['开仓理由'] or ''} [剩余{100 - close_pct:.0f}%]"
+                    cursor = self._conn.execute(
+                        f"INSERT INTO trades ({_COLUMN_SQL}) VALUES ({_PLACEHOLDERS})",
+                        tuple(remaining[c] for c in TRADE_COLUMNS),
+                    )
+                    row_ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._after_write(row_ids)
+            return {c: row[c] for c in TRADE_COLUMNS}
+
+    def update_open_trade(self, coin, side, updates: Dict) -> Optional[Dict]:
+        """更新最后一条未平仓记录的部分字段（只接受标准列），返回更新前的记录"""
+        updates = {c: _clean(v) for c, v in updates.items() if c in TRADE_COLUMNS}
+        with self._file_lock():
+            self.sync_from_csv()
+            row = self._last_open_row(coin, side)
+            if row is None:
+                return None
+            if updates:
+                assignments = ", ".join(f'"{c}" = ?' for c in updates)
+                self._conn.execute(
+                    f"UPDATE trades SET {assignments} WHERE id = ?",
+                    (*updates.values(), row["id"]),
+                )
+                self._after_write([row["id"]])
+            return {c: row[c] for c in TRADE_COLUMNS}
+
+    # ---------- 查询 ----------
+    def _last_open_row(self, coin, side) -> Optional[sqlite3.Row]:
+        return self._conn.execute(
+            'SELECT * FROM trades WHERE "币种" = ? AND "方向" = ? AND "平仓时间" IS NULL '
+            "ORDER BY id DESC LIMIT 1",
+            (coin, side),
+        ).fetchone()
+
+    def open_trade(self, coin, side) -> Optional[Dict]:
+        """该币种该方向最后一条未平仓记录（走部分索引）"""
+        with self._lock:
+            self.sync_from_csv()
+            row = self._last_open_row(coin, side)
+            return {c: row[c] for c in TRADE_COLUMNS} if row else None
+
+    def open_trades(self) -> List[Dict]:
+        """全部未平仓记录（按写入顺序）"""
+        with self._lock:
+            self.sync_from_csv()
+            rows = self._conn.execute(
+                f'SELECT {_COLUMN_SQL} FROM trades WHERE "平仓时间" IS NULL ORDER BY id'
+            ).fetchall()
+            return [dict(zip(TRADE_COLUMNS, row)) for row in rows]
+
+    def recent_closed(self, coin, side, limit: int = 3) -> List[Dict]:
+        """该币种该方向最近limit条已平仓记录（按写入顺序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {_COLUMN_SQL} FROM trades WHERE "币种" = ? AND "方向" = ? '
+                'AND "平仓时间" IS NOT NULL ORDER BY id DESC LIMIT ?',
+                (coin, side, limit),
+            ).fetchall()
+            return [dict(zip(TRADE_COLUMNS, row)) for row in reversed(rows)]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+
+
+_LEDGERS: Dict[str, TradeLedger] = {}
+_LEDGERS_LOCK = threading.Lock()
+
+
+def get_ledger(csv_path) -> TradeLedger:
+    """按CSV路径复用TradeLedger实例"""
+    key = str(Path(csv_path).resolve())
+    with _LEDGERS_LOCK:
+        if key not in _LEDGERS:
+            _LEDGERS[key] = TradeLedger(csv_path)
+        return _LEDGERS[key]
+
+
+def flush_trade_ledgers() -> int:
+    """导出所有账本待导出的CSV改动（交易循环结束、进程退出时调用），返回导出的账本数"""
+    with _LEDGERS_LOCK:
+        ledgers = list(_LEDGERS.values())
+    flushed = 0
+    for ledger in ledgers:
+        try:
+            flushed += ledger.flush_csv()
+        except Exception as e:
+            print(f"⚠️ 交易账本CSV导出失败 {ledger.csv_path}: {e}")
+    return flushed
+
+
+def read_trades_csv(csv_path, **read_csv_kwargs):
+    """
+    pd.read_csv读交易记录CSV（参数原样传入），读之前先导出本进程账本待导出的改动
+
+    deferred模式下平仓/修改最多延迟TRADE_LEDGER_CSV_FLUSH_SECONDS秒才写入CSV，
+    同一进程里直接读CSV的统计函数要经过这里，否则会读到平仓前的旧数据
+    """
+    import pandas as pd
+
+    with _LEDGERS_LOCK:
+        ledger = _LEDGERS.get(str(Path(csv_path).resolve()))
+    if ledger is not None:
+        ledger.flush_csv()
+    return pd.read_csv(csv_path, **read_csv_kwargs)
+
+
+atexit.register(flush_trade_ledgers)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        _self_check()
+        return
+    if args[0] not in ("export", "import"):
+        print(__doc__)
+        sys.exit(1)
+
+    models = args[1:] or ["deepseek", "qwen"]
+    for model in models:
+        csv_path = Path(__file__).parent / "trading_data" / model / "trades_history.csv"
+        if not csv_path.parent.exists():
+            print(f"⚠️  {model}: 未找到 {csv_path.parent}")
+            continue
+        ledger = get_ledger(csv_path)
+        if args[0] == "import":
+            ledger.sync_from_csv(force=True)
+        else:
+            print(f"✓ {model}: 导出{ledger.export_csv()}条 → {csv_path}")
+
+
+def _self_check():
+    """
+    自检：与旧版pandas读改写逻辑结果一致，CSV导出合并进行，
+    外部进程持有CSV锁时写入等待，外部改写CSV后自动重新导入（有未导出改动时合并）
+    """
+    import shutil
+    import tempfile
+    import time
+
+    import pandas as pd
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="trade_ledger_"))
+    try:
+        legacy_csv = tmp_dir / "legacy.csv"
+        ledger_csv = tmp_dir / "trades_history.csv"
+
+        def legacy_open(info):
+            df_new = pd.DataFrame([info]).reindex(columns=TRADE_COLUMNS)
+            if legacy_csv.exists():
+                df_old = pd.read_csv(legacy_csv).reindex(columns=TRADE_COLUMNS)
+                df_new = pd.concat([df_old.dropna(how="all"), df_new.dropna(how="all")], ignore_index=True)
+            df_new.to_csv(legacy_csv, index=False)
+
+        def legacy_close(coin, side, close_time, price, pnl, reason, pct=100):
+            df = pd.read_csv(legacy_csv)
+            rows = df[(df["币种"] == coin) & (df["方向"] == side) & (df["平仓时间"].isna())]
+            if rows.empty:
+                return
+            last = rows.index[-1]
+            original = df.loc[last].copy()
+            for column, value in (("平仓时间", close_time), ("平仓价格", price), ("盈亏(U)", pnl), ("平仓理由", reason)):
+                df[column] = df[column].astype(object)
+                df.at[last, column] = value
+            if pct < 100:
+                remaining = original.copy()
+                for column in ("平仓时间", "平仓价格", "盈亏(U)", "平仓理由"):
+                    remaining[column] = pd.NA
+                remaining["开仓理由"] = original["开仓理由"] + f" [剩余{100 - pct:.0f}%]"
+                df = pd.concat([df, pd.DataFrame([remaining])], ignore_index=True)
+            df.to_csv(legacy_csv, index=False)
+
+        ledger = TradeLedger(ledger_csv)
+        exports = []
+        export_csv = ledger.export_csv
+        ledger.export_csv = lambda path=None: exports.append(path) or export_csv(path)
+        coins = ["BTC", "ETH", "SOL", "BNB"]
+        t_legacy = t_ledger = 0.0
+        for i in range(300):
+            coin, side = coins[i % 4], "多" if i % 3 else "空"
+            info = {
+                "开仓时间": f"2025-01-{i % 28 + 1:02d} 10:00:00", "币种": coin, "方向": side,
+                "数量": 0.5 + i, "开仓价格": 100.0 + i, "仓位(U)": 50.0, "杠杆率": 5,
+                "止损": 95.0, "止盈": 110.0, "盈亏比": 2.0, "开仓理由": f"理由{i}",
+                "信号分数": 70, "共振指标数": 3, "多余字段": "丢弃",
+            }
+            t0 = time.time(); legacy_open(info); t_legacy += time.time() - t0
+            t0 = time.time(); ledger.record_open(info); t_ledger += time.time() - t0
+            if i % 2:
+                args_close = (coin, side, f"2025-02-01 {i % 24:02d}:00:00", 101.5, 1.25, "止盈", 50 if i % 5 == 0 else 100)
+                t0 = time.time(); legacy_close(*args_close); t_legacy += time.time() - t0
+                t0 = time.time(); ledger.record_close(*args_close); t_ledger += time.time() - t0
+
+        ledger.flush_csv()
+        rewrites = len(exports)
+        assert rewrites <= 3, f"CSV整表重写次数过多: {rewrites}"
+        expected = pd.read_csv(legacy_csv)
+        actual = pd.read_csv(ledger_csv)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+        assert ledger.open_trade("BTC", "多") == {
+            k: (None if pd.isna(v) else v) for k, v in
+            expected[(expected["币种"] == "BTC") & (expected["方向"] == "多") & expected["平仓时间"].isna()].iloc[-1].items()
+        }
+
+        # 开仓直接追加到CSV
+        exports.clear()
+        ledger.record_open({"开仓时间": "2025-03-01 10:00:00", "币种": "DOGE", "方向": "多"})
+        assert not exports and pd.read_csv(ledger_csv)["币种"].iloc[-1] == "DOGE"
+
+        # 外部进程持有CSV锁时写入等待
+        import fcntl as _fcntl
+
+        holder = open(ledger.lock_path, "w")
+        _fcntl.flock(holder.fileno(), _fcntl.LOCK_EX)
+        writer = threading.Thread(
+            target=ledger.record_open, args=({"开仓时间": "2025-03-02 10:00:00", "币种": "XRP", "方向": "空"},)
+        )
+        writer.start()
+        writer.join(0.3)
+        assert writer.is_alive(), "外部持锁时不应写入"
+        _fcntl.flock(holder.fileno(), _fcntl.LOCK_UN)
+        holder.close()
+        writer.join()
+        assert ledger.open_trade("XRP", "空") is not None
+        expected = pd.read_csv(ledger_csv)
+
+        # 外部脚本改写CSV → 自动重新导入
+        time.sleep(0.01)
+        expected.iloc[:10].to_csv(ledger_csv, index=False)
+        assert TradeLedger(ledger_csv).count() == 10
+
+        # 有未导出的平仓时外部修复CSV → 合并：修复和平仓都保留；read_trades_csv读到最新数据
+        merge_csv = tmp_dir / "merge" / "trades_history.csv"
+        merge_csv.parent.mkdir()
+        pd.DataFrame([
+            {"开仓时间": "2025-04-01 10:00:00", "币种": c, "方向": "多", "止损": 95.0, "开仓理由": "r"}
+            for c in ("BTC", "ETH", "SOL")
+        ]).reindex(columns=TRADE_COLUMNS).to_csv(merge_csv, index=False)
+        merge_ledger = get_ledger(merge_csv)
+        merge_ledger.record_close("BTC", "多", "2025-04-01 12:00:00", 101.0, 2.0, "止盈")
+        merge_ledger.record_close("SOL", "多", "2025-04-01 12:00:00", 99.0, -1.0, "止损", 50)
+        assert merge_ledger._csv_dirty and pd.read_csv(merge_csv)["平仓时间"].isna().all()
+        time.sleep(0.01)
+        repaired = pd.read_csv(merge_csv)
+        repaired.loc[repaired["币种"] == "ETH", "止损"] = 90.0
+        repaired.to_csv(merge_csv, index=False)
+        merged = read_trades_csv(merge_csv)
+        assert merged["币种"].tolist() == ["BTC", "ETH", "SOL", "SOL"]
+        assert merged["止损"].tolist() == [95.0, 90.0, 95.0, 95.0]
+        assert merged["平仓理由"].iloc[0] == "止盈" and merged["平仓理由"].iloc[2] == "止损"
+        assert pd.isna(merged["平仓时间"].iloc[3]) and merged["开仓理由"].iloc[3] == "r [剩余50%]"
+        assert not merge_ledger._csv_dirty and merge_ledger.open_trade("ETH", "多")["止损"] == 90.0
+        print(f"✅ 交易账本与旧版结果一致（{len(expected)}行）")
+        print(f"   旧版pandas读改写: {t_legacy:.2f}s | 账本: {t_ledger:.2f}s（含CSV导出，整表重写{rewrites}次）")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
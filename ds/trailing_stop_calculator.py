@@ -7,11 +7,32 @@
 1. 计算带移动止损的实际利润
 2. 支持静态止损和移动止损的对比
 3. 提供详细的退出原因分析
+4. 【V8.9.19】批量引擎：收盘价矩阵（机会数 × K线数）+ 多组止损/止盈/移动止损配置
+   一次性算出平仓K线、退出原因和利润（移动止损线 = 入场以来最高收盘价的累积最大值 - 距离），
+   结果与逐行的_calculate_with_future_data一致；batch_calculate_profits和
+   compare_static_vs_trailing（两组配置一次模拟）使用
+5. 未来价格：future_data_dict中的DataFrame，或机会自带的future_data["path"]
+   （【V8.9.18】PathArena视图，取收盘价列）；Phase 4验证因此按真实路径计算，没有路径时才按max_potential_profit模拟
+6. 空单（direction == 'short'）：价格取负后按多单规则模拟（止损在上方、移动止损跟随最低价），再换回原价格
 """
 
 from typing import Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
+# 退出原因编码（批量引擎）
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_TRAILING_STOP = 3
+EXIT_HOLDING_EXPIRED = 4
+
+EXIT_REASON_NAMES = {
+    EXIT_STOP_LOSS: 'stop_loss',
+    EXIT_TAKE_PROFIT: 'take_profit',
+    EXIT_TRAILING_STOP: 'trailing_stop',
+    EXIT_HOLDING_EXPIRED: 'holding_expired',
+}
+
 
 def calculate_profit_with_trailing_stop(
     opportunity: Dict,
@@ -48,10 +69,21 @@ def calculate_profit_with_trailing_stop(
     
     # 如果有未来数据，使用实际价格
     if future_data is not None and len(future_data) > 0:
-        return _calculate_with_future_data(
-            entry_price, initial_sl, initial_tp, atr, atr_stop_multiplier,
-            trailing_stop_enabled, max_holding_hours, future_data
+        if opportunity.get('direction') != 'short':
+            return _calculate_with_future_data(
+                entry_price, initial_sl, initial_tp, atr, atr_stop_multiplier,
+                trailing_stop_enabled, max_holding_hours, future_data
+            )
+        # 空单：价格取负后按多单规则模拟，利润和价格再换回来
+        mirrored = pd.DataFrame({'close': -future_data['close'].astype(float)}, index=future_data.index)
+        profit, exit_reason, details = _calculate_with_future_data(
+            -entry_price, -entry_price - atr * atr_stop_multiplier, -entry_price + atr * atr_tp_multiplier,
+            atr, atr_stop_multiplier, trailing_stop_enabled, max_holding_hours, mirrored
         )
+        for key in ('exit_price', 'highest_price'):
+            if key in details:
+                details[key] = -details[key]
+        return -profit, exit_reason, details
     
     # 如果没有未来数据，使用opportunity中的max_profit进行模拟
     return _calculate_with_max_profit(
@@ -211,6 +243,174 @@ def _calculate_with_max_profit(
             }
 
 
+def close_price_matrix(future_frames: List) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    把每个机会的未来收盘价（DataFrame的close列或一维数组）拼成NaN填充的收盘价矩阵
+
+    Returns:
+        (closes, lengths): (机会数, 最长K线数)矩阵和每行的有效K线数
+    """
+    values = [
+        frame['close'].to_numpy(dtype=np.float64) if isinstance(frame, pd.DataFrame)
+        else np.asarray(frame, dtype=np.float64)
+        for frame in future_frames
+    ]
+    lengths = np.array([len(v) for v in values], dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    closes = np.full((len(values), width), np.nan)
+    for i, close in enumerate(values):
+        closes[i, : lengths[i]] = close
+    return closes, lengths
+
+
+def _future_closes(opp: Dict, future_data_dict: Optional[Dict[str, pd.DataFrame]]):
+    """机会的未来收盘价：future_data_dict优先，其次是机会自带的路径（PathArena视图的收盘价列）"""
+    if future_data_dict:
+        future_data = future_data_dict.get(f"{opp.get('coin', 'UNKNOWN')}_{opp.get('timestamp', '')}")
+        if future_data is not None:
+            return future_data
+    summary = opp.get('future_data')
+    path = summary.get('path') if isinstance(summary, dict) else None
+    if path is None:
+        return None
+    from future_path_arena import PATH_CLOSE
+
+    return path[:, PATH_CLOSE]
+
+
+def simulate_trailing_batch(
+    entry: np.ndarray,
+    atr: np.ndarray,
+    closes: np.ndarray,
+    lengths: np.ndarray,
+    configs: List[Dict],
+    is_long: Optional[np.ndarray] = None,
+) -> List[Dict[str, np.ndarray]]:
+    """
+    多组配置 × 多个机会的止损/止盈/移动止损批量模拟（_calculate_with_future_data的向量化版本）
+
+    - 按收盘价判断，同一根K线先检查止损（或移动止损）再检查止盈
+    - 移动止损线 = max(入场价, 截至当根的最高收盘价) - ATR × atr_stop_multiplier
+      （未创新高时等于初始止损）
+    - 全部K线未触发时按最后一根收盘价平仓（holding_expired）
+    - 最高价累积只算一次，各配置共享
+
+    Args:
+        entry / atr: (m,) 入场价和ATR（调用方保证>0）
+        closes / lengths: close_price_matrix的返回值
+        configs: 参数字典列表，使用atr_stop_multiplier、atr_tp_multiplier、trailing_stop_enabled
+        is_long: (m,) 是否多单，None为全部多单；空单按取负的价格模拟
+
+    Returns:
+        每组配置一个dict: {"exit_reason": 编码, "bars_held", "exit_price", "profit", "highest_price"}
+        （空单的highest_price为入场以来的最低收盘价）
+    """
+    sign = np.ones(len(entry)) if is_long is None else np.where(is_long, 1.0, -1.0)
+    entry = entry * sign
+    closes = closes * sign[:, None]
+    m, width = closes.shape
+    rows = np.arange(m)
+    in_range = np.arange(width)[None, :] < lengths[:, None]
+    entry_col = entry[:, None]
+    atr_col = atr[:, None]
+
+    # NaN收盘价既不触发也不刷新最高价（与逐行比较的结果一致）
+    highest = np.fmax.accumulate(np.fmax(closes, entry_col), axis=1) if width else closes
+    last_idx = np.maximum(lengths - 1, 0)
+    final_close = closes[rows, last_idx] if width else np.full(m, np.nan)
+    highest_final = highest[rows, last_idx] if width else entry.copy()
+
+    results = []
+    for config in configs:
+        stop_distance = atr_col * float(config.get('atr_stop_multiplier', 1.5))
+        take_profit = entry_col + atr_col * float(config.get('atr_tp_multiplier', 3.0))
+        trailing = bool(config.get('trailing_stop_enabled', False))
+
+        stop_line = (highest if trailing else entry_col) - stop_distance
+        stop_line = np.broadcast_to(stop_line, closes.shape)
+        with np.errstate(invalid='ignore'):
+            sl_hit = in_range & (closes <= stop_line)
+            tp_hit = in_range & (closes >= take_profit)
+
+        any_hit = sl_hit | tp_hit
+        has_hit = any_hit.any(axis=1)
+        first = np.where(has_hit, any_hit.argmax(axis=1), last_idx)
+        hit_is_sl = has_hit & sl_hit[rows, first]
+
+        stop_reason = EXIT_TRAILING_STOP if trailing else EXIT_STOP_LOSS
+        exit_reason = np.where(
+            has_hit,
+            np.where(hit_is_sl, stop_reason, EXIT_TAKE_PROFIT),
+            EXIT_HOLDING_EXPIRED,
+        )
+        exit_price = np.where(
+            has_hit,
+            np.where(hit_is_sl, stop_line[rows, first], take_profit[:, 0]),
+            final_close,
+        )
+        results.append({
+            'exit_reason': exit_reason,
+            'bars_held': np.where(has_hit, first + 1, lengths),
+            'exit_price': exit_price * sign,
+            'profit': (exit_price - entry) / entry * 100 * sign,
+            'highest_price': np.where(has_hit, highest[rows, first], highest_final) * sign,
+        })
+    return results
+
+
+def _batch_calculate_profits_for_configs(
+    opportunities: List[Dict],
+    configs: List[Dict],
+    future_data_dict: Optional[Dict[str, pd.DataFrame]] = None
+) -> List[List[Dict]]:
+    """
+    多组参数批量计算利润：有未来价格（future_data_dict或机会自带的路径）的机会走批量引擎，
+    其余逐个走calculate_profit_with_trailing_stop
+    """
+    results: List[List[Optional[Dict]]] = [[None] * len(opportunities) for _ in configs]
+
+    batch_idx, frames = [], []
+    for i, opp in enumerate(opportunities):
+        future_data = _future_closes(opp, future_data_dict)
+        valid = float(opp.get('entry_price', 0)) > 0 and float(opp.get('atr', 0)) > 0
+        if valid and future_data is not None and len(future_data) > 0:
+            batch_idx.append(i)
+            frames.append(future_data)
+            continue
+        for k, params in enumerate(configs):
+            profit, exit_reason, details = calculate_profit_with_trailing_stop(opp, params, None)
+            results[k][i] = {
+                'opportunity': opp,
+                'profit': profit,
+                'exit_reason': exit_reason,
+                'details': details
+            }
+
+    if batch_idx:
+        entry = np.array([float(opportunities[i]['entry_price']) for i in batch_idx])
+        atr = np.array([float(opportunities[i]['atr']) for i in batch_idx])
+        is_long = np.array([opportunities[i].get('direction') != 'short' for i in batch_idx])
+        closes, lengths = close_price_matrix(frames)
+        batches = simulate_trailing_batch(entry, atr, closes, lengths, configs, is_long)
+        for k, batch in enumerate(batches):
+            trailing = bool(configs[k].get('trailing_stop_enabled', False))
+            for j, i in enumerate(batch_idx):
+                details = {
+                    'exit_price': float(batch['exit_price'][j]),
+                    'bars_held': int(batch['bars_held'][j]),
+                }
+                if trailing:
+                    details['highest_price'] = float(batch['highest_price'][j])
+                results[k][i] = {
+                    'opportunity': opportunities[i],
+                    'profit': float(batch['profit'][j]),
+                    'exit_reason': EXIT_REASON_NAMES[int(batch['exit_reason'][j])],
+                    'details': details
+                }
+
+    return results  # type: ignore[return-value]
+
+
 def batch_calculate_profits(
     opportunities: List[Dict],
     params: Dict,
@@ -222,32 +422,13 @@ def batch_calculate_profits(
     Args:
         opportunities: 机会列表
         params: 策略参数
-        future_data_dict: 未来数据字典 {opportunity_id: future_df}
+        future_data_dict: 未来数据字典 {opportunity_id: future_df}；
+            没有对应项时使用机会自带的future_data["path"]
     
     Returns:
         results: 结果列表，每个包含profit, exit_reason, details
     """
-    results = []
-    
-    for opp in opportunities:
-        opp_id = f"{opp.get('coin', 'UNKNOWN')}_{opp.get('timestamp', '')}"
-        future_data = None
-        
-        if future_data_dict and opp_id in future_data_dict:
-            future_data = future_data_dict[opp_id]
-        
-        profit, exit_reason, details = calculate_profit_with_trailing_stop(
-            opp, params, future_data
-        )
-        
-        results.append({
-            'opportunity': opp,
-            'profit': profit,
-            'exit_reason': exit_reason,
-            'details': details
-        })
-    
-    return results
+    return _batch_calculate_profits_for_configs(opportunities, [params], future_data_dict)[0]
 
 
 def compare_static_vs_trailing(
@@ -265,13 +446,12 @@ def compare_static_vs_trailing(
             'improvement': float
         }
     """
-    # 静态止损
+    # 静态止损 / 移动止损（一次批量模拟两组配置）
     static_params = {**base_params, 'trailing_stop_enabled': False}
-    static_results = batch_calculate_profits(opportunities, static_params, future_data_dict)
-    
-    # 移动止损
     trailing_params = {**base_params, 'trailing_stop_enabled': True}
-    trailing_results = batch_calculate_profits(opportunities, trailing_params, future_data_dict)
+    static_results, trailing_results = _batch_calculate_profits_for_configs(
+        opportunities, [static_params, trailing_params], future_data_dict
+    )
     
     # 统计
     static_avg = sum(r['profit'] for r in static_results) / len(static_results) if static_results else 0
@@ -291,3 +471,47 @@ def compare_static_vs_trailing(
         'improvement': improvement
     }
 
+
+
+if __name__ == "__main__":
+    """
+    对照测试：批量引擎 vs 逐行的_calculate_with_future_data
+    """
+    rng = np.random.default_rng(5)
+    opportunities, future_data_dict = [], {}
+    for i in range(300):
+        entry_price = 100 * float(np.exp(rng.normal(0, 0.3)))
+        length = int(rng.integers(1, 97))
+        close = entry_price * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+        if i % 25 == 0:
+            close[length // 2] = np.nan
+        opp = {'coin': f"C{i % 7}", 'timestamp': str(i), 'entry_price': entry_price,
+               'atr': entry_price * float(rng.uniform(0.002, 0.02)), 'max_potential_profit': 3.0,
+               'direction': 'short' if i % 3 == 0 else 'long'}
+        opportunities.append(opp)
+        if i % 10 == 5:
+            # 机会自带路径（PathArena视图）：high/low/close三列，取收盘价
+            opp['future_data'] = {'path': np.column_stack([close, close, close])}
+        elif i % 10:
+            future_data_dict[f"{opp['coin']}_{i}"] = pd.DataFrame({'close': close})
+
+    grid = [
+        {'atr_stop_multiplier': sl, 'atr_tp_multiplier': tp, 'trailing_stop_enabled': ts}
+        for sl in (1.0, 2.0) for tp in (2.0, 6.0) for ts in (False, True)
+    ]
+    batch_results = _batch_calculate_profits_for_configs(opportunities, grid, future_data_dict)
+    mismatches = 0
+    for params, results in zip(grid, batch_results):
+        for opp, result in zip(opportunities, results):
+            future_data = future_data_dict.get(f"{opp['coin']}_{opp['timestamp']}")
+            if 'future_data' in opp:
+                future_data = pd.DataFrame({'close': opp['future_data']['path'][:, 2]})
+            profit, exit_reason, details = calculate_profit_with_trailing_stop(opp, params, future_data)
+            same_profit = np.isclose(profit, result['profit']) or (np.isnan(profit) and np.isnan(result['profit']))
+            same_details = details.keys() == result['details'].keys() and all(
+                np.isclose(details[k], result['details'][k], equal_nan=True) for k in details
+            )
+            if exit_reason != result['exit_reason'] or not same_profit or not same_details:
+                mismatches += 1
+    assert mismatches == 0, f"{mismatches}处不一致"
+    print(f"✅ {len(grid)}组配置 × {len(opportunities)}个机会：批量引擎与逐行计算一致")
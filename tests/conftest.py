@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""ds/下的模块互相按顶层模块名导入（与运行主程序时一致），测试时同样把ds/加入sys.path"""
+
+import sys
+from pathlib import Path
+
+DS_DIR = Path(__file__).resolve().parent.parent / "ds"
+if str(DS_DIR) not in sys.path:
+    sys.path.insert(0, str(DS_DIR))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""batch_trade_simulator：向量化模拟与主程序标量实现一致；机会数组不会因列表原地修改而过期"""
+
+import numpy as np
+
+from batch_trade_simulator import (
+    EXIT_TYPE_NAMES,
+    check_against_scalar_oracles,
+    opportunity_arrays,
+    simulate_opportunities_batch,
+)
+
+PARAMS = {
+    "min_indicator_consensus": 2,
+    "min_risk_reward": 1.2,
+    "atr_stop_multiplier": 1.2,
+    "atr_tp_multiplier": 2.5,
+    "max_holding_hours": 12,
+}
+
+
+def _opportunity(entry, direction="long", consensus=3):
+    return {
+        "entry_price": entry,
+        "direction": direction,
+        "atr": entry * 0.01,
+        "consensus": consensus,
+        "risk_reward": 2.0,
+        "future_data": {"max_high": entry * 1.05, "min_low": entry * 0.999, "final_close": entry},
+    }
+
+
+def test_matches_scalar_oracles():
+    mismatches = check_against_scalar_oracles(m=200)
+    assert not mismatches, mismatches[:5]
+
+
+def test_in_place_mutation_is_not_served_stale():
+    opportunities = [_opportunity(100.0), _opportunity(200.0, consensus=0)]
+    first = simulate_opportunities_batch(opportunities, PARAMS)
+    assert first["can_entry"].tolist() == [True, False]
+
+    # 同一个列表对象、长度不变：修改元素字段
+    opportunities[1]["consensus"] = 4
+    opportunities[0]["future_data"]["min_low"] = 50.0
+    second = simulate_opportunities_batch(opportunities, PARAMS)
+    assert second["can_entry"].tolist() == [True, True]
+    assert EXIT_TYPE_NAMES[int(second["exit_type"][0])] == "stop_loss"
+
+    # 替换元素、追加元素
+    opportunities[0] = _opportunity(100.0, consensus=0)
+    opportunities.append(_opportunity(300.0, direction="short"))
+    third = simulate_opportunities_batch(opportunities, PARAMS)
+    assert third["can_entry"].tolist() == [False, True, True]
+
+
+def test_explicit_arrays_are_used_as_given():
+    opportunities = [_opportunity(100.0), _opportunity(120.0)]
+    arrays = opportunity_arrays(opportunities)
+    expected = simulate_opportunities_batch(opportunities, PARAMS)
+    got = simulate_opportunities_batch(opportunities, PARAMS, arrays=arrays)
+    for key in ("can_entry", "exit_type", "profit"):
+        np.testing.assert_array_equal(got[key], expected[key])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""market_snapshot_store：追加时列类型固定（数值列float64 + NaN），全None列不会被锁定成字符串；
+非数字字符串把数值列升级为字符串列；schema不变时原地追加"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import market_snapshot_store as store
+
+DAY = "20260101"
+
+
+def _row(time, coin, **fields):
+    row = {"time": time, "coin": coin, "close": 100.0, "indicator_consensus": 3, "has_breakout": False}
+    row.update(fields)
+    return row
+
+
+def test_all_none_column_on_first_write_stays_numeric(tmp_path):
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0000", "BTC", support=None, pin_bar=None)])
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0015", "BTC", support=95.5, pin_bar="bullish_pin")])
+
+    table = store.open_snapshot_day(tmp_path, DAY)
+    assert table.dtype["support"] == np.float64
+    assert table.dtype["indicator_consensus"] == np.float64
+    assert table.dtype["has_breakout"] == np.bool_
+    assert table.dtype["pin_bar"].kind == "U"
+
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert np.isnan(df["support"].iloc[0]) and df["support"].iloc[1] == 95.5
+    assert pd.isna(df["pin_bar"].iloc[0]) and df["pin_bar"].iloc[1] == "bullish_pin"
+    assert df["indicator_consensus"].tolist() == [3.0, 3.0]
+
+
+def test_appends_are_cast_to_stored_schema(tmp_path):
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0000", "BTC", atr=1.5)])
+    # 数值列遇到None/数字字符串：按float64存；新增列补齐旧行
+    store.append_snapshot_rows(
+        tmp_path, DAY, [_row("0015", "ETH", atr=None), _row("0015", "SOL", atr="2.5", trend_1h="多头")]
+    )
+
+    table = store.open_snapshot_day(tmp_path, DAY)
+    assert table.dtype["atr"] == np.float64
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert df["atr"].iloc[0] == 1.5 and np.isnan(df["atr"].iloc[1]) and df["atr"].iloc[2] == 2.5
+    assert pd.isna(df["trend_1h"].iloc[0]) and df["trend_1h"].iloc[2] == "多头"
+    assert df["coin"].tolist() == ["BTC", "ETH", "SOL"]
+
+
+def test_non_numeric_string_upgrades_column_to_string(tmp_path):
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0000", "BTC", atr=1.5), _row("0000", "ETH", atr=None)])
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0015", "SOL", atr="n/a")])
+
+    assert store.open_snapshot_day(tmp_path, DAY).dtype["atr"].kind == "U"
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert df["atr"].iloc[0] == "1.5" and pd.isna(df["atr"].iloc[1]) and df["atr"].iloc[2] == "n/a"
+
+
+def test_append_with_same_schema_writes_in_place(tmp_path):
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0000", "BTC", atr=1.5), _row("0000", "ETH")])
+    path = store.columnar_path(tmp_path, DAY)
+    inode = os.stat(path).st_ino
+
+    for i in range(1, 6):
+        store.append_snapshot_rows(tmp_path, DAY, [_row(f"{i:02d}15", "BTC", atr=float(i)), _row(f"{i:02d}15", "ETH")])
+    assert os.stat(path).st_ino == inode  # 没有整体重写（os.replace会换inode）
+
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert len(df) == 12 and df["time"].iloc[-1] == "0515"
+    assert df["atr"].iloc[10] == 5.0 and np.isnan(df["atr"].iloc[11])
+    assert np.load(path, allow_pickle=False).shape == (12,)
+
+    # 字符串变宽 / 新增列：整体重写
+    store.append_snapshot_rows(tmp_path, DAY, [_row("0615", "DOGE1000", extra=1.0)])
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert df["coin"].iloc[-1] == "DOGE1000" and np.isnan(df["extra"].iloc[0]) and len(df) == 13
+
+
+def test_legacy_empty_string_column_is_upgraded(tmp_path):
+    # 旧版本把当天首批全None的列存成了空字符串列
+    legacy = pd.DataFrame({"time": ["0000"], "coin": ["BTC"], "support": [""]})
+    path = store.columnar_path(tmp_path, DAY)
+    store._write_table(path, [(c, np.array(legacy[c].tolist(), dtype=str)) for c in legacy.columns])
+
+    store.append_snapshot_rows(tmp_path, DAY, [{"time": "0015", "coin": "BTC", "support": 99.0}])
+    df = store.load_snapshot_day(tmp_path, DAY)
+    assert store.open_snapshot_day(tmp_path, DAY).dtype["support"] == np.float64
+    assert np.isnan(df["support"].iloc[0]) and df["support"].iloc[1] == 99.0
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""phase3_enhanced_optimizer：Phase3FilterIndex的列式掩码与逐行_passes_phase3_filters一致"""
+
+import itertools
+
+import numpy as np
+
+from opportunity_table import OpportunityTable
+from phase3_enhanced_optimizer import Phase3FilterIndex, _passes_phase3_filters, compact_opportunity
+
+
+def _opportunities(count=400):
+    rng = np.random.default_rng(11)
+    opportunities = []
+    for i in range(count):
+        price = float(rng.uniform(10, 1000))
+        snapshot = {
+            "has_pin_bar": bool(i % 5 == 0),
+            "has_engulfing": bool(i % 7 == 0),
+            "trend_4h_strength": ["weak", "normal", "strong"][i % 3],
+            "current_price": price if i % 11 else 0,
+            "support_resistance": {
+                "nearest_support": {"price": price * float(rng.uniform(0.9, 1.0)), "strength": 2},
+                "nearest_resistance": None if i % 4 == 0 else {"price": price * float(rng.uniform(1.0, 1.1))},
+            },
+            "rsi": float(rng.uniform(0, 100)),
+        }
+        if i % 13 == 0:
+            del snapshot["trend_4h_strength"], snapshot["support_resistance"]
+        opp = {
+            "coin": "BTC",
+            "consensus": int(rng.integers(0, 5)),
+            "signal_score": float(rng.uniform(40, 100)),
+            "risk_reward": float(rng.uniform(0, 4)),
+            "profit_density": float("nan") if i % 17 == 0 else float(rng.uniform(0, 10)),
+        }
+        if i % 19:
+            opp["snapshot"] = snapshot
+        opportunities.append(compact_opportunity(opp))
+    return opportunities
+
+
+def test_mask_matches_row_filter_for_every_combination():
+    opportunities = _opportunities()
+    index = Phase3FilterIndex(opportunities)
+    grid = itertools.product([1, 3], [60, 80], [0, 1.5], [0, 4.0], [False, True], ["any", "normal", "strong"], [False, True])
+    for consensus, score, rr, density, pattern, strength, near_sr in grid:
+        params = {
+            "min_indicator_consensus": consensus,
+            "min_signal_score": score,
+            "min_risk_reward": rr,
+            "min_profit_density": density,
+            "require_strong_pattern": pattern,
+            "min_trend_strength": strength,
+            "require_near_sr": near_sr,
+        }
+        expected = [_passes_phase3_filters(opp, params) for opp in opportunities]
+        assert index.mask(params).tolist() == expected, params
+
+
+def test_index_accepts_opportunity_table():
+    opportunities = _opportunities(120)
+    params = {"min_indicator_consensus": 2, "min_signal_score": 70, "require_near_sr": True, "min_trend_strength": "normal"}
+    from_table = Phase3FilterIndex(OpportunityTable.from_dicts(opportunities)).mask(params)
+    assert from_table.tolist() == Phase3FilterIndex(opportunities).mask(params).tolist()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Phase 3重算的signal_score写回输入，Phase 4在同一份机会上筛选时看到同样的分数"""
+
+import numpy as np
+
+from opportunity_table import OpportunityTable
+from phase3_enhanced_optimizer import rescore_opportunities_for_phase3
+from phase4_validator import test_params_on_data as phase4_test_params
+
+SCALPING_WEIGHTS = {"name": "test", "weights": {"rsi": 1.0}}
+
+
+def _opportunities(count=120):
+    rng = np.random.default_rng(5)
+    opportunities = []
+    for i in range(count):
+        opportunities.append({
+            "coin": "BTC",
+            "timestamp": f"2025-11-{10 + i % 14:02d} 00:00:00",
+            "signal_type": "scalping" if i % 3 else "swing",
+            "signal_score": int(rng.integers(40, 100)),
+            "indicator_consensus": int(rng.integers(0, 5)),
+            "entry_price": 100.0,
+            "atr": 2.0,
+            "direction": "long",
+            "max_potential_profit": float(rng.uniform(1, 10)),
+            "snapshot": {"rsi": float(rng.uniform(0, 100)), "current_price": 100.0},
+        })
+    return opportunities
+
+
+def _recalculate(opp, signal_type, learning_config):
+    assert learning_config["scalping_weights"] == SCALPING_WEIGHTS["weights"]
+    return round(opp["snapshot"]["rsi"], 2)
+
+
+def test_phase4_sees_phase3_scores_on_table():
+    opportunities = _opportunities()
+    table = OpportunityTable.from_dicts(opportunities)
+    lean, recalc_count = rescore_opportunities_for_phase3(table, SCALPING_WEIGHTS, {}, _recalculate)
+
+    assert recalc_count == sum(o["signal_type"] == "scalping" for o in opportunities)
+    assert table.column("signal_score").tolist() == [o["signal_score"] for o in lean]
+    # 波段没有权重，保持原分数
+    assert all(
+        o["signal_score"] == src["signal_score"]
+        for o, src in zip(lean, opportunities) if src["signal_type"] == "swing"
+    )
+
+    params = {"min_signal_score": 60, "min_indicator_consensus": 2}
+    expected = sum(
+        o["signal_score"] >= 60 and o["indicator_consensus"] >= 2 for o in lean
+    )
+    assert phase4_test_params(table, params, "test")["captured_count"] == expected
+
+
+def test_phase3_writes_scores_back_to_dicts():
+    opportunities = _opportunities(60)
+    lean, _ = rescore_opportunities_for_phase3(opportunities, SCALPING_WEIGHTS, {}, _recalculate)
+    assert [o["signal_score"] for o in opportunities] == [o["signal_score"] for o in lean]
+    # Phase 3的其他字段仍只落在精简副本上
+    assert all("_old_signal_score" not in o for o in opportunities)
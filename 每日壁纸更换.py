@@ -7,11 +7,13 @@ import json
 import os
 import random
 from PIL import Image  # type: ignore[import-untyped]
-from io import BytesIO
+from io import BytesIO, StringIO
 # import numpy as np  # 临时注释
 import re
 from datetime import timedelta
 import csv
+import sys
+import threading
 import time  # 【V8.5.2.4.88优化】添加时间模块用于缓存
 
 
@@ -19,8 +21,9 @@ app = Flask(__name__)
 
 # 【V8.5.2.4.88优化】数据缓存配置
 # 缓存summary数据，减少频繁读取CSV文件的内存和CPU开销
-SUMMARY_CACHE: dict[str, dict] = {}
-CACHE_DURATION = 30  # 缓存有效期（秒）
+# 【V8.9.13】缓存项为 (summary, 数据文件指纹, 生成时间)，指纹不变即有效（不再按30秒过期），按最近使用淘汰
+SUMMARY_CACHE: dict[str, tuple] = {}
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "64"))
 
 # ==================== 时区转换辅助函数 ====================
 
@@ -319,6 +322,309 @@ def filter_data_by_time_range(data_list, time_field, range_type='all', start_dat
     
     return filtered
 
+# ==================== 【V8.9.13】变更驱动的摘要引擎 ====================
+# 按文件(大小, 修改时间)判断数据是否变化：没变化时直接复用已算好的结果（不再有30秒过期），
+# 变化时只重新解析变化的文件；CSV只是末尾追加时只解析新增的行（前缀用哈希校验）
+
+def _file_signature(path):
+    """文件指纹（大小 + 修改时间），文件不存在时为None"""
+    try:
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+
+class IncrementalCsvTable:
+    """
+    CSV行缓存：文件未变化时不读取；只追加时从上次解析到的字节位置继续读新增部分，
+    文件被截短或整体改写（inode变化/上次位置之前的末尾字节不同）时才整文件重读
+    """
+
+    TAIL_BYTES = 256  # 记录上次位置之前的这些字节，用来识别原地改写
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.fieldnames = None
+        self.rows = []
+        self.new_rows = []
+        self._offset = 0
+        self._inode = None
+        self._tail = b''
+
+    def refresh(self):
+        """返回 None（未变化）/ 'append'（只解析了新增行）/ 'reload'（整文件重读）"""
+        signature = _file_signature(self.path)
+        if signature == self.signature:
+            return None
+        self.signature = signature
+        if signature is None:
+            self.fieldnames, self.rows, self.new_rows = None, [], []
+            self._offset, self._inode, self._tail = 0, None, b''
+            return 'reload'
+
+        with open(self.path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if self._can_resume(f, inode, signature[0]):
+                f.seek(self._offset)
+                self.new_rows = self._parse(f.read(), self._offset)
+                self.rows.extend(self.new_rows)
+                return 'append'
+            f.seek(0)
+            data = f.read()
+
+        self.fieldnames = None
+        self._inode, self._tail = inode, b''
+        self.rows = self.new_rows = self._parse(data, 0)
+        return 'reload'
+
+    def _can_resume(self, f, inode, size):
+        if not (self.fieldnames and self._offset and inode == self._inode and size >= self._offset):
+            return False
+        f.seek(self._offset - len(self._tail))
+        return f.read(len(self._tail)) == self._tail
+
+    def _parse(self, chunk, base):
+        """chunk为文件从base字节开始的内容；只解析完整的行，写到一半的末行留到下次"""
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return []
+        text = chunk[:end].decode('utf-8-sig' if base == 0 else 'utf-8')
+        reader = csv.DictReader(StringIO(text), fieldnames=self.fieldnames)
+        if self.fieldnames is None:
+            reader.fieldnames = [name.strip() if name else name for name in reader.fieldnames or []]
+            self.fieldnames = reader.fieldnames
+        rows = list(reader)
+        self._offset = base + end
+        self._tail = (self._tail + chunk[:end])[-self.TAIL_BYTES:]
+        return rows
+
+
+class ModelTradeState:
+    """
+    单个模型的交易/盈亏数据及滚动统计
+
+    - 全部已平仓交易的笔数、胜场、已实现盈亏、最大回撤随新增行逐笔累加（与calculate_max_drawdown结果一致）
+    - 时间周期（day/week/month/custom）的统计按 (周期, 北京日期) 记忆，数据变化时失效
+    """
+
+    def __init__(self, data_dir):
+        self.trades = IncrementalCsvTable(os.path.join(data_dir, 'trades_history.csv'))
+        self.pnl = IncrementalCsvTable(os.path.join(data_dir, 'pnl_history.csv'))
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.closed_trades = []
+        self.open_details = {}
+        self.realized_pnl = 0
+        self.win_count = 0
+        # 最大回撤的滚动状态（按开仓时间顺序累加）
+        self._capital = self._peak = 100.0
+        self._max_dd = 0.0
+        self._last_open_time = ''
+        self._drawdown_dirty = False
+        self._range_metrics = {}
+        self._sharpe_all = None
+
+    def refresh(self):
+        """检查文件变化并更新统计，返回(交易指纹, 盈亏指纹)"""
+        with self.lock:
+            trades_change = self.trades.refresh()
+            pnl_change = self.pnl.refresh()
+            if trades_change == 'reload':
+                self._reset()
+            if trades_change:
+                for trade in self.trades.new_rows:
+                    self._fold(trade)
+            if trades_change or pnl_change:
+                self._range_metrics = {}
+                self._sharpe_all = None
+            return self.trades.signature, self.pnl.signature
+
+    def _fold(self, trade):
+        close_time = trade.get('平仓时间')
+        if not (close_time and close_time.strip()):
+            if close_time:
+                return
+            key = f"{trade.get('币种', '')}_{trade.get('方向', '')}"
+            self.open_details[key] = {
+                'open_time': trade.get('开仓时间', ''),
+                'stop_loss': float(trade.get('止损', 0) or 0),
+                'take_profit': float(trade.get('止盈', 0) or 0),
+                'risk_reward': float(trade.get('盈亏比', 0) or 0),
+                'margin': float(trade.get('仓位(U)', 0) or 0),
+                'leverage': int(float(trade.get('杠杆率', 1) or 1)),
+                'open_reason': trade.get('开仓理由', '')
+            }
+            return
+
+        self.closed_trades.append(trade)
+        try:
+            pnl = float(trade.get('盈亏(U)', '0') or '0')
+            self.realized_pnl += pnl
+            if pnl > 0:
+                self.win_count += 1
+        except (ValueError, TypeError):
+            pass
+
+        # 开仓时间不早于已累加的交易时直接累加，否则（乱序/无法解析）下次取值时按开仓时间整体重算
+        if self._drawdown_dirty or trade.get('开仓时间', '') < self._last_open_time:
+            self._drawdown_dirty = True
+            return
+        try:
+            self._fold_drawdown(trade)
+        except (ValueError, TypeError):
+            self._drawdown_dirty = True
+
+    def _fold_drawdown(self, trade):
+        """与calculate_max_drawdown相同的逐笔累加"""
+        self._capital += float(trade.get('盈亏(U)', 0) or 0)
+        self._last_open_time = trade.get('开仓时间', '')
+        if self._capital > self._peak:
+            self._peak = self._capital
+        if self._peak > 0:
+            self._max_dd = max(self._max_dd, (self._peak - self._capital) / self._peak * 100)
+
+    def max_drawdown_all(self):
+        if self._drawdown_dirty:
+            self._capital = self._peak = 100.0
+            self._max_dd = 0.0
+            self._last_open_time = ''
+            for trade in sorted(self.closed_trades, key=lambda x: x.get('开仓时间', '')):
+                self._fold_drawdown(trade)
+            self._drawdown_dirty = False
+        return self._max_dd
+
+    def metrics(self, range_type='all', start_date='', end_date=''):
+        """
+        已平仓交易统计（与原get_model_summary中的计算一致）
+
+        Returns:
+            {'closed_trades', 'total_realized_pnl', 'win_count', 'total_count', 'win_rate',
+             'max_drawdown', 'sharpe_ratio', 'first_open_time'}
+        """
+        with self.lock:
+            if range_type == 'all':
+                if self._sharpe_all is None:
+                    self._sharpe_all = calculate_sharpe_ratio(
+                        self.closed_trades, self.pnl.rows if self.pnl.rows else None, 100.0
+                    )
+                return self._build_metrics(
+                    self.closed_trades, self.realized_pnl, self.win_count,
+                    self.max_drawdown_all(), self._sharpe_all
+                )
+
+            key = (range_type, start_date, end_date, summary_range_anchor())
+            if key not in self._range_metrics:
+                closed = filter_data_by_time_range(
+                    self.closed_trades, '平仓时间', range_type, start_date, end_date
+                )
+                realized, wins = 0, 0
+                for trade in closed:
+                    try:
+                        pnl = float(trade.get('盈亏(U)', '0') or '0')
+                        realized += pnl
+                        if pnl > 0:
+                            wins += 1
+                    except (ValueError, TypeError):
+                        continue
+                pnl_history = filter_data_by_time_range(
+                    self.pnl.rows, '时间', range_type, start_date, end_date
+                )
+                self._range_metrics[key] = self._build_metrics(
+                    closed, realized, wins, calculate_max_drawdown(closed),
+                    calculate_sharpe_ratio(closed, pnl_history if pnl_history else None, 100.0)
+                )
+            return self._range_metrics[key]
+
+    @staticmethod
+    def _build_metrics(closed, realized, wins, max_drawdown, sharpe_ratio):
+        total = len(closed)
+        return {
+            'closed_trades': closed,
+            'total_realized_pnl': realized,
+            'win_count': wins,
+            'total_count': total,
+            'win_rate': (wins / total * 100) if total > 0 else 0,
+            'max_drawdown': max_drawdown,
+            'sharpe_ratio': sharpe_ratio,
+            'first_open_time': min((t.get('开仓时间', '') for t in closed), default=''),
+        }
+
+    def display_trades(self, model, range_type='all', start_date='', end_date=''):
+        """
+        交易记录列表（已平仓按平仓时间、未平仓按开仓时间筛选），
+        返回副本：标记来源模型并把时间转换为北京时间，不改动缓存的行
+        """
+        with self.lock:
+            rows = list(self.trades.rows)
+        closed = [t for t in rows if t.get('平仓时间') and t.get('平仓时间').strip()]
+        still_open = [t for t in rows if not (t.get('平仓时间') and t.get('平仓时间').strip())]
+        closed = filter_data_by_time_range(closed, '平仓时间', range_type, start_date, end_date)
+        still_open = filter_data_by_time_range(still_open, '开仓时间', range_type, start_date, end_date)
+
+        trades = []
+        for trade in closed + still_open:
+            trade = dict(trade)
+            trade['model'] = model  # 标记来源模型
+            if trade.get('开仓时间'):
+                trade['开仓时间'] = utc_to_beijing_time(trade['开仓时间'])
+            if trade.get('平仓时间'):
+                trade['平仓时间'] = utc_to_beijing_time(trade['平仓时间'])
+            trades.append(trade)
+        return trades, len(closed), len(still_open)
+
+    def pnl_24h(self):
+        """最近96条（24小时）的总资产变化"""
+        pnl_data = self.pnl.rows[-96:]
+        if not pnl_data:
+            return None
+        start_assets = float(pnl_data[0].get('总资产', pnl_data[0].get('total_assets', 0)))
+        end_assets = float(pnl_data[-1].get('总资产', pnl_data[-1].get('total_assets', 0)))
+        change = end_assets - start_assets
+        return {
+            'start': start_assets,
+            'end': end_assets,
+            'change': change,
+            'change_pct': (change / start_assets * 100) if start_assets > 0 else 0
+        }
+
+
+TRADE_STATES: dict[str, ModelTradeState] = {}
+_TRADE_STATES_LOCK = threading.Lock()
+
+
+def get_trade_state(model):
+    """按模型复用ModelTradeState，并在返回前同步文件变化"""
+    data_dir = get_trading_data_dir(model)
+    with _TRADE_STATES_LOCK:
+        if data_dir not in TRADE_STATES:
+            TRADE_STATES[data_dir] = ModelTradeState(data_dir)
+        state = TRADE_STATES[data_dir]
+    state.refresh()
+    return state
+
+
+def summary_range_anchor():
+    """day/week/month周期的边界只在北京时间跨日时变化"""
+    return datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d')
+
+
+def annualized_return_since(first_open_time, profit_rate):
+    """从最早开仓时间到现在的年化收益（复利），无法解析时为0"""
+    if not first_open_time:
+        return 0
+    try:
+        start_time = datetime.strptime(first_open_time, '%Y-%m-%d %H:%M:%S')
+        days_elapsed = (datetime.now() - start_time).total_seconds() / 86400
+        if days_elapsed > 0:
+            return ((profit_rate / 100 + 1) ** (365 / days_elapsed) - 1) * 100
+    except Exception as e:
+        logging.error(f"计算年化收益失败: {e}")
+    return 0
+
 # 设置日志格式，日志级别设为DEBUG以便于调试
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -1102,6 +1408,50 @@ def upload_images():
 
 TRADING_DATA_BASE = '/root/10-23-bot/ds/trading_data'
 
+# 【V8.9.9】市场快照列式存储（ds/market_snapshot_store.py，需要numpy/pandas），不可用时读CSV
+try:
+    sys.path.insert(0, os.path.dirname(TRADING_DATA_BASE))
+    from market_snapshot_store import load_snapshot_day
+    HAS_SNAPSHOT_STORE = True
+except ImportError:
+    HAS_SNAPSHOT_STORE = False
+
+SNAPSHOT_KLINE_COLUMNS = ['time', 'coin', 'open', 'high', 'low', 'close']
+
+# 【V8.9.15】K线侧车索引 + 解码块LRU：价格图只读需要的币种
+try:
+    from snapshot_ohlc_index import query_klines
+    HAS_OHLC_INDEX = True
+except ImportError:
+    HAS_OHLC_INDEX = False
+
+# 【V8.9.11】AI决策日志（jsonl + 尾部索引），读最近N条不解析整个文件
+try:
+    from decision_journal import get_journal
+    HAS_DECISION_JOURNAL = True
+except ImportError:
+    HAS_DECISION_JOURNAL = False
+
+
+# 【V8.9.14】盈亏历史时间索引：按时间范围二分查找，只读命中的行，并可LTTB降采样
+try:
+    from pnl_time_index import PNL_CHART_MAX_POINTS, downsample_rows, get_pnl_history, to_epoch
+    HAS_PNL_INDEX = True
+except ImportError:
+    HAS_PNL_INDEX = False
+
+
+def read_recent_decisions(data_dir, limit):
+    """最近limit条AI决策：优先读jsonl日志，没有再读旧版ai_decisions.json"""
+    if HAS_DECISION_JOURNAL:
+        return get_journal(data_dir).tail(limit)
+    decisions_file = os.path.join(data_dir, 'ai_decisions.json')
+    if not os.path.exists(decisions_file):
+        return []
+    with open(decisions_file, 'r', encoding='utf-8') as f:
+        decisions = json.load(f)
+    return decisions[-limit:] if isinstance(decisions, list) else []
+
 def get_trading_data_dir(model='deepseek'):
     """根据模型名称获取数据目录"""
     if model not in ['deepseek', 'qwen']:
@@ -1277,6 +1627,44 @@ def trading_history():
         logging.error(f"读取交易历史失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+def query_pnl_chart(pnl_file, range_type, start_date, end_date, limit, max_points):
+    """
+    【V8.9.14】/trading-pnl 的索引查询（筛选规则与逐行解析版一致）
+
+    时间范围换算为UTC时间戳后在索引中二分查找，只读取范围内的行；
+    点数超过max_points时按总资产做LTTB降采样
+    """
+    # 根据日期范围筛选（使用北京时间 UTC+8）
+    now_beijing = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    start_time, end_time = None, None
+    if range_type == 'day':
+        start_time = now_beijing.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif range_type == 'week':
+        start_time = (now_beijing - timedelta(days=now_beijing.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    elif range_type == 'month':
+        start_time = now_beijing.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif start_date and end_date:
+        start_time = datetime.strptime(start_date, '%Y-%m-%d')
+        end_time = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    
+    # 北京时间边界 → UTC时间戳（CSV存储的是UTC时间）
+    start_ts = to_epoch(start_time - timedelta(hours=8)) if start_time else None
+    end_ts = to_epoch(end_time - timedelta(hours=8)) if end_time else None
+    epochs, rows = get_pnl_history(pnl_file).query(start_ts, end_ts)
+    
+    # "全部"显示所有历史数据，不受limit限制
+    if range_type != 'all' and len(rows) > limit:
+        epochs, rows = epochs[-limit:], rows[-limit:]
+    total_points = len(rows)
+    epochs, rows = downsample_rows(epochs, rows, max_points)
+    
+    for ts, row in zip(epochs, rows):
+        beijing_time = (datetime(1970, 1, 1) + timedelta(seconds=ts, hours=8)).strftime('%Y-%m-%d %H:%M:%S')
+        row['时间'] = beijing_time
+        if 'timestamp' in row:
+            row['timestamp'] = beijing_time
+    return {'pnl_data': rows, 'total_points': total_points}
+
 @app.route('/trading-pnl', methods=['GET'])
 def trading_pnl():
     """获取盈亏曲线数据（支持日期范围筛选）"""
@@ -1289,6 +1677,9 @@ def trading_pnl():
         end_date = request.args.get('end_date', '')  # YYYY-MM-DD
         
         pnl_file = os.path.join(data_dir, 'pnl_history.csv')
+        if HAS_PNL_INDEX and os.path.exists(pnl_file):
+            max_points = int(request.args.get('max_points', PNL_CHART_MAX_POINTS))
+            return jsonify(query_pnl_chart(pnl_file, range_type, start_date, end_date, limit, max_points)), 200
         if os.path.exists(pnl_file):
             with open(pnl_file, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
@@ -1370,16 +1761,8 @@ def trading_ai_decisions():
         model = request.args.get('model', 'deepseek')
         data_dir = get_trading_data_dir(model)
         limit = int(request.args.get('limit', 9999))
-        decisions_file = os.path.join(data_dir, 'ai_decisions.json')
-        if os.path.exists(decisions_file):
-            with open(decisions_file, 'r', encoding='utf-8') as f:
-                decisions = json.load(f)
-                # 返回最后N条
-                if isinstance(decisions, list):
-                    decisions = decisions[-limit:]
-                return jsonify({'decisions': decisions}), 200
-        else:
-            return jsonify({'decisions': []}), 200
+        # 返回最后N条
+        return jsonify({'decisions': read_recent_decisions(data_dir, limit)}), 200
     except Exception as e:
         logging.error(f"读取AI决策失败: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1399,71 +1782,23 @@ def trading_summary():
         
         # 系统状态（适配中英文字段名）
         status_file = os.path.join(data_dir, 'system_status.json')
-        trades_file = os.path.join(data_dir, 'trades_history.csv')
         
-        # 初始化all_trades，避免作用域问题
-        all_trades = []
+        # 【V8.9.13】交易/盈亏数据由摘要引擎维护（文件未变化时不重新解析）
+        state = get_trade_state(model)
         
         if os.path.exists(status_file):
             with open(status_file, 'r', encoding='utf-8') as f:
                 raw_status = json.load(f)
                 
-                # 读取所有交易记录（重新赋值，覆盖外部初始化）
-                all_trades = []
-                if os.path.exists(trades_file):
-                    try:
-                        with open(trades_file, 'r', encoding='utf-8') as tf:
-                            trades_reader = csv.DictReader(tf)
-                            trades_reader.fieldnames = [name.strip() if name else name for name in trades_reader.fieldnames]
-                            for trade in trades_reader:
-                                trade_cleaned = {k.strip() if k else k: v for k, v in trade.items()}
-                                all_trades.append(trade_cleaned)
-                            logging.info(f"[{model}] 读取到 {len(all_trades)} 笔交易记录")
-                    except Exception as e:
-                        logging.error(f"读取交易历史失败: {e}")
-                
-                # 🔥 时间周期过滤：过滤已平仓的交易
-                closed_trades = [t for t in all_trades if t.get('平仓时间') and t.get('平仓时间').strip()]
-                logging.info(f"[{model}] 已平仓交易数: {len(closed_trades)}, 时间范围: {range_type}")
-                
-                filtered_closed_trades = filter_data_by_time_range(
-                    closed_trades, '平仓时间', range_type, start_date, end_date
-                )
-                logging.info(f"[{model}] 筛选后已平仓交易数: {len(filtered_closed_trades)}")
-                
-                # 计算总已实现盈亏和胜率（基于过滤后的交易）
-                total_realized_pnl = 0
-                win_count = 0
-                total_count = len(filtered_closed_trades)
-                
-                for trade in filtered_closed_trades:
-                    pnl_str = trade.get('盈亏(U)', '0') or '0'
-                    try:
-                        pnl = float(pnl_str)
-                        total_realized_pnl += pnl
-                        if pnl > 0:
-                            win_count += 1
-                    except (ValueError, TypeError):
-                        continue
-                
-                # 计算胜率
-                win_rate = (win_count / total_count * 100) if total_count > 0 else 0
+                # 🔥 时间周期过滤后的已平仓交易统计
+                metrics = state.metrics(range_type, start_date, end_date)
+                total_realized_pnl = metrics['total_realized_pnl']
+                win_count = metrics['win_count']
+                total_count = metrics['total_count']
+                win_rate = metrics['win_rate']
+                logging.info(f"[{model}] 筛选后已平仓交易数: {total_count}, 时间范围: {range_type}")
                 logging.info(f"[{model}] 胜率: {win_rate:.1f}% ({win_count}/{total_count})")
                 
-                # 读取盈亏历史数据（用于计算夏普比率）
-                pnl_history = []
-                pnl_file = os.path.join(data_dir, 'pnl_history.csv')
-                if os.path.exists(pnl_file):
-                    try:
-                        with open(pnl_file, 'r', encoding='utf-8') as pf:
-                            pnl_reader = csv.DictReader(pf)
-                            pnl_history = list(pnl_reader)
-                            pnl_history = filter_data_by_time_range(
-                                pnl_history, '时间', range_type, start_date, end_date
-                            )
-                    except Exception as e:
-                        logging.error(f"读取盈亏历史失败: {e}")
-                
                 # 计算未实现盈亏（当前持仓的盈亏，不受时间筛选影响）
                 unrealized_pnl = 0
                 
@@ -1478,27 +1813,9 @@ def trading_summary():
                     profit_rate = (total_realized_pnl / initial_capital * 100) if initial_capital > 0 else 0
                 
                 # 计算年化收益率
-                annualized_return = 0
-                if filtered_closed_trades:
-                    try:
-                        sorted_trades = sorted(filtered_closed_trades, key=lambda x: x.get('开仓时间', ''))
-                        first_trade = sorted_trades[0]
-                        start_time = datetime.strptime(first_trade.get('开仓时间', ''), '%Y-%m-%d %H:%M:%S')
-                        days_elapsed = (datetime.now() - start_time).total_seconds() / 86400
-                        if days_elapsed > 0:
-                            annualized_return = ((profit_rate / 100 + 1) ** (365 / days_elapsed) - 1) * 100
-                    except Exception as e:
-                        logging.error(f"计算年化收益失败: {e}")
-                
-                # 🔥 计算最大回撤
-                max_drawdown = calculate_max_drawdown(filtered_closed_trades)
-                
-                # 🔥 计算夏普比率
-                sharpe_ratio = calculate_sharpe_ratio(
-                    filtered_closed_trades,
-                    pnl_history if pnl_history else None,
-                    initial_capital
-                )
+                annualized_return = annualized_return_since(metrics['first_open_time'], profit_rate)
+                max_drawdown = metrics['max_drawdown']  # 🔥 最大回撤
+                sharpe_ratio = metrics['sharpe_ratio']  # 🔥 夏普比率
                 
                 # 计算总保证金占用（从positions中获取）
                 total_margin = 0
@@ -1537,28 +1854,12 @@ def trading_summary():
         
         # 当前持仓（适配中英文字段名）
         positions_file = os.path.join(data_dir, 'current_positions.csv')
-        trades_file = os.path.join(data_dir, 'trades_history.csv')
         if os.path.exists(positions_file):
             with open(positions_file, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 raw_positions = list(reader)
                 # 从trades_history.csv读取开仓时间、止损、止盈等信息
-                trade_details = {}
-                if os.path.exists(trades_file):
-                    with open(trades_file, 'r', encoding='utf-8') as tf:
-                        trades_reader = csv.DictReader(tf)
-                        for trade in trades_reader:
-                            if not trade.get('平仓时间'):  # 未平仓
-                                key = f"{trade.get('币种', '')}_{trade.get('方向', '')}"
-                                trade_details[key] = {
-                                    'open_time': trade.get('开仓时间', ''),
-                                    'stop_loss': float(trade.get('止损', 0) or 0),
-                                    'take_profit': float(trade.get('止盈', 0) or 0),
-                                    'risk_reward': float(trade.get('盈亏比', 0) or 0),
-                                    'margin': float(trade.get('仓位(U)', 0) or 0),  # 保证金
-                                    'leverage': int(trade.get('杠杆率', 1) or 1),
-                                    'open_reason': trade.get('开仓理由', '')
-                                }
+                trade_details = state.open_details
                 # 转换字段名
                 summary['positions'] = []
                 for pos in raw_positions:
@@ -1619,53 +1920,16 @@ def trading_summary():
         if 'status' in summary:
             summary['status']['usdt_balance'] = summary['status']['total_assets'] - total_margin
         
-        # 🔥 根据时间周期过滤交易记录（复用前面已读取的all_trades）
-        # 已平仓的交易：根据平仓时间筛选
-        closed_trades_for_display = [t for t in all_trades if t.get('平仓时间') and t.get('平仓时间').strip()]
-        closed_trades_for_display = filter_data_by_time_range(
-            closed_trades_for_display, '平仓时间', range_type, start_date, end_date
+        # 🔥 根据时间周期过滤交易记录，标记来源模型并转换时间为北京时间
+        summary['recent_trades'], closed_shown, open_shown = state.display_trades(
+            model, range_type, start_date, end_date
         )
-        
-        # 未平仓的交易：根据开仓时间筛选
-        open_trades_for_display = [t for t in all_trades if not (t.get('平仓时间') and t.get('平仓时间').strip())]
-        open_trades_for_display = filter_data_by_time_range(
-            open_trades_for_display, '开仓时间', range_type, start_date, end_date
-        )
-        
-        logging.info(f"[{model}] 显示交易 - 已平仓: {len(closed_trades_for_display)}, 未平仓: {len(open_trades_for_display)}, 时间范围: {range_type}")
-        
-        # 合并过滤后的交易，并标记来源模型，转换时间为北京时间
-        summary['recent_trades'] = []
-        for trade in closed_trades_for_display + open_trades_for_display:
-            trade['model'] = model  # 标记来源模型
-            if trade.get('开仓时间'):
-                trade['开仓时间'] = utc_to_beijing_time(trade['开仓时间'])
-            if trade.get('平仓时间'):
-                trade['平仓时间'] = utc_to_beijing_time(trade['平仓时间'])
-            summary['recent_trades'].append(trade)
+        logging.info(f"[{model}] 显示交易 - 已平仓: {closed_shown}, 未平仓: {open_shown}, 时间范围: {range_type}")
         
         # 24小时盈亏（适配中英文字段名）
-        pnl_file = os.path.join(data_dir, 'pnl_history.csv')
-        if os.path.exists(pnl_file):
-            with open(pnl_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                # 取最近96条（15分钟一条 = 24小时）
-                if len(lines) > 96:
-                    lines = [lines[0]] + lines[-96:]
-                reader = csv.DictReader(lines)
-                pnl_data = list(reader)
-                if pnl_data:
-                    # 支持中英文字段名
-                    start_assets = float(pnl_data[0].get('总资产', pnl_data[0].get('total_assets', 0)))
-                    end_assets = float(pnl_data[-1].get('总资产', pnl_data[-1].get('total_assets', 0)))
-                    change = end_assets - start_assets
-                    change_pct = (change / start_assets * 100) if start_assets > 0 else 0
-                    summary['pnl_24h'] = {
-                        'start': start_assets,
-                        'end': end_assets,
-                        'change': change,
-                        'change_pct': change_pct
-                    }
+        pnl_24h = state.pnl_24h()
+        if pnl_24h:
+            summary['pnl_24h'] = pnl_24h
         
         # 读取当前运行模式（从环境变量文件）
         try:
@@ -1916,6 +2180,22 @@ def trading_combined():
         logging.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+def summary_data_versions(model, data_dir, state):
+    """摘要依赖的全部数据文件指纹；任一文件变化或北京时间跨日时摘要需要重新生成"""
+    env_file = '/root/10-23-bot/ds/.env' if model == 'deepseek' else '/root/10-23-bot/ds/.env.qwen'
+    return (
+        state.trades.signature,
+        state.pnl.signature,
+        _file_signature(os.path.join(data_dir, 'system_status.json')),
+        _file_signature(os.path.join(data_dir, 'current_positions.csv')),
+        _file_signature(os.path.join(data_dir, 'learning_config.json')),
+        _file_signature(os.path.join(data_dir, 'ai_decisions.jsonl')),
+        _file_signature(os.path.join(data_dir, 'ai_decisions.json')),
+        _file_signature(env_file),
+        summary_range_anchor(),
+    )
+
+
 def get_model_summary(model, range_type='all', start_date='', end_date=''):
     """获取单个模型的摘要数据（内部辅助函数）
     :param model: 模型名称（deepseek/qwen）
@@ -1924,84 +2204,48 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
     :param end_date: 自定义结束日期
     """
     # 【V8.5.2.4.88优化】缓存逻辑：避免频繁读取CSV导致内存飙升
+    # 【V8.9.13】数据文件没有变化就一直复用，变化后立即重建（交易/盈亏CSV只解析新增的行）
     cache_key = f"{model}_{range_type}_{start_date}_{end_date}"
     current_time = time.time()
     
-    # 检查缓存是否存在且未过期
-    if cache_key in SUMMARY_CACHE:
-        cached_data, cache_time = SUMMARY_CACHE[cache_key]
-        age = int(current_time - cache_time)
-        if current_time - cache_time < CACHE_DURATION:
-            logging.info(f"[{model}][缓存命中] 使用{age}秒前的数据，跳过CSV读取")
-            return cached_data
-        else:
-            logging.info(f"[{model}][缓存过期] 缓存已过期({age}秒)，重新读取")
-    
     try:
         data_dir = get_trading_data_dir(model)
+        state = get_trade_state(model)
+        versions = summary_data_versions(model, data_dir, state)
+        
+        cached = SUMMARY_CACHE.pop(cache_key, None)
+        if cached is not None and cached[1] == versions:
+            SUMMARY_CACHE[cache_key] = cached  # 移到最近使用
+            # 年化收益依赖当前时间，命中缓存时在副本上单独刷新（缓存中的摘要保持不变）
+            summary = dict(cached[0])
+            if summary.get('status'):
+                summary['status'] = dict(summary['status'])
+                summary['status']['annualized_return'] = annualized_return_since(
+                    state.metrics(range_type, start_date, end_date)['first_open_time'],
+                    summary['status']['profit_rate']
+                )
+            logging.info(f"[{model}][缓存命中] 数据未变化，使用{int(current_time - cached[2])}秒前生成的摘要")
+            return summary
+        if cached is not None:
+            logging.info(f"[{model}][缓存失效] 数据文件已更新，重新生成摘要")
+        
         summary = {}
         
         status_file = os.path.join(data_dir, 'system_status.json')
-        trades_file = os.path.join(data_dir, 'trades_history.csv')
         positions_file = os.path.join(data_dir, 'current_positions.csv')
-        pnl_file = os.path.join(data_dir, 'pnl_history.csv')
         
         if os.path.exists(status_file):
             with open(status_file, 'r', encoding='utf-8') as f:
                 raw_status = json.load(f)
                 
-                # 读取所有交易记录
-                all_trades = []
-                if os.path.exists(trades_file):
-                    try:
-                        with open(trades_file, 'r', encoding='utf-8') as tf:
-                            trades_reader = csv.DictReader(tf)
-                            trades_reader.fieldnames = [name.strip() if name else name for name in trades_reader.fieldnames]
-                            for trade in trades_reader:
-                                trade_cleaned = {k.strip() if k else k: v for k, v in trade.items()}
-                                all_trades.append(trade_cleaned)
-                    except Exception as e:
-                        logging.error(f"读取{model}交易历史失败: {e}")
-                
-                # 🔥 时间周期过滤：过滤已平仓的交易
-                closed_trades = [t for t in all_trades if t.get('平仓时间') and t.get('平仓时间').strip()]
-                filtered_closed_trades = filter_data_by_time_range(
-                    closed_trades, '平仓时间', range_type, start_date, end_date
-                )
-                
-                # 计算总已实现盈亏和胜率（基于过滤后的交易）
-                total_realized_pnl = 0
-                win_count = 0
-                total_count = len(filtered_closed_trades)
-                
-                for trade in filtered_closed_trades:
-                    pnl_str = trade.get('盈亏(U)', '0') or '0'
-                    try:
-                        pnl = float(pnl_str)
-                        total_realized_pnl += pnl
-                        if pnl > 0:
-                            win_count += 1
-                    except (ValueError, TypeError):
-                        continue
-                
-                # 计算胜率
-                win_rate = (win_count / total_count * 100) if total_count > 0 else 0
+                # 🔥 已平仓交易的统计（时间周期过滤、胜率、最大回撤、夏普比率），数据未变化时直接复用
+                metrics = state.metrics(range_type, start_date, end_date)
+                total_realized_pnl = metrics['total_realized_pnl']
+                win_count = metrics['win_count']
+                total_count = metrics['total_count']
+                win_rate = metrics['win_rate']
                 logging.info(f"[{model}][get_model_summary] 胜率: {win_rate:.1f}% ({win_count}/{total_count})")
                 
-                # 读取盈亏历史数据（用于计算夏普比率）
-                pnl_history = []
-                if os.path.exists(pnl_file):
-                    try:
-                        with open(pnl_file, 'r', encoding='utf-8') as pf:
-                            pnl_reader = csv.DictReader(pf)
-                            pnl_history = list(pnl_reader)
-                            # 根据时间周期过滤盈亏历史
-                            pnl_history = filter_data_by_time_range(
-                                pnl_history, '时间', range_type, start_date, end_date
-                            )
-                    except Exception as e:
-                        logging.error(f"读取{model}盈亏历史失败: {e}")
-                
                 # 计算未实现盈亏（当前持仓的盈亏，不受时间筛选影响）
                 unrealized_pnl = 0
                 if '持仓详情' in raw_status:
@@ -2019,29 +2263,8 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
                     # 特定周期：基于该周期的已实现盈亏
                     profit_rate = (total_realized_pnl / initial_capital * 100) if initial_capital > 0 else 0
                 
-                # 计算年化收益率
-                annualized_return = 0
-                if filtered_closed_trades:
-                    # 找到该周期内最早的交易时间
-                    try:
-                        sorted_trades = sorted(filtered_closed_trades, key=lambda x: x.get('开仓时间', ''))
-                        first_trade = sorted_trades[0]
-                        start_time = datetime.strptime(first_trade.get('开仓时间', ''), '%Y-%m-%d %H:%M:%S')
-                        days_elapsed = (datetime.now() - start_time).total_seconds() / 86400
-                        if days_elapsed > 0:
-                            annualized_return = ((profit_rate / 100 + 1) ** (365 / days_elapsed) - 1) * 100
-                    except Exception as e:
-                        logging.error(f"计算年化收益失败: {e}")
-                
-                # 🔥 计算最大回撤（基于过滤后的交易）
-                max_drawdown = calculate_max_drawdown(filtered_closed_trades)
-                
-                # 🔥 计算夏普比率（基于过滤后的数据）
-                sharpe_ratio = calculate_sharpe_ratio(
-                    filtered_closed_trades, 
-                    pnl_history if pnl_history else None, 
-                    initial_capital
-                )
+                # 计算年化收益率（从该周期内最早的开仓时间算起）
+                annualized_return = annualized_return_since(metrics['first_open_time'], profit_rate)
                 
                 # 确保AI分析和风险评估是字符串格式
                 ai_analysis = raw_status.get('AI分析', raw_status.get('ai_analysis', ''))
@@ -2062,8 +2285,8 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
                     'total_realized_pnl': total_realized_pnl,
                     'profit_rate': profit_rate,
                     'annualized_return': annualized_return,
-                    'max_drawdown': max_drawdown,  # 🔥 最大回撤
-                    'sharpe_ratio': sharpe_ratio,  # 🔥 夏普比率
+                    'max_drawdown': metrics['max_drawdown'],  # 🔥 最大回撤
+                    'sharpe_ratio': metrics['sharpe_ratio'],  # 🔥 夏普比率
                     'win_rate': win_rate,  # 🔥 胜率
                     'win_count': win_count,  # 盈利交易数
                     'total_trades': total_count,  # 总交易数
@@ -2081,22 +2304,7 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
                 reader = csv.DictReader(f)
                 raw_positions = list(reader)
                 
-                trade_details = {}
-                if os.path.exists(trades_file):
-                    with open(trades_file, 'r', encoding='utf-8') as tf:
-                        trades_reader = csv.DictReader(tf)
-                        for trade in trades_reader:
-                            if not trade.get('平仓时间'):
-                                key = f"{trade.get('币种', '')}_{trade.get('方向', '')}"
-                                trade_details[key] = {
-                                    'open_time': trade.get('开仓时间', ''),
-                                    'stop_loss': float(trade.get('止损', 0) or 0),
-                                    'take_profit': float(trade.get('止盈', 0) or 0),
-                                    'risk_reward': float(trade.get('盈亏比', 0) or 0),
-                                    'margin': float(trade.get('仓位(U)', 0) or 0),
-                                    'leverage': int(trade.get('杠杆率', 1) or 1),
-                                    'open_reason': trade.get('开仓理由', '')
-                                }
+                trade_details = state.open_details
                 
                 summary['positions'] = []
                 for pos in raw_positions:
@@ -2164,62 +2372,16 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
         if 'status' in summary:
             summary['status']['usdt_balance'] = summary['status']['total_assets'] - total_margin_model
         
-        # 所有交易记录（包括未平仓和已平仓）
-        if os.path.exists(trades_file):
-            with open(trades_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                reader.fieldnames = [name.strip() if name else name for name in reader.fieldnames]
-                all_trades_raw = []
-                for trade in reader:
-                    trade_cleaned = {k.strip() if k else k: v for k, v in trade.items()}
-                    trade_cleaned['model'] = model  # 标记来源模型
-                    all_trades_raw.append(trade_cleaned)
-                
-                # 🔥 根据时间周期筛选交易记录
-                # 已平仓的交易：根据平仓时间筛选
-                closed_trades_for_display = [t for t in all_trades_raw if t.get('平仓时间') and t.get('平仓时间').strip()]
-                closed_trades_filtered = filter_data_by_time_range(
-                    closed_trades_for_display, '平仓时间', range_type, start_date, end_date
-                )
-                
-                # 未平仓的交易：根据开仓时间筛选
-                open_trades_for_display = [t for t in all_trades_raw if not (t.get('平仓时间') and t.get('平仓时间').strip())]
-                open_trades_filtered = filter_data_by_time_range(
-                    open_trades_for_display, '开仓时间', range_type, start_date, end_date
-                )
-                
-                # 合并过滤后的交易，并转换时间为北京时间
-                all_filtered_trades = closed_trades_filtered + open_trades_filtered
-                for trade in all_filtered_trades:
-                    if trade.get('开仓时间'):
-                        trade['开仓时间'] = utc_to_beijing_time(trade['开仓时间'])
-                    if trade.get('平仓时间'):
-                        trade['平仓时间'] = utc_to_beijing_time(trade['平仓时间'])
-                summary['recent_trades'] = all_filtered_trades
-                logging.info(f"[{model}][get_model_summary] 交易记录 - 已平仓: {len(closed_trades_filtered)}, 未平仓: {len(open_trades_filtered)}")
-        else:
-            summary['recent_trades'] = []
+        # 所有交易记录（包括未平仓和已平仓），根据时间周期筛选并转换为北京时间
+        summary['recent_trades'], closed_shown, open_shown = state.display_trades(
+            model, range_type, start_date, end_date
+        )
+        logging.info(f"[{model}][get_model_summary] 交易记录 - 已平仓: {closed_shown}, 未平仓: {open_shown}")
         
         # 24小时盈亏
-        pnl_file = os.path.join(data_dir, 'pnl_history.csv')
-        if os.path.exists(pnl_file):
-            with open(pnl_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                if len(lines) > 96:
-                    lines = [lines[0]] + lines[-96:]
-                reader = csv.DictReader(lines)
-                pnl_data = list(reader)
-                if pnl_data:
-                    start_assets = float(pnl_data[0].get('总资产', pnl_data[0].get('total_assets', 0)))
-                    end_assets = float(pnl_data[-1].get('总资产', pnl_data[-1].get('total_assets', 0)))
-                    change = end_assets - start_assets
-                    change_pct = (change / start_assets * 100) if start_assets > 0 else 0
-                    summary['pnl_24h'] = {
-                        'start': start_assets,
-                        'end': end_assets,
-                        'change': change,
-                        'change_pct': change_pct
-                    }
+        pnl_24h = state.pnl_24h()
+        if pnl_24h:
+            summary['pnl_24h'] = pnl_24h
         
         # 读取当前运行模式（从环境变量文件）
         try:
@@ -2274,32 +2436,18 @@ def get_model_summary(model, range_type='all', start_date='', end_date=''):
         
         # 🆕 【V8.3.21修复】读取AI决策历史（用于综合页面显示）
         try:
-            decisions_file = os.path.join(data_dir, 'ai_decisions.json')
-            if os.path.exists(decisions_file):
-                with open(decisions_file, 'r', encoding='utf-8') as f:
-                    decisions = json.load(f)
-                    # 只返回最后10条决策，减少数据传输量
-                    if isinstance(decisions, list):
-                        summary['ai_decisions'] = decisions[-10:]
-                    else:
-                        summary['ai_decisions'] = []
-            else:
-                summary['ai_decisions'] = []
+            # 只返回最后10条决策，减少数据传输量
+            summary['ai_decisions'] = read_recent_decisions(data_dir, 10)
         except Exception as e:
             logging.error(f"读取{model}AI决策历史失败: {e}")
             summary['ai_decisions'] = []
         
-        # 【V8.5.2.4.88优化】保存到缓存（30秒有效期）
-        SUMMARY_CACHE[cache_key] = (summary, current_time)
-        
-        # 【V8.5.2.4.88优化】自动清理过期缓存，防止内存泄漏
-        expired_keys = [
-            k for k, (_, cache_time) in SUMMARY_CACHE.items() 
-            if current_time - cache_time > CACHE_DURATION * 3
-        ]
-        for k in expired_keys:
-            del SUMMARY_CACHE[k]
-            logging.debug(f"[缓存清理] 删除过期缓存: {k}")
+        # 【V8.9.13】保存到缓存（记录数据文件指纹），超过上限时淘汰最久未使用的
+        SUMMARY_CACHE[cache_key] = (summary, versions, current_time)
+        while len(SUMMARY_CACHE) > SUMMARY_CACHE_MAX_ENTRIES:
+            evicted = next(iter(SUMMARY_CACHE))
+            SUMMARY_CACHE.pop(evicted, None)
+            logging.debug(f"[缓存清理] 淘汰最久未使用的缓存: {evicted}")
         
         logging.info(f"[{model}][缓存更新] 已保存到缓存，当前缓存数: {len(SUMMARY_CACHE)}")
         
@@ -2315,17 +2463,20 @@ def trading_cache_status():
         current_time = time.time()
         cache_info = []
         
-        for cache_key, (_, cache_time) in SUMMARY_CACHE.items():
+        for cache_key, (_, versions, cache_time) in list(SUMMARY_CACHE.items()):
+            model = cache_key.split('_', 1)[0]
+            state = get_trade_state(model)
             age = int(current_time - cache_time)
             cache_info.append({
                 'key': cache_key,
                 'age_seconds': age,
-                'status': '有效' if age < CACHE_DURATION else '已过期'
+                'status': '有效' if versions == summary_data_versions(model, get_trading_data_dir(model), state) else '已过期'
             })
         
         return jsonify({
             'cache_count': len(SUMMARY_CACHE),
-            'cache_duration': CACHE_DURATION,
+            'cache_max_entries': SUMMARY_CACHE_MAX_ENTRIES,
+            'cache_policy': '数据文件变化时失效',
             'cache_items': cache_info,
             'memory_tip': '缓存减少了CSV读取次数，降低了内存和CPU占用'
         }), 200
@@ -2747,15 +2898,47 @@ def trading_price_data():
             # 遍历日期读取market_snapshots - 使用日期循环而不是日期时间
             current_date = start_dt.date()
             end_date = end_dt.date()
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y%m%d')
-                snapshot_file = os.path.join(data_dir, 'market_snapshots', f'{date_str}.csv')
+            
+            # 【V8.9.15】按币种读侧车索引（命中LRU时不读文件），索引过期的日期自动改为解析源文件
+            if HAS_OHLC_INDEX:
+                dates = [
+                    (current_date + timedelta(days=i)).strftime('%Y%m%d')
+                    for i in range((end_date - current_date).days + 1)
+                ]
+                # 北京时间闭区间（K线时间为整秒，开始时间向上取整到秒）
+                range_start = start_beijing.replace(microsecond=0)
+                if start_beijing.microsecond:
+                    range_start += timedelta(seconds=1)
+                kline_data = query_klines(
+                    os.path.join(data_dir, 'market_snapshots'), dates, symbol,
+                    range_start.strftime('%Y-%m-%d %H:%M:%S'), end_beijing.strftime('%Y-%m-%d %H:%M:%S')
+                )
+            else:
+                # 没有侧车索引模块：逐天解析快照文件
+                while current_date <= end_date:
+                    date_str = current_date.strftime('%Y%m%d')
+                    snapshot_file = os.path.join(data_dir, 'market_snapshots', f'{date_str}.csv')
                 
-                if os.path.exists(snapshot_file):
-                    try:
-                        with open(snapshot_file, 'r', encoding='utf-8-sig') as f:
-                            reader = csv.DictReader(f)
-                            for row in reader:
+                    # 【V8.9.9】优先读列式分区（只取K线需要的6列），没有再读CSV
+                    rows = None
+                    if HAS_SNAPSHOT_STORE:
+                        try:
+                            frame = load_snapshot_day(
+                                os.path.join(data_dir, 'market_snapshots'), date_str,
+                                columns=SNAPSHOT_KLINE_COLUMNS
+                            )
+                            if frame is not None:
+                                frame = frame[frame['coin'].astype(str).str.upper() == symbol.upper()]
+                                rows = frame.dropna(subset=['time']).to_dict('records')
+                        except Exception as e:
+                            logging.error(f"读取列式快照失败 {date_str}: {e}")
+                
+                    if rows is not None or os.path.exists(snapshot_file):
+                        try:
+                            if rows is None:
+                                with open(snapshot_file, 'r', encoding='utf-8-sig') as f:
+                                    rows = list(csv.DictReader(f))
+                            for row in rows:
                                 if row.get('coin', '').upper() == symbol.upper():
                                     time_str = row.get('time', '').strip()
                                     # 规范化时间格式：0000 -> 00:00:00
@@ -2763,14 +2946,14 @@ def trading_price_data():
                                         time_str = f"{time_str[:2]}:{time_str[2:]}:00"
                                     elif ':' in time_str and len(time_str.split(':')) == 2:
                                         time_str = time_str + ":00"
-                                    
+                                
                                     # UTC时间 - 使用当前日期构造完整时间戳
                                     timestamp_utc = f"{current_date.strftime('%Y-%m-%d')} {time_str}"
                                     try:
                                         # 转换为北京时间
                                         timestamp_bj = utc_to_beijing_time(timestamp_utc)
                                         beijing_dt = datetime.strptime(timestamp_bj, '%Y-%m-%d %H:%M:%S')
-                                        
+                                    
                                         # 按北京时间范围过滤
                                         if start_beijing <= beijing_dt <= end_beijing:
                                             # 验证并转换价格数据
@@ -2792,10 +2975,10 @@ def trading_price_data():
                                                 logging.warning(f"无效K线数据: {timestamp_utc}, 错误: {e}")
                                     except Exception as e:
                                         logging.error(f"K线时间转换失败: {timestamp_utc}, 错误: {e}")
-                    except Exception as e:
-                        logging.error(f"读取快照文件失败 {snapshot_file}: {e}")
+                        except Exception as e:
+                            logging.error(f"读取快照文件失败 {snapshot_file}: {e}")
                 
-                current_date += timedelta(days=1)
+                    current_date += timedelta(days=1)
             
             logging.info(f"[K线数据] {model_name} {symbol}: 共{len(kline_data)}条")
             if kline_data:
@@ -2908,7 +3091,7 @@ def trading_price_data():
             for k in ds_kline + qw_kline:
                 ts = k['timestamp']
                 if ts not in kline_dict:
-                    kline_dict[ts] = k
+                    kline_dict[ts] = dict(k)
                 else:
                     # 取平均值
                     kline_dict[ts]['close'] = (kline_dict[ts]['close'] + k['close']) / 2